@@ -7,6 +7,7 @@ class ConstitutiveBase:
         self.stateVars = None
         self.stiffness_matrix = None
         self.is_elastic = False
+        self.elastic_predictor = False
 
     def check_materialID(self, materialID, max_material_num):
         if materialID <= 0: 
@@ -38,6 +39,9 @@ class ConstitutiveBase:
     
     def find_max_sound_speed(self):
         return find_max_sound_speed_(self.matProps)
+
+    def find_max_wave_speed(self, particleNum, particle):
+        return find_max_wave_speed_(particleNum, particle, self.matProps)
     
     def state_vars_initialize(self, start_particle, end_particle, particle):
         kernel_initial_state_variables(start_particle, end_particle, particle, self.stateVars, self.matProps)
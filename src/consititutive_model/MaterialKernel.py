@@ -335,6 +335,25 @@ def find_max_sound_speed_(matProps: ti.template()) -> float:
         ti.atomic_max(max_sound_speed, sound_speed)
     return max_sound_speed
 
+@ti.kernel
+def find_max_wave_speed_(particleNum: int, particle: ti.template(), matProps: ti.template()) -> float:
+    max_wave_speed = 0.
+    for np in range(particleNum):
+        materialID = int(particle[np].materialID)
+        if materialID > 0 and int(particle[np].active) == 1:
+            ti.atomic_max(max_wave_speed, particle[np].v.norm() + matProps[materialID]._get_sound_speed())
+    return max_wave_speed
+
+@ti.kernel
+def find_max_wave_speed_by_model_(start_index: int, end_index: int, particle_index: ti.template(), particle: ti.template(), matProps: ti.template()) -> float:
+    max_wave_speed = 0.
+    for index in range(start_index, end_index):
+        np = particle_index[index]
+        materialID = int(particle[np].materialID)
+        if materialID > 0 and int(particle[np].active) == 1:
+            ti.atomic_max(max_wave_speed, particle[np].v.norm() + matProps[materialID]._get_sound_speed())
+    return max_wave_speed
+
 @ti.kernel
 def kernel_initial_state_variables(to_beg: int, to_end: int, particle: ti.template(), stateVars: ti.template(), matProps: ti.template()):
     for np in range(to_beg, to_end):
@@ -299,6 +299,34 @@ class ModifiedCamClayModel:
         previous_stress = self.ImplicitIntegration(np, -previous_stress, de, dw, stateVars)
         return previous_stress
     
+    @ti.func
+    def ElasticPredictor2D(self, np, previous_stress, velocity_gradient, stateVars, dt):
+        de = calculate_strain_increment2D(-velocity_gradient, dt)
+        dw = calculate_vorticity_increment2D(velocity_gradient, dt)
+        stress = -previous_stress
+        void_ratio = stateVars[np].void_ratio
+        alpha = self.CalculateElasticFactor(de, stress, void_ratio, stateVars[np].pc)
+        is_plastic = int(ti.abs(1. - alpha) > Threshold)
+        update_stress = previous_stress
+        if is_plastic == 0:
+            update_stress = -self.ComputeElasticStress(alpha, de, stress, void_ratio) + Sigrot(stress, dw)
+            self.UpdateStateVariables(np, update_stress, stateVars)
+        return is_plastic, update_stress
+
+    @ti.func
+    def ElasticPredictor(self, np, previous_stress, velocity_gradient, stateVars, dt):
+        de = calculate_strain_increment(-velocity_gradient, dt)
+        dw = calculate_vorticity_increment(velocity_gradient, dt)
+        stress = -previous_stress
+        trial_stress = self.ComputeElasticStress(1., de, stress, stateVars[np].void_ratio)
+        yield_state_trial, _ = self.ComputeYieldState(trial_stress, stateVars[np].pc)
+        is_plastic = int(yield_state_trial > 0)
+        update_stress = previous_stress
+        if is_plastic == 0:
+            update_stress = -trial_stress + Sigrot(stress, dw)
+            self.UpdateStateVariables(np, update_stress, stateVars)
+        return is_plastic, update_stress
+    
     @ti.func
     def ImplicitIntegration(self, np, previous_stress, de, dw, stateVars):
         void_ratio = stateVars[np].void_ratio
@@ -637,7 +637,7 @@ class StateDependentMohrCoulombModel:
         return updated_stress
     
     @ti.func
-    def ImplicitIntegration1(self, np, previous_stress, de, dw, stateVars):
+    def ComputeTrialState1(self, np, previous_stress, de, dw, stateVars):
         e_Tao = self.e_Tao
         lambda_c = self.lambda_c
         ksi = self.ksi
@@ -648,12 +648,12 @@ class StateDependentMohrCoulombModel:
         dv = de[0] + de[1] + de[2]
         e_c = e_Tao - lambda_c * (p/101000.)**ksi
         e = stateVars[np].void_ratio
-        stateVars[np].void_ratio = e + (1.0 + e) * dv
-        if stateVars[np].void_ratio > 1.5:
-            stateVars[np].void_ratio = 1.5
-        elif stateVars[np].void_ratio < 0.1:
-            stateVars[np].void_ratio = 0.1
-        SP = stateVars[np].void_ratio - e_c
+        void_ratio = e + (1.0 + e) * dv
+        if void_ratio > 1.5:
+            void_ratio = 1.5
+        elif void_ratio < 0.1:
+            void_ratio = 0.1
+        SP = void_ratio - e_c
         nd, nf = self.nd, self.nf
         psi = ti.atan2(-nd * SP, 1.)
         fai = ti.tan(fai_c) * ti.exp(-nf * SP)
@@ -670,8 +670,6 @@ class StateDependentMohrCoulombModel:
         kfai = 6.* self.c *cfai/ti.sqrt(3.)/(3.+sfai)
         qpsi = 6.* spsi/ ti.sqrt(3.)/ (3.+spsi)
         tenf = self.tensile
-        bulk_mod = self.bulk
-        shear_mod = self.shear
         if qfai ==0.:
             tenf =0.
         else:
@@ -680,18 +678,46 @@ class StateDependentMohrCoulombModel:
         stress = previous_stress
         sigrot = Sigrot(stress, dw)
         stress += sigrot
-        dstress = ElasticTensorMultiplyVector(de, bulk_mod, shear_mod)
+        dstress = ElasticTensorMultiplyVector(de, self.bulk, self.shear)
         trial_stress = stress + dstress
         sm = MeanStress(trial_stress)
         sd = DeviatoricStress(trial_stress)
-        epeff_ = stateVars[np].epstrain
         
-        iplas = 0  # elastic calculation
         J2 = 0.5 * (sd[0]**2 + sd[1]**2 + sd[2]**2) + sd[3]**2 + sd[4]**2 + sd[5]**2
         Tau = ti.sqrt(J2)
-        seqv = Tau * ti.sqrt(3.0)
         dpFi = Tau + qfai * sm - kfai
         dpsig = sm - tenf
+        return void_ratio, qfai, kfai, qpsi, tenf, sm, sd, Tau, dpFi, dpsig
+
+    @ti.func
+    def ElasticPredictor2D(self, np, previous_stress, velocity_gradient, stateVars, dt):
+        # the friction and dilation angles are updated before the trial of ImplicitIntegration, every particle takes the return mapping pass
+        return 1, previous_stress
+
+    @ti.func
+    def ElasticPredictor(self, np, previous_stress, velocity_gradient, stateVars, dt):
+        de = calculate_strain_increment(velocity_gradient, dt)
+        dw = calculate_vorticity_increment(velocity_gradient, dt)
+        void_ratio, _, _, _, _, sm, sd, _, dpFi, dpsig = self.ComputeTrialState1(np, previous_stress, de, dw, stateVars)
+        is_plastic = 1
+        update_stress = previous_stress
+        if dpsig < 0.0 and dpFi <= 0.0:
+            is_plastic = 0
+            stateVars[np].void_ratio = void_ratio
+            update_stress = AssembleMeanDeviaStress(sd, sm)
+            stateVars[np].estress = VonMisesStress(update_stress)
+        return is_plastic, update_stress
+    
+    @ti.func
+    def ImplicitIntegration1(self, np, previous_stress, de, dw, stateVars):
+        void_ratio, qfai, kfai, qpsi, tenf, sm, sd, Tau, dpFi, dpsig = self.ComputeTrialState1(np, previous_stress, de, dw, stateVars)
+        stateVars[np].void_ratio = void_ratio
+        bulk_mod = self.bulk
+        shear_mod = self.shear
+        epeff_ = stateVars[np].epstrain
+        
+        iplas = 0  # elastic calculation
+        seqv = Tau * ti.sqrt(3.0)
         
         if dpsig < 0.0:
             if dpFi > 0.0:
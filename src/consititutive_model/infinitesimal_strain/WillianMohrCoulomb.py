@@ -372,6 +372,29 @@ class WillianMohrCoulombModel:
         previous_stress = self.ImplicitIntegration(np, previous_stress, de, dw, stateVars)
         return previous_stress
 
+    @ti.func
+    def ElasticPredictor2D(self, np, previous_stress, velocity_gradient, stateVars, dt):
+        de = calculate_strain_increment2D(velocity_gradient, dt)
+        dw = calculate_vorticity_increment2D(velocity_gradient, dt)
+        return self.ElasticTrial(np, previous_stress, de, dw, stateVars)
+
+    @ti.func
+    def ElasticPredictor(self, np, previous_stress, velocity_gradient, stateVars, dt):
+        de = calculate_strain_increment(velocity_gradient, dt)
+        dw = calculate_vorticity_increment(velocity_gradient, dt)
+        return self.ElasticTrial(np, previous_stress, de, dw, stateVars)
+
+    @ti.func
+    def ElasticTrial(self, np, previous_stress, de, dw, stateVars):
+        trial_stress = previous_stress + ElasticTensorMultiplyVector(de, self.bulk, self.shear)
+        yield_state_trial, _ = self.ComputeYieldState(trial_stress)
+        is_plastic = int(yield_state_trial > 0)
+        update_stress = previous_stress
+        if is_plastic == 0:
+            update_stress = trial_stress + Sigrot(previous_stress, dw)
+            stateVars[np].estress = VonMisesStress(update_stress)
+        return is_plastic, update_stress
+
     @ti.func
     def ExplicitIntegration(self, np, previous_stress, de, dw, stateVars):
         ############################## STEP2 ##############################
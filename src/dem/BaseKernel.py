@@ -5,52 +5,125 @@ from src.utils.Quaternion import SetFromTwoVec, SetToRotate, RodriguesRotationMa
 from src.utils.TypeDefination import vec3f, vec4f, vec2i
 from src.utils.VectorFunction import SquareLen
 from src.utils.BitFunction import Zero2OneVector
+from src.utils.DomainBoundary import periodic_position
+
+
+@ti.kernel
+def count_remaining_particles_(particleNum: int, sphereNum: int, clumpNum: int, particle: ti.template(), sphere: ti.template(), clump: ti.template(), 
+                               particle_offset: ti.template(), sphere_offset: ti.template(), clump_offset: ti.template()):
+    particle_offset.fill(0)
+    sphere_offset.fill(0)
+    clump_offset.fill(0)
+    if ti.static(not sphere == None):
+        for nsphere in range(sphereNum):
+            sphere_offset[nsphere + 1] = int(particle[sphere[nsphere].sphereIndex].active)
+    if ti.static(not clump == None):
+        # a clump is removed as a whole once one of its pebbles is inactive
+        for nclump in range(clumpNum):
+            remaining = 1
+            for np in range(clump[nclump].startIndex, clump[nclump].endIndex + 1):
+                if int(particle[np].active) == 0:
+                    remaining = 0
+            clump_offset[nclump + 1] = remaining
+    for np in range(particleNum):
+        multisphereIndex = particle[np].multisphereIndex
+        if multisphereIndex < 0:
+            particle_offset[np + 1] = sphere_offset[-multisphereIndex]
+        else:
+            particle_offset[np + 1] = clump_offset[multisphereIndex + 1]
 
 
 @ti.kernel
-def update_particle_storage_(particleNum: ti.types.ndarray(), sphereNum: ti.types.ndarray(), clumpNum: ti.types.ndarray(), particle: ti.template(), sphere: ti.template(), clump: ti.template()):
-    active = True
-    remaining_sphere = 0
-    remaining_clump = 0
-    remaining_particle = 0
-    delete_particle = 0
-    ti.loop_config(serialize=True)
-    for np in range(particleNum[0]):
-        multisphereIndex = particle[np].multisphereIndex
-        if ti.static(not sphere == None):
+def compact_particle_storage_(particleNum: int, sphereNum: int, clumpNum: int, particle_offset: ti.template(), sphere_offset: ti.template(), clump_offset: ti.template(), particle: ti.template(), 
+                              sphere: ti.template(), clump: ti.template(), particle_buffer: ti.template(), sphere_buffer: ti.template(), clump_buffer: ti.template(), particle_map: ti.template()):
+    for np in range(particleNum):
+        particle_map[np] = -1
+        if particle_offset[np + 1] > particle_offset[np]:
+            new_particle = particle_offset[np]
+            multisphereIndex = particle[np].multisphereIndex
+            particle_buffer[new_particle] = particle[np]
             if multisphereIndex < 0:
-                if int(particle[np].active) == 1:
-                    particle[remaining_particle] = particle[np]
-                    particle[remaining_particle].multisphereIndex += delete_particle
-                    sphere[remaining_sphere] = sphere[-multisphereIndex - 1]
-                    sphere[remaining_sphere].sphereIndex -= delete_particle
-                    remaining_particle += 1
-                    remaining_sphere += 1
-                else:
-                    delete_particle += 1
-        if ti.static(not clump == None):
-            if multisphereIndex >= 0:
-                if active and int(particle[np].active) == 0:
-                    active = False
-                startIndex = clump[multisphereIndex].startIndex
-                endIndex = clump[multisphereIndex].endIndex
-                if np == endIndex:
-                    pebble_num = endIndex - startIndex + 1
-                    if active:
-                        for npebble in range(pebble_num):
-                            particle[remaining_particle + npebble] = particle[np]
-                            particle[remaining_particle + npebble].multisphereIndex -= delete_particle
-                        clump[remaining_clump] = clump[multisphereIndex]
-                        clump[remaining_clump].startIndex -= delete_particle
-                        clump[remaining_clump].endIndex -= delete_particle
-                        remaining_particle += pebble_num
-                        remaining_clump += 1
-                    else:
-                        delete_particle += pebble_num
-                    active = True
-    sphereNum[0] = remaining_sphere
-    clumpNum[0] = remaining_clump
-    particleNum[0] = remaining_particle
+                particle_buffer[new_particle].multisphereIndex = -sphere_offset[-multisphereIndex - 1] - 1
+            else:
+                particle_buffer[new_particle].multisphereIndex = clump_offset[multisphereIndex]
+            particle_map[np] = new_particle
+    if ti.static(not sphere == None):
+        for nsphere in range(sphereNum):
+            if sphere_offset[nsphere + 1] > sphere_offset[nsphere]:
+                new_sphere = sphere_offset[nsphere]
+                sphere_buffer[new_sphere] = sphere[nsphere]
+                sphere_buffer[new_sphere].sphereIndex = particle_offset[sphere[nsphere].sphereIndex]
+    if ti.static(not clump == None):
+        for nclump in range(clumpNum):
+            if clump_offset[nclump + 1] > clump_offset[nclump]:
+                new_clump = clump_offset[nclump]
+                clump_buffer[new_clump] = clump[nclump]
+                clump_buffer[new_clump].startIndex = particle_offset[clump[nclump].startIndex]
+                clump_buffer[new_clump].endIndex = particle_offset[clump[nclump].endIndex]
+
+
+@ti.kernel
+def count_body_particles_(bodyNum: int, sphereNum: int, clump: ti.template(), bodyID: ti.template(), particle_offset: ti.template(), sphere_offset: ti.template()):
+    particle_offset.fill(0)
+    sphere_offset.fill(0)
+    for nb in range(bodyNum):
+        body = bodyID[nb]
+        if body < sphereNum:
+            particle_offset[nb + 1] = 1
+            sphere_offset[nb + 1] = 1
+        else:
+            if ti.static(not clump == None):
+                particle_offset[nb + 1] = clump[body - sphereNum].endIndex - clump[body - sphereNum].startIndex + 1
+
+
+@ti.kernel
+def reorder_particle_storage_(bodyNum: int, sphereNum: int, bodyID: ti.template(), particle_offset: ti.template(), sphere_offset: ti.template(), particle: ti.template(), sphere: ti.template(),
+                              clump: ti.template(), particle_buffer: ti.template(), sphere_buffer: ti.template(), clump_buffer: ti.template(), particle_map: ti.template()):
+    for nb in range(bodyNum):
+        body = bodyID[nb]
+        start = particle_offset[nb]
+        if body < sphereNum:
+            if ti.static(not sphere == None):
+                new_sphere = sphere_offset[nb]
+                np = sphere[body].sphereIndex
+                particle_buffer[start] = particle[np]
+                particle_buffer[start].multisphereIndex = -new_sphere - 1
+                sphere_buffer[new_sphere] = sphere[body]
+                sphere_buffer[new_sphere].sphereIndex = start
+                particle_map[np] = start
+        else:
+            if ti.static(not clump == None):
+                new_clump = nb - sphere_offset[nb]
+                startIndex, endIndex = clump[body - sphereNum].startIndex, clump[body - sphereNum].endIndex
+                for np in range(startIndex, endIndex + 1):
+                    particle_buffer[start + np - startIndex] = particle[np]
+                    particle_buffer[start + np - startIndex].multisphereIndex = new_clump
+                    particle_map[np] = start + np - startIndex
+                clump_buffer[new_clump] = clump[body - sphereNum]
+                clump_buffer[new_clump].startIndex = start
+                clump_buffer[new_clump].endIndex = start + endIndex - startIndex
+
+
+@ti.kernel
+def copy_storage_(objectNum: int, buffer: ti.template(), storage: ti.template()):
+    for i in range(objectNum):
+        storage[i] = buffer[i]
+
+
+@ti.kernel
+def apply_period_boundary_(sphereNum: int, clumpNum: int, particle: ti.template(), sphere: ti.template(), clump: ti.template()):
+    if ti.static(not sphere == None):
+        for nsphere in range(sphereNum):
+            np = sphere[nsphere].sphereIndex
+            particle[np].x = periodic_position(particle[np].x)
+    if ti.static(not clump == None):
+        for nclump in range(clumpNum):
+            # pebbles are shifted together with their mass center to keep the clump rigid
+            mass_center = clump[nclump].mass_center
+            shift = periodic_position(mass_center) - mass_center
+            clump[nclump].mass_center += shift
+            for np in range(clump[nclump].startIndex, clump[nclump].endIndex + 1):
+                particle[np].x += shift
 
 
 @ti.kernel
@@ -149,6 +222,15 @@ def find_particle_min_radius_(particleNum: int, particle: ti.template()) -> floa
     return min_radius
 
 
+@ti.kernel
+def find_max_velocity_(objectNum: int, object: ti.template()) -> float:
+    max_velocity = 0.
+    for nobject in range(objectNum):
+        velocity = object[nobject]._get_velocity().norm()
+        ti.atomic_max(max_velocity, velocity)
+    return max_velocity
+
+
 @ti.kernel
 def find_patch_max_radius_(wallNum: int, wall: ti.template()) -> float:
     max_radius = 0.
@@ -169,7 +251,7 @@ def find_patch_min_radius_(wallNum: int, wall: ti.template()) -> float:
 @ti.kernel
 def kernel_delete_particles(particleNum: int, particle: ti.template(), bodyID: int):
     for np in range(particleNum):
-        if particle[np].bodyID == bodyID:
+        if int(particle[np].groupID) == bodyID:
             particle[np].active = ti.u8(0)
 
 
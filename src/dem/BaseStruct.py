@@ -178,6 +178,10 @@ class ParticleFamily:          # device memory: 84B
     def _get_contact_radius(self, contact_point): return (contact_point - self.x).norm()
 
 
+# the derivatives of the acceleration and the angular acceleration carried by the Gear predictor-corrector
+GEAR_MEMBERS = {"jerk": vec3f, "snap": vec3f, "aw": vec3f, "jerk_w": vec3f, "snap_w": vec3f}
+
+
 @ti.dataclass
 class SphereFamily:            # device memory: 48B
     sphereIndex: int
@@ -198,6 +202,14 @@ class SphereFamily:            # device memory: 48B
         self.fix_v = ti.cast(fix_v, ti.u8)
         self.fix_w = ti.cast(fix_w, ti.u8)
 
+    @ti.func
+    def _restart_predictor_corrector(self, jerk, snap, aw, jerk_w, snap_w):
+        self.jerk = jerk
+        self.snap = snap
+        self.aw = aw
+        self.jerk_w = jerk_w
+        self.snap_w = snap_w
+
     @ti.func
     def _scale(self, factor):
         self.inv_I /= factor * factor * factor * factor * factor
@@ -260,6 +272,14 @@ class ClumpFamily:            # device memory: 84B
         self.angmoment = angmoment
         self.inv_I = inv_I
 
+    @ti.func
+    def _restart_predictor_corrector(self, jerk, snap, aw, jerk_w, snap_w):
+        self.jerk = jerk
+        self.snap = snap
+        self.aw = aw
+        self.jerk_w = jerk_w
+        self.snap_w = snap_w
+
     @ti.func
     def _scale(self, factor):
         self.m *= factor * factor * factor
@@ -1087,6 +1107,14 @@ class RigidBody:
         self.inv_I = float(inv_I)
         self.is_fix = ti.cast(is_fix, ti.u8)
 
+    @ti.func
+    def _restart_predictor_corrector(self, jerk, snap, aw, jerk_w, snap_w):
+        self.jerk = float(jerk)
+        self.snap = float(snap)
+        self.aw = float(aw)
+        self.jerk_w = float(jerk_w)
+        self.snap_w = float(snap_w)
+
     @ti.func
     def _add_body_attribute(self, centor_of_mass, mass, equiv_rad, inv_inertia, q):
         self.mass_center = float(centor_of_mass)
@@ -1738,6 +1766,43 @@ class CoupledContactTable:
         self.oldTangOverlap = ZEROVEC3f
 
 
+@ti.dataclass
+class FluidCell:
+    solid_volume: float
+    fluid_mass: float
+    fluid_volume: float
+    viscous_mass: float
+    momentum: vec3f
+    reaction: vec3f
+
+    @ti.func
+    def _reset_fluid(self):
+        self.fluid_mass = 0.
+        self.fluid_volume = 0.
+        self.viscous_mass = 0.
+        self.momentum = ZEROVEC3f
+        self.reaction = ZEROVEC3f
+
+    @ti.func
+    def _reset_solid(self):
+        self.solid_volume = 0.
+
+    @ti.func
+    def _update_fluid(self, mass, volume, viscosity, velocity):
+        self.fluid_mass += mass
+        self.fluid_volume += volume
+        self.viscous_mass += mass * viscosity
+        self.momentum += mass * velocity
+
+    @ti.func
+    def _update_solid(self, volume):
+        self.solid_volume += volume
+
+    @ti.func
+    def _update_reaction(self, force):
+        self.reaction += force
+
+
 @ti.dataclass
 class CoupledRollingContactTable:
     endID1: int
@@ -8,8 +8,11 @@ from src.dem.GenerateManager import GenerateManager
 from src.dem.Recorder import WriteFile
 from src.dem.SceneManager import myScene
 from src.dem.Simulation import Simulation
+from src.utils.AdaptiveTimestep import AdaptiveTimestep
 from src.utils.constants import Threshold
+from src.utils.linalg import no_operation
 from src.utils.ObjectIO import DictIO
+from src.utils.TimeTicker import Profiler
 from src.utils.TypeDefination import vec3f
 
 
@@ -35,6 +38,11 @@ class Solver(object):
         self.calm_interval = 0
         self.last_calm = 0
         self.postprocess = []
+        self.profiler = None
+
+        self.update_timestep = no_operation
+        self.print_timestep = no_operation
+        self.timestepper = None
     
     def set_callback_function(self, functions):
         if not functions is None:
@@ -54,8 +62,25 @@ class Solver(object):
 
     def save_file(self, scene):
         print('# Step =', self.sims.current_step, '   ', 'Save Number =', self.sims.current_print, '   ', 'Simulation time =', self.sims.current_time, '\n')
+        self.print_timestep()
         self.recorder.output(self.sims, scene)
 
+    def timestep_initialize(self):
+        self.update_timestep = no_operation
+        self.print_timestep = no_operation
+        if self.sims.isadaptive:
+            self.update_timestep = self.adaptive_timestep
+            self.print_timestep = self.print_adaptive_timestep
+            # the following saves are scheduled from the current time, the steps are cut to land on them
+            self.last_save_time = 1. * self.sims.current_time
+            self.timestepper = AdaptiveTimestep(self.sims, self.engine, self.sims.adaptive_interval)
+
+    def adaptive_timestep(self, scene: myScene):
+        self.timestepper.update(scene, self.last_save_time)
+
+    def print_adaptive_timestep(self):
+        self.timestepper.print_info()
+
     def Solver(self, scene: myScene):
         print("#", " Start Simulation ".center(67,"="), "#")
         if self.sims.current_time < Threshold:
@@ -64,9 +89,14 @@ class Solver(object):
             self.last_save_time = -0.8 * self.sims.delta
 
         self.engine.pre_calculation(self.sims, scene, self.contact.neighbor)
+        self.timestep_initialize()
+        self.start_profiler(scene)
         start_time = time.time()
         while self.sims.current_time <= self.sims.time:
+            self.update_timestep(scene)
             self.core(scene)
+            if self.profiler is not None:
+                self.profiler.step()
 
             new_body = self.generator.regenerate(scene)
             if self.sims.current_time - self.last_save_time + 0.1 * self.sims.delta > self.sims.save_interval or new_body:
@@ -87,9 +117,27 @@ class Solver(object):
             self.last_save_time = 1. * self.sims.current_time
             self.sims.current_print += 1
 
+        self.recorder.flush()
+        self.finish_profiler()
+        self.print_timestep()
         print('Physical time = ', end_time - start_time)
         print("#", " End Simulation ".center(67,"="), "#", '\n')
 
+    def start_profiler(self, scene: myScene):
+        if self.sims.profile:
+            self.profiler = Profiler(self.sims.profile_interval)
+            instrument_dem(self.profiler, self.sims, scene, self.engine, self.contact.neighbor, self.contact.physpp, self.contact.physpw)
+            self.profiler.instrument(self.recorder, "output", "output")
+            self.profiler.start()
+
+    def finish_profiler(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.restore()
+            self.profiler.print_table()
+            self.profiler.dump(self.sims.path + "/profile.json")
+            self.profiler = None
+
     def Visualize(self, scene: myScene):
         print("#", " Start Simulation ".center(67,"="), "#")
 
@@ -127,8 +175,10 @@ class Solver(object):
             self.last_save_time = -0.8 * self.sims.delta
 
         self.engine.pre_calculation(self.sims, scene, self.contact.neighbor)
+        self.timestep_initialize()
         start_time = time.time()
         while window.running:
+            self.update_timestep(scene)
             self.core(scene)
             
             new_body = self.generator.regenerate(scene)
@@ -164,6 +214,7 @@ class Solver(object):
             self.last_save_time = 1. * self.sims.current_time
             self.sims.current_print += 1
 
+        self.recorder.flush()
         print('Physical time = ', end_time - start_time)
         print("#", " End Simulation ".center(67,"="), "#", '\n')
 
@@ -177,3 +228,33 @@ class Solver(object):
     
 
     
+
+
+def instrument_dem(profiler: Profiler, sims: Simulation, scene: myScene, engine: ExplicitEngine, neighbor, physpp, physpw, prefix=""):
+    profiler.instrument(engine, "reset_wall_message", prefix + "reset")
+    profiler.instrument(engine, "reset_particle_message", prefix + "reset")
+    profiler.instrument(engine, "is_verlet_update", prefix + "verlet check", after=lambda update: profiler.count(prefix + "verlet rebuilds", update == 1))
+    profiler.instrument(engine, "is_verlet_update_point", prefix + "verlet check", after=lambda update: profiler.count(prefix + "point verlet rebuilds", update == 1))
+    profiler.instrument(engine, "reorder", prefix + "reorder")
+    profiler.instrument(engine.verlet_tuner, "update", prefix + "verlet check", after=lambda _: profiler.gauge(prefix + "verlet distance", sims.verlet_distance))
+    profiler.instrument(scene, "apply_boundary_conditions", prefix + "boundary")
+    profiler.instrument(neighbor, "update_verlet_table", prefix + "neighbor rebuild")
+    profiler.instrument(neighbor, "update_point_verlet_table", prefix + "neighbor rebuild")
+    profiler.instrument(physpp, "update_verlet_particle_particle_tables", prefix + "neighbor rebuild")
+    profiler.instrument(physpw, "update_verlet_particle_wall_tables", prefix + "neighbor rebuild")
+    profiler.instrument(neighbor, "update_particle_particle_auxiliary_lists", prefix + "contact table")
+    profiler.instrument(neighbor, "update_particle_wall_auxiliary_lists", prefix + "contact table")
+    if sims.scheme == "DEM" and physpp.cplist is not None and sims.max_particle_num > 1:
+        # share of the preallocated contact list filled after a rebuild, the rest is the headroom of /compaction_ratio/
+        profiler.instrument(physpp, "update_contact_table", prefix + "contact table",
+                            after=lambda _: profiler.gauge(prefix + "particle-particle list usage", neighbor.particle_particle[int(scene.particleNum[0])] / physpp.cplist.shape[0]))
+    else:
+        profiler.instrument(physpp, "update_contact_table", prefix + "contact table")
+    if sims.scheme == "DEM" and physpw.cplist is not None and sims.max_wall_num > 0 and sims.wall_type != 3:
+        profiler.instrument(physpw, "update_contact_table", prefix + "contact table",
+                            after=lambda _: profiler.gauge(prefix + "particle-wall list usage", neighbor.particle_wall[int(scene.particleNum[0])] / physpw.cplist.shape[0]))
+    else:
+        profiler.instrument(physpw, "update_contact_table", prefix + "contact table")
+    profiler.instrument(physpp, "resolve", prefix + "resolve")
+    profiler.instrument(physpw, "resolve", prefix + "resolve")
+    profiler.instrument(engine, "integration", prefix + "integration")
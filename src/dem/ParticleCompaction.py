@@ -0,0 +1,57 @@
+import taichi as ti
+
+from src.dem.BaseKernel import count_remaining_particles_, compact_particle_storage_, copy_storage_
+from src.dem.BaseStruct import ParticleFamily, SphereFamily, ClumpFamily
+from src.dem.Simulation import Simulation
+from src.utils.PrefixSum import PrefixSumExecutor
+
+
+class ParticleCompaction(object):
+    sims: Simulation
+
+    def __init__(self, sims: Simulation) -> None:
+        self.sims = sims
+        self.particle_pse = None
+        self.sphere_pse = None
+        self.clump_pse = None
+        self.particle_offset = None
+        self.sphere_offset = None
+        self.clump_offset = None
+        self.particle_map = None
+        self.particle_buffer = None
+        self.sphere_buffer = None
+        self.clump_buffer = None
+        self.compaction_initialize()
+
+    def compaction_initialize(self):
+        self.particle_pse = PrefixSumExecutor(self.sims.max_particle_num + 1)
+        self.sphere_pse = PrefixSumExecutor(self.sims.max_sphere_num + 1)
+        self.clump_pse = PrefixSumExecutor(self.sims.max_clump_num + 1)
+        self.particle_offset = ti.field(int, shape=self.particle_pse.get_length())
+        self.sphere_offset = ti.field(int, shape=self.sphere_pse.get_length())
+        self.clump_offset = ti.field(int, shape=self.clump_pse.get_length())
+        self.particle_map = ti.field(int, shape=max(self.sims.max_particle_num, 1))
+        self.particle_buffer = ParticleFamily.field(shape=max(self.sims.max_particle_num, 1))
+        if self.sims.max_sphere_num > 0:
+            self.sphere_buffer = SphereFamily.field(shape=self.sims.max_sphere_num)
+        if self.sims.max_clump_num > 0:
+            self.clump_buffer = ClumpFamily.field(shape=self.sims.max_clump_num)
+
+    def compact(self, scene):
+        # the remaining bodies keep their order, particle_map holds the new index of each particle (-1 once removed) for the contact history
+        particleNum, sphereNum, clumpNum = int(scene.particleNum[0]), int(scene.sphereNum[0]), int(scene.clumpNum[0])
+        count_remaining_particles_(particleNum, sphereNum, clumpNum, scene.particle, scene.sphere, scene.clump, self.particle_offset, self.sphere_offset, self.clump_offset)
+        self.particle_pse.run(self.particle_offset)
+        self.sphere_pse.run(self.sphere_offset)
+        self.clump_pse.run(self.clump_offset)
+        compact_particle_storage_(particleNum, sphereNum, clumpNum, self.particle_offset, self.sphere_offset, self.clump_offset, scene.particle, scene.sphere, scene.clump,
+                                  self.particle_buffer, self.sphere_buffer, self.clump_buffer, self.particle_map)
+
+        remaining_particle, remaining_sphere, remaining_clump = self.particle_offset[particleNum], self.sphere_offset[sphereNum], self.clump_offset[clumpNum]
+        copy_storage_(remaining_particle, self.particle_buffer, scene.particle)
+        if remaining_sphere > 0:
+            copy_storage_(remaining_sphere, self.sphere_buffer, scene.sphere)
+        if remaining_clump > 0:
+            copy_storage_(remaining_clump, self.clump_buffer, scene.clump)
+        scene.particleNum[0], scene.sphereNum[0], scene.clumpNum[0] = remaining_particle, remaining_sphere, remaining_clump
+        return sphereNum - remaining_sphere, clumpNum - remaining_clump
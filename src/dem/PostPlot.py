@@ -3,7 +3,9 @@ import numpy as np
 
 from src.dem.BaseKernel import kernel_postvisualize_surface_
 from src.dem.Simulation import Simulation
+from src.utils.ChunkedStore import frame_exists, load_frame
 from src.utils.ObjectIO import DictIO
+from src.utils.SparseContact import read_sparse_contact
 from third_party.pyevtk.hl import pointsToVTK, unstructuredGridToVTK
 from third_party.pyevtk.vtk import VtkTriangle
 
@@ -27,10 +29,10 @@ def write_dem_vtk_file(sims: Simulation, start_file, end_file, read_path, write_
     for printNum in range(start_file, end_file):
         data = {}
         particle_file = read_path + "/particles/DEMParticle{0:06d}.npz".format(printNum)
-        if not os.access(particle_file, os.F_OK): continue
+        if not frame_exists(particle_file): continue
 
         print((" DEM Postprocessing: Output VTK File" + str(printNum) + ' ').center(71, '-'))
-        particle_info = np.load(particle_file, allow_pickle=True)
+        particle_info = load_frame(particle_file)
         
         if printNum == start_file:
             position0 = np.ascontiguousarray(DictIO.GetEssential(particle_info, "position"))
@@ -85,8 +87,8 @@ def write_lsdem_vtk_file(sims: Simulation, start_file, end_file, read_path, writ
     surface_num = 0
     for printNum in range(start_file, end_file):
         surface_file = read_path + "/particles/LSDEMSurface{0:06d}.npz".format(printNum)
-        if not os.access(surface_file, os.F_OK): continue
-        surface_info = np.load(surface_file, allow_pickle=True)
+        if not frame_exists(surface_file): continue
+        surface_info = load_frame(surface_file)
         surface_num = max(int(DictIO.GetEssential(surface_info, "surface_num")), surface_num)
     vertices = ti.Vector.field(3, float, shape=surface_num)
 
@@ -94,11 +96,11 @@ def write_lsdem_vtk_file(sims: Simulation, start_file, end_file, read_path, writ
         data = {}
         particle_file = read_path + "/particles/LSDEMRigid{0:06d}.npz".format(printNum)
         surface_file = read_path + "/particles/LSDEMSurface{0:06d}.npz".format(printNum)
-        if not os.access(particle_file, os.F_OK) or not os.access(surface_file, os.F_OK): continue
+        if not frame_exists(particle_file) or not frame_exists(surface_file): continue
 
         print((" LSDEM Postprocessing: Output VTK File" + str(printNum) + ' ').center(71, '-'))
-        particle_info = np.load(particle_file, allow_pickle=True)
-        surface_info = np.load(surface_file, allow_pickle=True)
+        particle_info = load_frame(particle_file)
+        surface_info = load_frame(surface_file)
 
         if printNum == start_file:
             position0 = np.ascontiguousarray(DictIO.GetEssential(particle_info, "mass_center"))
@@ -173,7 +175,7 @@ def PlotBoundings(printNum, read_path, write_path, kwargs):
 
 def PlotWalls(sims: Simulation, printNum, read_path, write_path, kwargs):
     if DictIO.GetAlternative(kwargs, "write_wall", False):
-        wall_info = np.load(read_path + "/walls/DEMWall{0:06d}.npz".format(printNum))
+        wall_info = load_frame(read_path + "/walls/DEMWall{0:06d}.npz".format(printNum))
         if sims.wall_type == "Plane":
             pass
         elif sims.wall_type == "Facet" or sims.wall_type == "Patch":
@@ -203,11 +205,17 @@ def PointonPlan(wall_info, position, wall_id):
     return position - np.dot(position - point, norm) * norm
 
 
+def load_contact(contact_path, printNum):
+    if frame_exists(contact_path + "{0:06d}.npz".format(printNum)):
+        return load_frame(contact_path + "{0:06d}.npz".format(printNum))
+    return read_sparse_contact(contact_path + "Sparse", printNum)
+
+
 def PlotForceChains(position, printNum, read_path, write_path, kwargs):
     if DictIO.GetAlternative(kwargs, "write_force_chain", False):
-        wall_info = np.load(read_path + "/walls/DEMWall{0:06d}.npz".format(printNum))
-        ppcontact_info = np.load(read_path + "/contacts/DEMContactPP{0:06d}.npz".format(printNum))
-        pwcontact_info = np.load(read_path + "/contacts/DEMContactPW{0:06d}.npz".format(printNum))
+        wall_info = load_frame(read_path + "/walls/DEMWall{0:06d}.npz".format(printNum))
+        ppcontact_info = load_contact(read_path + "/contacts/DEMContactPP", printNum)
+        pwcontact_info = load_contact(read_path + "/contacts/DEMContactPW", printNum)
 
         outContactFile = open(write_path+f'/GraphicForceChain{printNum:06d}.vtp', 'w')
         selectpp = np.linalg.norm(DictIO.GetEssential(ppcontact_info, "normal_force") ,axis=1) > 0.
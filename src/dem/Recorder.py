@@ -2,10 +2,14 @@ import os
 
 import numpy as np
 
+from src.dem.BaseStruct import GEAR_MEMBERS
 from src.dem.SceneManager import myScene
 from src.dem.contact.ContactModelBase import ContactModelBase 
 from src.dem.neighbor.NeighborBase import NeighborBase
 from src.dem.Simulation import Simulation
+from src.utils.AsyncWriter import AsyncWriter, SnapshotBuffer
+from src.utils.ChunkedStore import ChunkedStore
+from src.utils.SparseContact import SparseContactEncoder
 from third_party.pyevtk.hl import pointsToVTK, gridToVTK, unstructuredGridToVTK
 from third_party.pyevtk.vtk import VtkTriangle, VtkQuad
 
@@ -24,6 +28,11 @@ class WriteFile:
         self.wall_path = None
         self.contact_path = None
         self.output = None
+        self.writer = None
+        self.savez = np.savez
+        self.particle_snapshot = None
+        self.ppcontact_encoder = None
+        self.pwcontact_encoder = None
 
         self.save_particle = self.no_operation
         self.save_sphere = self.no_operation
@@ -62,6 +71,11 @@ class WriteFile:
         pass
 
     def manage_function(self, sims: Simulation):
+        if sims.async_output and self.writer is None:
+            self.writer = AsyncWriter(sims.output_queue_size)
+        if sims.output_format == "chunked" and self.savez is np.savez:
+            self.savez = ChunkedStore(sims.output_compression, sims.output_downcast).savez
+
         if sims.scheme == "DEM":
             self.visualizeParticle = self.no_visualizeDEM
             if sims.visualize:
@@ -69,6 +83,8 @@ class WriteFile:
             self.output = self.outputDEM
             if sims.max_particle_num > 0 and 'particle' in sims.monitor_type:
                 self.save_particle = self.MonitorParticle
+                if sims.async_output:
+                    self.save_particle = self.MonitorParticleAsync
             if sims.max_sphere_num > 0 and 'sphere' in sims.monitor_type:
                 self.save_sphere = self.MonitorSphere
             if sims.max_clump_num > 0 and 'clump' in sims.monitor_type:
@@ -103,8 +119,20 @@ class WriteFile:
         
         if sims.max_particle_num > 1. and 'ppcontact' in sims.monitor_type:
             self.save_ppcontact = self.MonitorPPContact
+            if sims.contact_output == "Sparse":
+                self.save_ppcontact = self.MonitorPPContactSparse
+                if self.ppcontact_encoder is None:
+                    self.ppcontact_encoder = SparseContactEncoder(sims.keyframe_interval)
         if sims.max_particle_num > 0. and sims.max_wall_num > 0. and 'pwcontact' in sims.monitor_type:
             self.save_pwcontact = self.MonitorPWContact
+            if sims.contact_output == "Sparse":
+                self.save_pwcontact = self.MonitorPWContactSparse
+                if self.pwcontact_encoder is None:
+                    self.pwcontact_encoder = SparseContactEncoder(sims.keyframe_interval)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
 
     def outputWall(self, sims: Simulation, scene: myScene):
         self.save_wall(sims, scene)
@@ -129,13 +157,13 @@ class WriteFile:
         self.outputWall(sims, scene)
         self.ouptutContact(sims, scene)
 
-    def VisualizeDEM(self, sims: Simulation, position, bodyID, groupID, rad):
+    def VisualizeDEM(self, current_print, position, bodyID, groupID, rad):
         posx = np.ascontiguousarray(position[:, 0])
         posy = np.ascontiguousarray(position[:, 1])
         posz = np.ascontiguousarray(position[:, 2])
-        pointsToVTK(self.vtk_path+f'/GraphicDEMParticle{sims.current_print:06d}', posx, posy, posz, data={'bodyID': bodyID, 'group': groupID, "radius": rad})
+        pointsToVTK(self.vtk_path+f'/GraphicDEMParticle{current_print:06d}', posx, posy, posz, data={'bodyID': bodyID, 'group': groupID, "radius": rad})
 
-    def no_visualizeDEM(self, sims, position, bodyID, groupID, rad): pass
+    def no_visualizeDEM(self, current_print, position, bodyID, groupID, rad): pass
 
     def VisualizePlane(self, sims: Simulation, scene: myScene):    
         point = np.ascontiguousarray(scene.wall.point.to_numpy()[0:scene.wallNum[0]])
@@ -247,7 +275,7 @@ class WriteFile:
         omega = np.ascontiguousarray(scene.particle.w.to_numpy()[0: particle_num])
         contact_force = np.ascontiguousarray(scene.particle.contact_force.to_numpy()[0: particle_num])
         contact_torque = np.ascontiguousarray(scene.particle.contact_torque.to_numpy()[0: particle_num])
-        self.visualizeParticle(sims, position, Index, groupID, radius)
+        self.visualizeParticle(sims.current_print, position, Index, groupID, radius)
         output = {'t_current': sims.current_time, 'body_num': particle_num, 'active': active,
                   'Index': Index, 'groupID': groupID, 'materialID': materialID, 'mass': mass, 'radius': radius,
                   'position': position, 'velocity': velocity, 'omega': omega, 'contact_force': contact_force, 'contact_torque': contact_torque}
@@ -256,7 +284,27 @@ class WriteFile:
             friction_energy = np.ascontiguousarray(scene.particle.friction_energy.to_numpy()[0: particle_num])
             damp_energy = np.ascontiguousarray(scene.particle.damp_energy.to_numpy()[0: particle_num])
             output.update({"elastic_energy": elastic_energy, "friction_energy": friction_energy, "damp_energy": damp_energy})
-        np.savez(self.particle_path+f'/DEMParticle{sims.current_print:06d}', **output)
+        self.savez(self.particle_path+f'/DEMParticle{sims.current_print:06d}', **output)
+
+    def MonitorParticleAsync(self, sims: Simulation, scene: myScene):
+        particle_num = scene.particleNum[0]
+        if self.particle_snapshot is None:
+            members = ['active', 'multisphereIndex', 'groupID', 'materialID', 'm', 'rad', 'x', 'v', 'w', 'contact_force', 'contact_torque']
+            if sims.energy_tracking:
+                members += ['elastic_energy', 'friction_energy', 'damp_energy']
+            self.particle_snapshot = SnapshotBuffer(scene.particle, members)
+        snapshot = self.particle_snapshot.snapshot(particle_num)
+        self.writer.submit(self.WriteParticle, sims.current_print, sims.current_time, particle_num, snapshot)
+
+    def WriteParticle(self, current_print, current_time, particle_num, snapshot):
+        data = snapshot.collect()
+        output = {'t_current': current_time, 'body_num': particle_num, 'active': data['active'],
+                  'Index': data['multisphereIndex'], 'groupID': data['groupID'], 'materialID': data['materialID'], 'mass': data['m'], 'radius': data['rad'],
+                  'position': data['x'], 'velocity': data['v'], 'omega': data['w'], 'contact_force': data['contact_force'], 'contact_torque': data['contact_torque']}
+        if 'elastic_energy' in data:
+            output.update({"elastic_energy": data['elastic_energy'], "friction_energy": data['friction_energy'], "damp_energy": data['damp_energy']})
+        self.visualizeParticle(current_print, output['position'], output['Index'], output['groupID'], output['radius'])
+        self.savez(self.particle_path+f'/DEMParticle{current_print:06d}', **output)
     
     def MonitorSphere(self, sims: Simulation, scene: myScene):    
         sphere_num = scene.sphereNum[0]
@@ -267,9 +315,11 @@ class WriteFile:
         angmoment = np.ascontiguousarray(scene.sphere.angmoment.to_numpy()[0: sphere_num])
         fix_v = np.ascontiguousarray(scene.sphere.fix_v.to_numpy()[0: sphere_num])
         fix_w = np.ascontiguousarray(scene.sphere.fix_w.to_numpy()[0: sphere_num])
-        np.savez(self.particle_path+f'/DEMSphere{sims.current_print:06d}', t_current=sims.current_time, body_num = sphere_num, 
-                                                                                Index=Index, inverseInertia=inverseInertia, quanternion=quanternion, 
-                                                                                acceleration=a, angular_moment=angmoment, fix_v=fix_v, fix_w=fix_w)
+        output = {'t_current': sims.current_time, 'body_num': sphere_num, 'Index': Index, 'inverseInertia': inverseInertia, 'quanternion': quanternion, 
+                  'acceleration': a, 'angular_moment': angmoment, 'fix_v': fix_v, 'fix_w': fix_w}
+        if sims.engine == "PredictCorrector":
+            output.update(self.GearState(scene.sphere, sphere_num))
+        self.savez(self.particle_path+f'/DEMSphere{sims.current_print:06d}', **output)
         
     def MonitorClump(self, sims: Simulation, scene: myScene):        
         clump_num = scene.clumpNum[0]
@@ -285,9 +335,12 @@ class WriteFile:
         angular_moment = np.ascontiguousarray(scene.clump.angmoment.to_numpy()[0: clump_num])
         quanternion = np.ascontiguousarray(scene.clump.q.to_numpy()[0: clump_num])
         inverse_inertia = np.ascontiguousarray(scene.clump.inv_I.to_numpy()[0: clump_num])
-        np.savez(self.particle_path+f'/DEMClump{sims.current_print:06d}', t_current=sims.current_time, body_num = clump_num, 
-                                                                                startIndex=startIndex, endIndex=endIndex, mass=mass, equivalentRadius=equivalentRadius, centerOfMass=centerOfMass,
-                                                                                acceleration=acceleration, angular_moment=angular_moment, velocity=velocity, omega=omega, quanternion=quanternion, inverse_inertia=inverse_inertia)
+        output = {'t_current': sims.current_time, 'body_num': clump_num, 'startIndex': startIndex, 'endIndex': endIndex, 'mass': mass, 'equivalentRadius': equivalentRadius, 
+                  'centerOfMass': centerOfMass, 'acceleration': acceleration, 'angular_moment': angular_moment, 'velocity': velocity, 'omega': omega, 
+                  'quanternion': quanternion, 'inverse_inertia': inverse_inertia}
+        if sims.engine == "PredictCorrector":
+            output.update(self.GearState(scene.clump, clump_num))
+        self.savez(self.particle_path+f'/DEMClump{sims.current_print:06d}', **output)
 
     def MonitorLSBody(self, sims: Simulation, scene: myScene):
         body_num = scene.particleNum[0]
@@ -317,19 +370,25 @@ class WriteFile:
             friction_energy = np.ascontiguousarray(scene.rigid.friction_energy.to_numpy()[0: body_num])
             damp_energy = np.ascontiguousarray(scene.rigid.damp_energy.to_numpy()[0: body_num])
             output.update({"elastic_energy": elastic_energy, "friction_energy": friction_energy, "damp_energy": damp_energy})
-        np.savez(self.particle_path+f'/LSDEMRigid{sims.current_print:06d}', **output)
+        if sims.engine == "PredictCorrector":
+            output.update(self.GearState(scene.rigid, body_num))
+        self.savez(self.particle_path+f'/LSDEMRigid{sims.current_print:06d}', **output)
+
+    def GearState(self, body, body_num):
+        # the derivatives the predictor-corrector needs to continue from a restart without a start-up transient
+        return {member: np.ascontiguousarray(getattr(body, member).to_numpy()[0: body_num]) for member in GEAR_MEMBERS}
 
     def MonitorLSGrid(self, sims: Simulation, scene: myScene):
         grid_num = scene.gridID[len(scene.gridID)]
         distance_field = np.ascontiguousarray(scene.rigid_grid.distance_field.to_numpy()[0: grid_num])
-        np.savez(self.particle_path+f'/LSDEMGrid{sims.current_print:06d}', t_current=sims.current_time, grid_num=grid_num, distance_field=distance_field)
+        self.savez(self.particle_path+f'/LSDEMGrid{sims.current_print:06d}', t_current=sims.current_time, grid_num=grid_num, distance_field=distance_field)
 
     def MonitorLSBounding(self, sims: Simulation, scene: myScene):
         body_num = scene.particleNum[0]
         active = np.ascontiguousarray(scene.particle.active.to_numpy()[0: body_num])
         radius = np.ascontiguousarray(scene.particle.rad.to_numpy()[0: body_num])
         center = np.ascontiguousarray(scene.particle.x.to_numpy()[0: body_num])
-        np.savez(self.particle_path+f'/LSDEMBoundingSphere{sims.current_print:06d}', t_current=sims.current_time, body_num=body_num, active=active, radius=radius, center=center)
+        self.savez(self.particle_path+f'/LSDEMBoundingSphere{sims.current_print:06d}', t_current=sims.current_time, body_num=body_num, active=active, radius=radius, center=center)
 
         min_box = np.ascontiguousarray(scene.box.xmin.to_numpy()[0: body_num])
         max_box = np.ascontiguousarray(scene.box.xmax.to_numpy()[0: body_num])
@@ -338,7 +397,7 @@ class WriteFile:
         grid_space = np.ascontiguousarray(scene.box.grid_space.to_numpy()[0: body_num])
         scale = np.ascontiguousarray(scene.box.scale.to_numpy()[0: body_num])
         extent = np.ascontiguousarray(scene.box.extent.to_numpy()[0: body_num])
-        np.savez(self.particle_path+f'/LSDEMBoundingBox{sims.current_print:06d}', t_current=sims.current_time, body_num=body_num, min_box=min_box, max_box=max_box, startGrid=startGrid, 
+        self.savez(self.particle_path+f'/LSDEMBoundingBox{sims.current_print:06d}', t_current=sims.current_time, body_num=body_num, min_box=min_box, max_box=max_box, startGrid=startGrid, 
                                                                                   grid_num=grid_num, grid_space=grid_space, scale=scale, extent=extent)
 
     def MonitorLSSurface(self, sims: Simulation, scene: myScene):
@@ -349,7 +408,7 @@ class WriteFile:
         parameters = np.ascontiguousarray(scene.vertice.parameter.to_numpy()[0: node_num])
         connectivity = np.ascontiguousarray(scene.connectivity)
         self.visualizeParticle(sims, scene)
-        np.savez(self.particle_path+f'/LSDEMSurface{sims.current_print:06d}', t_current=sims.current_time, surface_num=surface_num, master=master, vertices=vertices, parameters=parameters, connectivity=connectivity)
+        self.savez(self.particle_path+f'/LSDEMSurface{sims.current_print:06d}', t_current=sims.current_time, surface_num=surface_num, master=master, vertices=vertices, parameters=parameters, connectivity=connectivity)
 
     def MonitorPlane(self, sims: Simulation, scene: myScene):  
         active = np.ascontiguousarray(scene.wall.active.to_numpy()[0: scene.wallNum[0]])
@@ -357,7 +416,7 @@ class WriteFile:
         materialID = np.ascontiguousarray(scene.wall.materialID.to_numpy()[0:scene.wallNum[0]])
         point = np.ascontiguousarray(scene.wall.point.to_numpy()[0:scene.wallNum[0]])
         norm = np.ascontiguousarray(scene.wall.norm.to_numpy()[0:scene.wallNum[0]])
-        np.savez(self.wall_path+f'/DEMWall{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.wallNum[0], active=active,
+        self.savez(self.wall_path+f'/DEMWall{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.wallNum[0], active=active,
                                                                      wallID=wallID, materialID=materialID, point=point, norm=norm)
 
     def MonitorServo(self, sims: Simulation, scene: myScene):  
@@ -367,7 +426,7 @@ class WriteFile:
         alpha = np.ascontiguousarray(scene.servo.alpha.to_numpy()[0:scene.servoNum[0]])
         target_stress = np.ascontiguousarray(scene.servo.target_stress.to_numpy()[0:scene.servoNum[0]])
         max_velocity = np.ascontiguousarray(scene.servo.max_velocity.to_numpy()[0:scene.servoNum[0]])
-        np.savez(self.wall_path+f'/DEMServo{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.servoNum[0], active=active,
+        self.savez(self.wall_path+f'/DEMServo{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.servoNum[0], active=active,
                                                                       startIndex=startIndex, endIndex=endIndex, alpha=alpha, target_stress=target_stress, max_velocity=max_velocity)    
 
     def MonitorFacet(self, sims: Simulation, scene: myScene):    
@@ -381,7 +440,7 @@ class WriteFile:
         velocity = np.ascontiguousarray(scene.wall.v.to_numpy()[0: scene.wallNum[0]])
         contact_force = np.ascontiguousarray(scene.wall.contact_force.to_numpy()[0: scene.wallNum[0]])
         self.visualizeWall(sims, point1, point2, point3)
-        np.savez(self.wall_path+f'/DEMWall{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.wallNum[0], active=active,
+        self.savez(self.wall_path+f'/DEMWall{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.wallNum[0], active=active,
                                                                      wallID=wallID, materialID=materialID, point1=point1, point2=point2, point3=point3, 
                                                                      norm=norm, velocity=velocity, contact_force=contact_force)
 
@@ -394,13 +453,29 @@ class WriteFile:
         point3 = np.ascontiguousarray(scene.wall.vertice3.to_numpy()[0: scene.wallNum[0]])
         norm = np.ascontiguousarray(scene.wall.norm.to_numpy()[0: scene.wallNum[0]])
         self.visualizeWall(sims, point1, point2, point3)
-        np.savez(self.wall_path+f'/DEMWall{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.wallNum[0], active=active,
+        self.savez(self.wall_path+f'/DEMWall{sims.current_print:06d}', t_current=sims.current_time, body_num=scene.wallNum[0], active=active,
                                                                      wallID=wallID, materialID=materialID, point1=point1, point2=point2, point3=point3, norm=norm)
     
     def MonitorPPContact(self, sims: Simulation, scene: myScene): 
-        self.physpp.get_ppcontact_output(self.contact_path+'/DEMContactPP', sims.current_time, sims.current_print, scene, self.pcontact)
+        self.physpp.get_ppcontact_output(self.contact_path+'/DEMContactPP', sims.current_time, sims.current_print, scene, self.pcontact, self.savez)
 
     def MonitorPWContact(self, sims: Simulation, scene: myScene): 
-        self.physpw.get_pwcontact_output(self.contact_path+'/DEMContactPW', sims.current_time, sims.current_print, scene, self.pcontact)
+        self.physpw.get_pwcontact_output(self.contact_path+'/DEMContactPW', sims.current_time, sims.current_print, scene, self.pcontact, self.savez)
+
+    def is_restart_frame(self, sims: Simulation):
+        return sims.restart_interval > 0 and sims.current_print % sims.restart_interval == 0
+
+    def MonitorPPContactSparse(self, sims: Simulation, scene: myScene): 
+        if self.is_restart_frame(sims):
+            # restart-grade dump, which also starts a new chain of delta-encoded frames
+            self.MonitorPPContact(sims, scene)
+            self.ppcontact_encoder.reset()
+        self.physpp.get_ppcontact_output(self.contact_path+'/DEMContactPP', sims.current_time, sims.current_print, scene, self.pcontact, self.savez, self.ppcontact_encoder)
+
+    def MonitorPWContactSparse(self, sims: Simulation, scene: myScene): 
+        if self.is_restart_frame(sims):
+            self.MonitorPWContact(sims, scene)
+            self.pwcontact_encoder.reset()
+        self.physpw.get_pwcontact_output(self.contact_path+'/DEMContactPW', sims.current_time, sims.current_print, scene, self.pcontact, self.savez, self.pwcontact_encoder)
     
     
\ No newline at end of file
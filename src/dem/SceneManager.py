@@ -4,6 +4,7 @@ import numpy as np
 from src.dem.BaseStruct import *
 from src.dem.Simulation import Simulation
 from src.dem.BaseKernel import *
+from src.dem.ParticleCompaction import ParticleCompaction
 from src.sdf.BasicShape import BasicShape
 from src.utils.DomainBoundary import DomainBoundary
 from src.utils.linalg import no_operation
@@ -23,6 +24,7 @@ class myScene(object):
 
     def __init__(self) -> None:
         self.domain_boundary = None
+        self.compaction = None
         self.particle = None
         self.clump = None
         self.sphere = None
@@ -104,13 +106,19 @@ class myScene(object):
         if self.sphere is None:
             if self.particle is None:
                 self.activate_particle(sims)
-            self.sphere = SphereFamily.field(shape=sims.max_sphere_num)
+            stemp = SphereFamily
+            if sims.engine == "PredictCorrector":
+                stemp.members.update(GEAR_MEMBERS)
+            self.sphere = stemp.field(shape=sims.max_sphere_num)
 
     def activate_clump(self, sims: Simulation):
         if self.clump is None:
             if self.particle is None:
                 self.activate_particle(sims)
-            self.clump = ClumpFamily.field(shape=sims.max_clump_num)
+            ctemp = ClumpFamily
+            if sims.engine == "PredictCorrector":
+                ctemp.members.update(GEAR_MEMBERS)
+            self.clump = ctemp.field(shape=sims.max_clump_num)
 
     def activate_levelset_grid(self, sims: Simulation):
         if sims.max_level_grid_num > 0:
@@ -126,6 +134,8 @@ class myScene(object):
             ptemp = RigidBody
             if sims.energy_tracking:
                 ptemp.members.update({"elastic_energy": float, "friction_energy": float, "damp_energy": float})
+            if sims.engine == "PredictCorrector":
+                ptemp.members.update(GEAR_MEMBERS)
             self.rigid = ptemp.field(shape=max(sims.max_rigid_body_num, 1))
 
             if self.rigid_grid is None: 
@@ -350,6 +360,17 @@ class myScene(object):
                 rad_max = max(rad_max, find_patch_max_radius_(int(self.wallNum[0]), self.wall))
         return rad_max
 
+    def find_max_velocity(self, sims: Simulation):
+        max_velocity = 0.
+
+        if self.particleNum[0] > 0:
+            max_velocity = max(max_velocity, find_max_velocity_(int(self.particleNum[0]), self.particle))
+
+        # only the facets are moved by the servo mechanism, the other walls are fixed
+        if sims.wall_type == 1 and self.wallNum[0] > 0:
+            max_velocity = max(max_velocity, find_max_velocity_(int(self.wallNum[0]), self.wall))
+        return max_velocity
+
     def find_particle_min_mass(self, scheme):
         if scheme == "LSDEM":
             return find_particle_min_mass_(int(self.particleNum[0]), self.rigid)
@@ -558,28 +579,42 @@ class myScene(object):
         if check is False:
             raise RuntimeError("The equivalent radius should be sorted in ascending order. Please double check create_body and add_body")
         
-    def delete_particles(self, bodyID):
-        initial_particle = self.particleNum[0]
-        kernel_delete_particles(self.particleNum[0], self.particle, bodyID)
-        self.particleNum[0] = update_particle_storage_(self.particleNum[0], self.particle)
-        finial_particle = self.particleNum[0]
-        print(f"Total {-finial_particle + initial_particle} particles has been deleted", '\n')
-
-    def delete_particles_in_region(self, is_in_region):
-        initial_particle = self.particleNum[0]
-        kernel_delete_particles_in_region(self.particleNum[0], self.particle, is_in_region)
-        self.particleNum[0] = update_particle_storage_(self.particleNum[0], self.particle)
-        finial_particle = self.particleNum[0]
-        print(f"Total {-finial_particle + initial_particle} particles has been deleted", '\n')
+    def update_particle_storage(self, sims: Simulation):
+        if self.compaction is None:
+            self.compaction = ParticleCompaction(sims)
+        return self.compaction.compact(self)
+
+    def delete_particles(self, sims: Simulation, bodyID):
+        kernel_delete_particles(int(self.particleNum[0]), self.particle, bodyID)
+        self.print_delete_particles(*self.update_particle_storage(sims))
+
+    def delete_particles_in_region(self, sims: Simulation, is_in_region):
+        kernel_delete_particles_in_region(int(self.particleNum[0]), self.particle, is_in_region)
+        self.print_delete_particles(*self.update_particle_storage(sims))
 
     def set_boundary_condition(self, sims: Simulation):
         self.domain_boundary = DomainBoundary(sims.domain)
-        self.domain_boundary.set_boundary_condition(sims.boundary)
-        if self.domain_boundary.need_run and sims.scheme == "DEM":
+        # periodic axes are wrapped body by body so that clump pebbles stay together
+        self.domain_boundary.set_boundary_condition([-1 if int(b) == 2 else int(b) for b in sims.boundary])
+        if self.domain_boundary.need_run and sims.scheme == "DEM" and self.compaction is None:
+            self.compaction = ParticleCompaction(sims)
+        if self.domain_boundary.need_run and sims.pbc and sims.scheme == "DEM":
+            self.apply_boundary_conditions = self.apply_boundary_condition_with_period
+        elif self.domain_boundary.need_run and sims.scheme == "DEM":
             self.apply_boundary_conditions = self.apply_boundary_condition
+        elif sims.pbc and sims.scheme == "DEM":
+            self.apply_boundary_conditions = self.apply_period_boundary
         else:
             self.apply_boundary_conditions = no_operation
 
     def apply_boundary_condition(self):
         if self.domain_boundary.apply_boundary_conditions(int(self.particleNum[0]), self.particle):
-            update_particle_storage_(self.particleNum, self.sphereNum, self.clumpNum, self.particle, self.sphere, self.clump)
+            return sum(self.compaction.compact(self)) > 0
+        return False
+
+    def apply_period_boundary(self):
+        apply_period_boundary_(int(self.sphereNum[0]), int(self.clumpNum[0]), self.particle, self.sphere, self.clump)
+
+    def apply_boundary_condition_with_period(self):
+        self.apply_period_boundary()
+        return self.apply_boundary_condition()
@@ -21,9 +21,11 @@ class Simulation(object):
         self.sparse_grid = False
         self.energy_tracking = False
         self.search_direction = "Up"
+        self.history_transfer = "LinearScan"
 
         self.dt = ti.field(float, shape=())
         self.delta = 0.
+        self.max_timestep = 0.
         self.current_time = 0.
         self.current_step = 0
         self.current_print = 0
@@ -74,9 +76,24 @@ class Simulation(object):
         self.time = 0.
         self.CFL = 0.2
         self.isadaptive = False
+        self.adaptive_interval = 1
+        self.reorder_interval = 0
+        self.adaptive_verlet = False
+        self.verlet_tune_window = 4
+        self.verlet_distance_range = [0.25, 4.]
         self.visualize = True
         self.save_interval = 1e6
         self.path = None
+        self.async_output = False
+        self.output_queue_size = 2
+        self.output_format = "npz"
+        self.output_compression = 1
+        self.output_downcast = False
+        self.contact_output = "Full"
+        self.restart_interval = 10
+        self.keyframe_interval = 10
+        self.profile = False
+        self.profile_interval = 0
         self.verlet_distance = 0.
         self.point_verlet_distance = 0.
 
@@ -135,6 +152,12 @@ class Simulation(object):
         if not search_direction in valid:
             raise RuntimeError(f"Keyword:: /search_direction/ is wrong, Only the following is valid: {valid}")
         
+    def set_history_transfer(self, history_transfer):
+        self.history_transfer = history_transfer
+        valid = ["LinearScan", "HashTable"]
+        if not history_transfer in valid:
+            raise RuntimeError(f"Keyword:: /history_transfer/ is wrong, Only the following is valid: {valid}")
+        
     def set_track_energy(self, track_energy):
         if track_energy and self.coupling:
             raise RuntimeError("Coupling MPDEM do not support energy tracking yet!")
@@ -143,6 +166,8 @@ class Simulation(object):
 
     def activate_period_boundary(self):
         self.pbc = True
+        GlobalVariable.PERIODIC = [int(b) == 2 for b in self.boundary]
+        GlobalVariable.DOMAIN = [float(d) for d in self.domain]
 
     def update_critical_timestep(self, dt):
         print("The time step is corrected as:", dt, '\n')
@@ -365,6 +390,7 @@ class Simulation(object):
     def set_timestep(self, timestep):
         self.dt[None] = timestep
         self.delta = timestep
+        self.max_timestep = timestep
 
     def set_simulation_time(self, time):
         self.time = time
@@ -372,8 +398,40 @@ class Simulation(object):
     def set_CFL(self, CFL):
         self.CFL = CFL
 
-    def set_adaptive_timestep(self, isadaptive):
+    def set_adaptive_timestep(self, isadaptive, adaptive_interval=1):
+        if isadaptive:
+            if self.scheme != "DEM":
+                raise RuntimeError("Keyword:: /AdaptiveTimestep/ is only supported for DEM scheme")
+            if self.coupling:
+                raise RuntimeError("Keyword:: /AdaptiveTimestep/ is not supported for coupling MPDEM")
+        if adaptive_interval < 1:
+            raise ValueError("Keyword:: /AdaptiveInterval/ should be larger than 0!")
         self.isadaptive = isadaptive
+        self.adaptive_interval = int(adaptive_interval)
+
+    def set_reorder_interval(self, reorder_interval):
+        if reorder_interval < 0:
+            raise ValueError("Keyword:: /ReorderInterval/ should be larger than or equal to 0!")
+        if reorder_interval > 0:
+            if self.scheme != "DEM" or self.search != "LinkedCell":
+                raise RuntimeError("Keyword:: /ReorderInterval/ Morton reordering is only supported for DEM scheme with LinkedCell search")
+            if self.coupling:
+                raise RuntimeError("Keyword:: /ReorderInterval/ Morton reordering is not supported for coupling MPDEM")
+        self.reorder_interval = int(reorder_interval)
+
+    def set_adaptive_verlet(self, adaptive_verlet, verlet_tune_window=4, verlet_distance_range=[0.25, 4.]):
+        if adaptive_verlet:
+            if self.scheme != "DEM" or self.search != "LinkedCell":
+                raise RuntimeError("Keyword:: /AdaptiveVerlet/ is only supported for DEM scheme with LinkedCell search")
+            if self.coupling:
+                raise RuntimeError("Keyword:: /AdaptiveVerlet/ is not supported for coupling MPDEM")
+        if verlet_tune_window < 1:
+            raise ValueError("Keyword:: /VerletTuneWindow/ should be larger than 0!")
+        if not isinstance(verlet_distance_range, (list, tuple)) or len(verlet_distance_range) != 2 or not 0. < verlet_distance_range[0] <= 1. <= verlet_distance_range[1]:
+            raise ValueError("Keyword:: /VerletDistanceRange/ should be [lower, upper] multiples of the initial verlet distance with 0 < lower <= 1 <= upper")
+        self.adaptive_verlet = adaptive_verlet
+        self.verlet_tune_window = int(verlet_tune_window)
+        self.verlet_distance_range = [float(verlet_distance_range[0]), float(verlet_distance_range[1])]
 
     def set_save_interval(self, save_interval):
         self.save_interval = save_interval
@@ -421,6 +479,40 @@ class Simulation(object):
     def set_save_path(self, path):
         self.path = path
 
+    def set_async_output(self, async_output, output_queue_size=2):
+        if output_queue_size < 1:
+            raise ValueError("Keyword:: /OutputQueueSize/ should be larger than 0")
+        self.async_output = async_output
+        self.output_queue_size = int(output_queue_size)
+
+    def set_output_format(self, output_format, compression=1, downcast=False):
+        valid_format = ["npz", "chunked"]
+        if output_format not in valid_format:
+            raise ValueError(f"Keyword:: /OutputFormat/ {output_format} is invalid, only the following is valid: {valid_format}")
+        if not 0 <= compression <= 9:
+            raise ValueError("Keyword:: /Compression/ should be an integer between 0 and 9")
+        self.output_format = output_format
+        self.output_compression = int(compression)
+        self.output_downcast = downcast
+
+    def set_contact_output(self, contact_output, restart_interval=10, keyframe_interval=10):
+        valid_output = ["Full", "Sparse"]
+        if contact_output not in valid_output:
+            raise ValueError(f"Keyword:: /ContactOutput/ {contact_output} is invalid, only the following is valid: {valid_output}")
+        if restart_interval < 0:
+            raise ValueError("Keyword:: /RestartInterval/ should not be smaller than 0")
+        if keyframe_interval < 1:
+            raise ValueError("Keyword:: /KeyframeInterval/ should be larger than 0")
+        self.contact_output = contact_output
+        self.restart_interval = int(restart_interval)
+        self.keyframe_interval = int(keyframe_interval)
+
+    def set_profile(self, profile, profile_interval=0):
+        if profile_interval < 0:
+            raise ValueError("Keyword:: /ProfileInterval/ should not be smaller than 0")
+        self.profile = profile
+        self.profile_interval = int(profile_interval)
+
     def define_work_load(self):
         if self.max_particle_num <= 1000:
             self.particle_work = 0
@@ -1,9 +1,11 @@
 import taichi as ti
 
-from src.utils.constants import ZEROVEC3f, Threshold
+from src.dem.neighbor.neighbor_kernel import fluid_cell_range, fluid_cell_weight
+from src.utils.constants import PI, MThreshold, ZEROVEC3f, Threshold
 from src.utils.Quaternion import SetToRotate
 from src.utils.ScalarFunction import PairingMapping, EffectiveValue, linearize3D
 from src.utils.TypeDefination import vec3f
+from src.utils.DomainBoundary import periodic_image
 from src.utils import GlobalVariable
 
 
@@ -201,6 +203,68 @@ def kernel_inherit_rolling_history(particleNum: int, cplist: ti.template(), hist
         cplist[nc].oldTwistAngle = twistAngleOld
 
 
+@ti.func
+def get_history_slot(end2, capacity):
+    return int(ti.cast(end2, ti.u32) * ti.u32(2654435761) % ti.u32(capacity))
+
+
+@ti.func
+def find_history_offset(end1, end2, hist_cplist, hist_object_object, history_table):
+    location = -1
+    table_start, capacity = 2 * hist_object_object[end1], 2 * (hist_object_object[end1 + 1] - hist_object_object[end1])
+    if capacity > 0:
+        slot = get_history_slot(end2, capacity)
+        while history_table[table_start + slot] != -1:
+            offset = history_table[table_start + slot]
+            if hist_cplist[offset].DstID == end2:
+                location = offset
+                break
+            slot = (slot + 1) % capacity
+    return location
+
+
+@ti.kernel
+def kernel_build_history_table(particleNum: int, hist_cplist: ti.template(), hist_object_object: ti.template(), history_table: ti.template()):
+    # Each particle owns an open-addressing table of twice its history segment length, so probing always ends at an empty slot
+    for end1 in range(particleNum):
+        table_start, capacity = 2 * hist_object_object[end1], 2 * (hist_object_object[end1 + 1] - hist_object_object[end1])
+        for slot in range(table_start, table_start + capacity):
+            history_table[slot] = -1
+        for offset in range(hist_object_object[end1], hist_object_object[end1 + 1]):
+            slot = get_history_slot(hist_cplist[offset].DstID, capacity)
+            while history_table[table_start + slot] != -1:
+                slot = (slot + 1) % capacity
+            history_table[table_start + slot] = offset
+
+
+@ti.kernel
+def kernel_hash_contact_history(particleNum: int, cplist: ti.template(), hist_cplist: ti.template(), object_object: ti.template(), hist_object_object: ti.template(), history_table: ti.template()):
+    total_contact_num = object_object[particleNum]
+    for nc in range(total_contact_num):
+        end1, end2 = cplist[nc].endID1, cplist[nc].endID2
+        tangOverlapOld = ZEROVEC3f
+        offset = find_history_offset(end1, end2, hist_cplist, hist_object_object, history_table)
+        if offset != -1:
+            tangOverlapOld = hist_cplist[offset].oldTangOverlap
+        cplist[nc].oldTangOverlap = tangOverlapOld
+
+
+@ti.kernel
+def kernel_hash_rolling_history(particleNum: int, cplist: ti.template(), hist_cplist: ti.template(), object_object: ti.template(), hist_object_object: ti.template(), history_table: ti.template()):
+    total_contact_num = object_object[particleNum]
+    for nc in range(total_contact_num):
+        end1, end2 = cplist[nc].endID1, cplist[nc].endID2
+        tangOverlapOld, rollAngleOld, twistAngleOld = ZEROVEC3f, ZEROVEC3f, ZEROVEC3f
+        offset = find_history_offset(end1, end2, hist_cplist, hist_object_object, history_table)
+        if offset != -1:
+            tangOverlapOld = hist_cplist[offset].oldTangOverlap
+            rollAngleOld = hist_cplist[offset].oldRollAngle
+            twistAngleOld = hist_cplist[offset].oldTwistAngle
+        cplist[nc].oldTangOverlap = tangOverlapOld
+        cplist[nc].oldRollAngle = rollAngleOld
+        cplist[nc].oldTwistAngle = twistAngleOld
+
+
 @ti.kernel
 def copy_contact_table(object_object: ti.template(), particleNum: int, cplist: ti.template(), hist_cplist: ti.template()):
     total_contact_num = object_object[particleNum]
@@ -219,17 +283,131 @@ def copy_addition_contact_table(object_object: ti.template(), particleNum: int,
         hist_cplist[nc].oldTwistAngle = cplist[nc].oldTwistAngle
 
 
+@ti.func
+def get_reorder_ends(particleNum, end1, end2, particle_map, is_particle_particle: ti.template()):
+    # the contact is owned by the end with the smaller new index, so that the master < slave order of the neighbor search is kept.
+    # deleted particles are mapped to -1, their contacts are dropped from both ends
+    owner, dst, swap = particle_map[end1], end2, 0
+    if ti.static(is_particle_particle):
+        dst = -1
+        if end2 >= 0 and end2 < particleNum:
+            dst = particle_map[end2]
+        if owner >= 0 and dst >= 0 and owner > dst:
+            dst = owner
+            owner = particle_map[end2]
+            swap = 1
+    if dst < 0:
+        owner = -1
+    return owner, dst, swap
+
+
+@ti.kernel
+def kernel_count_reorder_contact_(particleNum: int, is_particle_particle: ti.template(), particle_map: ti.template(), cplist: ti.template(), object_object: ti.template(), hist_object_object: ti.template()):
+    object_object.fill(0)
+    for nc in range(hist_object_object[particleNum]):
+        owner, _, _ = get_reorder_ends(particleNum, cplist[nc].endID1, cplist[nc].endID2, particle_map, is_particle_particle)
+        if owner >= 0:
+            ti.atomic_add(object_object[owner + 1], 1)
+
+
+@ti.kernel
+def kernel_reorder_contact_history_(particleNum: int, is_particle_particle: ti.template(), particle_map: ti.template(), cplist: ti.template(), hist_cplist: ti.template(),
+                                    object_object: ti.template(), hist_object_object: ti.template()):
+    # hist_object_object is used as the insertion cursor of each new segment, the auxiliary lists restore it afterwards
+    total_contact_num = hist_object_object[particleNum]
+    for np in range(particleNum):
+        hist_object_object[np] = object_object[np]
+    for nc in range(total_contact_num):
+        owner, dst, swap = get_reorder_ends(particleNum, cplist[nc].endID1, cplist[nc].endID2, particle_map, is_particle_particle)
+        if owner >= 0:
+            new_contact = ti.atomic_add(hist_object_object[owner], 1)
+            # the tangential history is measured from endID1 to endID2 and changes sign with the contact direction
+            sign = 1. - 2. * swap
+            hist_cplist[new_contact]._copy(dst, sign * cplist[nc].oldTangOverlap)
+
+
+@ti.kernel
+def kernel_reorder_rolling_history_(particleNum: int, is_particle_particle: ti.template(), particle_map: ti.template(), cplist: ti.template(), hist_cplist: ti.template(),
+                                    object_object: ti.template(), hist_object_object: ti.template()):
+    total_contact_num = hist_object_object[particleNum]
+    for np in range(particleNum):
+        hist_object_object[np] = object_object[np]
+    for nc in range(total_contact_num):
+        owner, dst, swap = get_reorder_ends(particleNum, cplist[nc].endID1, cplist[nc].endID2, particle_map, is_particle_particle)
+        if owner >= 0:
+            new_contact = ti.atomic_add(hist_object_object[owner], 1)
+            sign = 1. - 2. * swap
+            hist_cplist[new_contact]._copy(dst, sign * cplist[nc].oldTangOverlap, sign * cplist[nc].oldRollAngle, sign * cplist[nc].oldTwistAngle)
+
+
+@ti.kernel
+def kernel_restore_contact_history_(particleNum: int, cplist: ti.template(), hist_cplist: ti.template(), object_object: ti.template()):
+    for np in range(particleNum):
+        for nc in range(object_object[np], object_object[np + 1]):
+            cplist[nc]._set_id(np, hist_cplist[nc].DstID)
+            cplist[nc].oldTangOverlap = hist_cplist[nc].oldTangOverlap
+
+
+@ti.kernel
+def kernel_restore_rolling_history_(particleNum: int, cplist: ti.template(), hist_cplist: ti.template(), object_object: ti.template()):
+    for np in range(particleNum):
+        for nc in range(object_object[np], object_object[np + 1]):
+            cplist[nc]._set_id(np, hist_cplist[nc].DstID)
+            cplist[nc].oldTangOverlap = hist_cplist[nc].oldTangOverlap
+            cplist[nc].oldRollAngle = hist_cplist[nc].oldRollAngle
+            cplist[nc].oldTwistAngle = hist_cplist[nc].oldTwistAngle
+
+
 @ti.kernel
 def kernel_update_active_collisions_(particleNum: int, particle: ti.template(), cplist: ti.template(), object_object: ti.template()):
     total_contact_num = object_object[particleNum]
     for nc in range(total_contact_num):
         end1, end2 = cplist[nc].endID1, cplist[nc].endID2
         pos1, pos2 = particle[end1].x, particle[end2].x
+        pos2 = periodic_image(pos1, pos2)
         rad1, rad2 = particle[end1].rad, particle[end2].rad
         gapn = (pos1 - pos2).norm() - (rad1 + rad2)
         cplist[nc].avtice = ti.u8(gapn < 0.)
 
 
+@ti.kernel
+def kernel_find_particle_particle_stiffness_ratio_(particleNum: int, max_material_num: int, surfaceProps: ti.template(), particle: ti.template(),
+                                                   cplist: ti.template(), particle_particle: ti.template()) -> float:
+    # the lighter particle of each pair is taken alone, as the critical time step estimated at setup
+    max_ratio = 0.
+    total_contact_num = particle_particle[particleNum]
+    for nc in range(total_contact_num):
+        end1, end2 = cplist[nc].endID1, cplist[nc].endID2
+        pos1, pos2 = particle[end1]._get_position(), particle[end2]._get_position()
+        pos2 = periodic_image(pos1, pos2)
+        rad1, rad2 = particle[end1]._get_radius(), particle[end2]._get_radius()
+        gapn = (pos1 - pos2).norm() - (rad1 + rad2)
+        if gapn < 0.:
+            materialID = PairingMapping(particle[end1].materialID, particle[end2].materialID, max_material_num)
+            rad_eff = EffectiveValue(rad1 + 0.5 * gapn, rad2 + 0.5 * gapn)
+            stiffness = surfaceProps[materialID]._get_contact_stiffness(rad_eff, gapn)
+            ti.atomic_max(max_ratio, stiffness / ti.min(particle[end1]._get_mass(), particle[end2]._get_mass()))
+    return max_ratio
+
+
+@ti.kernel
+def kernel_find_particle_wall_stiffness_ratio_(particleNum: int, max_material_num: int, surfaceProps: ti.template(), particle: ti.template(),
+                                               wall: ti.template(), cplist: ti.template(), particle_wall: ti.template()) -> float:
+    max_ratio = 0.
+    total_contact_num = particle_wall[particleNum]
+    for nc in range(total_contact_num):
+        end1, end2 = cplist[nc].endID1, cplist[nc].endID2
+        pos1, particle_rad = particle[end1]._get_position(), particle[end1]._get_radius()
+        distance = wall[end2]._get_norm_distance(pos1)
+        gapn = distance - particle_rad
+        fraction = ti.abs(wall[end2].processCircleShape(pos1, particle_rad, distance))
+        if gapn < 0. and fraction > Threshold:
+            materialID = PairingMapping(particle[end1].materialID, wall[end2].materialID, max_material_num)
+            stiffness = surfaceProps[materialID]._get_contact_stiffness(particle_rad + 0.5 * gapn, gapn)
+            ti.atomic_max(max_ratio, fraction * stiffness / particle[end1]._get_mass())
+    return max_ratio
+
+
 @ti.kernel
 def kernel_particle_particle_force_assemble_(particleNum: int, dt: ti.template(), max_material_num: int, surfaceProps: ti.template(), particle1: ti.template(), particle2: ti.template(), 
                                              cplist: ti.template(), particle_particle: ti.template(), contact_model: ti.template()):
@@ -239,6 +417,7 @@ def kernel_particle_particle_force_assemble_(particleNum: int, dt: ti.template()
         end1, end2 = cplist[nc].endID1, cplist[nc].endID2
         matID1, matID2 = particle1[end1].materialID, particle2[end2].materialID
         pos1, pos2 = particle1[end1]._get_position(), particle2[end2]._get_position()
+        pos2 = periodic_image(pos1, pos2)
         rad1, rad2 = particle1[end1]._get_radius(), particle2[end2]._get_radius() 
         gapn = (pos1 - pos2).norm() - (rad1 + rad2)  
         materialID = PairingMapping(matID1, matID2, max_material_num)
@@ -395,6 +574,7 @@ def kernel_calculate_contact_force(particleNum: int, dt: ti.template(), max_mate
         end1, end2 = cplist[nc].endID1, cplist[nc].endID2
         matID1, matID2 = particle[end1].materialID, particle[end2].materialID
         pos1, pos2 = particle[end1].x, particle[end2].x
+        pos2 = periodic_image(pos1, pos2)
         rad1, rad2 = particle[end1].rad, particle[end2].rad 
         gapn = (pos1 - pos2).norm() - (rad1 + rad2)  
         materialID = PairingMapping(matID1, matID2, max_material_num)
@@ -697,6 +877,73 @@ def fluid_wall_contact_model(materialID, nc, end1, end2, gapn, fraction, pos1, p
         cplist[nc]._no_contact()
 
 
+@ti.func
+def difelice_drag_force(radius, porosity, density, viscosity, v_rel):
+    drag_force = ZEROVEC3f
+    speed = v_rel.norm()
+    if speed > 0.:
+        reynolds = ti.max(2. * radius * density * porosity * speed / viscosity, Threshold)
+        drag_coefficient = (0.63 + 4.8 / ti.sqrt(reynolds)) ** 2
+        exponent = 3.7 - 0.65 * ti.exp(-0.5 * (1.5 - ti.log(reynolds) / ti.log(10.)) ** 2)
+        drag_force = 0.5 * drag_coefficient * density * PI * radius * radius * porosity ** (2. - exponent) * speed * v_rel
+    return drag_force
+
+
+@ti.kernel
+def kernel_fluid_particle_force_assemble_(particleNum: int, min_porosity: float, gravity: ti.types.vector(3, float), grid_size: ti.types.vector(3, float), igrid_size: ti.types.vector(3, float),
+                                          cnum: ti.types.vector(3, int), particle: ti.template(), fluid_cell: ti.template()):
+    cell_volume = grid_size[0] * grid_size[1] * grid_size[2]
+    for np in range(particleNum):
+        position, radius = particle[np]._get_position(), particle[np]._get_radius()
+        cell_start, cell_end = fluid_cell_range(position, radius, igrid_size, cnum)
+
+        weights, solid_volume, fluid_mass, fluid_volume, viscous_mass, momentum = 0., 0., 0., 0., 0., ZEROVEC3f
+        for neigh_i, neigh_j, neigh_k in ti.ndrange((cell_start[0], cell_end[0] + 1), (cell_start[1], cell_end[1] + 1), (cell_start[2], cell_end[2] + 1)):
+            weight = fluid_cell_weight(neigh_i, neigh_j, neigh_k, position, radius, grid_size)
+            cellID = linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+            weights += weight
+            solid_volume += weight * fluid_cell[cellID].solid_volume
+            fluid_mass += weight * fluid_cell[cellID].fluid_mass
+            fluid_volume += weight * fluid_cell[cellID].fluid_volume
+            viscous_mass += weight * fluid_cell[cellID].viscous_mass
+            momentum += weight * fluid_cell[cellID].momentum
+
+        if fluid_mass > 0. and fluid_volume > 0.:
+            # the grain sees the cells it overlaps, the reaction goes back to them in proportion to their fluid
+            porosity = ti.max(1. - solid_volume / (weights * cell_volume), min_porosity)
+            saturation = ti.min(fluid_volume / (weights * cell_volume), 1.)
+            density, viscosity = fluid_mass / fluid_volume, viscous_mass / fluid_mass
+            v_rel = momentum / fluid_mass - particle[np]._get_velocity()
+
+            drag_force = difelice_drag_force(radius, porosity, density, viscosity, v_rel)
+            buoyancy = -density * 4./3. * PI * radius * radius * radius * gravity
+            fluid_force = saturation * (drag_force + buoyancy)
+            particle[np]._update_contact_interaction(fluid_force, ZEROVEC3f)
+
+            for neigh_i, neigh_j, neigh_k in ti.ndrange((cell_start[0], cell_end[0] + 1), (cell_start[1], cell_end[1] + 1), (cell_start[2], cell_end[2] + 1)):
+                weight = fluid_cell_weight(neigh_i, neigh_j, neigh_k, position, radius, grid_size)
+                cellID = linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+                fluid_cell[cellID]._update_reaction(-weight * fluid_cell[cellID].fluid_mass / fluid_mass * fluid_force)
+
+
+@ti.kernel
+def kernel_fluid_reaction_assemble_(igrid_size: ti.types.vector(3, float), cnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), fluid_cell: ti.template()):
+    for np in range(particleNum):
+        if int(particle[np].active) == 0: continue
+        grid_idx = ti.min(ti.max(ti.floor(particle[np].x * igrid_size, int), 0), cnum - 1)
+        cellID = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
+        particle[np].external_force += particle[np].m / fluid_cell[cellID].fluid_mass * fluid_cell[cellID].reaction
+
+
+@ti.kernel
+def kernel_find_min_drag_relaxation_time_(particleNum: int, viscosity: float, porosity_factor: float, particle: ti.template()) -> float:
+    relaxation_time = MThreshold
+    for np in range(particleNum):
+        radius = particle[np]._get_radius()
+        ti.atomic_min(relaxation_time, porosity_factor * particle[np]._get_mass() / (6. * PI * viscosity * radius))
+    return relaxation_time
+
+
 @ti.func
 def LSparticle_wall_contact_model(materialID, nc, parameter, end1, end2, min_dist, mass_center1, intruding_node, rigid, wall, surfaceProps, cplist, dt):
     if min_dist < surfaceProps[materialID].ncut:
@@ -8,6 +8,7 @@ from src.dem.Simulation import Simulation
 from src.dem.SceneManager import myScene
 from src.dem.neighbor.NeighborBase import NeighborBase
 from src.dem.neighbor.HierarchicalLinkedCell import HierarchicalLinkedCell
+from src.utils.ChunkedStore import frame_exists, load_frame
 from src.utils.ObjectIO import DictIO
 from src.utils.linalg import round32
 from src.utils.TypeDefination import u1
@@ -23,6 +24,7 @@ class ContactModelBase(object):
         self.update_contact_table = None
         self.cplist = None
         self.hist_cplist = None
+        self.history_table = None
         self.contact_active = None
         self.deactivate_exist = None
         self.surfaceProps = None
@@ -33,8 +35,13 @@ class ContactModelBase(object):
     def manage_function(self, object_type, work_type):
         self.resolve = self.no_operation
         self.update_contact_table = self.no_operation
+        self.reorder_contact_history = self.no_reorder_operation
+        self.inherit_history = self.scan_contact_history
+        if self.sims.history_transfer == "HashTable":
+            self.inherit_history = self.hash_contact_history
         self.add_surface_properties = self.no_add_property
         self.calcu_critical_timesteps = self.no_critical_timestep
+        self.find_max_stiffness_ratio = self.no_stiffness_ratio
         self.update_verlet_particle_particle_tables = self.no_operation
         self.update_verlet_particle_wall_tables = self.no_operation
         if not self.null_model:
@@ -47,6 +54,8 @@ class ContactModelBase(object):
                     if self.sims.scheme == "DEM":
                         self.resolve = self.tackle_particle_particle_contact_cplist
                         self.update_contact_table = self.update_particle_particle_contact_table
+                        self.reorder_contact_history = self.reorder_particle_particle_history
+                        self.find_max_stiffness_ratio = self.find_particle_particle_stiffness_ratio
                     elif self.sims.scheme == "LSDEM":
                         self.resolve = self.tackle_LSparticle_LSparticle_contact_cplist
                         self.update_contact_table = self.update_LSparticle_LSparticle_contact_table
@@ -58,12 +67,15 @@ class ContactModelBase(object):
                         if self.sims.scheme == "DEM":
                             self.resolve = self.tackle_particle_wall_contact_cplist
                             self.update_contact_table = self.update_particle_wall_contact_table
+                            self.reorder_contact_history = self.reorder_particle_wall_history
+                            self.find_max_stiffness_ratio = self.find_particle_wall_stiffness_ratio
                         elif self.sims.scheme == "LSDEM":
                             self.resolve = self.tackle_LSparticle_wall_contact_cplist
                             self.update_contact_table = self.update_LSparticle_wall_contact_table
                 elif self.sims.wall_type == 3:
                     if self.sims.scheme == "DEM":
                         self.resolve = self.tackle_particle_digital_elevation_contact_cplist
+                        self.find_max_stiffness_ratio = self.static_stiffness_ratio
                     elif self.sims.scheme == "LSDEM":
                         self.resolve = self.tackle_LSparticle_digital_elevation_contact_cplist
 
@@ -125,6 +137,8 @@ class ContactModelBase(object):
                     self.hist_cplist = ContactTable.field(shape=max_object_pairs)
                 elif work_type == 2:
                     self.hist_cplist = HistoryContactTable.field(shape=max_object_pairs)
+                    if self.sims.history_transfer == "HashTable":
+                        self.history_table = ti.field(int, shape=2 * max_object_pairs)
             elif object_type == 'wall' and self.sims.wall_type == 3:
                 if self.sims.scheme == "DEM":
                     self.cplist = DigitalContactTable.field(shape=int(self.sims.max_particle_num))
@@ -145,6 +159,19 @@ class ContactModelBase(object):
     
     def no_critical_timestep(self, scene):
         return 1e-3
+
+    def no_stiffness_ratio(self, sims, scene, pcontact):
+        return 0.
+
+    def static_stiffness_ratio(self, sims, scene, pcontact):
+        # the contacts are not listed, the setup estimate bounds the stiffness per mass instead
+        return 1. / self.calcu_critical_timesteps(scene) ** 2
+
+    def find_particle_particle_stiffness_ratio(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
+        return kernel_find_particle_particle_stiffness_ratio_(int(scene.particleNum[0]), sims.max_material_num, self.surfaceProps, scene.particle, self.cplist, pcontact.hist_particle_particle)
+
+    def find_particle_wall_stiffness_ratio(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
+        return kernel_find_particle_wall_stiffness_ratio_(int(scene.particleNum[0]), sims.max_material_num, self.surfaceProps, scene.particle, scene.wall, self.cplist, pcontact.hist_particle_wall)
     
     def find_max_penetration(self):
         return 0.
@@ -175,11 +202,14 @@ class ContactModelBase(object):
             if not os.path.exists(contact):
                 raise EOFError("Invaild contact path")
             
+            contact_file = contact + ("/DEMContactPP{0:06d}.npz" if is_particle_particle else "/DEMContactPW{0:06d}.npz").format(file_number)
+            if not frame_exists(contact_file):
+                raise EOFError(f"{contact_file} is not found. Only restart-grade contact dumps can be used for restart, see Keyword:: /RestartInterval/")
+
+            contact_info = load_frame(contact_file)
             if is_particle_particle:
-                contact_info = np.load(contact + "/DEMContactPP{0:06d}.npz".format(file_number), allow_pickle=True) 
                 self.rebuild_ppcontact_list(pcontact, contact_info)
             else:
-                contact_info = np.load(contact + "/DEMContactPW{0:06d}.npz".format(file_number), allow_pickle=True) 
                 self.rebuild_pwcontact_list(pcontact, contact_info)
             
     def rebuild_contact_list(self, contact_info):
@@ -195,16 +225,22 @@ class ContactModelBase(object):
         oldTangOverlap = DictIO.GetEssential(contact_info, "oldTangentialOverlap")
         return object_object, LocID, DstID, oldTangOverlap
 
-    def get_ppcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase):
+    def get_ppcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase, savez=np.savez, sparse=None):
         end1, end2, normal_force, tangential_force, oldTangentialOverlap = self.get_contact_output(scene, pcontact.particle_particle)
+        if sparse is not None:
+            sparse.write(contact_path+f'Sparse{current_print:06d}', current_time, current_print, end1, end2, normal_force, tangential_force, savez)
+            return
         particleParticle = np.ascontiguousarray(pcontact.particle_particle.to_numpy()[0:scene.particleNum[0] + 1])
-        np.savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleParticle, end1=end1, end2=end2, normal_force=normal_force, 
+        savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleParticle, end1=end1, end2=end2, normal_force=normal_force, 
                                                       tangential_force=tangential_force, oldTangentialOverlap=oldTangentialOverlap)
         
-    def get_pwcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase):
+    def get_pwcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase, savez=np.savez, sparse=None):
         end1, end2, normal_force, tangential_force, oldTangentialOverlap = self.get_contact_output(scene, pcontact.particle_wall)
+        if sparse is not None:
+            sparse.write(contact_path+f'Sparse{current_print:06d}', current_time, current_print, end1, end2, normal_force, tangential_force, savez)
+            return
         particleWall = np.ascontiguousarray(pcontact.particle_wall.to_numpy()[0:scene.particleNum[0] + 1])
-        np.savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleWall, end1=end1, end2=end2, normal_force=normal_force, 
+        savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleWall, end1=end1, end2=end2, normal_force=normal_force, 
                                                       tangential_force=tangential_force, oldTangentialOverlap=oldTangentialOverlap)
     
     def rebuild_ppcontact_list(self, pcontact: NeighborBase, contact_info):
@@ -240,12 +276,33 @@ class ContactModelBase(object):
     def update_particle_particle_contact_table(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         copy_contact_table(pcontact.hist_particle_particle, int(scene.particleNum[0]), self.cplist, self.hist_cplist)
         self.update_ppcontact_table(sims, scene, pcontact)
-        kernel_inherit_contact_history(int(scene.particleNum[0]), self.cplist, self.hist_cplist, pcontact.particle_particle, pcontact.hist_particle_particle)
+        self.inherit_history(int(scene.particleNum[0]), pcontact.particle_particle, pcontact.hist_particle_particle)
          
     def update_particle_wall_contact_table(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         copy_contact_table(pcontact.hist_particle_wall, int(scene.particleNum[0]), self.cplist, self.hist_cplist)
         self.update_pwcontact_table(sims, scene, pcontact)
-        kernel_inherit_contact_history(int(scene.particleNum[0]), self.cplist, self.hist_cplist, pcontact.particle_wall, pcontact.hist_particle_wall)
+        self.inherit_history(int(scene.particleNum[0]), pcontact.particle_wall, pcontact.hist_particle_wall)
+        
+    def scan_contact_history(self, objectNum, object_object, hist_object_object):
+        kernel_inherit_contact_history(objectNum, self.cplist, self.hist_cplist, object_object, hist_object_object)
+
+    def hash_contact_history(self, objectNum, object_object, hist_object_object):
+        kernel_build_history_table(objectNum, self.hist_cplist, hist_object_object, self.history_table)
+        kernel_hash_contact_history(objectNum, self.cplist, self.hist_cplist, object_object, hist_object_object, self.history_table)
+
+    def reorder_particle_particle_history(self, particleNum: int, pcontact: NeighborBase, particle_map):
+        kernel_count_reorder_contact_(particleNum, True, particle_map, self.cplist, pcontact.particle_particle, pcontact.hist_particle_particle)
+        pcontact.particle_pse.run(pcontact.particle_particle)
+        kernel_reorder_contact_history_(particleNum, True, particle_map, self.cplist, self.hist_cplist, pcontact.particle_particle, pcontact.hist_particle_particle)
+        kernel_restore_contact_history_(particleNum, self.cplist, self.hist_cplist, pcontact.particle_particle)
+        pcontact.update_particle_particle_auxiliary_lists()
+
+    def reorder_particle_wall_history(self, particleNum: int, pcontact: NeighborBase, particle_map):
+        kernel_count_reorder_contact_(particleNum, False, particle_map, self.cplist, pcontact.particle_wall, pcontact.hist_particle_wall)
+        pcontact.particle_pse.run(pcontact.particle_wall)
+        kernel_reorder_contact_history_(particleNum, False, particle_map, self.cplist, self.hist_cplist, pcontact.particle_wall, pcontact.hist_particle_wall)
+        kernel_restore_contact_history_(particleNum, self.cplist, self.hist_cplist, pcontact.particle_wall)
+        pcontact.update_particle_wall_auxiliary_lists()
         
     def tackle_particle_particle_contact_cplist(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         kernel_particle_particle_force_assemble_(int(scene.particleNum[0]), sims.dt, sims.max_material_num, self.surfaceProps, scene.particle, scene.particle, self.cplist, pcontact.hist_particle_particle, self.contact_model)
@@ -264,12 +321,12 @@ class ContactModelBase(object):
     def update_LSparticle_LSparticle_contact_table(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         copy_contact_table(pcontact.hist_lsparticle_lsparticle, int(scene.surfaceNum[0]), self.cplist, self.hist_cplist)
         self.update_ppcontact_table(sims, scene, pcontact)
-        kernel_inherit_contact_history(int(scene.surfaceNum[0]), self.cplist, self.hist_cplist, pcontact.lsparticle_lsparticle, pcontact.hist_lsparticle_lsparticle)
+        self.inherit_history(int(scene.surfaceNum[0]), pcontact.lsparticle_lsparticle, pcontact.hist_lsparticle_lsparticle)
         
     def update_LSparticle_wall_contact_table(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         copy_contact_table(pcontact.hist_lsparticle_wall, int(scene.surfaceNum[0]), self.cplist, self.hist_cplist)
         self.update_pwcontact_table(sims, scene, pcontact)
-        kernel_inherit_contact_history(int(scene.surfaceNum[0]), self.cplist, self.hist_cplist, pcontact.lsparticle_wall, pcontact.hist_lsparticle_wall)
+        self.inherit_history(int(scene.surfaceNum[0]), pcontact.lsparticle_wall, pcontact.hist_lsparticle_wall)
         
     def tackle_LSparticle_LSparticle_contact_cplist(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         kernel_LSparticle_LSparticle_force_assemble_(int(scene.surfaceNum[0]), sims.dt, sims.max_material_num, self.surfaceProps, scene.rigid, scene.rigid_grid, 
@@ -310,4 +367,7 @@ class ContactModelBase(object):
         update_LScontact_table_(sims.point_wall_coordination_number, int(scene.surfaceNum[0]), pcontact.lsparticle_wall, pcontact.potential_list_point_wall, self.cplist)
     
     def no_operation(self, sims, scene, pcontact):
+        pass
+
+    def no_reorder_operation(self, particleNum, pcontact, particle_map):
         pass
\ No newline at end of file
@@ -123,6 +123,12 @@ class HertzMindlinSurfaceProperty:
         contactAreaRadius = ti.sqrt(-gapn * particle_rad)
         fraction = ti.abs(wall[end2].processCircleShape(pos1, particle_rad, distance))
         return 2 * fraction * self.YoungModulus * contactAreaRadius
+
+    @ti.func
+    def _get_contact_stiffness(self, rad_eff, gapn):
+        # the stiffness grows with the contact area, i.e. with the square root of the overlap
+        contactAreaRadius = ti.sqrt(ti.max(-gapn, 0.) * rad_eff)
+        return ti.max(2 * self.YoungModulus * contactAreaRadius, 8 * self.ShearModulus * contactAreaRadius)
     
     @ti.func
     def _elastic_normal_energy(self, kn, normal_force):
@@ -50,6 +50,8 @@ class JiangRollingResistanceModel(ContactModelBase):
                     self.old_cplist = RollingContactTable.field(shape=max_object_pairs)
                 elif work_type == 2:
                     self.hist_cplist = HistoryRollingContactTable.field(shape=max_object_pairs)
+                    if self.sims.history_transfer == "HashTable":
+                        self.history_table = ti.field(int, shape=2 * max_object_pairs)
             elif object_type == 'wall' and self.sims.wall_type == 3:
                 if self.sims.scheme == "DEM":
                     self.cplist = DigitalRollingContactTable.field(shape=int(self.sims.max_particle_num))
@@ -105,16 +107,22 @@ class JiangRollingResistanceModel(ContactModelBase):
         oldTwistAngle = np.ascontiguousarray(self.cplist.oldTwistAngle.to_numpy()[0:neighbor_list[scene.particleNum[0]]])
         return end1, end2, normal_force, tangential_force, oldTangentialOverlap, oldRollAngle, oldTwistAngle
     
-    def get_ppcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase):
+    def get_ppcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase, savez=np.savez, sparse=None):
         end1, end2, normal_force, tangential_force, oldTangentialOverlap, oldRollAngle, oldTwistAngle = self.get_contact_output(scene, pcontact.particle_particle)
+        if sparse is not None:
+            sparse.write(contact_path+f'Sparse{current_print:06d}', current_time, current_print, end1, end2, normal_force, tangential_force, savez)
+            return
         particleParticle = np.ascontiguousarray(pcontact.particle_particle.to_numpy()[0:scene.particleNum[0] + 1])
-        np.savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleParticle, end1=end1, end2=end2, normal_force=normal_force, 
+        savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleParticle, end1=end1, end2=end2, normal_force=normal_force, 
                                                       tangential_force=tangential_force, oldTangentialOverlap=oldTangentialOverlap, oldRollAngle=oldRollAngle, oldTwistAngle=oldTwistAngle)
         
-    def get_pwcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase):
+    def get_pwcontact_output(self, contact_path, current_time, current_print, scene: myScene, pcontact: NeighborBase, savez=np.savez, sparse=None):
         end1, end2, normal_force, tangential_force, oldTangentialOverlap, oldRollAngle, oldTwistAngle = self.get_contact_output(scene, pcontact.particle_wall)
+        if sparse is not None:
+            sparse.write(contact_path+f'Sparse{current_print:06d}', current_time, current_print, end1, end2, normal_force, tangential_force, savez)
+            return
         particleWall = np.ascontiguousarray(pcontact.particle_wall.to_numpy()[0:scene.particleNum[0] + 1])
-        np.savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleWall, end1=end1, end2=end2, normal_force=normal_force, 
+        savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleWall, end1=end1, end2=end2, normal_force=normal_force, 
                                                       tangential_force=tangential_force, oldTangentialOverlap=oldTangentialOverlap, oldRollAngle=oldRollAngle, oldTwistAngle=oldTwistAngle)
         
     def rebuild_contact_list(self, contact_info):
@@ -143,12 +151,33 @@ class JiangRollingResistanceModel(ContactModelBase):
     def update_particle_particle_contact_table(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         copy_addition_contact_table(pcontact.hist_particle_particle, int(scene.particleNum[0]), self.cplist, self.hist_cplist)
         self.update_ppcontact_table(sims, scene, pcontact)
-        kernel_inherit_rolling_history(int(scene.particleNum[0]), self.cplist, self.hist_cplist, pcontact.particle_particle, pcontact.hist_particle_particle)
+        self.inherit_history(int(scene.particleNum[0]), pcontact.particle_particle, pcontact.hist_particle_particle)
 
     def update_particle_wall_contact_table(self, sims: Simulation, scene: myScene, pcontact: NeighborBase):
         copy_addition_contact_table(pcontact.hist_particle_wall, int(scene.particleNum[0]), self.cplist, self.hist_cplist)
         self.update_pwcontact_table(sims, scene, pcontact)
-        kernel_inherit_rolling_history(int(scene.particleNum[0]), self.cplist, self.hist_cplist, pcontact.particle_wall, pcontact.hist_particle_wall)
+        self.inherit_history(int(scene.particleNum[0]), pcontact.particle_wall, pcontact.hist_particle_wall)
+
+    def scan_contact_history(self, objectNum, object_object, hist_object_object):
+        kernel_inherit_rolling_history(objectNum, self.cplist, self.hist_cplist, object_object, hist_object_object)
+
+    def hash_contact_history(self, objectNum, object_object, hist_object_object):
+        kernel_build_history_table(objectNum, self.hist_cplist, hist_object_object, self.history_table)
+        kernel_hash_rolling_history(objectNum, self.cplist, self.hist_cplist, object_object, hist_object_object, self.history_table)
+
+    def reorder_particle_particle_history(self, particleNum: int, pcontact: NeighborBase, particle_map):
+        kernel_count_reorder_contact_(particleNum, True, particle_map, self.cplist, pcontact.particle_particle, pcontact.hist_particle_particle)
+        pcontact.particle_pse.run(pcontact.particle_particle)
+        kernel_reorder_rolling_history_(particleNum, True, particle_map, self.cplist, self.hist_cplist, pcontact.particle_particle, pcontact.hist_particle_particle)
+        kernel_restore_rolling_history_(particleNum, self.cplist, self.hist_cplist, pcontact.particle_particle)
+        pcontact.update_particle_particle_auxiliary_lists()
+
+    def reorder_particle_wall_history(self, particleNum: int, pcontact: NeighborBase, particle_map):
+        kernel_count_reorder_contact_(particleNum, False, particle_map, self.cplist, pcontact.particle_wall, pcontact.hist_particle_wall)
+        pcontact.particle_pse.run(pcontact.particle_wall)
+        kernel_reorder_rolling_history_(particleNum, False, particle_map, self.cplist, self.hist_cplist, pcontact.particle_wall, pcontact.hist_particle_wall)
+        kernel_restore_rolling_history_(particleNum, self.cplist, self.hist_cplist, pcontact.particle_wall)
+        pcontact.update_particle_wall_auxiliary_lists()
 
 
 @ti.dataclass
@@ -189,6 +218,11 @@ class JiangRollingSurfaceProperty:
         distance = (pos1 - pos2).dot(norm)
         fraction = ti.abs(wall[end2].processCircleShape(pos1, particle_rad, distance))
         return 2 * fraction * particle_rad * self.YoungModulus
+
+    @ti.func
+    def _get_contact_stiffness(self, rad_eff, gapn):
+        kn = 2 * rad_eff * self.YoungModulus
+        return ti.max(kn, kn * self.stiffness_ratio)
     
     @ti.func
     def _normal_force(self, kn, ndratio, gapn, vn):
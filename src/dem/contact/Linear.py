@@ -106,6 +106,10 @@ class LinearSurfaceProperty:
         distance = (pos1 - pos2).dot(norm)
         fraction = ti.abs(wall[end2].processCircleShape(pos1, particle_rad, distance))
         return fraction * self.kn
+
+    @ti.func
+    def _get_contact_stiffness(self, rad_eff, gapn):
+        return ti.max(self.kn, self.ks)
     
     @ti.func
     def _elastic_normal_energy(self, kn, normal_force):
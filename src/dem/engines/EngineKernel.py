@@ -1,10 +1,10 @@
 import taichi as ti
 
 from src.utils.constants import ZEROVEC3f
-from src.utils.Quaternion import SetDQ, SetToRotate, UpdateQAccurate
+from src.utils.Quaternion import SetDQ, SetToRotate
 from src.utils.ScalarFunction import PairingMapping, sgn
 from src.utils.TypeDefination import vec3f
-from src.utils.VectorFunction import SquaredLength, Squared, Normalize
+from src.utils.VectorFunction import Squared, Normalize
 from src.utils import GlobalVariable
 
 
@@ -45,6 +45,43 @@ def w_dot(w, torque, inertia, inv_inertia):
                  (torque[1] + w[2] * w[0] * (inertia[2] - inertia[0])) * inv_inertia[1],
                  (torque[2] + w[0] * w[1] * (inertia[0] - inertia[1])) * inv_inertia[2])
 
+# see Allen and Tildesley (1987) Computer Simulation of Liquids. The five-value Gear corrector of the second order equation of
+# motion carries x, v, a, da/dt and d2a/dt2, the four-value corrector of the first order Euler equation carries w, dw/dt and its
+# two derivatives. The derivatives are stored unscaled, so the step may change between two steps. A body without any derivative
+# has not been integrated yet, it only takes the acceleration: correcting against the zero prediction would seed spurious higher
+# derivatives and degrade the scheme to first order.
+@ti.func
+def gear_correct_translation(dt, x, v, a, jerk, snap, acceleration):
+    delta = acceleration - a
+    if Squared(a) + Squared(jerk) + Squared(snap) == 0.:
+        delta = ZEROVEC3f
+    return x + 19. / 240. * dt * dt * delta, v + 3. / 8. * dt * delta, acceleration, jerk + 1.5 / dt * delta, snap + 1. / (dt * dt) * delta
+
+@ti.func
+def gear_predict_translation(dt, x, v, a, jerk, snap):
+    return x + dt * (v + dt * (0.5 * a + dt * (jerk / 6. + dt * snap / 24.))), v + dt * (a + dt * (0.5 * jerk + dt * snap / 6.)), a + dt * (jerk + 0.5 * dt * snap), jerk + dt * snap
+
+@ti.func
+def gear_correct_rotation(dt, w, aw, jerk_w, snap_w, angular_acceleration):
+    delta = angular_acceleration - aw
+    if Squared(aw) + Squared(jerk_w) + Squared(snap_w) == 0.:
+        delta = ZEROVEC3f
+    return w + 3. / 8. * dt * delta, angular_acceleration, jerk_w + 1.5 / dt * delta, snap_w + 1. / (dt * dt) * delta
+
+@ti.func
+def gear_predict_rotation(dt, w, aw, jerk_w, snap_w):
+    return w + dt * (aw + dt * (0.5 * jerk_w + dt * snap_w / 6.)), aw + dt * (jerk_w + 0.5 * dt * snap_w), jerk_w + dt * snap_w
+
+@ti.func
+def gear_half_step_omega(dt, w, aw, jerk_w, snap_w):
+    return w + 0.5 * dt * (aw + 0.25 * dt * (jerk_w + dt * snap_w / 6.))
+
+@ti.func
+def gear_rotate(dt, q, omega):
+    # midpoint rule of dq/dt = q * w_body / 2 with the angular velocity of the half step
+    half_q = Normalize(q + 0.5 * dt * SetDQ(q, SetToRotate(q).transpose() @ omega))
+    return Normalize(q + dt * SetDQ(half_q, SetToRotate(half_q).transpose() @ omega))
+
 @ti.kernel
 def move_spheres_euler_(bodyNum: int, dt: ti.template(), sphere: ti.template(), particle: ti.template(), material: ti.template(), gravity: ti.types.vector(3, float)):
     for nsphere in range(bodyNum):
@@ -404,6 +441,50 @@ def move_level_set_verlet_(bodyNum: int, dt: ti.template(), sphere: ti.template(
         if ti.static(GlobalVariable.TRACKENERGY):
             rigid[np].damp_energy += cundall_damping_energy(fdamp, tdamp, old_vel, old_omega, cforce + gravity * mass, ctorque, dt)
 
+@ti.kernel
+def move_spheres_predictor_corrector_(bodyNum: int, dt: ti.template(), sphere: ti.template(), particle: ti.template(), material: ti.template(), gravity: ti.types.vector(3, float)):
+    # the stored state is the prediction of the last step, the force evaluated on it corrects the state and predicts the next step
+    for nsphere in range(bodyNum):
+        np = sphere[nsphere].sphereIndex
+        materialID = int(particle[np].materialID)
+        fdamp = material[materialID].fdamp
+        tdamp = material[materialID].tdamp
+        
+        cforce, ctorque = particle[np].contact_force, particle[np].contact_torque
+        mass, is_fix = particle[np].m, sphere[nsphere].fix_v
+        old_pos, old_vel = particle[np].x, particle[np].v
+
+        force = cundall_damp1st(fdamp, cforce + gravity * mass, old_vel)
+        av = force / mass * int(is_fix)
+        pos, vel, av, jerk, snap = gear_correct_translation(dt[None], old_pos, old_vel, sphere[nsphere].a, sphere[nsphere].jerk, sphere[nsphere].snap, av)
+        pos, vel, av, jerk = gear_predict_translation(dt[None], pos, vel, av, jerk, snap)
+
+        sphere[nsphere].a = av
+        sphere[nsphere].jerk = jerk
+        sphere[nsphere].snap = snap
+        particle[np].v = vel
+        particle[np].x = pos
+        particle[np].verletDisp += pos - old_pos
+
+        inv_i, is_fix = sphere[nsphere].inv_I, sphere[nsphere].fix_w
+        old_omega, old_q = particle[np].w, sphere[nsphere].q
+
+        torque = cundall_damp1st(tdamp, ctorque, old_omega)
+        aw = torque * inv_i * int(is_fix)
+        omega, aw, jerk_w, snap_w = gear_correct_rotation(dt[None], old_omega, sphere[nsphere].aw, sphere[nsphere].jerk_w, sphere[nsphere].snap_w, aw)
+        q = gear_rotate(dt[None], old_q, gear_half_step_omega(dt[None], omega, aw, jerk_w, snap_w))
+        omega, aw, jerk_w = gear_predict_rotation(dt[None], omega, aw, jerk_w, snap_w)
+
+        sphere[nsphere].aw = aw
+        sphere[nsphere].jerk_w = jerk_w
+        sphere[nsphere].snap_w = snap_w
+        sphere[nsphere].angmoment = omega / inv_i
+        sphere[nsphere].q = q
+        particle[np].w = omega
+
+        if ti.static(GlobalVariable.TRACKENERGY):
+            particle[np].damp_energy += cundall_damping_energy(fdamp, tdamp, old_vel, old_omega, cforce + gravity * mass, ctorque, dt)
+
 @ti.kernel
 def move_clumps_predictor_corrector_(bodyNum: int, dt: ti.template(), clump: ti.template(), particle: ti.template(), material: ti.template(), gravity: ti.types.vector(3, float)):    
     for nclump in range(bodyNum):
@@ -413,48 +494,41 @@ def move_clumps_predictor_corrector_(bodyNum: int, dt: ti.template(), clump: ti.
         tdamp = material[materialID].tdamp
         
         mass = clump[nclump].m
-        old_av, old_vel, old_pos = clump[nclump].a, clump[nclump].v, clump[nclump].mass_center
+        old_vel, old_pos = clump[nclump].v, clump[nclump].mass_center
 
         cforce, ctorque = ZEROVEC3f, ZEROVEC3f
         for np in range(pebb_beg, pebb_end + 1):
             contact_force = particle[np].contact_force
             cforce += contact_force
             ctorque += particle[np].contact_torque + (particle[np].x - old_pos).cross(contact_force)
-        
-        vel_half = old_vel + 0.5 * dt[None] * old_av
-        force = cundall_damp1st(fdamp, cforce + gravity * mass , vel_half)
-        pos = old_pos + dt[None] * vel_half 
-        av = force / mass 
-        vel = vel_half + 0.5 * av * dt[None]
+
+        force = cundall_damp1st(fdamp, cforce + gravity * mass, old_vel)
+        av = force / mass
+        pos, vel, av, jerk, snap = gear_correct_translation(dt[None], old_pos, old_vel, clump[nclump].a, clump[nclump].jerk, clump[nclump].snap, av)
+        pos, vel, av, jerk = gear_predict_translation(dt[None], pos, vel, av, jerk, snap)
 
         clump[nclump].a = av
+        clump[nclump].jerk = jerk
+        clump[nclump].snap = snap
         clump[nclump].v = vel
         clump[nclump].mass_center = pos
 
         inv_i = clump[nclump].inv_I
-        i = 1. / inv_i
-        old_omega, old_q, old_alpha = clump[nclump].w, clump[nclump].q, clump[nclump].angmoment
+        old_omega, old_q = clump[nclump].w, clump[nclump].q
 
         torque = cundall_damp1st(tdamp, ctorque, old_omega)
         rotation_matrix = SetToRotate(old_q)
-
         torque_local = rotation_matrix.transpose() @ torque
         omega_local = rotation_matrix.transpose() @ old_omega
-
-        temp_alpha0, temp_alpha = vec3f(0, 0, 0), old_alpha
-        while SquaredLength(temp_alpha0, temp_alpha) > 1e-5:
-            temp_alpha0 = temp_alpha
-            temp_omega = omega_local + 0.5 * temp_alpha * dt[None]
-            temp_alpha = vec3f(torque_local[0] + temp_omega[1] * temp_omega[2] * (i[1] - i[2]) * i[0],
-                               torque_local[1] + temp_omega[2] * temp_omega[0] * (i[2] - i[0]) * i[1],
-                               torque_local[2] + temp_omega[0] * temp_omega[1] * (i[0] - i[1]) * i[2])
-        omega_local += temp_alpha * dt[None]
-        omega = rotation_matrix @ omega_local
-
-        # see Langston et al. (2004) Distinct element modelling of non-spherical frictionless particle flow.
-        q = Normalize(UpdateQAccurate(old_q, omega_local, dt))                 
-
-        clump[nclump].angmoment = temp_alpha
+        aw = rotation_matrix @ (inv_i * (torque_local - omega_local.cross(1. / inv_i * omega_local)))
+        omega, aw, jerk_w, snap_w = gear_correct_rotation(dt[None], old_omega, clump[nclump].aw, clump[nclump].jerk_w, clump[nclump].snap_w, aw)
+        q = gear_rotate(dt[None], old_q, gear_half_step_omega(dt[None], omega, aw, jerk_w, snap_w))
+        omega, aw, jerk_w = gear_predict_rotation(dt[None], omega, aw, jerk_w, snap_w)
+
+        clump[nclump].aw = aw
+        clump[nclump].jerk_w = jerk_w
+        clump[nclump].snap_w = snap_w
+        clump[nclump].angmoment = omega / inv_i
         clump[nclump].w = omega
         clump[nclump].q = q
         
@@ -467,6 +541,59 @@ def move_clumps_predictor_corrector_(bodyNum: int, dt: ti.template(), clump: ti.
             particle[np].x = pebble_pos
             particle[np].verletDisp += pebble_pos - old_pebble_pos
 
+        if ti.static(GlobalVariable.TRACKENERGY):
+            damp_energy = cundall_damping_energy(fdamp, tdamp, old_vel, old_omega, cforce + gravity * mass, ctorque, dt)
+            for np in range(pebb_beg, pebb_end + 1):
+                particle[np].damp_energy += damp_energy / (pebb_end - pebb_beg + 1)
+
+@ti.kernel
+def move_level_set_predictor_corrector_(bodyNum: int, dt: ti.template(), sphere: ti.template(), rigid: ti.template(), material: ti.template(), gravity: ti.types.vector(3, float)):
+    for np in range(bodyNum):
+        materialID = int(rigid[np].materialID)
+        fdamp = material[materialID].fdamp
+        tdamp = material[materialID].tdamp
+        
+        cforce, ctorque = rigid[np].contact_force, rigid[np].contact_torque
+        old_center, old_x = rigid[np].mass_center, sphere[np].x
+
+        mass, is_fix = rigid[np].m, rigid[np].is_fix
+        old_vel = rigid[np].v
+        force = cundall_damp1st(fdamp, cforce + gravity * mass, old_vel)
+        av = force / mass * int(is_fix)
+        mass_center, vel, av, jerk, snap = gear_correct_translation(dt[None], old_center, old_vel, rigid[np].a, rigid[np].jerk, rigid[np].snap, av)
+        mass_center, vel, av, jerk = gear_predict_translation(dt[None], mass_center, vel, av, jerk, snap)
+
+        rigid[np].a = av
+        rigid[np].jerk = jerk
+        rigid[np].snap = snap
+        rigid[np].v = vel
+        rigid[np].mass_center = mass_center
+
+        inv_i = rigid[np].inv_I
+        old_omega, old_q = rigid[np].w, rigid[np].q
+
+        torque = cundall_damp1st(tdamp, ctorque, old_omega)
+        rotation_matrix = SetToRotate(old_q)
+        torque_local = rotation_matrix.transpose() @ torque
+        omega_local = rotation_matrix.transpose() @ old_omega
+        aw = rotation_matrix @ (inv_i * (torque_local - omega_local.cross(1. / inv_i * omega_local))) * int(is_fix)
+        omega, aw, jerk_w, snap_w = gear_correct_rotation(dt[None], old_omega, rigid[np].aw, rigid[np].jerk_w, rigid[np].snap_w, aw)
+        q = gear_rotate(dt[None], old_q, gear_half_step_omega(dt[None], omega, aw, jerk_w, snap_w))
+        omega, aw, jerk_w = gear_predict_rotation(dt[None], omega, aw, jerk_w, snap_w)
+
+        rigid[np].aw = aw
+        rigid[np].jerk_w = jerk_w
+        rigid[np].snap_w = snap_w
+        rigid[np].angmoment = omega / inv_i
+        rigid[np].w = omega
+        rigid[np].q = q
+
+        rotation_matrix1 = SetToRotate(q)
+        sphere[np]._move(mass_center + rotation_matrix1 @ (rotation_matrix.transpose() @ (old_x - old_center)) - old_x)
+
+        if ti.static(GlobalVariable.TRACKENERGY):
+            rigid[np].damp_energy += cundall_damping_energy(fdamp, tdamp, old_vel, old_omega, cforce + gravity * mass, ctorque, dt)
+
 @ti.kernel
 def move_walls_euler_(wallNum: int, dt: ti.template(), wall: ti.template()):
     # ti.block_local(dt)
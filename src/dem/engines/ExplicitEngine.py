@@ -3,6 +3,8 @@ import numpy as np
 from src.dem.contact.ContactModelBase import ContactModelBase 
 from src.dem.ContactManager import ContactManager
 from src.dem.neighbor.NeighborBase import NeighborBase
+from src.dem.neighbor.MortonReorder import MortonReorder
+from src.dem.neighbor.VerletTuner import VerletTuner
 from src.dem.engines.EngineKernel import *
 from src.dem.SceneManager import myScene
 from src.dem.Simulation import Simulation
@@ -23,6 +25,8 @@ class ExplicitEngine(object):
         self.update_servo_wall = None
         self.callback = None
         self.calm = None
+        self.reorderer = None
+        self.verlet_tuner = None
 
         self.limit1 = 0.
         self.limit2 = 0.
@@ -33,6 +37,18 @@ class ExplicitEngine(object):
         if sims.scheme == "LSDEM":
             self.update_neighbor_lists = self.update_LSneighbor_list
             self.reset_particle_message = self.reset_level_set_particle
+        elif sims.adaptive_verlet:
+            if self.verlet_tuner is None:
+                self.verlet_tuner = VerletTuner(sims)
+                self.verlet_tuner.tuner_initialize(self.neighbor)
+            self.update_neighbor_lists = self.update_adaptive_neighbor_list
+
+        self.reorder = self.no_operation_other
+        if sims.reorder_interval > 0:
+            if self.reorderer is None:
+                self.reorderer = MortonReorder(sims)
+                self.reorderer.reorder_initialize(self.neighbor)
+            self.reorder = self.morton_reorder
 
         self.reset_wall_message = self.no_operation_rest
         if sims.max_wall_num > 0 and sims.wall_type == 1 and sims.servo_status == "On":
@@ -56,7 +72,12 @@ class ExplicitEngine(object):
             if sims.scheme == "DEM" and sims.max_clump_num > 0:
                 self.calcu_clump_position = self.verlet_clump_integration
         elif sims.engine == "PredictCorrector":
-            pass
+            if sims.scheme == "DEM" and sims.max_sphere_num > 0:
+                self.calcu_sphere_position = self.predictor_corrector_sphere_integration
+            elif sims.scheme == "LSDEM" and sims.max_rigid_body_num > 0:
+                self.calcu_sphere_position = self.predictor_corrector_level_set_integration
+            if sims.scheme == "DEM" and sims.max_clump_num > 0:
+                self.calcu_clump_position = self.predictor_corrector_clump_integration
         else:
             raise RuntimeError("Engine Type is error")
         
@@ -134,7 +155,7 @@ class ExplicitEngine(object):
         return self.neighbor.is_particle_wall_point_need_update_verlet_table(limit, self.scene)
 
     def pre_calculation(self, sims: Simulation, scene: myScene, neighbor: NeighborBase):
-        scene.apply_boundary_conditions()
+        self.apply_boundary_conditions(scene, neighbor)
         if sims.scheme == "DEM":
             neighbor.pre_neighbor(scene)
             self.physpp.update_contact_table(sims, scene, neighbor)
@@ -154,20 +175,48 @@ class ExplicitEngine(object):
             self.limit1 = sims.verlet_distance * sims.verlet_distance
             self.limit2 = sims.point_verlet_distance * sims.point_verlet_distance
 
+    def calculate_critical_timestep(self, sims: Simulation, scene: myScene):
+        # the stiffest active contact bounds the step as sqrt(m / k), the fastest body may only travel a fraction of the smallest radius
+        stiffness_ratio = max(self.physpp.find_max_stiffness_ratio(sims, scene, self.neighbor), self.physpw.find_max_stiffness_ratio(sims, scene, self.neighbor))
+        velocity_ratio = scene.find_max_velocity(sims) / scene.find_particle_min_radius(sims.scheme)
+        frequency = max(stiffness_ratio ** 0.5, velocity_ratio)
+        return 1. / frequency if frequency > 0. else float("inf")
+
     def update_neighbor_list(self, sims, scene: myScene, neighbor: NeighborBase):
+        # verletDisp is accumulated by the integrators with the step actually taken, the check holds when the step varies
         if self.is_verlet_update(self.limit1) == 1:
             self.update_verlet_table(sims, scene, neighbor)
         self.physpp.resolve(sims, scene, neighbor)
         self.physpw.resolve(sims, scene, neighbor)
 
+    def update_adaptive_neighbor_list(self, sims, scene: myScene, neighbor: NeighborBase):
+        self.verlet_tuner.step()
+        if self.is_verlet_update(self.limit1) == 1:
+            self.verlet_tuner.update(scene, neighbor, self.physpp, self.physpw)
+            self.limit1 = sims.verlet_distance * sims.verlet_distance
+            self.update_verlet_table(sims, scene, neighbor)
+        self.physpp.resolve(sims, scene, neighbor)
+        self.physpw.resolve(sims, scene, neighbor)
+
+    def apply_boundary_conditions(self, scene: myScene, neighbor: NeighborBase):
+        # the removed particles are compacted away, the contact history follows the surviving particles to their new indices
+        particleNum = int(scene.particleNum[0])
+        if scene.apply_boundary_conditions():
+            self.physpp.reorder_contact_history(particleNum, neighbor, scene.compaction.particle_map)
+            self.physpw.reorder_contact_history(particleNum, neighbor, scene.compaction.particle_map)
+
     def update_verlet_table(self, sims, scene: myScene, neighbor: NeighborBase):
-        scene.apply_boundary_conditions()
+        self.apply_boundary_conditions(scene, neighbor)
+        self.reorder(sims, scene, neighbor)
         neighbor.update_verlet_table(scene)
         self.physpp.update_contact_table(sims, scene, neighbor)
         self.physpw.update_contact_table(sims, scene, neighbor)
         neighbor.update_particle_particle_auxiliary_lists()
         neighbor.update_particle_wall_auxiliary_lists()
 
+    def morton_reorder(self, sims, scene: myScene, neighbor: NeighborBase):
+        self.reorderer.update(scene, neighbor, self.physpp, self.physpw)
+
     def update_LSneighbor_list(self, sims, scene: myScene, neighbor: NeighborBase):
         if self.is_verlet_update(self.limit1) == 1:
             self.update_LSDEM_verlet_table1(sims, scene, neighbor)
@@ -227,6 +276,15 @@ class ExplicitEngine(object):
     def verlet_level_set_integration(self, sims: Simulation, scene: myScene):
         move_level_set_verlet_(int(scene.particleNum[0]), sims.dt, scene.particle, scene.rigid, scene.material, sims.gravity)
         
+    def predictor_corrector_sphere_integration(self, sims: Simulation, scene: myScene):
+        move_spheres_predictor_corrector_(int(scene.sphereNum[0]), sims.dt, scene.sphere, scene.particle, scene.material, sims.gravity)
+
+    def predictor_corrector_clump_integration(self, sims: Simulation, scene: myScene):
+        move_clumps_predictor_corrector_(int(scene.clumpNum[0]), sims.dt, scene.clump, scene.particle, scene.material, sims.gravity)
+
+    def predictor_corrector_level_set_integration(self, sims: Simulation, scene: myScene):
+        move_level_set_predictor_corrector_(int(scene.particleNum[0]), sims.dt, scene.particle, scene.rigid, scene.material, sims.gravity)
+        
     def compute_aratio(self, sims: Simulation, scene: myScene, neighbor: NeighborBase):
         currF = 0.
         if int(scene.sphereNum[0]) > 0:
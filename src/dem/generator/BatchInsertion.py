@@ -0,0 +1,109 @@
+import taichi as ti
+import math
+
+from src.dem.generator.InsertionKernel import *
+
+
+class BatchInsertion(object):
+    """Inserts spheres by rounds of candidates processed in parallel
+
+    Each round draws a batch of candidates at once and drops those overlapping the spheres already inserted.
+    Overlaps among the candidates of a round are resolved by repeated selection passes that keep a candidate when
+    no overlapping candidate with a smaller index is still kept or pending, so that the accepted candidates are the
+    ones a one-by-one insertion in index order would accept. Candidates are hashed into cells of the same size as
+    the insertion grid; a candidate falling into a full cell is discarded.
+    """
+    def __init__(self) -> None:
+        self.batch_size = 0
+        self.candidate_per_cell = 0
+        self.snode_tree = None
+        self.candidate_coords = None
+        self.candidate_radii = None
+        self.candidate_state = None
+        self.candidate_in_cell = None
+        self.candidate_neighbor = None
+        self.volume_drawn = None
+        self.rounds = 0
+        self.selections = 0
+
+    def clear(self):
+        if self.snode_tree is not None:
+            self.snode_tree.destroy()
+            self.snode_tree = None
+
+    def allocate(self, batch_size, cell_num, tries_number=0):
+        total_cell = int(cell_num[0] * cell_num[1] * cell_num[2])
+        self.batch_size = max(batch_size, total_cell, 1024, tries_number)
+        average = self.batch_size / total_cell
+        self.candidate_per_cell = int(math.ceil(average + 4. * math.sqrt(average))) + 4 + tries_number
+
+        field_builder = ti.FieldsBuilder()
+        self.candidate_coords = ti.Vector.field(3, float)
+        self.candidate_radii = ti.field(float)
+        self.candidate_state = ti.field(int)
+        self.candidate_in_cell = ti.field(int)
+        self.candidate_neighbor = ti.field(int)
+        self.volume_drawn = ti.field(float)
+        field_builder.dense(ti.i, self.batch_size).place(self.candidate_coords, self.candidate_radii, self.candidate_state)
+        field_builder.dense(ti.i, total_cell).place(self.candidate_in_cell)
+        field_builder.dense(ti.ij, (total_cell, self.candidate_per_cell)).place(self.candidate_neighbor)
+        field_builder.place(self.volume_drawn)
+        self.snode_tree = field_builder.finalize()
+        self.rounds = 0
+        self.selections = 0
+
+    def select(self, candidate_num, start_point, neighbor):
+        remains = 1
+        while remains > 0:
+            remains = kernel_select_sphere_candidates_(candidate_num, start_point, neighbor.cell_num, neighbor.cell_size, self.candidate_coords, self.candidate_radii,
+                                                       self.candidate_state, self.candidate_in_cell, self.candidate_neighbor)
+            self.selections += 1
+
+    def insert(self, candidate_num, expected_body_num, start_point, insert_body_num, insert_particle_in_neighbor, sphere_coords, sphere_radii, neighbor):
+        self.rounds += 1
+        return kernel_insert_sphere_candidates_(candidate_num, expected_body_num, start_point, self.candidate_coords, self.candidate_radii, self.candidate_state,
+                                                insert_body_num, insert_particle_in_neighbor, sphere_coords, sphere_radii, neighbor.cell_num, neighbor.cell_size, neighbor.position,
+                                                neighbor.radius, neighbor.num_particle_in_cell, neighbor.particle_neighbor, neighbor.insert_particle)
+
+    def generate_spheres(self, min_rad, max_rad, tries_number, expected_body_num, region, insert_body_num, insert_particle_in_neighbor, sphere_coords, sphere_radii, neighbor):
+        # a round accepting less than one out of /TryNumber/ candidates means the region is (nearly) jammed
+        while insert_body_num[None] < expected_body_num:
+            kernel_sphere_generate_candidates_(self.batch_size, min_rad, max_rad, region.start_point, region.region_size, self.candidate_coords, self.candidate_radii,
+                                               self.candidate_state, self.candidate_in_cell, self.candidate_neighbor, insert_particle_in_neighbor, neighbor.cell_num, neighbor.cell_size,
+                                               neighbor.position, neighbor.radius, neighbor.num_particle_in_cell, neighbor.particle_neighbor, region.function, neighbor.overlap)
+            self.select(self.batch_size, region.start_point, neighbor)
+            inserted = self.insert(self.batch_size, expected_body_num, region.start_point, insert_body_num, insert_particle_in_neighbor, sphere_coords, sphere_radii, neighbor)
+            if inserted * tries_number < self.batch_size:
+                break
+
+    def possion_sampling(self, min_rad, max_rad, tries_number, expected_body_num, region, insert_body_num, insert_particle_in_neighbor, sphere_coords, sphere_radii, neighbor, front=0):
+        # every round takes the next spheres of the front as sources and draws /TryNumber/ candidates around each of them
+        source_per_round = max(self.batch_size // tries_number, 1)
+        while front < insert_body_num[None] and insert_body_num[None] < expected_body_num:
+            source_num = min(insert_body_num[None] - front, source_per_round)
+            candidate_num = source_num * tries_number
+            kernel_sphere_possion_candidates_(candidate_num, front, min_rad, max_rad, tries_number, region.start_point, sphere_coords, sphere_radii, self.candidate_coords,
+                                              self.candidate_radii, self.candidate_state, self.candidate_in_cell, self.candidate_neighbor, insert_particle_in_neighbor, neighbor.cell_num,
+                                              neighbor.cell_size, neighbor.position, neighbor.radius, neighbor.num_particle_in_cell, neighbor.particle_neighbor, region.function, neighbor.overlap)
+            self.select(candidate_num, region.start_point, neighbor)
+            self.insert(candidate_num, expected_body_num, region.start_point, insert_body_num, insert_particle_in_neighbor, sphere_coords, sphere_radii, neighbor)
+            front += source_num
+
+    def distribute_spheres(self, min_rad, max_rad, actual_volume, region, insert_body_num, insert_particle_in_neighbor, sphere_coords, sphere_radii):
+        inserted_volume = 0.
+        self.volume_drawn[None] = 0.
+        while self.volume_drawn[None] < actual_volume:
+            inserted_volume += kernel_distribute_sphere_candidates_(self.batch_size, min_rad, max_rad, actual_volume, self.volume_drawn, insert_body_num, insert_particle_in_neighbor,
+                                                                    sphere_coords, sphere_radii, region.start_point, region.region_size, region.function)
+            self.rounds += 1
+        return inserted_volume
+
+    def print_info(self, body_num, insert_time):
+        if self.selections > 0:
+            print("Parallel Insertion Rounds: ", self.rounds, "   Selection Passes: ", self.selections)
+        else:
+            print("Parallel Insertion Rounds: ", self.rounds)
+        if insert_time > 0.:
+            print("Insertion Throughput: ", body_num / insert_time, "bodies/s")
+        self.rounds = 0
+        self.selections = 0
@@ -1,9 +1,11 @@
 import math
 import os
+import time
 
 import numpy as np
 import taichi as ti
 
+from src.dem.generator.BatchInsertion import BatchInsertion
 from src.dem.generator.BrustNeighbor import BruteSearch
 from src.dem.generator.InsertionKernel import *
 from src.dem.generator.LinkedCellNeighbor import LinkedCell
@@ -216,6 +218,9 @@ class ParticleGenerator(object):
         self.tries_number = 0
         self.porosity = 0.345
         self.is_poission = False
+        self.is_parallel = False
+        self.batch_size = 0
+        self.batch_insertion = None
         self.type = None
         self.btype = None
         self.name = None
@@ -252,6 +257,8 @@ class ParticleGenerator(object):
         self.save_path = DictIO.GetAlternative(body_dict, "SavePath", '')
         self.tries_number = DictIO.GetAlternative(body_dict, "TryNumber", 100)
         self.is_poission = DictIO.GetAlternative(body_dict, "PoissionSampling", False)
+        self.is_parallel = DictIO.GetAlternative(body_dict, "ParallelSampling", False)
+        self.batch_size = DictIO.GetAlternative(body_dict, "BatchSize", 0)
         self.porosity = DictIO.GetAlternative(body_dict, "Porosity", 0.345)
 
     def set_template(self, template_ptr):
@@ -428,7 +435,12 @@ class ParticleGenerator(object):
         self.hist_check_by_number(particle, sphere, clump, sphereNum, clumpNum, insert_num)
         particle_in_region = insert_num + self.region.inserted_particle_num
 
-        if particle_in_region < 1000:
+        if self.is_parallel:
+            if self.neighbor is None: self.neighbor = LinkedCell()
+            self.neighbor.neighbor_init(min(min_radius), max(max_radius), self.region.region_size, particle_in_region, parallel=True)
+            self.batch_insertion = BatchInsertion()
+            self.batch_insertion.allocate(self.batch_size, self.neighbor.cell_num, self.tries_number if self.is_poission else 0)
+        elif particle_in_region < 1000:
             if self.neighbor is None: self.neighbor = BruteSearch()
             self.neighbor.neighbor_init(particle_in_region)
         elif particle_in_region >= 1000:
@@ -445,6 +457,7 @@ class ParticleGenerator(object):
         elif type(self.template_dict) is list:
             for temp in self.template_dict:
                 self.generate_template_spheres(scene, temp)
+        self.clear_batch_insertion()
     
     def hist_check_by_number(self, particle, sphere, clump, sphereNum, clumpNum, insert_num):
         if insert_num > 0.:
@@ -474,9 +487,12 @@ class ParticleGenerator(object):
             raise RuntimeError("Keyword:: /MinRadius/ must not be larger than /MaxRadius/")
 
         start_body_num = self.insert_body_num[None]
+        ti.sync()
+        insert_start = time.time()
         self.GenerateSphere(min_radius, max_radius, actual_body, start_body_num)
         end_body_num = self.insert_body_num[None]
         body_count = end_body_num - start_body_num
+        self.print_insertion_info(body_count, time.time() - insert_start)
         self.region.inserted_body_num = end_body_num
         self.region.inserted_particle_num = end_body_num
         
@@ -556,8 +572,22 @@ class ParticleGenerator(object):
             for temp in self.template_dict:
                 self.insert_sphere(scene, temp, 0, self.insert_body_num[None], self.insert_body_num[None])
 
+    def clear_batch_insertion(self):
+        if self.batch_insertion is not None:
+            self.batch_insertion.clear()
+            self.batch_insertion = None
+
+    def print_insertion_info(self, body_num, insert_time):
+        print(f"Inserting {body_num} bodies costs {insert_time:.4f} s")
+        if self.batch_insertion is not None:
+            self.batch_insertion.print_info(body_num, insert_time)
+        elif insert_time > 0.:
+            print("Insertion Throughput: ", body_num / insert_time, "bodies/s")
+
     def GenerateSphere(self, min_rad, max_rad, actual_body, start_body_num):
-        if self.is_poission:
+        if self.batch_insertion is not None:
+            self.ParallelGenerateSphere(min_rad, max_rad, actual_body, start_body_num)
+        elif self.is_poission:
             if self.insert_particle_in_neighbor[None] - start_body_num == 0:
                 position = self.region.start_point + 0.5 * self.region.region_size
                 radius = 0.5 * (max_rad + min_rad)
@@ -576,6 +606,24 @@ class ParticleGenerator(object):
                                                     self.sphere_coords, self.sphere_radii, self.neighbor.cell_num, self.neighbor.cell_size, self.neighbor.position, self.neighbor.radius, self.neighbor.num_particle_in_cell, 
                                                     self.neighbor.particle_neighbor, self.region.function, self.neighbor.overlap, self.neighbor.insert_particle)
 
+    def ParallelGenerateSphere(self, min_rad, max_rad, actual_body, start_body_num):
+        if self.is_poission:
+            if self.insert_particle_in_neighbor[None] - start_body_num == 0:
+                position = self.region.start_point + 0.5 * self.region.region_size
+                radius = 0.5 * (max_rad + min_rad)
+            else:
+                location = self.insert_particle_in_neighbor[None] - 1
+                position = self.neighbor.position[location]
+                radius = self.neighbor.radius[location]
+
+            kernel_insert_first_sphere_(self.region.start_point, position, radius, self.insert_body_num, self.insert_particle_in_neighbor, self.sphere_coords, self.sphere_radii, self.neighbor.cell_num, 
+                                        self.neighbor.cell_size, self.neighbor.position, self.neighbor.radius, self.neighbor.num_particle_in_cell, self.neighbor.particle_neighbor, self.neighbor.insert_particle)
+            self.batch_insertion.possion_sampling(min_rad, max_rad, self.tries_number, actual_body + start_body_num, self.region, self.insert_body_num, self.insert_particle_in_neighbor, 
+                                                  self.sphere_coords, self.sphere_radii, self.neighbor, front=start_body_num)
+        else:
+            self.batch_insertion.generate_spheres(min_rad, max_rad, self.tries_number, actual_body + start_body_num, self.region, self.insert_body_num, self.insert_particle_in_neighbor, 
+                                                  self.sphere_coords, self.sphere_radii, self.neighbor)
+
     def LatticeSphere(self, min_rad, max_rad, actual_body, start_body_num, insert_particle):
         if self.insert_body_num[None] == 0:
             fill_valid(self.valid)
@@ -615,12 +663,16 @@ class ParticleGenerator(object):
         self.hist_check_by_volume(particle, sphere, clump, sphereNum, clumpNum)
         self.region.estimate_body_volume(total_fraction)
         self.allocate_sphere_memory(insert_particle, distribute=True)
+        if self.is_parallel:
+            self.batch_insertion = BatchInsertion()
+            self.batch_insertion.allocate(self.batch_size, vec3i(1, 1, 1))
 
         if type(self.template_dict) is dict:
             self.distribute_template_spheres(scene, self.template_dict)
         elif type(self.template_dict) is list:
             for temp in self.template_dict:
                 self.distribute_template_spheres(scene, temp)
+        self.clear_batch_insertion()
         
     def distribute_template_spheres(self, scene: myScene, template):       
         fraction = DictIO.GetAlternative(template, "Fraction", 1.0)
@@ -628,9 +680,12 @@ class ParticleGenerator(object):
         max_radius = DictIO.GetEssential(template, "MaxRadius", "Radius")   
         actual_volume = fraction * self.region.expected_particle_volume
         start_body_num =  self.insert_body_num[None]
+        ti.sync()
+        insert_start = time.time()
         insert_volume = self.DistributeSphere(min_radius, max_radius, actual_volume)
         end_body_num = self.insert_body_num[None]
         body_count = end_body_num - start_body_num
+        self.print_insertion_info(body_count, time.time() - insert_start)
         self.region.inserted_body_num = end_body_num
         self.region.inserted_particle_num = end_body_num
         
@@ -669,6 +724,9 @@ class ParticleGenerator(object):
         kernel_position_rotate_(self.region.zdirection, self.region.rotate_center, self.sphere_coords, start_body_num, end_body_num)
 
     def DistributeSphere(self, min_rad, max_rad, actual_volume):
+        if self.batch_insertion is not None:
+            return self.batch_insertion.distribute_spheres(min_rad, max_rad, actual_volume, self.region, self.insert_body_num, self.insert_particle_in_neighbor, 
+                                                           self.sphere_coords, self.sphere_radii)
         return kernel_distribute_sphere_(min_rad, max_rad, actual_volume, self.insert_body_num, self.insert_particle_in_neighbor, self.sphere_coords, self.sphere_radii, 
                                          self.region.start_point, self.region.region_size, self.region.function)
     
@@ -1003,7 +1061,12 @@ class ParticleGenerator(object):
         self.hist_check_levelset_number(bounding_sphere, particleNum, insert_num)
         particle_in_region = insert_num + self.region.inserted_particle_num
 
-        if particle_in_region < 1000:
+        if self.is_parallel:
+            if self.neighbor is None: self.neighbor = LinkedCell()
+            self.neighbor.neighbor_init(min(min_radius), max(max_radius), self.region.region_size, particle_in_region, parallel=True)
+            self.batch_insertion = BatchInsertion()
+            self.batch_insertion.allocate(self.batch_size, self.neighbor.cell_num, self.tries_number if self.is_poission else 0)
+        elif particle_in_region < 1000:
             if self.neighbor is None: self.neighbor = BruteSearch()
             self.neighbor.neighbor_init(particle_in_region)
         elif particle_in_region >= 1000:
@@ -1019,6 +1082,7 @@ class ParticleGenerator(object):
         elif type(self.template_dict) is list:
             for temp in self.template_dict:
                 self.generate_template_rigid_body(scene, temp)
+        self.clear_batch_insertion()
 
     def generate_template_rigid_body(self, scene: myScene, template): 
         actual_body = DictIO.GetEssential(template, "BodyNumber")
@@ -1030,9 +1094,12 @@ class ParticleGenerator(object):
             raise RuntimeError("Keyword:: /MinRadius/ must not be larger than /MaxRadius/")
 
         start_body_num = self.insert_body_num[None]
+        ti.sync()
+        insert_start = time.time()
         self.GenerateSphere(min_radius, max_radius, actual_body, start_body_num)
         end_body_num = self.insert_body_num[None]
         body_count = end_body_num - start_body_num
+        self.print_insertion_info(body_count, time.time() - insert_start)
         self.region.inserted_body_num = end_body_num
         self.region.inserted_particle_num = end_body_num
         parallel_sort_with_value(self.sphere_radii, self.sphere_coords, start_body_num, body_count)
@@ -1,6 +1,6 @@
 import taichi as ti
 
-from src.utils.constants import PI
+from src.utils.constants import PI, Threshold
 from src.utils.Quaternion import RodriguesRotationMatrix, RandomGenerator, SetFromTwoVec, SetToRotate
 from src.utils.TypeDefination import vec3f, vec2f, vec2i, vec4f, vec3u8
 from src.utils.ScalarFunction import vectorize_id, linearize3D, equal_to
@@ -468,6 +468,111 @@ def kernel_sphere_generate_without_overlap_(min_rad: float, max_rad: float, trie
         if count == tries_default:
             break
 
+@ti.func
+def get_candidate_cell(start_point, cell_num, cell_size, sphere_coord):
+    cell_index = ti.max(ti.min(ti.floor((sphere_coord - start_point) / cell_size, int), cell_num - 1), 0)
+    return cell_index, linearize3D(cell_index[0], cell_index[1], cell_index[2], cell_num)
+
+@ti.func
+def register_sphere_candidate(nc, sphere_coord, sphere_radius, start_point, cell_num, cell_size, candidate_coords, candidate_radii, candidate_state, candidate_in_cell, candidate_neighbor):
+    # state of a candidate: 0 rejected, 1 pending, 2 accepted
+    candidate_coords[nc] = sphere_coord
+    candidate_radii[nc] = sphere_radius
+    candidate_state[nc] = 0
+    _, cell_id = get_candidate_cell(start_point, cell_num, cell_size, sphere_coord)
+    location = ti.atomic_add(candidate_in_cell[cell_id], 1)
+    if location < candidate_neighbor.shape[1]:
+        candidate_neighbor[cell_id, location] = nc
+        candidate_state[nc] = 1
+
+@ti.func
+def candidate_conflict(nc, state_min, start_point, cell_num, cell_size, candidate_coords, candidate_radii, candidate_state, candidate_in_cell, candidate_neighbor):
+    # returns the smallest index of the candidates with state >= state_min overlapping candidate nc, or -1
+    conflict = -1
+    position, rad = candidate_coords[nc], candidate_radii[nc]
+    cell_index, _ = get_candidate_cell(start_point, cell_num, cell_size, position)
+    cell_begin = ti.max(cell_index - 1, 0)
+    cell_end = ti.min(cell_index + 2, cell_num)
+    for i, j, k in ti.ndrange((cell_begin[0], cell_end[0]), (cell_begin[1], cell_end[1]), (cell_begin[2], cell_end[2])):
+        cell_id = linearize3D(i, j, k, cell_num)
+        for location in range(ti.min(candidate_in_cell[cell_id], candidate_neighbor.shape[1])):
+            slave = candidate_neighbor[cell_id, location]
+            if slave != nc and candidate_state[slave] >= state_min and (conflict == -1 or slave < conflict):
+                if candidate_radii[slave] + rad - (candidate_coords[slave] - position).norm() > Threshold:
+                    conflict = slave
+    return conflict
+
+@ti.kernel
+def kernel_sphere_generate_candidates_(candidate_num: int, min_rad: float, max_rad: float, start_point: ti.types.vector(3, float), region_size: ti.types.vector(3, float), candidate_coords: ti.template(), 
+                                       candidate_radii: ti.template(), candidate_state: ti.template(), candidate_in_cell: ti.template(), candidate_neighbor: ti.template(), insert_particle_in_neighbor: ti.template(), 
+                                       cell_num: ti.types.vector(3, int), cell_size: float, position: ti.template(), radius: ti.template(), num_particle_in_cell: ti.template(), particle_neighbor: ti.template(), 
+                                       check_in_domain: ti.template(), overlap: ti.template()):
+    candidate_in_cell.fill(0)
+    for nc in range(candidate_num):
+        sphere_radius = min_rad + ti.random() * (max_rad - min_rad)
+        offset = vec3f([ti.random(), ti.random(), ti.random()]) * region_size
+        sphere_coord = start_point + offset 
+        candidate_state[nc] = 0
+        if check_in_domain(sphere_coord, sphere_radius) and \
+           overlap(cell_num, cell_size, sphere_coord - start_point, sphere_radius, insert_particle_in_neighbor, position, radius, num_particle_in_cell, particle_neighbor) == 0: 
+            register_sphere_candidate(nc, sphere_coord, sphere_radius, start_point, cell_num, cell_size, candidate_coords, candidate_radii, candidate_state, candidate_in_cell, candidate_neighbor)
+
+@ti.kernel
+def kernel_sphere_possion_candidates_(candidate_num: int, source_start: int, min_rad: float, max_rad: float, tries_default: int, start_point: ti.types.vector(3, float), sphere_coords: ti.template(), 
+                                      sphere_radii: ti.template(), candidate_coords: ti.template(), candidate_radii: ti.template(), candidate_state: ti.template(), candidate_in_cell: ti.template(), 
+                                      candidate_neighbor: ti.template(), insert_particle_in_neighbor: ti.template(), cell_num: ti.types.vector(3, int), cell_size: float, position: ti.template(), radius: ti.template(), 
+                                      num_particle_in_cell: ti.template(), particle_neighbor: ti.template(), check_in_domain: ti.template(), overlap: ti.template()):
+    candidate_in_cell.fill(0)
+    for nc in range(candidate_num):
+        source = source_start + nc // tries_default
+        source_x, source_rad = sphere_coords[source], sphere_radii[source]
+        sphere_radius = min_rad + ti.random() * (max_rad - min_rad)
+        u, v = ti.random(), ti.random()
+        theta, phi = 2 * PI * u, ti.acos(2 * v - 1)
+        randvector = vec3f([ti.sin(theta) * ti.sin(phi), ti.cos(theta) * ti.sin(phi), ti.cos(phi)]).normalized()
+        offset = randvector * ((1 + ti.random()) * sphere_radius + source_rad)
+        sphere_coord = source_x + offset
+        candidate_state[nc] = 0
+        if check_in_domain(sphere_coord, sphere_radius) and \
+           overlap(cell_num, cell_size, sphere_coord - start_point, sphere_radius, insert_particle_in_neighbor, position, radius, num_particle_in_cell, particle_neighbor) == 0: 
+            register_sphere_candidate(nc, sphere_coord, sphere_radius, start_point, cell_num, cell_size, candidate_coords, candidate_radii, candidate_state, candidate_in_cell, candidate_neighbor)
+
+@ti.kernel
+def kernel_select_sphere_candidates_(candidate_num: int, start_point: ti.types.vector(3, float), cell_num: ti.types.vector(3, int), cell_size: float, candidate_coords: ti.template(), candidate_radii: ti.template(), 
+                                     candidate_state: ti.template(), candidate_in_cell: ti.template(), candidate_neighbor: ti.template()) -> int:
+    # a pending candidate is accepted when no pending or accepted candidate with a smaller index overlaps it, which
+    # reproduces inserting the candidates one by one in index order
+    for nc in range(candidate_num):
+        if candidate_state[nc] == 1:
+            conflict = candidate_conflict(nc, 1, start_point, cell_num, cell_size, candidate_coords, candidate_radii, candidate_state, candidate_in_cell, candidate_neighbor)
+            if conflict == -1 or conflict > nc:
+                candidate_state[nc] = 2
+
+    remains = 0
+    for nc in range(candidate_num):
+        if candidate_state[nc] == 1:
+            if candidate_conflict(nc, 2, start_point, cell_num, cell_size, candidate_coords, candidate_radii, candidate_state, candidate_in_cell, candidate_neighbor) != -1:
+                candidate_state[nc] = 0
+            else:
+                remains += 1
+    return remains
+
+@ti.kernel
+def kernel_insert_sphere_candidates_(candidate_num: int, expected_body_num: int, start_point: ti.types.vector(3, float), candidate_coords: ti.template(), candidate_radii: ti.template(), candidate_state: ti.template(), 
+                                     insert_body_num: ti.template(), insert_particle_in_neighbor: ti.template(), sphere_coords: ti.template(), sphere_radii: ti.template(), cell_num: ti.types.vector(3, int), 
+                                     cell_size: float, position: ti.template(), radius: ti.template(), num_particle_in_cell: ti.template(), particle_neighbor: ti.template(), insert_particle: ti.template()) -> int:
+    inserted = 0
+    for nc in range(candidate_num):
+        if candidate_state[nc] == 2:
+            body_id = ti.atomic_add(insert_body_num[None], 1)
+            if body_id < expected_body_num:
+                sphere_coords[body_id] = candidate_coords[nc]
+                sphere_radii[body_id] = candidate_radii[nc]
+                insert_particle(cell_num, cell_size, candidate_coords[nc] - start_point, candidate_radii[nc], insert_particle_in_neighbor, position, radius, num_particle_in_cell, particle_neighbor)
+                inserted += 1
+    insert_body_num[None] = ti.min(insert_body_num[None], expected_body_num)
+    return inserted
+
 @ti.kernel                
 def kernel_sphere_generate_lattice_(min_rad: float, max_rad: float, expected_body_num: int, position_distribution: ti.types.vector(3, int), start_point: ti.types.vector(3, float), valid: ti.template(),
                                     insert_body_num: ti.template(), insert_particle_in_neighbor: ti.template(),  sphere_coords: ti.template(), sphere_radii: ti.template(), 
@@ -521,6 +626,25 @@ def kernel_distribute_sphere_(min_rad: float, max_rad: float, volume_expect: flo
             insert_particle_in_neighbor[None] += 1
     return inserted_volume
 
+@ti.kernel
+def kernel_distribute_sphere_candidates_(candidate_num: int, min_rad: float, max_rad: float, volume_expect: float, volume_drawn: ti.template(), insert_body_num: ti.template(), insert_particle_in_neighbor: ti.template(), 
+                                         sphere_coords: ti.template(), sphere_radii: ti.template(), start_point: ti.types.vector(3, float), region_size: ti.types.vector(3, float), check_in_domain: ti.template()) -> float:
+    inserted_volume = 0.
+    for _ in range(candidate_num):
+        sphere_radius = min_rad + ti.random() * (max_rad - min_rad)
+        offset = vec3f([ti.random(), ti.random(), ti.random()]) * region_size
+        sphere_coord = start_point + offset 
+        
+        if check_in_domain(sphere_coord, sphere_radius):        
+            pvol = 4./3. * PI * sphere_radius * sphere_radius * sphere_radius
+            if ti.atomic_add(volume_drawn[None], pvol) < volume_expect:
+                body_id = ti.atomic_add(insert_body_num[None], 1)
+                sphere_coords[body_id] = sphere_coord
+                sphere_radii[body_id] = sphere_radius
+                inserted_volume += pvol
+                ti.atomic_add(insert_particle_in_neighbor[None], 1)
+    return inserted_volume
+
 @ti.kernel
 def kernel_insert_first_multisphere_(start_point: ti.types.vector(3, float), nspheres: int, r_equiv: float, x_pebble: ti.types.ndarray(), rad_pebble: ti.types.ndarray(), 
                                      com_pos: ti.types.vector(3, float), equiv_rad: float, insert_body_num: ti.template(), insert_particle_in_neighbor: ti.template(), 
@@ -691,6 +815,16 @@ def kernel_rebuild_clump(start: int, number: int, clump: ti.template(), startInd
                                vec3f(angmoment[nclump, 0], angmoment[nclump, 1], angmoment[nclump, 2]), vec4f(q[nclump, 0], q[nclump, 1], q[nclump, 2], q[nclump, 3]), vec3f(inv_I[nclump, 0], inv_I[nclump, 1], inv_I[nclump, 2]))
 
 
+@ti.kernel
+def kernel_rebuild_predictor_corrector(start: int, number: int, body: ti.template(), jerk: ti.types.ndarray(), snap: ti.types.ndarray(), aw: ti.types.ndarray(), 
+                                       jerk_w: ti.types.ndarray(), snap_w: ti.types.ndarray()):
+    for sbody in range(start, start + number):
+        nbody = sbody - start
+        body[sbody]._restart_predictor_corrector(vec3f(jerk[nbody, 0], jerk[nbody, 1], jerk[nbody, 2]), vec3f(snap[nbody, 0], snap[nbody, 1], snap[nbody, 2]), 
+                                                 vec3f(aw[nbody, 0], aw[nbody, 1], aw[nbody, 2]), vec3f(jerk_w[nbody, 0], jerk_w[nbody, 1], jerk_w[nbody, 2]), 
+                                                 vec3f(snap_w[nbody, 0], snap_w[nbody, 1], snap_w[nbody, 2]))
+
+
 @ti.kernel
 def kernel_rebuild_plane(start: int, number: int, wall: ti.template(), active: ti.types.ndarray(), wallID: ti.types.ndarray(), materialID: ti.types.ndarray(), point: ti.types.ndarray(), norm: ti.types.ndarray()):
     for swall in range(start, start + number):
@@ -2,6 +2,7 @@ import numpy as np
 
 from src.sdf.BasicShape import BasicShape
 from src.dem.generator.Boundings import Boundings
+from src.dem.generator.TemplateCache import TemplateCache
 from src.utils.ObjectIO import DictIO
 
 
@@ -19,6 +20,7 @@ class LevelSetTemplate(object):
         self.soft_template = False
         self.surface_resolution = 2 ** 22
         self.surface_node_number = 0
+        self.cache = None
 
     def levelset_template(self, template_dict):
         print('#', "Start calculating properties of level-set template ...".ljust(67))
@@ -31,6 +33,8 @@ class LevelSetTemplate(object):
         self.save_path = DictIO.GetAlternative(template_dict, "SavePath", './')
         self.visualize_mode = DictIO.GetAlternative(template_dict, "VisualizeMode", None)
         self.length_size = DictIO.GetAlternative(template_dict, "LengthSize", None)
+        cache_path = DictIO.GetAlternative(template_dict, "CachePath", None)
+        cache_key = DictIO.GetAlternative(template_dict, "CacheKey", None)
 
         if not self.visualize_mode in ["gui", "matplot", None]:
             raise RuntimeError
@@ -42,8 +46,13 @@ class LevelSetTemplate(object):
             raise RuntimeError("You asked for a level set shape with no more than two boundary nodes, for contact detection purposes. \
                                This is too few and will lead to square roots of negative numbers, then unexpected events.")
         
-        self.build()
-        self.multibody_template_initialize()
+        if cache_path is not None:
+            self.cache = TemplateCache(cache_path)
+        if self.cache is None or not self.cache.load(self, cache_key):
+            self.build()
+            self.multibody_template_initialize()
+            if self.cache is not None:
+                self.cache.save(self)
         self.print_info()
         self.visualize()
         self.write()
@@ -119,6 +128,8 @@ class LevelSetTemplate(object):
 
     def write(self):
         if self.write_file:
+            if self.objects.grid.node_coord is None:
+                self.objects.grid.build_node_coords()
             self.objects.dump_files(path=self.save_path, pname=self.name+'Particle', gname=self.name+'Grid')
             self.objects.visualize(path=self.save_path, pname=self.name+'Particle', gname=self.name+'Grid', bname=self.name+'Box')
 
@@ -21,10 +21,13 @@ class LinkedCell(object):
         self.snode_tree.destroy()
         del self.cell_num, self.cell_size, self.num_particle_in_cell, self.particle_neighbor, self.position, self.radius
 
-    def neighbor_init(self, min_rad, max_rad, region_size, expected_particle_number):
+    def neighbor_init(self, min_rad, max_rad, region_size, expected_particle_number, parallel=False):
         self.cell_size = 2 * max_rad
         ratio = math.ceil(max_rad / min_rad)
         particle_per_cell = max(ratio * ratio * ratio, 4)
+        if parallel:
+            # spheres inserted concurrently may fill a cell up to the densest packing of the smallest spheres
+            particle_per_cell = max(particle_per_cell, math.ceil((self.cell_size + 2 * min_rad) ** 3 * 0.7405 / (4./3. * math.pi * min_rad ** 3)))
         self.cell_num = vec3i(ti.ceil(region_size[0] / self.cell_size), ti.ceil(region_size[1] / self.cell_size), ti.ceil(region_size[2] / self.cell_size))
         total_cell = int(self.cell_num[0] * self.cell_num[1] * self.cell_num[2])
         
@@ -103,12 +106,11 @@ def insert_particle(cell_num, cell_size, pos, rad, offset, position, radius, num
     cell_index = get_cell_index(cell_size, pos)
     cell_id = get_cell_id(cell_index[0], cell_index[1], cell_index[2], cell_num)
     particle_id = ti.atomic_add(offset[None], 1)
-    particle_in_cell = num_particle_in_cell[cell_id]
+    particle_in_cell = ti.atomic_add(num_particle_in_cell[cell_id], 1)
     
     position[particle_id] = pos
     radius[particle_id] = rad
     particle_neighbor[cell_id, particle_in_cell] = particle_id
-    ti.atomic_add(num_particle_in_cell[cell_id], 1)
 
 @ti.func
 def overlap(cell_num, cell_size, pos, rad, offset, position, radius, num_particle_in_cell, particle_neighbor):   
@@ -6,6 +6,7 @@ from src.dem.generator.InsertionKernel import *
 from src.dem.generator.LevelSetTemplate import LevelSetTemplate
 from src.dem.SceneManager import myScene
 from src.dem.Simulation import Simulation
+from src.utils.ChunkedStore import frame_exists, load_frame
 from src.utils.ObjectIO import DictIO
 from src.utils.TypeDefination import vec3f, vec3i
 
@@ -297,10 +298,10 @@ class ParticleReader(object):
                 raise ValueError("Particle type error")
         
     def restart_particles(self, scene: myScene, particle_file_name):
-        if not os.path.exists(particle_file_name):
+        if not frame_exists(particle_file_name):
             raise EOFError("Invaild particle path")
         
-        particle_info = np.load(particle_file_name, allow_pickle=True) 
+        particle_info = load_frame(particle_file_name) 
         particle_number = int(DictIO.GetEssential(particle_info, "body_num"))
         if self.sims.is_continue:
             self.sims.current_time = DictIO.GetEssential(particle_info, "t_current")
@@ -321,10 +322,10 @@ class ParticleReader(object):
         print("Inserted particle Number: ", particle_number)
 
     def restart_spheres(self, scene: myScene, sphere_file_name):
-        if not os.path.exists(sphere_file_name):
+        if not frame_exists(sphere_file_name):
             raise EOFError("Invaild sphere path")
         
-        sphere_info = np.load(sphere_file_name, allow_pickle=True) 
+        sphere_info = load_frame(sphere_file_name) 
         sphere_number = int(DictIO.GetEssential(sphere_info, "body_num"))
 
         scene.check_sphere_number(self.sims, body_number=sphere_number)
@@ -336,14 +337,15 @@ class ParticleReader(object):
                               DictIO.GetEssential(sphere_info, "angular_moment"),
                               DictIO.GetEssential(sphere_info, "fix_v"),
                               DictIO.GetEssential(sphere_info, "fix_w"))
+        self.restart_predictor_corrector(int(scene.sphereNum[0]), sphere_number, scene.sphere, sphere_info)
         scene.sphereNum[0] += sphere_number
         print("Inserted sphere Number: ", sphere_number)
 
     def restart_clumps(self, scene: myScene, clump_file_name):
-        if not os.path.exists(clump_file_name):
+        if not frame_exists(clump_file_name):
             raise EOFError("Invaild clump path")
         
-        clump_info = np.load(clump_file_name, allow_pickle=True) 
+        clump_info = load_frame(clump_file_name) 
         clump_number = int(DictIO.GetEssential(clump_info, "body_num"))
 
         scene.check_clump_number(self.sims, body_number=clump_number)
@@ -359,9 +361,20 @@ class ParticleReader(object):
                              DictIO.GetEssential(clump_info, "angular_moment"),
                              DictIO.GetEssential(clump_info, "quanternion"),
                              DictIO.GetEssential(clump_info, "inverse_inertia"))
+        self.restart_predictor_corrector(int(scene.clumpNum[0]), clump_number, scene.clump, clump_info)
         scene.clumpNum[0] += clump_number
         print("Inserted clump Number: ", clump_number)
 
+    def restart_predictor_corrector(self, start, body_number, body, body_info):
+        # files written by the other engines carry no derivatives, the predictor-corrector then starts from zero as on a fresh run
+        if self.sims.engine == "PredictCorrector" and "jerk" in body_info:
+            kernel_rebuild_predictor_corrector(start, body_number, body, 
+                                               DictIO.GetEssential(body_info, "jerk"),
+                                               DictIO.GetEssential(body_info, "snap"),
+                                               DictIO.GetEssential(body_info, "aw"),
+                                               DictIO.GetEssential(body_info, "jerk_w"),
+                                               DictIO.GetEssential(body_info, "snap_w"))
+
     def load_npz_spheres(self, scene, template):
         pass
 
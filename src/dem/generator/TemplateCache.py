@@ -0,0 +1,128 @@
+import hashlib, json, os, shutil, time, uuid
+import numpy as np
+import trimesh as tm
+
+from src.dem.generator.Boundings import Boundings
+from src.sdf.BasicShape import Surface
+
+
+CACHE_FORMAT = 1
+PROBE_NUMBER = 4096
+SOURCE_FILES = [os.path.join("sdf", name) for name in ("BasicShape.py", "BuildSurfaceNode.py", "FastMarchingMethod.py", "LevelSetGrid.py", "MultiSDF.py", "SDFs.py", "SDFs3D.py", "mesh.py")] + \
+               [os.path.join("dem", "generator", "LevelSetTemplate.py"), os.path.join("dem", "generator", "Boundings.py")]
+ARRAYS = ["distance_field", "start_point", "region_size", "gnum", "vertices", "faces", "parameter", "center", "inertia", "x_bound", "center_mass", "extents"]
+_code_version = None
+
+
+def get_code_version():
+    # the sources building a template, so that a change of the construction invalidates the entries stored before
+    global _code_version
+    if _code_version is None:
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        digest = hashlib.sha256(str(CACHE_FORMAT).encode())
+        for file in SOURCE_FILES:
+            path = os.path.join(root, file)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+class TemplateCache(object):
+    """Content-addressed store of level-set templates
+
+    An entry is keyed by the geometry of the object, its generation settings (grid space and extent, resolution,
+    ray tracing, number of surface nodes, ray path) and the version of the code building the template. The geometry
+    is the mesh itself for mesh-based objects and the distance function sampled at fixed points of the bounding box
+    otherwise. Every entry is a folder of ``.npy`` arrays, loaded memory-mapped, and ``info.json`` holding the scalars
+    and the time the construction took. Entries are written to a temporary folder first and renamed, so that runs
+    sharing the cache do not read half-written entries.
+    """
+    def __init__(self, path) -> None:
+        self.path = path
+        self.key = None
+        self.start_time = 0.
+
+    def get_key(self, template, cache_key=None):
+        objects = template.objects
+        digest = hashlib.sha256()
+        digest.update(type(objects).__name__.encode())
+        settings = {key: value for key, value in vars(objects).items() if isinstance(value, (bool, int, float, str))}
+        if objects.grid is not None:
+            settings.update({"grid_space": float(objects.grid.grid_space), "extent": int(objects.grid.extent)})
+        settings.update({"ray_path": template.ray_path, "surface_resolution": int(template.surface_resolution),
+                         "surface_node_number": int(template.surface_node_number), "code_version": get_code_version()})
+        if cache_key is not None:
+            settings.update({"cache_key": str(cache_key)})
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+
+        if objects.mesh is not None:
+            digest.update(np.ascontiguousarray(objects.mesh.vertices, dtype=np.float64).tobytes())
+            digest.update(np.ascontiguousarray(objects.mesh.faces, dtype=np.int64).tobytes())
+        else:
+            lower_bound, upper_bound = np.array(objects.lower_bound, dtype=np.float64), np.array(objects.upper_bound, dtype=np.float64)
+            probe = lower_bound + np.random.default_rng(0).random((PROBE_NUMBER, 3)) * (upper_bound - lower_bound)
+            digest.update(lower_bound.tobytes())
+            digest.update(upper_bound.tobytes())
+            # surfaces only have a distance once their mesh is built, their implicit function is sampled instead
+            probe_function = objects.fx if isinstance(objects, Surface) else objects
+            digest.update(np.ascontiguousarray(probe_function(probe), dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def load(self, template, cache_key=None):
+        self.start_time = time.time()
+        self.key = self.get_key(template, cache_key)
+        folder = os.path.join(self.path, self.key)
+        if not os.path.exists(os.path.join(folder, "info.json")):
+            print("Template cache miss: ", self.key)
+            return False
+
+        with open(os.path.join(folder, "info.json"), "r") as f:
+            info = json.load(f)
+        data = {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode='r') for name in ARRAYS}
+
+        objects = template.objects
+        objects.grid.clear()
+        objects.grid.start_point = np.array(data["start_point"])
+        objects.grid.region_size = np.array(data["region_size"])
+        objects.grid.gnum = np.array(data["gnum"], dtype=np.int32)
+        objects.grid.gridSum = int(np.prod(objects.grid.gnum))
+        objects.grid.distance_field = data["distance_field"]
+        objects.mesh = tm.Trimesh(vertices=np.array(data["vertices"]), faces=np.array(data["faces"]), process=False)
+        objects.volume = info["volume"]
+        objects.center = data["center"]
+        objects.inertia = data["inertia"]
+        template.boundings = Boundings()
+        template.boundings.set_boundings(np.array(data["x_bound"]), info["r_bound"], np.array(data["center_mass"]), np.array(data["extents"]))
+        template.parameter = data["parameter"]
+        template.surface_node_number = info["surface_node_number"]
+
+        load_time = time.time() - self.start_time
+        print("Template cache hit: ", self.key)
+        print(f"Template loaded in {load_time:.4f} s, time saved = {max(info['build_time'] - load_time, 0.):.4f} s")
+        return True
+
+    def save(self, template):
+        build_time = time.time() - self.start_time
+        objects = template.objects
+        mesh = objects.mesh
+        data = {"distance_field": objects.grid.distance_field, "start_point": objects.grid.start_point, "region_size": objects.grid.region_size, "gnum": objects.grid.gnum,
+                "vertices": mesh.vertices, "faces": mesh.faces, "parameter": template.parameter, "center": objects.center, "inertia": objects.inertia,
+                "x_bound": template.boundings.x_bound, "center_mass": mesh.center_mass, "extents": mesh.bounding_box.extents}
+        info = {"name": template.name, "build_time": build_time, "volume": float(objects.volume), "eqradius": float(objects.eqradius),
+                "r_bound": float(template.boundings.r_bound), "surface_node_number": int(template.surface_node_number)}
+
+        folder = os.path.join(self.path, self.key)
+        temporary = os.path.join(self.path, f".{self.key}.{uuid.uuid4().hex}")
+        os.makedirs(temporary)
+        for name in ARRAYS:
+            np.save(os.path.join(temporary, name + ".npy"), np.ascontiguousarray(data[name]))
+        with open(os.path.join(temporary, "info.json"), "w") as f:
+            json.dump(info, f)
+        try:
+            os.rename(temporary, folder)
+        except OSError:
+            # another run stored the same template meanwhile
+            shutil.rmtree(temporary, ignore_errors=True)
+        print(f"Template built in {build_time:.4f} s and stored in the cache")
@@ -1,9 +1,10 @@
-import os, warnings
+import warnings
 
 from src.dem.generator.InsertionKernel import *
 from src.dem.SceneManager import myScene
 from src.dem.Simulation import Simulation
 from src.utils.linalg import flip2d
+from src.utils.ChunkedStore import frame_exists, load_frame
 from src.utils.ObjectIO import DictIO
 from src.utils.PolygonDiscretization import *
 from src.utils.TypeDefination import vec3f
@@ -274,10 +275,10 @@ class WallGenerator(object):
         
     def restart_npz_wall(self, wall, sims: Simulation, scene: myScene):
         if not wall is None:
-            if not os.path.exists(wall):
+            if not frame_exists(wall):
                 raise EOFError("Invaild wall path")
             
-            wall_info = np.load(wall, allow_pickle=True) 
+            wall_info = load_frame(wall) 
             wall_number = int(DictIO.GetEssential(wall_info, "body_num"))
             if sims.is_continue:
                 sims.current_time = DictIO.GetAlternative(wall_info, "t_current", 0)
@@ -319,7 +320,7 @@ class WallGenerator(object):
             if wall is None:
                 raise EOFError("Invalid path to read wall information")
             
-            servo_info = np.load(servo, allow_pickle=True)
+            servo_info = load_frame(servo)
             servo_number = int(DictIO.GetEssential(servo_info, "body_num"))
 
             scene.check_servo_number(sims, body_number=servo_number)
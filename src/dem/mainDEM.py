@@ -42,6 +42,7 @@ class DEM(object):
         self.sims.set_engine(DictIO.GetAlternative(kwargs, "engine", "SymplecticEuler"))
         self.sims.set_search(DictIO.GetAlternative(kwargs, "search", "LinkedCell"))
         self.sims.set_search_direction(DictIO.GetAlternative(kwargs, "search_direction", "Up"))
+        self.sims.set_history_transfer(DictIO.GetAlternative(kwargs, "history_transfer", "LinearScan"))
         self.sims.set_dem_scheme(DictIO.GetAlternative(kwargs, "scheme", "DEM"))
         self.sims.set_track_energy(DictIO.GetAlternative(kwargs, "track_energy", False))
         self.sims.set_visualize(DictIO.GetAlternative(kwargs, "visualize", True))
@@ -53,9 +54,16 @@ class DEM(object):
         self.sims.set_timestep(DictIO.GetEssential(solver, "Timestep"))
         self.sims.set_simulation_time(DictIO.GetEssential(solver, "SimulationTime"))
         self.sims.set_CFL(DictIO.GetAlternative(solver, "CFL", 0.5))
-        self.sims.set_adaptive_timestep(DictIO.GetAlternative(solver, "AdaptiveTimestep", False))
+        self.sims.set_adaptive_timestep(DictIO.GetAlternative(solver, "AdaptiveTimestep", False), DictIO.GetAlternative(solver, "AdaptiveInterval", 1))
+        self.sims.set_reorder_interval(DictIO.GetAlternative(solver, "ReorderInterval", 0))
+        self.sims.set_adaptive_verlet(DictIO.GetAlternative(solver, "AdaptiveVerlet", False), DictIO.GetAlternative(solver, "VerletTuneWindow", 4), DictIO.GetAlternative(solver, "VerletDistanceRange", [0.25, 4.]))
         self.sims.set_save_interval(DictIO.GetEssential(solver, "SaveInterval"))
         self.sims.set_save_path(DictIO.GetAlternative(solver, "SavePath", 'OutputData'))
+        self.sims.set_async_output(DictIO.GetAlternative(solver, "AsyncOutput", False), DictIO.GetAlternative(solver, "OutputQueueSize", 2))
+        self.sims.set_output_format(DictIO.GetAlternative(solver, "OutputFormat", "npz"), DictIO.GetAlternative(solver, "Compression", 1), DictIO.GetAlternative(solver, "Downcast", False))
+        self.sims.set_contact_output(DictIO.GetAlternative(solver, "ContactOutput", "Full"), DictIO.GetAlternative(solver, "RestartInterval", 10),
+                                    DictIO.GetAlternative(solver, "KeyframeInterval", 10))
+        self.sims.set_profile(DictIO.GetAlternative(solver, "Profile", False), DictIO.GetAlternative(solver, "ProfileInterval", 0))
         if log: 
             self.print_solver_info()
             print('\n')
@@ -105,6 +113,7 @@ class DEM(object):
         print(("Engine Type: " + str(self.sims.engine)).ljust(67))
         print(("Neighbor Search Type: " + str(self.sims.search)).ljust(67))
         print(("DEM Scheme: " + str(self.sims.scheme)).ljust(67))
+        print(("Contact History Transfer: " + str(self.sims.history_transfer)).ljust(67))
         if self.sims.energy_tracking:
             print("Energy tracking: ON")
 
@@ -113,8 +122,22 @@ class DEM(object):
         print(("Initial Simulation Time: " + str(self.sims.current_time)).ljust(67))
         print(("Finial Simulation Time: " + str(self.sims.current_time + self.sims.time)).ljust(67))
         print(("Time Step: " + str(self.sims.dt[None])).ljust(67))
+        if self.sims.isadaptive:
+            print(("Adaptive Time Step: CFL = " + str(self.sims.CFL) + ", Update Interval: " + str(self.sims.adaptive_interval)).ljust(67))
         print(("Save Interval: " + str(self.sims.save_interval)).ljust(67))
         print(("Save Path: " + str(self.sims.path)).ljust(67))
+        if self.sims.async_output:
+            print(("Asynchronous Output Queue: " + str(self.sims.output_queue_size)).ljust(67))
+        if self.sims.output_format == "chunked":
+            print(("Chunked Output Compression: " + str(self.sims.output_compression) + (", float32" if self.sims.output_downcast else "")).ljust(67))
+        if self.sims.contact_output == "Sparse":
+            print(("Sparse Contact Output, Restart Interval: " + str(self.sims.restart_interval) + ", Keyframe Interval: " + str(self.sims.keyframe_interval)).ljust(67))
+        if self.sims.reorder_interval > 0:
+            print(("Morton Reorder Interval: " + str(self.sims.reorder_interval)).ljust(67))
+        if self.sims.adaptive_verlet:
+            print(("Adaptive Verlet Distance, Tune Window: " + str(self.sims.verlet_tune_window) + " rebuilds").ljust(67))
+        if self.sims.profile:
+            print(("Profile Report Interval: " + str(self.sims.profile_interval)).ljust(67))
 
     def add_region(self, region):
         if type(region) is dict:
@@ -220,7 +243,7 @@ class DEM(object):
             self.sims.set_simulation_time(DictIO.GetEssential(kwargs, "SimulationTime"))
             if "Timestep" in kwargs: self.sims.set_timestep(DictIO.GetEssential(kwargs, "Timestep"))
             if "CFL" in kwargs: self.sims.set_CFL(DictIO.GetEssential(kwargs, "CFL"))
-            if "AdaptiveTimestep" in kwargs: self.sims.set_adaptive_timestep(DictIO.GetEssential(kwargs, "AdaptiveTimestep"))
+            if "AdaptiveTimestep" in kwargs: self.sims.set_adaptive_timestep(DictIO.GetEssential(kwargs, "AdaptiveTimestep"), DictIO.GetAlternative(kwargs, "AdaptiveInterval", self.sims.adaptive_interval))
             if "SaveInterval" in kwargs: self.sims.set_save_interval(DictIO.GetEssential(kwargs, "SaveInterval"))
             if "SavePath" in kwargs: self.sims.set_save_path(DictIO.GetEssential(kwargs, "SavePath"))
             if "gravity" in kwargs: self.sims.set_gravity(DictIO.GetEssential(kwargs, "gravity"))
@@ -286,6 +309,10 @@ class DEM(object):
 
     def check_critical_timestep(self):
         print("#", " Check Timestep ... ...".ljust(67))
+        if self.sims.isadaptive:
+            # the solver estimates the step from the active contacts, the prescribed step is only the upper bound
+            print("The time step is adapted to the active contacts\n")
+            return
         critical_timestep = self.get_critical_timestep()
         if self.sims.CFL * critical_timestep < self.sims.dt[None]:
             self.sims.update_critical_timestep(self.sims.CFL * critical_timestep)
@@ -316,13 +343,20 @@ class DEM(object):
         self.contactor.update_contact_property(self.sims, materialID1, materialID2, property_name, value, overide)
 
     def delete_particles(self, bodyID=None, region_name=None, function=None):
+        if self.sims.scheme != "DEM":
+            raise RuntimeError("Particle deletion is only supported by DEM scheme")
+        particleNum = int(self.scene.particleNum[0])
         if not bodyID is None:
-            self.scene.delete_particles(bodyID)
+            self.scene.delete_particles(self.sims, bodyID)
         elif not region_name is None:
             region: RegionFunction = self.generator.get_region_ptr(region_name)
-            self.scene.delete_particles_in_region(region.function)
+            self.scene.delete_particles_in_region(self.sims, region.function)
         elif not function is None:
-            self.scene.delete_particles_in_region(ti.pyfunc(function))
+            self.scene.delete_particles_in_region(self.sims, ti.pyfunc(function))
+
+        if self.contactor is not None and self.contactor.have_initialise and int(self.scene.particleNum[0]) < particleNum:
+            self.contactor.physpp.reorder_contact_history(particleNum, self.contactor.neighbor, self.scene.compaction.particle_map)
+            self.contactor.physpw.reorder_contact_history(particleNum, self.contactor.neighbor, self.scene.compaction.particle_map)
 
     def postprocessing(self, start_file=0, end_file=-1, read_path=None, write_path=None, scheme=None, **kwargs):
         if read_path is None:
@@ -32,8 +32,8 @@ class BrustSearch(NeighborBase):
         self.sims.set_verlet_distance(rad_min)
         self.sims.set_potential_list_size(rad_max)
 
-        if self.sims.pbc:
-            pass
+        if self.sims.pbc and self.sims.scheme == "LSDEM":
+            raise RuntimeError("Keyword:: /boundary/ Period boundary is not supported in LSDEM scheme")
 
         self.particle_pse = PrefixSumExecutor(self.sims.max_particle_num + 1)
         if self.sims.scheme == "LSDEM":
@@ -8,7 +8,6 @@ from src.dem.SceneManager import myScene
 from src.dem.Simulation import Simulation
 from src.utils.constants import Threshold
 from src.utils.PrefixSum import PrefixSumExecutor, serial
-from src.utils.TypeDefination import vec3i
 from src.utils.linalg import no_operation
 
 
@@ -78,9 +77,6 @@ class HierarchicalLinkedCell(NeighborBase):
         self.sims.set_verlet_distance(min(min_bounding_rad, rad_min[0]))
         self.sims.update_hierarchical_size(max(max_bounding_rad, rad_max[-1]))
         potential_particle_ratio = self.sims.compute_potential_ratios(rad_max)
-        
-        if self.sims.pbc:
-            pass
 
         initialize_body_information(int(scene.particleNum[0]), np.array(potential_particle_ratio), np.array(self.sims.body_coordination_number), np.array(self.sims.wall_coordination_number), self.body)
         serial(self.body.max_potential_particle_pairs)
@@ -118,7 +114,7 @@ class HierarchicalLinkedCell(NeighborBase):
             if grid_size < self.sims.hierarchical_size[i] * Threshold:
                 raise RuntimeError("Particle radius is equal to zero!")
             igrid_size = 1. / grid_size
-            cell_num = vec3i([int(domain * igrid_size) + 1 for domain in self.sims.domain])
+            cell_num = self.calculate_cell_number(igrid_size)
             cellSum = int(cell_num[0] * cell_num[1] * cell_num[2])
             gsize.append(grid_size)
             cnum.append(cell_num)
@@ -64,20 +64,13 @@ class LinkedCell(NeighborBase):
         rad_min = min(min_bounding_rad, rad_min)
         self.sims.set_verlet_distance(rad_min)
         self.sims.set_potential_list_size(rad_max)
-            
-        if self.sims.pbc:
-            pass
-        
+
+        self.rad_max = rad_max
         self.grid_size = 2 * (rad_max + self.sims.verlet_distance)
-        self.plane_insert_factor = 0.5 + rad_max / self.grid_size
         if self.grid_size < 1e-3 * Threshold:
             raise RuntimeError("Particle radius is equal to zero!")
-        self.igrid_size = 1. / self.grid_size
-        self.cnum = vec3i([int(domain * self.igrid_size) + 1 for domain in self.sims.domain])
-        for d in range(3):
-            if self.cnum[d] == 0:
-                self.cnum[d] = int(1)
-        self.cellSum = int(self.cnum[0] * self.cnum[1] * self.cnum[2])
+        self.set_grid_size(self.grid_size)
+        self.min_grid_size = self.grid_size
         
         self.cell_pse = PrefixSumExecutor(self.cellSum + 1)
         self.particle_pse = PrefixSumExecutor(self.sims.max_particle_num + 1)
@@ -87,6 +80,28 @@ class LinkedCell(NeighborBase):
         self.set_hash_table()
         self.print_info()
 
+    def set_grid_size(self, grid_size):
+        self.grid_size = grid_size
+        self.plane_insert_factor = 0.5 + self.rad_max / self.grid_size
+        self.igrid_size = 1. / self.grid_size
+        self.cnum = self.calculate_cell_number(self.igrid_size)
+        for d in range(3):
+            if self.cnum[d] == 0:
+                self.cnum[d] = int(1)
+        self.cellSum = int(self.cnum[0] * self.cnum[1] * self.cnum[2])
+
+    def is_grid_resizable(self):
+        # the hash tables of the initial grid are reused, so only coarser grids fit, and wall tables are sized per cell
+        return self.sims.wall_type is None or self.sims.wall_type == 3
+
+    def get_max_grid_size(self):
+        max_grid_size = 2. * max(self.sims.domain)
+        if self.sims.pbc:
+            for d in range(3):
+                if self.sims.boundary[d] == 2:
+                    max_grid_size = min(max_grid_size, 0.999 * self.sims.domain[d] / 3.)
+        return max_grid_size
+
     def print_info(self):
         print(" Neighbor Search Initialize ".center(71,"-"))
         print("Neighbor search method:  Linked-cell")
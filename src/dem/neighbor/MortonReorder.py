@@ -0,0 +1,79 @@
+import taichi as ti
+import math
+
+from src.dem.BaseKernel import count_body_particles_, reorder_particle_storage_, copy_storage_
+from src.dem.BaseStruct import ParticleFamily, SphereFamily, ClumpFamily
+from src.dem.contact.ContactModelBase import ContactModelBase
+from src.dem.neighbor.neighbor_kernel import calculate_body_morton_code_
+from src.dem.neighbor.LinkedCell import LinkedCell
+from src.dem.SceneManager import myScene
+from src.dem.Simulation import Simulation
+from src.utils.PrefixSum import PrefixSumExecutor
+from src.utils.sorting.RadixSort import RadixSort
+
+
+class MortonReorder(object):
+    sims: Simulation
+
+    def __init__(self, sims: Simulation) -> None:
+        self.sims = sims
+        self.shift = 0
+        self.verlet_update_num = 0
+        self.sorter = None
+        self.body_pse = None
+        self.particle_offset = None
+        self.sphere_offset = None
+        self.particle_map = None
+        self.particle_buffer = None
+        self.sphere_buffer = None
+        self.clump_buffer = None
+
+    def reorder_initialize(self, neighbor: LinkedCell):
+        if self.sims.wall_type == 3:
+            raise RuntimeError("Keyword:: /ReorderInterval/ Morton reordering is not supported for digital elevation facets")
+
+        max_body_num = self.sims.max_sphere_num + self.sims.max_clump_num
+        self.sorter = RadixSort(max(max_body_num, 1), with_value=True)
+        self.body_pse = PrefixSumExecutor(max_body_num + 1)
+        self.particle_offset = ti.field(int, shape=self.body_pse.get_length())
+        self.sphere_offset = ti.field(int, shape=self.body_pse.get_length())
+        self.particle_map = ti.field(int, shape=self.sims.max_particle_num)
+        self.particle_buffer = ParticleFamily.field(shape=self.sims.max_particle_num)
+        if self.sims.max_sphere_num > 0:
+            self.sphere_buffer = SphereFamily.field(shape=self.sims.max_sphere_num)
+        if self.sims.max_clump_num > 0:
+            self.clump_buffer = ClumpFamily.field(shape=self.sims.max_clump_num)
+
+        # morton3d32 encodes 10 bits per axis, coarser cells are used for larger grids
+        self.shift = max(0, int(math.ceil(math.log2(max(neighbor.cnum)))) - 10)
+        self.print_info(neighbor.grid_size * 2 ** self.shift)
+
+    def print_info(self, cell_size):
+        print(" Morton Reorder Initialize ".center(71,"-"))
+        print("Reorder interval (Verlet updates): ", self.sims.reorder_interval)
+        print("Morton cell size: ", cell_size, '\n')
+
+    def update(self, scene: myScene, neighbor: LinkedCell, physpp: ContactModelBase, physpw: ContactModelBase):
+        self.verlet_update_num += 1
+        if self.verlet_update_num % self.sims.reorder_interval == 0:
+            self.reorder(scene, neighbor, physpp, physpw)
+
+    def reorder(self, scene: myScene, neighbor: LinkedCell, physpp: ContactModelBase, physpw: ContactModelBase):
+        sphereNum, clumpNum = int(scene.sphereNum[0]), int(scene.clumpNum[0])
+        bodyNum = sphereNum + clumpNum
+        if bodyNum == 0: return
+        calculate_body_morton_code_(sphereNum, clumpNum, self.shift, neighbor.igrid_size, scene.particle, scene.sphere, scene.clump,
+                                    self.sorter.data_in, self.sorter.value_in, neighbor.cnum)
+        self.sorter.run(bodyNum, 30)
+        count_body_particles_(bodyNum, sphereNum, scene.clump, self.sorter.value_in, self.particle_offset, self.sphere_offset)
+        self.body_pse.run(self.particle_offset)
+        self.body_pse.run(self.sphere_offset)
+        reorder_particle_storage_(bodyNum, sphereNum, self.sorter.value_in, self.particle_offset, self.sphere_offset, scene.particle, scene.sphere, scene.clump,
+                                  self.particle_buffer, self.sphere_buffer, self.clump_buffer, self.particle_map)
+        copy_storage_(int(scene.particleNum[0]), self.particle_buffer, scene.particle)
+        if sphereNum > 0:
+            copy_storage_(sphereNum, self.sphere_buffer, scene.sphere)
+        if clumpNum > 0:
+            copy_storage_(clumpNum, self.clump_buffer, scene.clump)
+        physpp.reorder_contact_history(int(scene.particleNum[0]), neighbor, self.particle_map)
+        physpw.reorder_contact_history(int(scene.particleNum[0]), neighbor, self.particle_map)
@@ -106,6 +106,19 @@ class NeighborBase(object):
         elif self.sims.max_particle_num > 0 and self.sims.max_wall_num > 0 and self.sims.wall_type != 0:
             self.reset_verletDisp = scene.reset_verlet_disp
 
+    def calculate_cell_number(self, igrid_size):
+        cnum = [int(domain * igrid_size) + 1 for domain in self.sims.domain]
+        if self.sims.pbc:
+            if self.sims.scheme == "LSDEM":
+                raise RuntimeError("Keyword:: /boundary/ Period boundary is not supported in LSDEM scheme")
+            for d in range(3):
+                if self.sims.boundary[d] == 2:
+                    # cells of a periodic axis must tile the domain exactly, the last one absorbs the remainder
+                    cnum[d] = int(self.sims.domain[d] * igrid_size)
+                    if cnum[d] < 3:
+                        raise RuntimeError(f"Keyword:: /domain/ is too small along the periodic axis {d}, at least 3 cells of size {1. / igrid_size} are required")
+        return vec3i(cnum)
+
     def set_potential_contact_list(self, scene):
         if self.sims.max_particle_num > 1:
             if self.sims.scheme == "DEM":
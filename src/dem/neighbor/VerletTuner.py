@@ -0,0 +1,115 @@
+import taichi as ti
+from time import perf_counter
+
+from src.dem.contact.ContactModelBase import ContactModelBase
+from src.dem.neighbor.neighbor_kernel import get_max_object_number
+from src.dem.neighbor.LinkedCell import LinkedCell
+from src.dem.SceneManager import myScene
+from src.dem.Simulation import Simulation
+
+
+class VerletTuner(object):
+    """Adjusts the verlet distance (and the linked-cell size) at neighbor list rebuilds
+
+    The wall time between rebuilds, rebuilds included, is accumulated over a window of rebuilds and divided by the
+    number of steps. A thin skin gives short candidate lists but frequent rebuilds, a thick one the opposite: the
+    skin is scaled in the current direction at the end of each window and the direction is reversed whenever the
+    cost per step grows, so that it settles where both balance and follows the flow regime when it changes.
+    The skin is bounded by the lists allocated from /body_coordination_number/ and /compaction_ratio/, using the
+    candidate numbers of the last rebuild, and by the cells: coarser cells than the initial ones are only used
+    when no wall is hashed into the cells.
+    """
+    sims: Simulation
+
+    def __init__(self, sims: Simulation) -> None:
+        self.sims = sims
+        self.safety_factor = 0.9
+        self.max_factor = 1.25
+        self.min_factor = 1.05
+        self.max_window_steps = 100
+        self.factor = self.max_factor
+        self.direction = 1
+        self.improvements = 0
+        self.initial_verlet_distance = 0.
+        self.last_cost = None
+        self.window_start = None
+        self.window_steps = 0
+        self.window_rebuilds = 0
+        self.grid_resizable = False
+
+    def tuner_initialize(self, neighbor: LinkedCell):
+        self.initial_verlet_distance = self.sims.verlet_distance
+        self.grid_resizable = neighbor.is_grid_resizable()
+        self.print_info()
+
+    def print_info(self):
+        print(" Verlet Distance Tuner Initialize ".center(71,"-"))
+        print("Initial verlet distance: ", self.initial_verlet_distance)
+        print("Verlet distance range: ", [self.sims.verlet_distance_range[0] * self.initial_verlet_distance, self.sims.verlet_distance_range[1] * self.initial_verlet_distance])
+        print("Tune window (Verlet updates): ", self.sims.verlet_tune_window)
+        print("Resize linked cells: ", self.grid_resizable, '\n')
+
+    def step(self):
+        self.window_steps += 1
+
+    def update(self, scene: myScene, neighbor: LinkedCell, physpp: ContactModelBase, physpw: ContactModelBase):
+        ti.sync()
+        current = perf_counter()
+        if self.window_start is None:
+            self.reset_window(current)
+            return
+
+        self.window_rebuilds += 1
+        if self.window_rebuilds < self.sims.verlet_tune_window and self.window_steps < self.max_window_steps * self.sims.verlet_tune_window:
+            return
+
+        cost = (current - self.window_start) / max(self.window_steps, 1)
+        if self.last_cost is not None:
+            if cost > self.last_cost:
+                self.direction = -self.direction
+                self.factor = max(self.min_factor, self.factor ** 0.5)
+                self.improvements = 0
+            else:
+                self.improvements += 1
+                if self.improvements >= 2:
+                    self.factor = min(self.max_factor, self.factor ** 2)
+                    self.improvements = 0
+        self.last_cost = cost
+
+        verlet_distance = self.sims.verlet_distance * self.factor ** self.direction
+        verlet_distance = max(verlet_distance, self.sims.verlet_distance_range[0] * self.initial_verlet_distance)
+        verlet_distance = min(verlet_distance, self.get_max_verlet_distance(scene, neighbor, physpp, physpw))
+        if verlet_distance > 0.:
+            self.set_verlet_distance(neighbor, verlet_distance)
+        self.reset_window(perf_counter())
+
+    def reset_window(self, current):
+        self.window_start = current
+        self.window_steps = 0
+        self.window_rebuilds = 0
+
+    def get_max_verlet_distance(self, scene: myScene, neighbor: LinkedCell, physpp: ContactModelBase, physpw: ContactModelBase):
+        rad_max = max(neighbor.rad_max, self.sims.max_bounding_sphere_radius)
+        max_grid_size = neighbor.get_max_grid_size() if self.grid_resizable else neighbor.grid_size
+        max_verlet_distance = min(self.sims.verlet_distance_range[1] * self.initial_verlet_distance, 0.5 * max_grid_size - rad_max)
+
+        # candidates lie within rad1 + rad2 + 2 * verlet_distance, the smallest particles see the largest relative growth
+        rad_min = self.sims.min_bounding_sphere_radius
+        particleNum = int(scene.particleNum[0])
+        limits = []
+        if self.sims.max_particle_num > 1 and physpp.cplist is not None:
+            limits.append((get_max_object_number(particleNum, neighbor.particle_particle), self.sims.potential_particle_num))
+            limits.append((neighbor.particle_particle[particleNum], physpp.cplist.shape[0]))
+        if neighbor.particle_wall is not None and physpw.cplist is not None:
+            limits.append((get_max_object_number(particleNum, neighbor.particle_wall), self.sims.wall_coordination_number))
+            limits.append((neighbor.particle_wall[particleNum], physpw.cplist.shape[0]))
+        for number, capacity in limits:
+            if number > 0:
+                growth = (self.safety_factor * capacity / number) ** (1. / 3.)
+                max_verlet_distance = min(max_verlet_distance, (rad_min + self.sims.verlet_distance) * growth - rad_min)
+        return max_verlet_distance
+
+    def set_verlet_distance(self, neighbor: LinkedCell, verlet_distance):
+        self.sims.verlet_distance = verlet_distance
+        if self.grid_resizable:
+            neighbor.set_grid_size(max(2. * (max(neighbor.rad_max, self.sims.max_bounding_sphere_radius) + verlet_distance), neighbor.min_grid_size))
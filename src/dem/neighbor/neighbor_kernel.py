@@ -1,11 +1,14 @@
 import taichi as ti
 
-from src.utils.constants import Threshold, ZEROVEC3f
+from src.utils.constants import PI, Threshold, ZEROVEC3f
 from src.utils.GeometryFunction import intersectionOBBs
 from src.utils.TypeDefination import vec3f, vec3i, vec2i
 from src.utils.Quaternion import SetToRotate
 from src.utils.VectorFunction import SquaredLength, SquareLen
 from src.utils.ScalarFunction import linearize3D, vectorize_id
+from src.utils.BitFunction import morton3d32
+from src.utils.DomainBoundary import periodic_image, periodic_position, periodic_cell_index
+from src.utils import GlobalVariable
 
 
 @ti.kernel
@@ -20,7 +23,7 @@ def validate_pprelative_displacement_(limit: float, particleNum: int, dt: ti.tem
     flag = 0 
     for nc in range(total_contact):
         end1, end2 = pplist[nc].endID1, pplist[nc].endID2
-        pos1, pos2 = particle[end1].x, particle[end2].x
+        pos1, pos2 = particle[end1].x, periodic_image(particle[end1].x, particle[end2].x)
         rad1, rad2 = particle[end1].rad, particle[end2].rad
         vel1, vel2 = rigid[end1]._get_velocity(), rigid[end2]._get_velocity()
         w1, w2 = rigid[end1]._get_angular_velocity(), rigid[end2]._get_angular_velocity()
@@ -56,6 +59,13 @@ def initial_object_object(object_object: ti.template(), hist_object_object: ti.t
     for i in hist_object_object:
         hist_object_object[i] = object_object[i]
 
+@ti.kernel
+def get_max_object_number(objectNum: int, object_object: ti.template()) -> int:
+    max_number = 0
+    for i in range(objectNum):
+        ti.atomic_max(max_number, object_object[i + 1] - object_object[i])
+    return max_number
+
 # ================================================================= #
 #                                                                   #
 #                         Brust Search                              #
@@ -75,7 +85,7 @@ def board_search_particle_particle_brust_(potential_particle_num: int, particleN
             if master < slave and not index == particle[slave]._get_multisphere_index2():
                 pos2 = particle[slave].x
                 rad2 = particle[slave].rad
-                valid = SquaredLength(pos2, pos1) <= (rad1 + rad2 + 2 * verlet_distance) * (rad1 + rad2 + 2 * verlet_distance)
+                valid = SquaredLength(periodic_image(pos1, pos2), pos1) <= (rad1 + rad2 + 2 * verlet_distance) * (rad1 + rad2 + 2 * verlet_distance)
                 if valid: 
                     potential_list_particle_particle[sques] = slave
                     sques += 1
@@ -127,21 +137,78 @@ def board_search_particle_wall_brust_hierarchical_(particleNum: int, wallNum: in
 def get_cell_center(nc, cnum, grid_size):
     return (vec3f([vectorize_id(nc, cnum)]) + 0.5) * grid_size
 
+@ti.func
+def get_cell_index(position, igrid_size, cnum):
+    # the last cell of a periodic axis is stretched up to the domain end
+    grid_idx = ti.floor(position * igrid_size, int)
+    wrapped = periodic_position(position)
+    for d in ti.static(range(3)):
+        if ti.static(GlobalVariable.PERIODIC[d]):
+            grid_idx[d] = ti.min(int(wrapped[d] * igrid_size), cnum[d] - 1)
+    return grid_idx
+
+@ti.func
+def get_neighbor_cell_range(grid_idx, cnum):
+    cell_begin = ti.max(grid_idx - 1, 0)
+    cell_end = ti.min(grid_idx + 2, cnum)
+    for d in ti.static(range(3)):
+        if ti.static(GlobalVariable.PERIODIC[d]):
+            cell_begin[d] = grid_idx[d] - 1
+            cell_end[d] = grid_idx[d] + 2
+    return cell_begin, cell_end
+
+@ti.func
+def get_cell_range(lower, upper, igrid_size, cnum):
+    cell_begin = ti.max(ti.floor(lower * igrid_size, int), 0)
+    cell_end = ti.min(ti.ceil(upper * igrid_size, int), cnum)
+    begin_idx, end_idx = get_cell_index(lower, igrid_size, cnum), get_cell_index(upper, igrid_size, cnum)
+    for d in ti.static(range(3)):
+        if ti.static(GlobalVariable.PERIODIC[d]):
+            if (upper[d] - lower[d]) * igrid_size + 2 >= cnum[d]:
+                cell_begin[d], cell_end[d] = 0, cnum[d]
+            else:
+                cell_begin[d] = begin_idx[d]
+                cell_end[d] = begin_idx[d] + (end_idx[d] - begin_idx[d]) % cnum[d] + 1
+    return cell_begin, cell_end
+
+@ti.func
+def get_cell_id(neigh_i, neigh_j, neigh_k, cnum):
+    cell = periodic_cell_index(vec3i(neigh_i, neigh_j, neigh_k), cnum)
+    return linearize3D(cell[0], cell[1], cell[2], cnum)
+
 @ti.kernel
 def calculate_particles_position_(particleNum: int, igrid_size: float, particle: ti.template(), particle_count: ti.template(), particle_current: ti.template(), cnum: ti.types.vector(3, int)):
     # TODO: using morton code
     particle_count.fill(0)
     for np in range(particleNum):  
         if int(particle[np].active) == 0: continue
-        grid_idx = ti.floor(particle[np].x * igrid_size , int)
+        grid_idx = get_cell_index(particle[np].x, igrid_size, cnum)
         cellID = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
         particle_current[np] = ti.atomic_add(particle_count[cellID + 1], 1)
     
+@ti.func
+def get_morton_code(position, igrid_size, cnum, shift):
+    grid_idx = ti.floor(position * igrid_size, int)
+    grid_idx = ti.max(ti.min(grid_idx, cnum - 1), 0)
+    return morton3d32(grid_idx[0] >> shift, grid_idx[1] >> shift, grid_idx[2] >> shift)
+
+@ti.kernel
+def calculate_body_morton_code_(sphereNum: int, clumpNum: int, shift: int, igrid_size: float, particle: ti.template(), sphere: ti.template(), clump: ti.template(), 
+                                morton_code: ti.template(), bodyID: ti.template(), cnum: ti.types.vector(3, int)):
+    if ti.static(not sphere == None):
+        for nsphere in range(sphereNum):
+            morton_code[nsphere] = get_morton_code(particle[sphere[nsphere].sphereIndex].x, igrid_size, cnum, shift)
+            bodyID[nsphere] = nsphere
+    if ti.static(not clump == None):
+        for nclump in range(clumpNum):
+            morton_code[sphereNum + nclump] = get_morton_code(clump[nclump].mass_center, igrid_size, cnum, shift)
+            bodyID[sphereNum + nclump] = sphereNum + nclump
+
 @ti.kernel
 def insert_particle_to_cell_(igrid_size: float, particleNum: int, particle: ti.template(), particle_count: ti.template(), particle_current: ti.template(), particleID: ti.template(), cnum: ti.types.vector(3, int)):
     for np in range(particleNum):
         if int(particle[np].active) == 0: continue
-        grid_idx = ti.floor(particle[np].x * igrid_size, int)
+        grid_idx = get_cell_index(particle[np].x, igrid_size, cnum)
         cellID = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
         grain_location = particle_count[cellID] + particle_current[np]
         particleID[grain_location] = np
@@ -156,27 +223,22 @@ def board_search_particle_particle_linked_cell_(particleNum: int, potential_part
         position = particle[master].x
         radius = particle[master].rad
         index = particle[master]._get_multisphere_index1()
-        grid_idx = ti.floor(position * igrid_size, int)
+        grid_idx = get_cell_index(position, igrid_size, cnum)
         
-        x_begin = ti.max(grid_idx[0] - 1, 0)
-        x_end = ti.min(grid_idx[0] + 2, cnum[0])
-        y_begin = ti.max(grid_idx[1] - 1, 0)
-        y_end = ti.min(grid_idx[1] + 2, cnum[1])
-        z_begin = ti.max(grid_idx[2] - 1, 0)
-        z_end = ti.min(grid_idx[2] + 2, cnum[2])
+        cell_begin, cell_end = get_neighbor_cell_range(grid_idx, cnum)
 
         sques = master * potential_particle_num
         # isques = (master + 1) * potential_particle_num - 1
-        for neigh_i in range(x_begin, x_end):
-            for neigh_j in range(y_begin, y_end):
-                for neigh_k in range(z_begin, z_end):
-                    cellID = linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+        for neigh_i in range(cell_begin[0], cell_end[0]):
+            for neigh_j in range(cell_begin[1], cell_end[1]):
+                for neigh_k in range(cell_begin[2], cell_end[2]):
+                    cellID = get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                     for hash_index in range(particle_count[cellID], particle_count[cellID + 1]):
                         slave = particleID[hash_index]
                         if master < slave and not index == particle[slave]._get_multisphere_index2():
                             pos2 = particle[slave].x 
                             rad2 = particle[slave].rad
-                            valid = SquaredLength(pos2, position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
+                            valid = SquaredLength(periodic_image(position, pos2), position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
                             if valid: 
                                 potential_list_particle_particle[sques] = slave
                                 sques += 1
@@ -306,6 +368,48 @@ def board_search_coupled_lsparticle_linked_cell_(potential_particle_num: int, ve
         assert neighbors <= potential_particle_num, f"Keyword:: DEMPM /body_coordination_number/ is too small, Particle {master} has {neighbors} potential contact number"
         particle_particle[master + 1] = neighbors
 
+
+@ti.func
+def fluid_cell_range(position, radius, igrid_size, cnum):
+    cell_start = ti.max(ti.floor((position - radius) * igrid_size, int), 0)
+    cell_end = ti.min(ti.floor((position + radius) * igrid_size, int), cnum - 1)
+    return cell_start, cell_end
+
+
+@ti.func
+def fluid_cell_weight(neigh_i, neigh_j, neigh_k, position, radius, grid_size):
+    # share of the bounding cube of the particle falling into the cell
+    lower = vec3f(neigh_i, neigh_j, neigh_k) * grid_size
+    overlap = ti.max(ti.min(position + radius, lower + grid_size) - ti.max(position - radius, lower), 0.)
+    return overlap[0] * overlap[1] * overlap[2] / (8. * radius * radius * radius)
+
+
+@ti.kernel
+def place_fluid_particle_(igrid_size: ti.types.vector(3, float), cnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), matProps: ti.template(), fluid_cell: ti.template()):
+    for nc in fluid_cell:
+        fluid_cell[nc]._reset_fluid()
+
+    for np in range(particleNum):
+        if int(particle[np].active) == 0: continue
+        grid_idx = ti.min(ti.max(ti.floor(particle[np].x * igrid_size, int), 0), cnum - 1)
+        cellID = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
+        viscosity = matProps[int(particle[np].materialID)].viscosity
+        fluid_cell[cellID]._update_fluid(particle[np].m, particle[np].vol, viscosity, particle[np].v)
+
+
+@ti.kernel
+def place_solid_particle_(grid_size: ti.types.vector(3, float), igrid_size: ti.types.vector(3, float), cnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), fluid_cell: ti.template()):
+    for nc in fluid_cell:
+        fluid_cell[nc]._reset_solid()
+
+    for np in range(particleNum):
+        position, radius = particle[np]._get_position(), particle[np]._get_radius()
+        volume = 4./3. * PI * radius * radius * radius
+        cell_start, cell_end = fluid_cell_range(position, radius, igrid_size, cnum)
+        for neigh_i, neigh_j, neigh_k in ti.ndrange((cell_start[0], cell_end[0] + 1), (cell_start[1], cell_end[1] + 1), (cell_start[2], cell_end[2] + 1)):
+            weight = fluid_cell_weight(neigh_i, neigh_j, neigh_k, position, radius, grid_size)
+            fluid_cell[linearize3D(neigh_i, neigh_j, neigh_k, cnum)]._update_solid(weight * volume)
+
 '''
 @ti.kernel
 def board_search_particle_particle_linked_cell_(particleNum: int, cellSum: int, potential_particle_num: int, verlet_distance: float, igrid_size: float, grid_size:float, particle_count: ti.template(), 
@@ -443,7 +547,7 @@ def board_search_particle_plane_linked_cell_(particleNum: int, potential_wall_nu
     for particle_id in range(particleNum):
         position = particle[particle_id].x
         radius = particle[particle_id].rad 
-        grid_idx = ti.floor(position * igrid_size, int)
+        grid_idx = get_cell_index(position, igrid_size, cnum)
         
         sques = particle_id * potential_wall_num
         cellID = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
@@ -484,7 +588,7 @@ def board_search_particle_facet_linked_cell_(particleNum: int, potential_wall_nu
     for particle_id in range(particleNum):
         position = particle[particle_id].x
         radius = particle[particle_id].rad 
-        grid_idx = ti.floor(position * igrid_size, int)
+        grid_idx = get_cell_index(position, igrid_size, cnum)
 
         sques = particle_id * potential_wall_num
         cellID = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
@@ -564,7 +668,7 @@ def board_search_particle_static_facet_linked_cell_(particleNum: int, potential_
     for particle_id in range(particleNum):
         position = particle[particle_id].x
         radius = particle[particle_id].rad 
-        grid_idx = ti.floor(position * igrid_size, int)
+        grid_idx = get_cell_index(position, igrid_size, cnum)
 
         sques = particle_id * potential_wall_num
         cellID = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
@@ -604,20 +708,15 @@ def board_search_particle_patch_linked_cell_(particleNum: int, potential_wall_nu
     for particle_id in range(particleNum):
         position = particle[particle_id].x
         radius = particle[particle_id].rad
-        grid_idx = ti.floor(position * igrid_size, int)
+        grid_idx = get_cell_index(position, igrid_size, cnum)
 
-        x_begin = ti.max(grid_idx[0] - 1, 0)
-        x_end = ti.min(grid_idx[0] + 2, cnum[0])
-        y_begin = ti.max(grid_idx[1] - 1, 0)
-        y_end = ti.min(grid_idx[1] + 2, cnum[1])
-        z_begin = ti.max(grid_idx[2] - 1, 0)
-        z_end = ti.min(grid_idx[2] + 2, cnum[2])
+        cell_begin, cell_end = get_neighbor_cell_range(grid_idx, cnum)
 
         sques = particle_id * potential_wall_num
-        for neigh_i in range(x_begin, x_end):
-            for neigh_j in range(y_begin, y_end):
-                for neigh_k in range(z_begin, z_end):
-                    cellID = linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+        for neigh_i in range(cell_begin[0], cell_end[0]):
+            for neigh_j in range(cell_begin[1], cell_end[1]):
+                for neigh_k in range(cell_begin[2], cell_end[2]):
+                    cellID = get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                     for hash_index in range(wall_count[cellID], wall_count[cellID + 1]):
                         wall_id = wallID[hash_index]
                         #if particle_id==0:print(wall_id)
@@ -743,7 +842,7 @@ def calculate_particles_position_hierarchical_(particleNum: int, particle: ti.te
     for np in range(particleNum):  
         grid_level = body[np + 1].level
         start_index = grid[grid_level].cell_index
-        grid_idx = ti.floor(particle[np].x * grid[grid_level].igrid_size, int)
+        grid_idx = get_cell_index(particle[np].x, grid[grid_level].igrid_size, grid[grid_level].cnum)
         cellID = start_index + linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], grid[grid_level].cnum)
         particle_current[np] = ti.atomic_add(particle_count[cellID + 1], 1)
     
@@ -752,7 +851,7 @@ def insert_particle_to_cell_hierarchical_(particleNum: int, particle: ti.templat
     for np in range(particleNum):
         grid_level = body[np + 1].level
         start_index = grid[grid_level].cell_index
-        grid_idx = ti.floor(particle[np].x * grid[grid_level].igrid_size , int)
+        grid_idx = get_cell_index(particle[np].x, grid[grid_level].igrid_size, grid[grid_level].cnum)
         cellID = start_index + linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], grid[grid_level].cnum)
         grain_location = particle_count[cellID] + particle_current[np]
         particleID[grain_location] = np
@@ -769,26 +868,21 @@ def board_search_particle_particle_linked_cell_hierarchical_(particleNum: int, v
         cell_index = grid[grid_level].cell_index
         cnum = grid[grid_level].cnum
         potential_particle_num = body[master].potential_particle_num()
-        grid_idx = ti.floor(position * grid[grid_level].igrid_size, int)
+        grid_idx = get_cell_index(position, grid[grid_level].igrid_size, grid[grid_level].cnum)
         
-        x_begin = ti.max(grid_idx[0] - 1, 0)
-        x_end = ti.min(grid_idx[0] + 2, cnum[0])
-        y_begin = ti.max(grid_idx[1] - 1, 0)
-        y_end = ti.min(grid_idx[1] + 2, cnum[1])
-        z_begin = ti.max(grid_idx[2] - 1, 0)
-        z_end = ti.min(grid_idx[2] + 2, cnum[2])
+        cell_begin, cell_end = get_neighbor_cell_range(grid_idx, cnum)
 
         sques = potential_particle_num
-        for neigh_i in range(x_begin, x_end):
-            for neigh_j in range(y_begin, y_end):
-                for neigh_k in range(z_begin, z_end):
-                    cellID = cell_index + linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+        for neigh_i in range(cell_begin[0], cell_end[0]):
+            for neigh_j in range(cell_begin[1], cell_end[1]):
+                for neigh_k in range(cell_begin[2], cell_end[2]):
+                    cellID = cell_index + get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                     for hash_index in range(particle_count[cellID], particle_count[cellID + 1]):
                         slave = particleID[hash_index]
                         if master < slave and not index == particle[slave]._get_multisphere_index2():
                             pos2 = particle[slave].x 
                             rad2 = particle[slave].rad
-                            valid = SquaredLength(pos2, position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
+                            valid = SquaredLength(periodic_image(position, pos2), position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
                             if valid: 
                                 potential_list_particle_particle[sques] = slave
                                 sques += 1
@@ -798,26 +892,18 @@ def board_search_particle_particle_linked_cell_hierarchical_(particleNum: int, v
             cnum = grid[i].cnum
             grid_size = grid[i].grid_size
             igrid_size = grid[i].igrid_size
-            grid_start = ti.floor((position - radius - 0.5 * grid_size) * igrid_size, int)
-            grid_end = ti.ceil((position + radius + 0.5 * grid_size) * igrid_size, int)
-
-            x_begin = ti.max(grid_start[0], 0)
-            x_end = ti.min(grid_end[0], cnum[0])
-            y_begin = ti.max(grid_start[1], 0)
-            y_end = ti.min(grid_end[1], cnum[1])
-            z_begin = ti.max(grid_start[2], 0)
-            z_end = ti.min(grid_end[2], cnum[2])
+            cell_begin, cell_end = get_cell_range(position - radius - 0.5 * grid_size, position + radius + 0.5 * grid_size, igrid_size, cnum)
 
-            for neigh_i in range(x_begin, x_end):
-                for neigh_j in range(y_begin, y_end):
-                    for neigh_k in range(z_begin, z_end):
-                        cellID = cell_index + linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+            for neigh_i in range(cell_begin[0], cell_end[0]):
+                for neigh_j in range(cell_begin[1], cell_end[1]):
+                    for neigh_k in range(cell_begin[2], cell_end[2]):
+                        cellID = cell_index + get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                         for hash_index in range(particle_count[cellID], particle_count[cellID + 1]):
                             slave = particleID[hash_index]
                             if not index == particle[slave]._get_multisphere_index2():
                                 pos2 = particle[slave].x 
                                 rad2 = particle[slave].rad
-                                valid = SquaredLength(pos2, position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
+                                valid = SquaredLength(periodic_image(position, pos2), position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
                                 if valid: 
                                     potential_list_particle_particle[sques] = slave
                                     sques += 1
@@ -838,26 +924,21 @@ def board_search_particle_particle_linked_cell_hierarchical2_(particleNum: int,
         cell_index = grid[grid_level].cell_index
         cnum = grid[grid_level].cnum
         potential_particle_num = body[master].potential_particle_num()
-        grid_idx = ti.floor(position * grid[grid_level].igrid_size, int)
+        grid_idx = get_cell_index(position, grid[grid_level].igrid_size, grid[grid_level].cnum)
         
-        x_begin = ti.max(grid_idx[0] - 1, 0)
-        x_end = ti.min(grid_idx[0] + 2, cnum[0])
-        y_begin = ti.max(grid_idx[1] - 1, 0)
-        y_end = ti.min(grid_idx[1] + 2, cnum[1])
-        z_begin = ti.max(grid_idx[2] - 1, 0)
-        z_end = ti.min(grid_idx[2] + 2, cnum[2])
+        cell_begin, cell_end = get_neighbor_cell_range(grid_idx, cnum)
 
         sques = potential_particle_num
-        for neigh_i in range(x_begin, x_end):
-            for neigh_j in range(y_begin, y_end):
-                for neigh_k in range(z_begin, z_end):
-                    cellID = cell_index + linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+        for neigh_i in range(cell_begin[0], cell_end[0]):
+            for neigh_j in range(cell_begin[1], cell_end[1]):
+                for neigh_k in range(cell_begin[2], cell_end[2]):
+                    cellID = cell_index + get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                     for hash_index in range(particle_count[cellID], particle_count[cellID + 1]):
                         slave = particleID[hash_index]
                         if master < slave and not index == particle[slave]._get_multisphere_index2():
                             pos2 = particle[slave].x 
                             rad2 = particle[slave].rad
-                            valid = SquaredLength(pos2, position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
+                            valid = SquaredLength(periodic_image(position, pos2), position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
                             if valid: 
                                 potential_list_particle_particle[sques] = slave
                                 sques += 1
@@ -867,26 +948,18 @@ def board_search_particle_particle_linked_cell_hierarchical2_(particleNum: int,
             cnum = grid[i].cnum
             grid_size = grid[i].grid_size
             igrid_size = grid[i].igrid_size
-            grid_start = ti.floor((position - radius - 0.5 * grid_size) * igrid_size, int)
-            grid_end = ti.ceil((position + radius + 0.5 * grid_size) * igrid_size, int)
+            cell_begin, cell_end = get_cell_range(position - radius - 0.5 * grid_size, position + radius + 0.5 * grid_size, igrid_size, cnum)
 
-            x_begin = ti.max(grid_start[0], 0)
-            x_end = ti.min(grid_end[0], cnum[0])
-            y_begin = ti.max(grid_start[1], 0)
-            y_end = ti.min(grid_end[1], cnum[1])
-            z_begin = ti.max(grid_start[2], 0)
-            z_end = ti.min(grid_end[2], cnum[2])
-
-            for neigh_i in range(x_begin, x_end):
-                for neigh_j in range(y_begin, y_end):
-                    for neigh_k in range(z_begin, z_end):
-                        cellID = cell_index + linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+            for neigh_i in range(cell_begin[0], cell_end[0]):
+                for neigh_j in range(cell_begin[1], cell_end[1]):
+                    for neigh_k in range(cell_begin[2], cell_end[2]):
+                        cellID = cell_index + get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                         for hash_index in range(particle_count[cellID], particle_count[cellID + 1]):
                             slave = particleID[hash_index]
                             if not index == particle[slave]._get_multisphere_index2():
                                 pos2 = particle[slave].x 
                                 rad2 = particle[slave].rad
-                                valid = SquaredLength(pos2, position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
+                                valid = SquaredLength(periodic_image(position, pos2), position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
                                 if valid: 
                                     potential_list_particle_particle[sques] = slave
                                     sques += 1
@@ -906,26 +979,21 @@ def board_search_particle_particle_linked_cell_hierarchical_interlevel_(startID:
         cell_index = grid[grid_level].cell_index
         cnum = grid[grid_level].cnum
         potential_particle_num = body[master].potential_particle_num() + particle_particle[master + 1]
-        grid_idx = ti.floor(position * grid[grid_level].igrid_size, int)
+        grid_idx = get_cell_index(position, grid[grid_level].igrid_size, grid[grid_level].cnum)
         
-        x_begin = ti.max(grid_idx[0] - 1, 0)
-        x_end = ti.min(grid_idx[0] + 2, cnum[0])
-        y_begin = ti.max(grid_idx[1] - 1, 0)
-        y_end = ti.min(grid_idx[1] + 2, cnum[1])
-        z_begin = ti.max(grid_idx[2] - 1, 0)
-        z_end = ti.min(grid_idx[2] + 2, cnum[2])
+        cell_begin, cell_end = get_neighbor_cell_range(grid_idx, cnum)
 
         sques = potential_particle_num
-        for neigh_i in range(x_begin, x_end):
-            for neigh_j in range(y_begin, y_end):
-                for neigh_k in range(z_begin, z_end):
-                    cellID = cell_index + linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+        for neigh_i in range(cell_begin[0], cell_end[0]):
+            for neigh_j in range(cell_begin[1], cell_end[1]):
+                for neigh_k in range(cell_begin[2], cell_end[2]):
+                    cellID = cell_index + get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                     for hash_index in range(particle_count[cellID], particle_count[cellID + 1]):
                         slave = particleID[hash_index]
                         if master < slave and not index == particle[slave]._get_multisphere_index2():
                             pos2 = particle[slave].x 
                             rad2 = particle[slave].rad
-                            valid = SquaredLength(pos2, position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
+                            valid = SquaredLength(periodic_image(position, pos2), position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
                             if valid: 
                                 potential_list_particle_particle[sques] = slave
                                 sques += 1
@@ -954,26 +1022,18 @@ def board_search_particle_particle_linked_cell_hierarchical_crosslevel_(startID:
         cnum = grid[i].cnum
         grid_size = grid[i].grid_size
         igrid_size = grid[i].igrid_size
-        grid_start = ti.floor((position - radius - 0.5 * grid_size) * igrid_size, int)
-        grid_end = ti.ceil((position + radius + 0.5 * grid_size) * igrid_size, int)
+        cell_begin, cell_end = get_cell_range(position - radius - 0.5 * grid_size, position + radius + 0.5 * grid_size, igrid_size, cnum)
 
-        x_begin = ti.max(grid_start[0], 0)
-        x_end = ti.min(grid_end[0], cnum[0])
-        y_begin = ti.max(grid_start[1], 0)
-        y_end = ti.min(grid_end[1], cnum[1])
-        z_begin = ti.max(grid_start[2], 0)
-        z_end = ti.min(grid_end[2], cnum[2])
-
-        for neigh_i in range(x_begin, x_end):
-            for neigh_j in range(y_begin, y_end):
-                for neigh_k in range(z_begin, z_end):
-                    cellID = cell_index + linearize3D(neigh_i, neigh_j, neigh_k, cnum)
+        for neigh_i in range(cell_begin[0], cell_end[0]):
+            for neigh_j in range(cell_begin[1], cell_end[1]):
+                for neigh_k in range(cell_begin[2], cell_end[2]):
+                    cellID = cell_index + get_cell_id(neigh_i, neigh_j, neigh_k, cnum)
                     for hash_index in range(particle_count[cellID], particle_count[cellID + 1]):
                         slave = particleID[hash_index]
                         if not index == particle[slave]._get_multisphere_index2():
                             pos2 = particle[slave].x 
                             rad2 = particle[slave].rad
-                            valid = SquaredLength(pos2, position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
+                            valid = SquaredLength(periodic_image(position, pos2), position) <= (radius + rad2 + 2 * verlet_distance) * (radius + rad2 + 2 * verlet_distance)
                             if valid: 
                                 potential_list_particle_particle[sques] = slave
                                 sques += 1
@@ -1105,7 +1165,7 @@ def board_search_particle_plane_linked_cell_hierarchical_(particleNum: int, verl
         cell_index = grid[grid_level].cell_index
         cnum = grid[grid_level].cnum
         potential_wall_num = body[particle_id].potential_wall_num()
-        grid_idx = ti.floor(position * grid[grid_level].igrid_size, int)
+        grid_idx = get_cell_index(position, grid[grid_level].igrid_size, grid[grid_level].cnum)
         
         sques = potential_wall_num
         local_cell = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
@@ -1159,7 +1219,7 @@ def board_search_particle_facet_linked_cell_hierarchical_(particleNum: int, verl
         cell_index = grid[grid_level].cell_index
         cnum = grid[grid_level].cnum
         potential_wall_num = body[particle_id].potential_wall_num()
-        grid_idx = ti.floor(position * grid[grid_level].igrid_size, int)
+        grid_idx = get_cell_index(position, grid[grid_level].igrid_size, grid[grid_level].cnum)
 
         sques = potential_wall_num
         local_cell = linearize3D(grid_idx[0], grid_idx[1], grid_idx[2], cnum)
@@ -7,6 +7,7 @@ from src.mpdem.contact.Linear import LinearModel
 from src.mpdem.contact.LinearBond import LinearBondModel
 from src.mpdem.contact.ParticleFluid import ParticleFluid
 from src.mpdem.contact.MultiLinkedCell import MultiLinkedCell
+from src.mpdem.contact.UnresolvedFluid import UnresolvedFluid
 from src.mpdem.Simulation import Simulation
 
 
@@ -15,6 +16,7 @@ class ContactManager:
         self.neighbor = None
         self.physpp = None
         self.physpw = None
+        self.physfluid = None
         self.have_initialise = False
 
     def initialize(self, csims, msims, dsims, mscene, dscene):
@@ -84,6 +86,14 @@ class ContactManager:
                 self.physpw = ContactModelBase()
             self.physpw.manage_function("wall", None, wall_type)
 
+    def fluid_initialize(self, sims: Simulation, material_type, dem_scheme):
+        if self.physfluid is None and sims.coupling_scheme == "CFD-DEM":
+            if material_type != "Fluid":
+                raise RuntimeError("KeyWord:: /material_type/ of MPM should be set as /Fluid/ in the unresolved CFD-DEM coupling")
+            self.physfluid = UnresolvedFluid(sims.min_porosity)
+            self.physfluid.manage_function(dem_scheme)
+            self.physfluid.print_fluid_info()
+
     def collision_list(self, sims: Simulation):
         if self.physpp:
             self.physpp.collision_initialize(sims.particle_contact_list_length)
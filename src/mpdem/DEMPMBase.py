@@ -5,15 +5,18 @@ import taichi as ti
 from src.mpdem.GenerateManager import GenerateManager
 from src.dem.SceneManager import myScene as DEMScene
 from src.dem.Simulation import Simulation as DEMSimulation
+from src.dem.DEMBase import instrument_dem
 from src.dem.Recorder import WriteFile as DEMWriteFile
 from src.mpdem.Engine import Engine
 from src.mpdem.Recorder import WriteFile
 from src.mpdem.Simulation import Simulation
 from src.mpm.SceneManager import myScene as MPMScene
 from src.mpm.Simulation import Simulation as MPMSimulation
+from src.mpm.MPMBase import instrument_mpm
 from src.mpm.Recorder import WriteFile as MPMWriteFile
 from src.utils.constants import Threshold
 from src.utils.ObjectIO import DictIO
+from src.utils.TimeTicker import Profiler
 
 
 class Solver:
@@ -39,6 +42,7 @@ class Solver:
 
         self.last_save_time = 0.
         self.solve = None
+        self.profiler = None
 
     def set_callback_function(self, functions):
         if not functions is None:
@@ -57,7 +61,10 @@ class Solver:
             self.postprocess.append(lambda: self.engine.dengine.calm(self.sims.current_step, self.calm_interval, scene))
 
     def save_file(self, mscene:MPMScene, dscene: DEMScene):
-        print('# Step =', self.sims.current_step, '   ', 'Save Number =', self.sims.current_print, '   ', 'Simulation time =', self.sims.current_time, '\n')
+        if self.sims.substep > 1:
+            print('# Step =', self.sims.current_step, '   ', 'DEM Step =', self.sims.current_substep, '   ', 'Save Number =', self.sims.current_print, '   ', 'Simulation time =', self.sims.current_time, '\n')
+        else:
+            print('# Step =', self.sims.current_step, '   ', 'Save Number =', self.sims.current_print, '   ', 'Simulation time =', self.sims.current_time, '\n')
         self.recorder.output(self.sims, self.msims, mscene, self.dsims, dscene)
 
     def CouplingSolver(self, mscene: MPMScene, dscene: DEMScene):
@@ -70,6 +77,7 @@ class Solver:
             self.dsims.current_print += 1
             self.last_save_time = -0.8 * self.sims.delta
         self.engine.pre_calculate()
+        self.start_profiler(mscene, dscene)
             
         start_time = time.time()
         while self.sims.current_time <= self.sims.time:
@@ -77,6 +85,8 @@ class Solver:
             self.engine.compute()
             for functions in self.postprocess:
                 functions()
+            if self.profiler is not None:
+                self.profiler.step()
 
             new_body = self.generator.regenerate(self.sims, mscene, dscene)
             if self.sims.current_time - self.last_save_time + 0.1 * self.sims.delta> self.sims.save_interval or new_body:
@@ -93,6 +103,7 @@ class Solver:
             self.msims.current_time += self.sims.delta
             self.dsims.current_time += self.sims.delta
             self.sims.current_step += 1
+            self.sims.current_substep += self.sims.substep
         end_time = time.time()
 
         if abs(self.sims.current_time - self.last_save_time) > self.sims.save_interval:
@@ -103,8 +114,39 @@ class Solver:
             self.dsims.current_print += 1
             self.engine.reset_message()
 
+        self.recorder.flush()
+        self.finish_profiler()
         print('Physical time = ', end_time - start_time)
         print("#", " End Simulation ".center(67,"="), "#", '\n')
 
+    def start_profiler(self, mscene: MPMScene, dscene: DEMScene):
+        if self.sims.profile:
+            self.profiler = Profiler(self.sims.profile_interval)
+            engine = self.engine
+            instrument_dem(self.profiler, self.dsims, dscene, engine.dengine, engine.dneighbor, engine.dengine.physpp, engine.dengine.physpw, prefix="DEM ")
+            instrument_mpm(self.profiler, self.msims, mscene, engine.mengine, prefix="MPM ")
+            self.profiler.instrument(engine.neighbor, "update_verlet_table", "coupling neighbor rebuild", after=lambda _: self.profiler.count("coupling verlet rebuilds"))
+            self.profiler.instrument(engine.physpp, "update_contact_table", "coupling contact table")
+            self.profiler.instrument(engine.physpw, "update_contact_table", "coupling contact table")
+            self.profiler.instrument(engine.neighbor, "update_particle_particle_auxiliary_lists", "coupling contact table")
+            self.profiler.instrument(engine.neighbor, "update_particle_wall_auxiliary_lists", "coupling contact table")
+            self.profiler.instrument(engine.physpp, "resolve", "coupling resolve")
+            self.profiler.instrument(engine.physpw, "resolve", "coupling resolve")
+            self.profiler.instrument(engine, "average_coupling_force", "coupling resolve")
+            self.profiler.instrument(engine.neighbor, "update_fluid_cells", "coupling fluid cells")
+            self.profiler.instrument(engine.neighbor, "update_solid_cells", "coupling fluid cells")
+            self.profiler.instrument(engine.physfluid, "resolve", "coupling resolve")
+            self.profiler.instrument(engine.physfluid, "apply_fluid_reaction", "coupling resolve")
+            self.profiler.instrument(self.recorder, "output", "output")
+            self.profiler.start()
+
+    def finish_profiler(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.restore()
+            self.profiler.print_table()
+            self.profiler.dump(self.sims.path + "/profile.json")
+            self.profiler = None
+
 
 
@@ -7,8 +7,10 @@ from src.dem.SceneManager import myScene as DEMScene
 from src.dem.Simulation import Simulation as DEMSimulation
 from src.mpdem.contact.ContactModelBase import ContactModelBase
 from src.mpdem.contact.MultiLinkedCell import MultiLinkedCell
+from src.mpdem.contact.UnresolvedFluid import UnresolvedFluid
 from src.mpdem.Simulation import Simulation 
 from src.mpm.SpatialHashGrid import SpatialHashGrid
+from src.mpm.engines.EngineKernel import contact_force_average
 from src.mpm.engines.ULExplicitEngine import ULExplicitEngine as MPMExplicitEngine
 from src.mpm.SceneManager import myScene as MPMScene
 from src.mpm.Simulation import Simulation as MPMSimulation
@@ -27,8 +29,9 @@ class Engine(object):
     dneighbor: LinkedCell
     physpp: ContactModelBase
     physpw: ContactModelBase
+    physfluid: UnresolvedFluid
 
-    def __init__(self, sims, msims, dsims, mscene, dscene, mengine, dengine, neighbor, mneighbor, dneighbor, physpp, physpw) -> None:
+    def __init__(self, sims, msims, dsims, mscene, dscene, mengine, dengine, neighbor, mneighbor, dneighbor, physpp, physpw, physfluid=None) -> None:
         self.sims = sims
         self.msims = msims
         self.dsims = dsims
@@ -41,13 +44,15 @@ class Engine(object):
         self.dneighbor = dneighbor
         self.physpp = physpp
         self.physpw = physpw
+        self.physfluid = physfluid
         self.compute = None
         self.enforce_update_verlet_table = None
 
     def manage_function(self):
         valid_list = ["DEM: The material points are serves as rigid wall", 
                       "MPM: The discrete element particles are serves as rigid wall", 
-                      "DEM-MPM: Two-way coupling scheme"]
+                      "DEM-MPM: Two-way coupling scheme",
+                      "CFD-DEM: Unresolved coupling between the MPM fluid and the discrete element particles"]
         
         if self.sims.coupling_scheme == 'DEM-MPM':
             if self.dsims.scheme == "DEM":
@@ -55,11 +60,13 @@ class Engine(object):
                     if self.msims.material_type == "Solid":
                         pass
                     elif self.msims.material_type == "Fluid":
-                        self.compute = self.CFDEMintegration
+                        pass
                     elif self.msims.material_type == "TwoPhaseSingleLayer":
                         pass
                     elif self.msims.material_type == "TwoPhaseDoubleLayer":
                         pass
+                elif self.sims.subcycling:
+                    self.compute = self.subcycling_integration
                 else:
                     self.compute = self.integration
             elif self.dsims.scheme == "LSDEM":
@@ -67,11 +74,13 @@ class Engine(object):
                     if self.msims.material_type == "Solid":
                         pass
                     elif self.msims.material_type == "Fluid":
-                        self.compute = self.CFDEMlsintegration
+                        pass
                     elif self.msims.material_type == "TwoPhaseSingleLayer":
                         pass
                     elif self.msims.material_type == "TwoPhaseDoubleLayer":
                         pass
+                elif self.sims.subcycling:
+                    self.compute = self.subcycling_lsintegration
                 else:
                     self.compute = self.lsintegration
             self.enforce_update_verlet_table = self.enforce_reset_contact_list
@@ -84,6 +93,14 @@ class Engine(object):
         elif self.sims.coupling_scheme == "MPM":
             self.compute = self.mpm_integration
             self.enforce_update_verlet_table = self.enforce_reset_dempm_contact_list
+        elif self.sims.coupling_scheme == "CFD-DEM":
+            if "Implicit" in self.msims.solver_type:
+                raise RuntimeError("Keyword:: /coupling_scheme: CFD-DEM/ only supports the explicit MPM fluid")
+            if self.dsims.scheme == "DEM":
+                self.compute = self.CFDEMintegration
+            elif self.dsims.scheme == "LSDEM":
+                self.compute = self.CFDEMlsintegration
+            self.enforce_update_verlet_table = self.enforce_reset_dem_contact_list
         else:
             raise RuntimeError(f"Keyword:: /coupling_scheme: {self.sims.coupling_scheme}/ is invalid. Only the following is valid: \n{valid_list}")
         
@@ -194,15 +211,128 @@ class Engine(object):
         self.dengine.integration(self.dsims, self.dscene, self.dneighbor)
         self.mengine.compute(self.msims, self.mscene)
 
+    def dem_substep(self):
+        self.dengine.system_resolve(self.dsims, self.dscene, self.dneighbor)
+        self.system_resolve()
+
+        self.update_servo_wall()
+        self.dengine.integration(self.dsims, self.dscene, self.dneighbor)
+
+    def reset_dem_message(self):
+        self.dengine.reset_wall_message(self.dscene)
+        self.dengine.reset_particle_message(self.dscene)
+
+    def average_coupling_force(self):
+        # coupling forces of all substeps are summed on the material points, the grid receives their mean
+        if self.sims.substep > 1:
+            contact_force_average(int(self.mscene.particleNum[0]), self.sims.substep, self.mscene.particle)
+
+    def subcycling_integration(self):
+        if self.mengine.is_need_update_verlet_table(self.mscene) == 1 or self.dengine.is_verlet_update(self.dengine.limit1) == 1: 
+            self.dengine.update_verlet_table(self.dsims, self.dscene, self.dneighbor)
+            self.mengine.execute_board_serach(self.msims, self.mscene, self.mneighbor)
+            self.update_verlet_table()
+        else:
+            self.mengine.system_resolve(self.msims, self.mscene)
+        self.dem_substep()
+
+        for _ in range(1, self.sims.substep):
+            self.reset_dem_message()
+            if self.dengine.is_verlet_update(self.dengine.limit1) == 1:
+                self.dengine.update_verlet_table(self.dsims, self.dscene, self.dneighbor)
+                self.update_verlet_table()
+            self.dem_substep()
+
+        self.average_coupling_force()
+        self.mengine.compute(self.msims, self.mscene)
+
+    def subcycling_lsintegration(self):
+        if self.mengine.is_need_update_verlet_table(self.mscene) == 1 or self.dengine.is_verlet_update(self.dengine.limit1) == 1:
+            self.dengine.update_LSDEM_verlet_table1(self.dsims, self.dscene, self.dneighbor)
+            self.dengine.update_LSDEM_verlet_table2(self.dsims, self.dscene, self.dneighbor)
+            self.mengine.execute_board_serach(self.msims, self.mscene, self.mneighbor)
+            self.update_verlet_table()
+        elif self.dengine.is_verlet_update_point(self.dengine.limit2) == 1:
+            self.dengine.update_LSDEM_verlet_table2(self.dsims, self.dscene, self.dneighbor)
+        else:
+            self.mengine.system_resolve(self.msims, self.mscene)
+        self.dem_substep()
+
+        for _ in range(1, self.sims.substep):
+            self.reset_dem_message()
+            if self.dengine.is_verlet_update(self.dengine.limit1) == 1:
+                self.dengine.update_LSDEM_verlet_table1(self.dsims, self.dscene, self.dneighbor)
+                self.dengine.update_LSDEM_verlet_table2(self.dsims, self.dscene, self.dneighbor)
+                self.update_verlet_table()
+            elif self.dengine.is_verlet_update_point(self.dengine.limit2) == 1:
+                self.dengine.update_LSDEM_verlet_table2(self.dsims, self.dscene, self.dneighbor)
+            self.dem_substep()
+
+        self.average_coupling_force()
+        self.mengine.compute(self.msims, self.mscene)
+
+    def fluid_resolve(self):
+        self.neighbor.update_solid_cells(self.dscene)
+        self.physfluid.resolve(self.dsims, self.dscene, self.neighbor)
+
+    def apply_fluid_reaction(self):
+        self.physfluid.apply_fluid_reaction(self.mscene, self.neighbor)
+        self.average_coupling_force()
+
+    def fluid_substep(self):
+        if self.dengine.is_verlet_update(self.dengine.limit1) == 1:
+            self.dengine.update_verlet_table(self.dsims, self.dscene, self.dneighbor)
+        self.dengine.system_resolve(self.dsims, self.dscene, self.dneighbor)
+        self.fluid_resolve()
+        self.dengine.integration(self.dsims, self.dscene, self.dneighbor)
+
+    def fluid_lssubstep(self):
+        if self.dengine.is_verlet_update(self.dengine.limit1) == 1:
+            self.dengine.update_LSDEM_verlet_table1(self.dsims, self.dscene, self.dneighbor)
+            self.dengine.update_LSDEM_verlet_table2(self.dsims, self.dscene, self.dneighbor)
+        elif self.dengine.is_verlet_update_point(self.dengine.limit2) == 1:
+            self.dengine.update_LSDEM_verlet_table2(self.dsims, self.dscene, self.dneighbor)
+        self.dengine.system_resolve(self.dsims, self.dscene, self.dneighbor)
+        self.fluid_resolve()
+        self.dengine.integration(self.dsims, self.dscene, self.dneighbor)
+
     def CFDEMintegration(self):
-        pass
+        # the fluid is binned once per coupled step, the grains are subcycled through the frozen fluid
+        if self.mengine.is_need_update_verlet_table(self.mscene) == 1:
+            self.mengine.execute_board_serach(self.msims, self.mscene, self.mneighbor)
+        else:
+            self.mengine.system_resolve(self.msims, self.mscene)
+        self.neighbor.update_fluid_cells(self.mscene)
+        self.fluid_substep()
+
+        for _ in range(1, self.sims.substep):
+            self.reset_dem_message()
+            self.fluid_substep()
+
+        self.apply_fluid_reaction()
+        self.mengine.compute(self.msims, self.mscene)
 
     def CFDEMlsintegration(self):
-        pass
+        if self.mengine.is_need_update_verlet_table(self.mscene) == 1:
+            self.mengine.execute_board_serach(self.msims, self.mscene, self.mneighbor)
+        else:
+            self.mengine.system_resolve(self.msims, self.mscene)
+        self.neighbor.update_fluid_cells(self.mscene)
+        self.fluid_lssubstep()
+
+        for _ in range(1, self.sims.substep):
+            self.reset_dem_message()
+            self.fluid_lssubstep()
+
+        self.apply_fluid_reaction()
+        self.mengine.compute(self.msims, self.mscene)
 
     def enforce_reset_dempm_contact_list(self):
         self.update_verlet_table()
 
+    def enforce_reset_dem_contact_list(self):
+        self.dengine.update_verlet_table(self.dsims, self.dscene, self.dneighbor)
+
     def enforce_reset_contact_list(self):
         self.dengine.update_verlet_table(self.dsims, self.dscene, self.dneighbor)
         self.update_verlet_table()
\ No newline at end of file
@@ -46,6 +46,10 @@ class WriteFile:
         if sims.wall_interaction and dsims.max_wall_num > 0. and 'pwcontact' in dsims.monitor_type:
             self.save_pwcontact = self.MonitorPWContact
 
+    def flush(self):
+        self.mrecorder.flush()
+        self.drecorder.flush()
+
     def output(self, sims, msims, mscene, dsims, dscene):
         self.mrecorder.output(msims, mscene)
         self.drecorder.output(dsims, dscene)
@@ -53,7 +57,7 @@ class WriteFile:
         self.save_pwcontact(sims, mscene)
 
     def MonitorPPContact(self, sims: Simulation, mscene): 
-        self.physpp.get_ppcontact_output(self.contact_path+'/DEMPMContactPP', sims.current_time, sims.current_print, mscene, self.pcontact)
+        self.physpp.get_ppcontact_output(self.contact_path+'/DEMPMContactPP', sims.current_time, sims.current_print, mscene, self.pcontact, self.drecorder.savez)
 
     def MonitorPWContact(self, sims: Simulation, mscene): 
-        self.physpw.get_pwcontact_output(self.contact_path+'/DEMPMContactPW', sims.current_time, sims.current_print, mscene, self.pcontact)
+        self.physpw.get_pwcontact_output(self.contact_path+'/DEMPMContactPW', sims.current_time, sims.current_print, mscene, self.pcontact, self.drecorder.savez)
@@ -12,18 +12,24 @@ class Simulation(object):
         self.coupling_scheme = "DEM-MPM"
         self.particle_interaction = True
         self.wall_interaction = False
+        self.min_porosity = 0.3
         self.is_continue = True
 
         self.dt = ti.field(float, shape=())
         self.delta = 0.
         self.current_time = 0.
         self.current_step = 0
+        self.current_substep = 0
         self.current_print = 0
         self.CurrentTime = ti.field(float, shape=())
 
         self.time = 0.
         self.CFL = 0.2
         self.isadaptive = False
+        self.subcycling = False
+        self.substep = 1
+        self.profile = False
+        self.profile_interval = 0
         self.save_interval = 1e6
         self.visualize_interval = 0.
         self.window_size = 1024
@@ -50,7 +56,7 @@ class Simulation(object):
         self.domain = domain
 
     def set_coupling_scheme(self, coupling_scheme):
-        valid_scheme = ["DEM-MPM", "MPM", "DEM", "Soil-Structure-Interface"]
+        valid_scheme = ["DEM-MPM", "MPM", "DEM", "CFD-DEM", "Soil-Structure-Interface"]
         if not coupling_scheme in valid_scheme:
             raise RuntimeError(f"KeyWord:: /CouplingScheme/ {coupling_scheme} is invalid. Only the followings are valid: {valid_scheme}")
         self.coupling_scheme = coupling_scheme
@@ -61,6 +67,11 @@ class Simulation(object):
     def set_wall_interaction(self, wall_interaction):
         self.wall_interaction = wall_interaction
 
+    def set_min_porosity(self, min_porosity):
+        if not 0. < min_porosity <= 1.:
+            raise ValueError("Keyword:: /min_porosity/ should be in the range of (0, 1]")
+        self.min_porosity = min_porosity
+
     def set_timestep(self, timestep):
         self.dt[None] = timestep
         self.delta = timestep
@@ -74,6 +85,15 @@ class Simulation(object):
     def set_adaptive_timestep(self, isadaptive):
         self.isadaptive = isadaptive
 
+    def set_subcycling(self, subcycling):
+        self.subcycling = subcycling
+
+    def set_profile(self, profile, profile_interval=0):
+        if profile_interval < 0:
+            raise ValueError("Keyword:: /ProfileInterval/ should not be smaller than 0")
+        self.profile = profile
+        self.profile_interval = int(profile_interval)
+
     def set_save_interval(self, save_interval):
         self.save_interval = save_interval
 
@@ -126,6 +146,19 @@ class Simulation(object):
         msims.delta = dt
         dsims.delta = dt
 
+    def update_subcycling_timestep(self, msims: MPMSimulation, dsims: DEMSimulation, dt, substep):
+        # delta is the coupled (MPM) step, while the contact kernels advance with the DEM substep
+        print("The MPM time step is corrected as:", dt)
+        print("The DEM time step is corrected as:", dt / substep)
+        print("Number of DEM substeps per coupled step:", substep, '\n')
+        self.substep = substep
+        self.dt[None] = dt / substep
+        msims.dt[None] = dt
+        dsims.dt[None] = dt / substep
+        self.delta = dt
+        msims.delta = dt
+        dsims.delta = dt / substep
+
     def set_potential_list_size(self, msims: MPMSimulation, dsims: DEMSimulation, dem_rad_max, mpm_rad_max):
         potential_particle_ratio = ((dem_rad_max + mpm_rad_max + msims.verlet_distance + dsims.verlet_distance) / (dem_rad_max + mpm_rad_max)) ** 3
         self.potential_particle_num = int(potential_particle_ratio * self.body_coordination_number)
@@ -8,6 +8,7 @@ from src.dem.BaseStruct import CoupledContactTable, HistoryContactTable
 from src.dem.SceneManager import myScene as DEMScene
 from src.dem.contact.ContactKernel import *
 from src.mpm.SceneManager import myScene as MPMScene
+from src.utils.ChunkedStore import load_frame
 from src.utils.ObjectIO import DictIO
 
 
@@ -101,10 +102,10 @@ class ContactModelBase(object):
                 raise EOFError("Invaild contact path")
             
             if is_particle_particle:
-                contact_info = np.load(contact + "/DEMContactPP{0:06d}.npz".format(file_number), allow_pickle=True) 
+                contact_info = load_frame(contact + "/DEMContactPP{0:06d}.npz".format(file_number)) 
                 self.rebuild_ppcontact_list(pcontact, contact_info)
             else:
-                contact_info = np.load(contact + "/DEMContactPW{0:06d}.npz".format(file_number), allow_pickle=True) 
+                contact_info = load_frame(contact + "/DEMContactPW{0:06d}.npz".format(file_number)) 
                 self.rebuild_pwcontact_list(pcontact, contact_info)
             
     def rebuild_contact_list(self, contact_info):
@@ -114,21 +115,21 @@ class ContactModelBase(object):
         oldTangOverlap = DictIO.GetEssential(contact_info, "oldTangentialOverlap")
         return object_object, particle_number, DstID, oldTangOverlap
 
-    def get_ppcontact_output(self, contact_path, current_time, current_print, scene: MPMScene, pcontact: MultiLinkedCell):
+    def get_ppcontact_output(self, contact_path, current_time, current_print, scene: MPMScene, pcontact: MultiLinkedCell, savez=np.savez):
         end1, end2, oldTangentialOverlap = self.get_contact_output(scene, pcontact.particle_particle)
         end1 = np.ascontiguousarray(self.cplist.endID1.to_numpy()[0:pcontact.particle_particle[scene.particleNum[0]]])
         end2 = np.ascontiguousarray(self.cplist.endID2.to_numpy()[0:pcontact.particle_particle[scene.particleNum[0]]])
         oldTangentialOverlap = np.ascontiguousarray(self.cplist.oldTangOverlap.to_numpy()[0:pcontact.particle_particle[scene.particleNum[0]]])
         particleParticle = np.ascontiguousarray(pcontact.hist_particle_particle.to_numpy()[0:pcontact.particle_particle[scene.particleNum[0]]])
-        np.savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleParticle, end1=end1, end2=end2, oldTangentialOverlap=oldTangentialOverlap)
+        savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleParticle, end1=end1, end2=end2, oldTangentialOverlap=oldTangentialOverlap)
         
-    def get_pwcontact_output(self, contact_path, current_time, current_print, scene: MPMScene, pcontact: MultiLinkedCell):
+    def get_pwcontact_output(self, contact_path, current_time, current_print, scene: MPMScene, pcontact: MultiLinkedCell, savez=np.savez):
         end1, end2, oldTangentialOverlap = self.get_contact_output(scene, pcontact.particle_wall)
         end1 = np.ascontiguousarray(self.cplist.endID1.to_numpy()[0:pcontact.particle_wall[scene.particleNum[0]]])
         end2 = np.ascontiguousarray(self.cplist.endID2.to_numpy()[0:pcontact.particle_wall[scene.particleNum[0]]])
         oldTangentialOverlap = np.ascontiguousarray(self.cplist.oldTangOverlap.to_numpy()[0:pcontact.particle_wall[scene.particleNum[0]]])
         particleWall = np.ascontiguousarray(pcontact.hist_particle_wall.to_numpy()[0:pcontact.particle_wall[scene.particleNum[0]]])
-        np.savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleWall, end1=end1, end2=end2, oldTangentialOverlap=oldTangentialOverlap)
+        savez(contact_path+f'{current_print:06d}', t_current=current_time, contact_num=particleWall, end1=end1, end2=end2, oldTangentialOverlap=oldTangentialOverlap)
     
     def rebuild_ppcontact_list(self, pcontact: MultiLinkedCell, contact_info):
         object_object, particle_number, DstID, oldTangOverlap = self.rebuild_contact_list(contact_info)
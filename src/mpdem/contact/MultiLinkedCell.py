@@ -1,5 +1,6 @@
 import taichi as ti
 
+from src.dem.BaseStruct import FluidCell
 from src.dem.neighbor.neighbor_kernel import *
 from src.dem.neighbor.LinkedCell import LinkedCell
 from src.dem.SceneManager import myScene as DEMScene
@@ -39,12 +40,20 @@ class MultiLinkedCell(object):
 
         self.particle_pse = None
 
+        self.fluid_cell = None
+        self.fluid_grid_size = None
+        self.fluid_igrid_size = None
+        self.fluid_cnum = None
+
     def no_operation(self, mscene, dscene):
         pass
 
     def no_operation_without_paras(self):
         pass
 
+    def no_operation_rest(self, scene):
+        pass
+
     def manage_function(self):
         self.particle_particle_delete_vars = self.no_operation
         self.update_verlet_tables_particle_particle = self.no_operation
@@ -80,6 +89,15 @@ class MultiLinkedCell(object):
                 self.particle_wall_delete_vars = self.particle_patch_delete_var
                 self.update_verlet_table_particle_wall = self.update_verlet_table_particle_patch
 
+        self.update_fluid_cells = self.no_operation_rest
+        self.update_solid_cells = self.no_operation_rest
+        if self.csims.coupling_scheme == "CFD-DEM":
+            self.update_fluid_cells = self.place_fluid_particles
+            if self.dsims.scheme == "DEM":
+                self.update_solid_cells = self.place_solid_particles
+            elif self.dsims.scheme == "LSDEM":
+                self.update_solid_cells = self.place_solid_rigid_bodies
+
     def particle_particle_delete_var(self):
         del self.potential_list_particle_particle, self.particle_particle, self.hist_particle_particle
     
@@ -115,6 +133,25 @@ class MultiLinkedCell(object):
         if self.dsims.scheme == "LSDEM":
             self.dsims.check_grid_extent(*dscene.find_expect_extent(self.dsims, self.msims.verlet_distance + self.dsims.verlet_distance + mrad_max))
 
+        if self.csims.coupling_scheme == "CFD-DEM":
+            self.set_fluid_cell_list(mscene)
+
+    def set_fluid_cell_list(self, mscene: MPMScene):
+        # the fluid fields of the unresolved coupling live on the cells of the MPM background grid
+        self.fluid_grid_size = mscene.element.grid_size
+        self.fluid_igrid_size = mscene.element.igrid_size
+        self.fluid_cnum = mscene.element.cnum
+        self.fluid_cell = FluidCell.field(shape=int(mscene.element.cellSum))
+
+    def place_fluid_particles(self, mscene: MPMScene):
+        place_fluid_particle_(self.fluid_igrid_size, self.fluid_cnum, int(mscene.particleNum[0]), mscene.particle, mscene.material.matProps, self.fluid_cell)
+
+    def place_solid_particles(self, dscene: DEMScene):
+        place_solid_particle_(self.fluid_grid_size, self.fluid_igrid_size, self.fluid_cnum, int(dscene.particleNum[0]), dscene.particle, self.fluid_cell)
+
+    def place_solid_rigid_bodies(self, dscene: DEMScene):
+        place_solid_particle_(self.fluid_grid_size, self.fluid_igrid_size, self.fluid_cnum, int(dscene.rigidNum[0]), dscene.rigid, self.fluid_cell)
+
     def place_digital_elevation_facet(self, dscene: DEMScene):
         insert_digital_elevation_facet_(dscene.digital_elevation.idigital_size, int(dscene.wallNum[0]), dscene.digital_elevation.digital_dim, dscene.wall, self.digital_wall)
 
@@ -0,0 +1,64 @@
+from src.dem.Simulation import Simulation as DEMSimulation
+from src.dem.SceneManager import myScene as DEMScene
+from src.dem.contact.ContactKernel import *
+from src.mpdem.contact.MultiLinkedCell import MultiLinkedCell
+from src.mpm.SceneManager import myScene as MPMScene
+
+
+class UnresolvedFluid(object):
+    def __init__(self, min_porosity) -> None:
+        # the Di Felice exponent of the porosity tends to 3.7 at low Reynolds number
+        self.min_porosity = min_porosity
+        self.max_exponent = 3.7
+        self.resolve = None
+        self.calcu_critical_timesteps = None
+
+    def manage_function(self, dem_scheme):
+        if dem_scheme == "DEM":
+            self.resolve = self.tackle_particle_fluid_interaction
+            self.calcu_critical_timesteps = self.calcu_particle_critical_timestep
+        elif dem_scheme == "LSDEM":
+            self.resolve = self.tackle_rigid_fluid_interaction
+            self.calcu_critical_timesteps = self.calcu_rigid_critical_timestep
+
+    def print_fluid_info(self):
+        print(" Fluid-Particle Interaction Information ".center(71, '-'))
+        print('Coupling model: Unresolved CFD-DEM')
+        print('Drag force: Di Felice')
+        print('Minimum porosity = ', self.min_porosity)
+        print('\n')
+
+    def find_max_viscosity(self, mscene: MPMScene):
+        max_viscosity = 0.
+        for materialID in range(mscene.material.matProps.shape[0]):
+            if mscene.material.matProps[materialID].density > 0.:
+                max_viscosity = max(max_viscosity, mscene.material.matProps[materialID].viscosity)
+        return max_viscosity
+
+    def calcu_particle_critical_timestep(self, mscene: MPMScene, dsims: DEMSimulation, dscene: DEMScene):
+        viscosity = self.find_max_viscosity(mscene)
+        if viscosity == 0. or int(dscene.particleNum[0]) == 0:
+            return MThreshold
+        porosity_factor = self.min_porosity ** (self.max_exponent - 1.)
+        return kernel_find_min_drag_relaxation_time_(int(dscene.particleNum[0]), viscosity, porosity_factor, dscene.particle)
+
+    def calcu_rigid_critical_timestep(self, mscene: MPMScene, dsims: DEMSimulation, dscene: DEMScene):
+        viscosity = self.find_max_viscosity(mscene)
+        if viscosity == 0. or int(dscene.rigidNum[0]) == 0:
+            return MThreshold
+        porosity_factor = self.min_porosity ** (self.max_exponent - 1.)
+        return kernel_find_min_drag_relaxation_time_(int(dscene.rigidNum[0]), viscosity, porosity_factor, dscene.rigid)
+
+    # ========================================================= #
+    #                 Fluid Interaction Resolve                 #
+    # ========================================================= #
+    def tackle_particle_fluid_interaction(self, dsims: DEMSimulation, dscene: DEMScene, pcontact: MultiLinkedCell):
+        kernel_fluid_particle_force_assemble_(int(dscene.particleNum[0]), self.min_porosity, dsims.gravity, pcontact.fluid_grid_size, pcontact.fluid_igrid_size, pcontact.fluid_cnum,
+                                              dscene.particle, pcontact.fluid_cell)
+
+    def tackle_rigid_fluid_interaction(self, dsims: DEMSimulation, dscene: DEMScene, pcontact: MultiLinkedCell):
+        kernel_fluid_particle_force_assemble_(int(dscene.rigidNum[0]), self.min_porosity, dsims.gravity, pcontact.fluid_grid_size, pcontact.fluid_igrid_size, pcontact.fluid_cnum,
+                                              dscene.rigid, pcontact.fluid_cell)
+
+    def apply_fluid_reaction(self, mscene: MPMScene, pcontact: MultiLinkedCell):
+        kernel_fluid_reaction_assemble_(pcontact.fluid_igrid_size, pcontact.fluid_cnum, int(mscene.particleNum[0]), mscene.particle, pcontact.fluid_cell)
@@ -1,3 +1,4 @@
+import math
 import numpy as np
 from taichi.lang.impl import current_cfg
 
@@ -10,6 +11,7 @@ from src.mpdem.Engine import Engine
 from src.mpdem.GenerateManager import GenerateManager
 from src.mpdem.Recorder import WriteFile
 from src.mpdem.Simulation import Simulation
+from src.utils.constants import Threshold
 from src.utils.ObjectIO import DictIO
 
 
@@ -58,8 +60,12 @@ class DEMPM(object):
                 self.sims.set_domain(self.mpm.sims.get_simulation_domain())
         
         self.sims.set_coupling_scheme(DictIO.GetAlternative(kwargs, "coupling_scheme", "DEM-MPM"))
-        self.sims.set_particle_interaction(DictIO.GetAlternative(kwargs, "particle_interaction", True))
+        self.sims.set_particle_interaction(DictIO.GetAlternative(kwargs, "particle_interaction", self.sims.coupling_scheme != "CFD-DEM"))
         self.sims.set_wall_interaction(DictIO.GetAlternative(kwargs, "wall_interaction", False))
+        if self.sims.coupling_scheme == "CFD-DEM":
+            if self.sims.particle_interaction or self.sims.wall_interaction:
+                raise RuntimeError("KeyWord:: /particle_interaction/ and /wall_interaction/ should be deactivated in the unresolved CFD-DEM coupling")
+            self.sims.set_min_porosity(DictIO.GetAlternative(kwargs, "min_porosity", 0.3))
         self.mpm.sims.set_gravity(DictIO.GetAlternative(kwargs, "gravity", [0., 0., -9.8]))
         self.dem.sims.set_gravity(DictIO.GetAlternative(kwargs, "gravity", [0., 0., -9.8]))
         
@@ -78,8 +84,10 @@ class DEMPM(object):
         self.sims.set_simulation_time(DictIO.GetEssential(solver, "SimulationTime"))
         self.sims.set_CFL(DictIO.GetAlternative(solver, "CFL", 0.5))
         self.sims.set_adaptive_timestep(DictIO.GetAlternative(solver, "AdaptiveTimestep", False))
+        self.sims.set_subcycling(DictIO.GetAlternative(solver, "Subcycling", False))
         self.sims.set_save_interval(DictIO.GetEssential(solver, "SaveInterval"))
         self.sims.set_save_path(DictIO.GetAlternative(solver, "SavePath", 'OutputData'))
+        self.sims.set_profile(DictIO.GetAlternative(solver, "Profile", False), DictIO.GetAlternative(solver, "ProfileInterval", 0))
         self.mpm.set_solver(solver, log=False)
         self.dem.set_solver(solver, log=False)
         if log: 
@@ -109,8 +117,11 @@ class DEMPM(object):
         print(("Initial Simulation Time: " + str(self.sims.current_time)).ljust(67))
         print(("Finial Simulation Time: " + str(self.sims.current_time + self.sims.time)).ljust(67))
         print(("Time Step: " + str(self.sims.dt[None])).ljust(67))
+        print(("DEM Subcycling: " + str(self.sims.subcycling)).ljust(67))
         print(("Save Interval: " + str(self.sims.save_interval)).ljust(67))
         print(("Save Path: " + str(self.sims.path)).ljust(67))
+        if self.sims.profile:
+            print(("Profile Report Interval: " + str(self.sims.profile_interval)).ljust(67))
 
     def add_body(self, mpm_body=None, dem_particle=None, write_file=False, check_overlap=False):
         self.generator.add_mixture(check_overlap, dem_particle, mpm_body, self.sims, self.dem.scene, self.mpm.scene, self.dem.sims, self.mpm.sims)
@@ -134,6 +145,7 @@ class DEMPM(object):
         self.sims.set_particle_wall_contact_model(particle_wall_contact_model)
         self.contactor.particle_particle_initialize(self.sims, self.mpm.sims.material_type, self.dem.sims.scheme)
         self.contactor.particle_wall_initialize(self.sims, self.mpm.sims.material_type, self.dem.sims.wall_type)
+        self.contactor.fluid_initialize(self.sims, self.mpm.sims.material_type, self.dem.sims.scheme)
 
     def add_property(self, DEMmaterial, MPMmaterial, property, dType="all"):
         self.contactor.add_contact_property(self.sims, MPMmaterial, DEMmaterial, property, dType)
@@ -220,7 +232,7 @@ class DEMPM(object):
         self.recorder = WriteFile(self.sims, self.mpm.sims, self.dem.sims, self.dem.recorder, self.mpm.recorder, self.contactor.physpp, self.contactor.physpw, self.contactor.neighbor)
         if self.enginer is None:
             self.enginer = Engine(self.sims, self.mpm.sims, self.dem.sims, self.mpm.scene, self.dem.scene, self.mpm.enginer, self.dem.enginer,
-                                  self.contactor.neighbor, self.mpm.neighbor, self.dem.contactor.neighbor, self.contactor.physpp, self.contactor.physpw)
+                                  self.contactor.neighbor, self.mpm.neighbor, self.dem.contactor.neighbor, self.contactor.physpp, self.contactor.physpw, self.contactor.physfluid)
         self.enginer.manage_function()
 
         if self.solver is None:
@@ -244,12 +256,25 @@ class DEMPM(object):
         dem_critical_timestep = self.dem.get_critical_timestep()
         mpm_critical_timestep = self.mpm.scene.get_critical_timestep()
         dempm_critical_timestep = self.get_critical_timestep()
+        if self.sims.subcycling:
+            self.check_subcycling_timestep(mpm_critical_timestep, min(dem_critical_timestep, dempm_critical_timestep))
+            return
+        
         critical_timestep = min(dem_critical_timestep, mpm_critical_timestep, dempm_critical_timestep)
         if self.sims.CFL * critical_timestep < self.sims.dt[None]:
             self.sims.update_critical_timestep(self.mpm.sims, self.dem.sims, self.sims.CFL * critical_timestep)
         else:
             print("The prescribed time step is sufficiently small\n")
 
+    def check_subcycling_timestep(self, mpm_critical_timestep, dem_critical_timestep):
+        mpm_timestep = min(self.sims.CFL * mpm_critical_timestep, self.sims.delta)
+        substep = max(1, int(math.ceil(mpm_timestep / (self.sims.CFL * dem_critical_timestep) - Threshold)))
+        self.sims.update_subcycling_timestep(self.mpm.sims, self.dem.sims, mpm_timestep, substep)
+
     def get_critical_timestep(self):
-        return self.contactor.physpp.calcu_critical_timesteps(self.mpm.scene, self.dem.sims, self.dem.scene, self.sims.max_material_num)
+        critical_timestep = self.contactor.physpp.calcu_critical_timesteps(self.mpm.scene, self.dem.sims, self.dem.scene, self.sims.max_material_num)
+        if not self.contactor.physfluid is None:
+            # explicit drag stays stable below the relaxation time of the lightest grain
+            critical_timestep = min(critical_timestep, self.contactor.physfluid.calcu_critical_timesteps(self.mpm.scene, self.dem.sims, self.dem.scene))
+        return critical_timestep
     
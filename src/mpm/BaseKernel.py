@@ -3,8 +3,9 @@ import taichi as ti
 from src.utils.constants import MThreshold, Threshold, ZEROVEC3f
 from src.utils.ScalarFunction import linearize
 from src.utils.VectorFunction import SquareLen
-from src.utils.BitFunction import Zero2OneVector
+from src.utils.BitFunction import Zero2OneVector, morton2d32, morton3d32
 from src.utils.TypeDefination import vec3f
+import src.utils.GlobalVariable as GlobalVariable
 
 
 @ti.kernel
@@ -34,6 +35,73 @@ def update_particle_storage_(particleNum: int, particle: ti.template(), stateVar
             remaining_particle += 1
     return remaining_particle
 
+@ti.func
+def get_morton_code(position, igrid_size, cnum, shift):
+    grid_idx = ti.max(ti.min(ti.floor(position * igrid_size, int), cnum - 1), 0)
+    code = 0
+    if ti.static(GlobalVariable.DIMENSION == 2):
+        code = morton2d32(grid_idx[0] >> shift, grid_idx[1] >> shift)
+    else:
+        code = morton3d32(grid_idx[0] >> shift, grid_idx[1] >> shift, grid_idx[2] >> shift)
+    return code
+
+@ti.kernel
+def calculate_particle_morton_code_(particleNum: int, shift: int, igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float), cnum: ti.types.vector(GlobalVariable.DIMENSION, int), 
+                                    particle: ti.template(), morton_code: ti.template(), particleID: ti.template()):
+    for np in range(particleNum):
+        morton_code[np] = get_morton_code(particle[np].x, igrid_size, cnum, shift)
+        particleID[np] = np
+
+@ti.kernel
+def gather_particle_storage_(particleNum: int, particleID: ti.template(), storage: ti.template(), buffer: ti.template()):
+    for np in range(particleNum):
+        buffer[np] = storage[particleID[np]]
+
+@ti.kernel
+def copy_particle_storage_(particleNum: int, buffer: ti.template(), storage: ti.template()):
+    for np in range(particleNum):
+        storage[np] = buffer[np]
+
+@ti.kernel
+def inverse_particle_index_(particleNum: int, particleID: ti.template(), particle_map: ti.template()):
+    for np in range(particleNum):
+        particle_map[particleID[np]] = np
+
+@ti.kernel
+def update_state_vars_storage_(particleNum: int, particle: ti.template(), stateVars: ti.template()):
+    remaining_particle = 0
+    ti.loop_config(serialize=True)
+    for np in range(particleNum):
+        if int(particle[np].active) == 1:
+            stateVars[remaining_particle] = stateVars[np]
+            remaining_particle += 1
+
+@ti.kernel
+def kernel_sort_particles_by_model(particleNum: int, model_num: int, particle: ti.template(), model_of_material: ti.template(), model_offset: ti.template(), particle_index: ti.template()):
+    for nm in range(model_num + 1):
+        model_offset[nm] = 0
+    for np in range(particleNum):
+        model = model_of_material[int(particle[np].materialID)]
+        if model >= 0:
+            ti.atomic_add(model_offset[model + 1], 1)
+
+    ti.loop_config(serialize=True)
+    for nm in range(model_num):
+        model_offset[nm + 1] += model_offset[nm]
+
+    # stable scatter, so that every range keeps the storage order of the particles
+    ti.loop_config(serialize=True)
+    for np in range(particleNum):
+        model = model_of_material[int(particle[np].materialID)]
+        if model >= 0:
+            particle_index[model_offset[model]] = np
+            model_offset[model] += 1
+
+    ti.loop_config(serialize=True)
+    for nm in range(model_num):
+        model_offset[model_num - nm] = model_offset[model_num - nm - 1]
+    model_offset[0] = 0
+
 @ti.kernel
 def find_max_radius_(particleNum: int, particle: ti.template()) -> float:
     rmax = 0.
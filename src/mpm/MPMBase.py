@@ -7,8 +7,11 @@ from src.mpm.GenerateManager import GenerateManager
 from src.mpm.Recorder import WriteFile
 from src.mpm.SceneManager import myScene
 from src.mpm.Simulation import Simulation
+from src.utils.AdaptiveTimestep import AdaptiveTimestep
 from src.utils.constants import Threshold
+from src.utils.linalg import no_operation
 from src.utils.ObjectIO import DictIO
+from src.utils.TimeTicker import Profiler
 from src.utils.TypeDefination import vec3f
 
 
@@ -27,6 +30,11 @@ class Solver:
         self.last_save_time = 0.
         self.last_print_time = 0.
         self.postprocess = []
+        self.profiler = None
+
+        self.update_timestep = no_operation
+        self.print_timestep = no_operation
+        self.timestepper = None
 
     def set_callback_function(self, functions):
         if not functions is None:
@@ -44,8 +52,25 @@ class Solver:
         
     def save_file(self, scene):
         print('# Step =', self.sims.current_step, '   ', 'Save Number =', self.sims.current_print, '   ', 'Simulation time =', self.sims.current_time, '\n')
+        self.print_timestep()
         self.recorder.output(self.sims, scene)
 
+    def timestep_initialize(self):
+        self.update_timestep = no_operation
+        self.print_timestep = no_operation
+        if self.sims.isadaptive:
+            self.update_timestep = self.adaptive_timestep
+            self.print_timestep = self.print_adaptive_timestep
+            # the following saves are scheduled from the current time, the steps are cut to land on them
+            self.last_save_time = 1. * self.sims.current_time
+            self.timestepper = AdaptiveTimestep(self.sims, self.engine)
+
+    def adaptive_timestep(self, scene: myScene):
+        self.timestepper.update(scene, self.last_save_time)
+
+    def print_adaptive_timestep(self):
+        self.timestepper.print_info()
+
     def Solver(self, scene: myScene, neighbor):
         print("#", " Start Simulation ".center(67,"="), "#")
        
@@ -54,16 +79,22 @@ class Solver:
             self.save_file(scene)
             self.sims.current_print += 1
             self.last_save_time = -0.8 * self.sims.delta
+        self.timestep_initialize()
 
         print("Compiling first ... ...")
         start_time = time.time()
+        self.update_timestep(scene)
         self.core(scene, neighbor)
         end_time = time.time()
         print('Compiling time = ', end_time - start_time)
 
+        self.start_profiler(scene)
         start_time = time.time()
         while self.sims.current_time <= self.sims.time:
+            self.update_timestep(scene)
             self.core(scene, neighbor)
+            if self.profiler is not None:
+                self.profiler.step()
 
             new_body = self.generator.regenerate(scene)
             if self.sims.current_time - self.last_save_time + 0.1 * self.sims.delta > self.sims.save_interval or new_body:
@@ -81,9 +112,27 @@ class Solver:
             self.last_save_time = 1. * self.sims.current_time
             self.sims.current_print += 1
 
+        self.recorder.flush()
+        self.finish_profiler()
+        self.print_timestep()
         print('Physical time = ', end_time - start_time)
         print("#", " End Simulation ".center(67,"="), "#", '\n')
 
+    def start_profiler(self, scene: myScene):
+        if self.sims.profile:
+            self.profiler = Profiler(self.sims.profile_interval)
+            instrument_mpm(self.profiler, self.sims, scene, self.engine)
+            self.profiler.instrument(self.recorder, "output", "output")
+            self.profiler.start()
+
+    def finish_profiler(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler.restore()
+            self.profiler.print_table()
+            self.profiler.dump(self.sims.path + "/profile.json")
+            self.profiler = None
+
     def Visualize(self, scene: myScene, neighbor):
         print("#", " Start Simulation ".center(67,"="), "#")
 
@@ -119,9 +168,11 @@ class Solver:
             self.save_file(scene)
             self.sims.current_print += 1
             self.last_save_time = -0.8 * self.sims.delta
+        self.timestep_initialize()
         
         start_time = time.time()
         while window.running:
+            self.update_timestep(scene)
             self.core(scene, neighbor)
 
             new_body = self.generator.regenerate(scene)
@@ -154,13 +205,15 @@ class Solver:
             self.last_save_time = 1. * self.sims.current_time
             self.sims.current_print += 1
 
+        self.recorder.flush()
         print('Physical time = ', end_time - start_time)
         print("#", " End Simulation ".center(67,"="), "#", '\n')
 
     def core(self, scene: myScene, neighbor):
         tbl = getattr(self.sims, 'gravity_table', None)
         if tbl is not None:
-            idx = int(self.sims.current_time / self.sims.delta)
+            # the table is sampled at the prescribed time step, the adaptive step varies
+            idx = int(self.sims.current_time / (self.sims.max_timestep if self.sims.isadaptive else self.sims.delta))
             if idx >= tbl.shape[0]:
                 idx = tbl.shape[0] - 1
             row = tbl[idx]
@@ -168,8 +221,37 @@ class Solver:
                 self.sims.gravity = vec3f(row.tolist())
             else:
                 self.sims.gravity = vec3f([row[0], row[1], 0.])
+        self.engine.reorder_particles(self.sims, scene, neighbor)
         self.engine.reset_grid_messages(scene)
         self.engine.bulid_neighbor_list(self.sims, scene, neighbor)
         self.engine.compute(self.sims, scene)
+        scene.apply_boundary_conditions()
         for functions in self.postprocess:
             functions()
+
+
+MPM_PHASES = {"reset": ["reset_particle_message"],
+              "reorder": ["reorder_particles"],
+              "verlet check": ["is_need_update_verlet_table"],
+              "shape functions": ["calculate_interpolation"],
+              "P2G": ["compute_nodal_kinematic", "system_resolve", "compute_forces", "compute_internal_forces", "postmapping_grid_velocity"],
+              "grid update": ["compute_grid_velcity", "compute_grid_kinematic"],
+              "boundary": ["apply_particle_traction_constraints", "apply_traction_constraints", "apply_absorbing_constraints", 
+                           "apply_kinematic_constraints", "apply_dirichlet_constraints", "apply_displacement_constraints"],
+              "contact": ["pre_contact_calculate", "compute_contact_force_"],
+              "G2P": ["compute_particle_kinematic", "compute_velocity_gradient"],
+              "constitutive": ["compute_stress_strains", "pressure_smoothing_"]}
+
+
+def instrument_mpm(profiler: Profiler, sims: Simulation, scene: myScene, engine: Engine, prefix=""):
+    # the stage pointers are timed individually, whatever the scheme does besides them (e.g. the fused G2P2G
+    # kernel or the Newton iterations of the implicit engine) is reported as "engine"
+    profiler.instrument(engine, "compute", prefix + "engine")
+    for phase, functions in MPM_PHASES.items():
+        for function in functions:
+            profiler.instrument(engine, function, prefix + phase)
+    profiler.instrument(scene, "apply_boundary_conditions", prefix + "boundary")
+    profiler.instrument(engine, "update_verlet_table", prefix + "neighbor rebuild", after=lambda _: profiler.count(prefix + "verlet rebuilds"))
+    profiler.instrument(engine, "execute_board_serach", prefix + "neighbor rebuild")
+    profiler.instrument(engine, "reset_grid_messages", prefix + "reset", 
+                        after=lambda _: profiler.gauge(prefix + "particle storage usage", int(scene.particleNum[0]) / sims.max_particle_num))
@@ -16,69 +16,95 @@ from src.mpm.materials.strain_rate.Newtonian import Newtonian
 from src.mpm.materials.strain_rate.Bingham import Bingham
 from src.mpm.materials.strain_rate.FluidStructureInteraction import FluidStructureInteraction
 from src.mpm.materials.MaterialModel import UserDefined
+from src.mpm.materials.MultiConstitutiveModel import MultiConstitutiveModel
 
 class ConstitutiveModel:
     def __init__(self) -> None:
         self.constitutive_model = None
         self.material = None
+        self.models = {}
 
     def save_material(self, model, material):
+        materials = [material] if type(material) is dict else list(material)
+        if model in self.models:
+            self.models[model] += materials
+        else:
+            self.models[model] = materials
         self.constitutive_model = model
         self.material = material
 
     def initialize(self, sims: Simulation):
+        if len(self.models) > 1:
+            sims.set_constitutive_model_num(len(self.models))
+            self.material = self.models
+            material = MultiConstitutiveModel(sims, {model: self.create_model(sims, model) for model in self.models})
+        else:
+            if self.constitutive_model in self.models:
+                self.material = self.models[self.constitutive_model]
+            material = self.create_model(sims, self.constitutive_model)
+        if sims.elastic_predictor and not material.elastic_predictor:
+            raise RuntimeError(f"Keyword:: /elastic_predictor/ is only supported by ModifiedCamClay, StateDependentMohrCoulomb and MohrCoulomb, not by {type(material).__name__}")
+        return material
+
+    def create_model(self, sims: Simulation, constitutive_model):
+        if sims.constitutive_model_num > 1 and sims.material_type == "Solid":
+            # strain-rate models provide the same stress update as solids, so that fluids and solids can share a run
+            if constitutive_model == "Newtonian":
+                return Newtonian(sims)
+            elif constitutive_model == "Bingham":
+                return Bingham(sims)
         if sims.material_type == "Solid" or sims.material_type == "TwoPhaseDoubleLayer":
             model_type = ["None", "RigidBoyd", "LinearElastic", "HenckyElastic", "NeoHookean", "ElasticPerfectlyPlastic", "IsotropicHardeningPlastic",
                           "MohrCoulomb", "SoftenMohrCoulomb", "DruckerPrager", "ModifiedCamClay", "CohesiveModifiedCamClay", "SoilStructureInteraction", "UserDefined"]
-            if self.constitutive_model == "None" or self.constitutive_model == "RigidBody":
+            if constitutive_model == "None" or constitutive_model == "RigidBody":
                 return RigidBody(sims)
-            elif self.constitutive_model == "HenckyElastic":
+            elif constitutive_model == "HenckyElastic":
                 if sims.stabilize == "B-Bar Method":
                     raise RuntimeError("B bar method is unsupported in HenckyElastic material")
                 return HenckyElastic(sims)
-            elif self.constitutive_model == "NeoHookean":
+            elif constitutive_model == "NeoHookean":
                 if sims.stabilize == "B-Bar Method":
                     raise RuntimeError("B bar method is unsupported in NeoHookean material")
                 return NeoHookean(sims)
-            elif self.constitutive_model == "LinearElastic":
+            elif constitutive_model == "LinearElastic":
                 return LinearElastic(sims)
-            elif self.constitutive_model == "ElasticPerfectlyPlastic":
+            elif constitutive_model == "ElasticPerfectlyPlastic":
                 return ElasticPerfectlyPlastic(sims)
-            elif self.constitutive_model == "IsotropicHardeningPlastic":
+            elif constitutive_model == "IsotropicHardeningPlastic":
                 return IsotropicHardeningPlastic(sims)
-            elif self.constitutive_model == "MohrCoulomb":
+            elif constitutive_model == "MohrCoulomb":
                 return WillianMohrCoulomb(sims)
-            elif self.constitutive_model == "SoftenMohrCoulomb":
+            elif constitutive_model == "SoftenMohrCoulomb":
                 return MohrCoulomb(sims)
-            elif self.constitutive_model == "StateDependentMohrCoulomb":
+            elif constitutive_model == "StateDependentMohrCoulomb":
                 return StateDependentMohrCoulomb(sims)
-            elif self.constitutive_model == "DruckerPrager":
+            elif constitutive_model == "DruckerPrager":
                 return DruckerPrager(sims)
-            elif self.constitutive_model == "ModifiedCamClay":
+            elif constitutive_model == "ModifiedCamClay":
                 return ModifiedCamClay(sims)
-            elif self.constitutive_model == "CohesiveModifiedCamClay":
+            elif constitutive_model == "CohesiveModifiedCamClay":
                 return CohesiveModifiedCamClay(sims)
-            elif self.constitutive_model == "SoilStructureInteraction":
+            elif constitutive_model == "SoilStructureInteraction":
                 if sims.solver_type == "Implicit":
                     raise RuntimeError("Only /Explicit/ /ULMPM/ supports soil-structure interaction model")
                 return SoilStructureInteraction(sims)
-            elif self.constitutive_model == "UserDefined":
+            elif constitutive_model == "UserDefined":
                 return UserDefined(sims)
             else:
-                raise ValueError(f'Constitutive Model: {self.constitutive_model} error! Only the following is aviliable:\n{model_type}')
+                raise ValueError(f'Constitutive Model: {constitutive_model} error! Only the following is aviliable:\n{model_type}')
         elif sims.material_type == "Fluid":
             if sims.configuration =="TLMPM":
                 raise RuntimeError("Only /Explicit/ /ULMPM/ supports fluid model")
             
             model_type = ["Newtonian", "Bingham", "FluidStructureInteraction", "UserDefined"]
-            if self.constitutive_model == "Newtonian":
+            if constitutive_model == "Newtonian":
                 return Newtonian(sims)
-            elif self.constitutive_model == "Bingham":
+            elif constitutive_model == "Bingham":
                 return Bingham(sims)
-            elif self.constitutive_model == "FluidStructureInteraction":
+            elif constitutive_model == "FluidStructureInteraction":
                 return FluidStructureInteraction(sims)
             else:
-                raise ValueError(f'Constitutive Model: {self.constitutive_model} error! Only the following is aviliable:\n{model_type}')
+                raise ValueError(f'Constitutive Model: {constitutive_model} error! Only the following is aviliable:\n{model_type}')
         elif sims.material_type == "TwoPhaseSingleLayer":
             if sims.configuration =="TLMPM":
                 raise RuntimeError("Only /Explicit/ /ULMPM/ supports fluid model")
@@ -86,9 +112,9 @@ class ConstitutiveModel:
                 raise RuntimeError("Only /Explicit/ /ULMPM/ supports fluid model")
             
             model_type = ["LinearElastic"]
-            if self.constitutive_model == "LinearElastic":
+            if constitutive_model == "LinearElastic":
                 return LinearElastic(sims)
             else:
-                raise ValueError(f'Constitutive Model: {self.constitutive_model} error! Only the following is aviliable:\n{model_type}')
+                raise ValueError(f'Constitutive Model: {constitutive_model} error! Only the following is aviliable:\n{model_type}')
 
 
@@ -0,0 +1,72 @@
+import taichi as ti
+import math
+
+from src.mpm.BaseKernel import calculate_particle_morton_code_, gather_particle_storage_, copy_particle_storage_, inverse_particle_index_
+from src.mpm.boundaries.BoundaryCore import reorder_particle_traction_constraint
+from src.mpm.SceneManager import myScene
+from src.mpm.Simulation import Simulation
+from src.utils.sorting.RadixSort import RadixSort
+
+
+class MortonReorder(object):
+    sims: Simulation
+
+    def __init__(self, sims: Simulation) -> None:
+        self.sims = sims
+        self.shift = 0
+        self.step_num = 0
+        self.sorter = None
+        self.particle_map = None
+        self.buffers = {}
+
+    def reorder_initialize(self, scene: myScene):
+        self.sorter = RadixSort(max(self.sims.max_particle_num, 1), with_value=True)
+        self.particle_map = ti.field(int, shape=self.sims.max_particle_num)
+
+        # morton codes take 15 bits per axis in 2D and 10 bits in 3D, coarser cells are used for larger grids
+        bits = 15 if self.sims.dimension == 2 else 10
+        self.shift = max(0, int(math.ceil(math.log2(max(scene.element.cnum)))) - bits)
+        self.print_info(scene.element.grid_size * 2 ** self.shift)
+
+    def print_info(self, cell_size):
+        print(" Morton Reorder Initialize ".center(71,"-"))
+        print("Reorder interval (steps): ", self.sims.reorder_interval)
+        print("Morton cell size: ", cell_size, '\n')
+
+    def allocate_buffer(self, storage):
+        # the scratch storage has the members of the particle storage, so that one gather moves a whole particle
+        if id(storage) not in self.buffers:
+            members = {}
+            for name, member in storage.field_dict.items():
+                if isinstance(member, ti.lang.matrix.MatrixField):
+                    if member.ndim == 1:
+                        members[name] = ti.types.vector(member.n, member.dtype)
+                    else:
+                        members[name] = ti.types.matrix(member.n, member.m, member.dtype)
+                else:
+                    members[name] = member.dtype
+            self.buffers[id(storage)] = ti.Struct.field(members, shape=storage.shape)
+        return self.buffers[id(storage)]
+
+    def update(self, scene: myScene):
+        self.step_num += 1
+        if self.step_num % self.sims.reorder_interval == 0:
+            self.reorder(scene)
+            return True
+        return False
+
+    def reorder(self, scene: myScene):
+        particleNum = int(scene.particleNum[0])
+        if particleNum == 0: return
+        calculate_particle_morton_code_(particleNum, self.shift, scene.element.igrid_size, scene.element.cnum, scene.particle, self.sorter.data_in, self.sorter.value_in)
+        self.sorter.run(particleNum, 30)
+        self.reorder_storage(particleNum, scene.particle)
+        scene.material.reorder_particle_storage(particleNum, self.reorder_storage)
+        if int(scene.boundary.ptraction_list[0]) > 0 and self.sims.ptraction_method != "Virtual":
+            inverse_particle_index_(particleNum, self.sorter.value_in, self.particle_map)
+            reorder_particle_traction_constraint(int(scene.boundary.ptraction_list[0]), scene.boundary.particle_traction, self.particle_map)
+
+    def reorder_storage(self, particleNum, storage):
+        buffer = self.allocate_buffer(storage)
+        gather_particle_storage_(particleNum, self.sorter.value_in, storage, buffer)
+        copy_particle_storage_(particleNum, buffer, storage)
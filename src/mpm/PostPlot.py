@@ -4,6 +4,7 @@ import numpy as np
 
 from src.mpm.Simulation import Simulation
 from third_party.pyevtk.hl import pointsToVTK, gridToVTK
+from src.utils.ChunkedStore import frame_exists, load_frame
 from src.utils.ObjectIO import DictIO
 
 
@@ -26,10 +27,10 @@ def write_vtk_file(sims: Simulation, start_file, end_file, read_path, write_path
     for printNum in range(start_file, end_file):
         data = {}
         particle_file = (read_path + "/particles/MPMParticle{0:06d}.npz").format(printNum)
-        if not os.access(particle_file, os.F_OK): continue
+        if not frame_exists(particle_file): continue
 
         print((" MPM Postprocessing: Output VTK File" + str(printNum) + ' ').center(71, '-'))
-        particle_info = np.load(particle_file, allow_pickle=True)
+        particle_info = load_frame(particle_file)
         if printNum == start_file:
             position0 = np.ascontiguousarray(DictIO.GetEssential(particle_info, "position"))
         
@@ -116,7 +117,7 @@ def write_vtk_file(sims: Simulation, start_file, end_file, read_path, write_path
 
         if DictIO.GetAlternative(kwargs, "write_background_grid", False):
             grid_data = {}
-            grid_info = np.load((read_path + "/grids/MPMGrid{0:06d}.npz").format(printNum), allow_pickle=True)
+            grid_info = load_frame((read_path + "/grids/MPMGrid{0:06d}.npz").format(printNum))
 
             coords = DictIO.GetEssential(grid_info, "coords")
             posx = np.unique(np.ascontiguousarray(coords[:, 0]))
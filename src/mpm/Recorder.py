@@ -4,6 +4,8 @@ import numpy as np
 
 from src.mpm.Simulation import Simulation
 from src.mpm.SceneManager import myScene
+from src.utils.AsyncWriter import AsyncWriter, SnapshotBuffer
+from src.utils.ChunkedStore import ChunkedStore
 from src.utils.linalg import no_operation
 from third_party.pyevtk.vtk import VtkPolygon
 from third_party.pyevtk.hl import pointsToVTK, gridToVTK, unstructuredGridToVTK
@@ -17,12 +19,21 @@ class WriteFile:
 
         self.save_particle = no_operation
         self.save_grid = no_operation
+        self.writer = None
+        self.savez = np.savez
+        self.particle_snapshot = None
+        self.state_vars_snapshot = None
 
         self.mkdir(sims)
         self.manage_function(sims)
 
 
     def manage_function(self, sims: Simulation):
+        if sims.async_output and self.writer is None:
+            self.writer = AsyncWriter(sims.output_queue_size)
+        if sims.output_format == "chunked" and self.savez is np.savez:
+            self.savez = ChunkedStore(sims.output_compression, sims.output_downcast).savez
+
         if 'particle' in sims.monitor_type:
             self.visualizeParticle = no_operation
             if sims.visualize:
@@ -33,6 +44,8 @@ class WriteFile:
             if sims.neighbor_detection or sims.coupling:
                 if ("Implicit" in sims.solver_type) and (sims.material_type == "Fluid" or sims.material_type == "TwoPhaseDoubleLayer"):
                     self.save_particle = self.MonitorIncompressibleParticleCoupling
+                elif sims.async_output:
+                    self.save_particle = self.MonitorParticleAsync
                 else:
                     self.save_particle = self.MonitorParticleCoupling
             else:
@@ -41,6 +54,8 @@ class WriteFile:
                 else:
                     if ("Implicit" in sims.solver_type) and (sims.material_type == "Fluid" or sims.material_type == "TwoPhaseDoubleLayer"):
                         self.save_particle = self.MonitorIncompressibleParticle
+                    elif sims.async_output:
+                        self.save_particle = self.MonitorParticleAsync
                     else:
                         self.save_particle = self.MonitorParticle
 
@@ -65,6 +80,10 @@ class WriteFile:
         self.save_grid(sims, scene)
         self.visualizedObject(sims, scene)
 
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
     def mkdir(self, sims: Simulation):
         if not os.path.exists(sims.path):
             os.makedirs(sims.path)
@@ -94,7 +113,7 @@ class WriteFile:
         cell_types = np.array([7])
         unstructuredGridToVTK(self.vtk_path+f'/GraphicObject{sims.current_print:06d}', posx, posy, posz, connectivity, offsets, cell_types)
 
-    def VisualizeParticle(self, sims: Simulation, position, velocity, volume, state_vars):
+    def VisualizeParticle(self, current_print, position, velocity, volume, state_vars):
         posx = np.ascontiguousarray(position[:, 0])
         posy = np.ascontiguousarray(position[:, 1])
         posz = np.ascontiguousarray(position[:, 2])
@@ -103,9 +122,9 @@ class WriteFile:
         velz = np.ascontiguousarray(velocity[:, 2])
         data = {"velocity": (velx, vely, velz), "volume": volume}
         data.update(state_vars)
-        pointsToVTK(self.vtk_path+f'/GraphicMPMParticle{sims.current_print:06d}', posx, posy, posz, data=data)
+        pointsToVTK(self.vtk_path+f'/GraphicMPMParticle{current_print:06d}', posx, posy, posz, data=data)
 
-    def VisualizeParticle2D(self, sims: Simulation, position, velocity, volume, state_vars):
+    def VisualizeParticle2D(self, current_print, position, velocity, volume, state_vars):
         posx = np.ascontiguousarray(position[:, 0])
         posy = np.ascontiguousarray(position[:, 1])
         posz = np.zeros(position.shape[0])
@@ -114,7 +133,7 @@ class WriteFile:
         velz = np.zeros(velocity.shape[0])
         data = {"velocity": (velx, vely, velz), "volume": volume}
         data.update(state_vars)
-        pointsToVTK(self.vtk_path+f'/GraphicMPMParticle{sims.current_print:06d}', posx, posy, posz, data=data)
+        pointsToVTK(self.vtk_path+f'/GraphicMPMParticle{current_print:06d}', posx, posy, posz, data=data)
 
     def VisualizeGrid(self, sims: Simulation, coords, data):
         coordx = np.unique(np.ascontiguousarray(coords[:, 0]))
@@ -146,8 +165,8 @@ class WriteFile:
         #znorm = np.ascontiguousarray(normal[:, 2])
 
         #state_vars.update({"normal": (xnorm, ynorm, znorm)})
-        self.visualizeParticle(sims, output['position'], output['velocity'], output['volume'], state_vars)
-        np.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
+        self.visualizeParticle(sims.current_print, output['position'], output['velocity'], output['volume'], state_vars)
+        self.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
 
     def MonitorParticleTwoPhase(self, sims: Simulation, scene: myScene):
         particle_num = scene.particleNum[0]
@@ -171,8 +190,8 @@ class WriteFile:
         fix_v = scene.particle.fix_v.to_numpy()[0:scene.particleNum[0]] 
         state_vars: dict = scene.material.get_state_vars_dict(0, scene.particleNum[0])
         state_vars.update({"pressure": pressure})
-        self.visualizeParticle(sims, position, velocity, volume, state_vars)
-        np.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', t_current=sims.current_time, body_num = particle_num, 
+        self.visualizeParticle(sims.current_print, position, velocity, volume, state_vars)
+        self.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', t_current=sims.current_time, body_num = particle_num, 
                                                                              bodyID=bodyID, materialID=materialID, active=active, mass=mass, volume=volume, position=position, velocity=velocity, 
                                                                              stress=stress, solid_velocity_gradient=solid_velocity_gradient, fluid_velocity_gradient=fluid_velocity_gradient, fix_v=fix_v, state_vars=state_vars, 
                                                                              solid_velocity=solid_velocity, fluid_velocity=fluid_velocity, solid_mass=solid_mass, fluid_mass=fluid_mass, pressure=pressure, permeability=permeability, porosity=porosity)
@@ -194,8 +213,8 @@ class WriteFile:
         state_vars = scene.material.get_state_vars_dict(0, scene.particleNum[0])
         state_vars.update({'pressure': pressure})
         
-        self.visualizeParticle(sims, output['position'], output['velocity'], output['volume'], state_vars)
-        np.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
+        self.visualizeParticle(sims.current_print, output['position'], output['velocity'], output['volume'], state_vars)
+        self.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
         
     def MonitorParticle(self, sims: Simulation, scene: myScene):
         particle_num = scene.particleNum[0]
@@ -206,8 +225,8 @@ class WriteFile:
         state_vars = scene.material.get_state_vars_dict(0, scene.particleNum[0])
         output.update({'stress': stress, 'velocity_gradient': velocity_gradient, 'state_vars': state_vars})
         
-        self.visualizeParticle(sims, output['position'], output['velocity'], output['volume'], state_vars)
-        np.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
+        self.visualizeParticle(sims.current_print, output['position'], output['velocity'], output['volume'], state_vars)
+        self.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
         
     def MonitorIncompressibleParticle(self, sims: Simulation, scene: myScene):
         particle_num = scene.particleNum[0]
@@ -223,8 +242,37 @@ class WriteFile:
             yvelocity_gradient = scene.particle.yvelocity_gradient.to_numpy()[0:scene.particleNum[0]] 
             zvelocity_gradient = scene.particle.zvelocity_gradient.to_numpy()[0:scene.particleNum[0]] 
             output.update({'xvelocity_gradient': xvelocity_gradient, 'yvelocity_gradient': yvelocity_gradient, 'zvelocity_gradient': zvelocity_gradient})'''
-        self.visualizeParticle(sims, output['position'], output['velocity'], output['volume'], {'pressure': pressure})
-        np.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
+        self.visualizeParticle(sims.current_print, output['position'], output['velocity'], output['volume'], {'pressure': pressure})
+        self.savez(self.particle_path+f'/MPMParticle{sims.current_print:06d}', **output)
+
+    def MonitorParticleAsync(self, sims: Simulation, scene: myScene):
+        particle_num = scene.particleNum[0]
+        if self.particle_snapshot is None:
+            members = ['x', 'bodyID', 'materialID', 'active', 'v', 'm', 'vol', 'fix_v', 'stress', 'velocity_gradient']
+            if sims.neighbor_detection or sims.coupling:
+                members += ['rad', 'external_force']
+            self.particle_snapshot = SnapshotBuffer(scene.particle, members)
+            state_vars = scene.material.get_state_vars_dict(0, 0)
+            if state_vars and all(hasattr(scene.material.stateVars, name) for name in state_vars):
+                self.state_vars_snapshot = SnapshotBuffer(scene.material.stateVars, state_vars.keys())
+        snapshot = self.particle_snapshot.snapshot(particle_num)
+        if self.state_vars_snapshot is None:
+            state_vars = scene.material.get_state_vars_dict(0, particle_num)
+        else:
+            state_vars = self.state_vars_snapshot.snapshot(particle_num)
+        self.writer.submit(self.WriteParticle, sims.current_print, sims.current_time, particle_num, np.array(scene.psize), snapshot, state_vars)
+
+    def WriteParticle(self, current_print, current_time, particle_num, psize, snapshot, state_vars):
+        data = snapshot.collect()
+        if not isinstance(state_vars, dict):
+            state_vars = state_vars.collect()
+        output = {'t_current': current_time, 'body_num': particle_num, 'active': data['active'], 'bodyID': data['bodyID'], 'materialID': data['materialID'], 
+                  'mass': data['m'], 'volume': data['vol'], 'position': data['x'], 'velocity': data['v'], 'fix_v': data['fix_v'], 'psize': psize,
+                  'stress': data['stress'], 'velocity_gradient': data['velocity_gradient'], 'state_vars': state_vars}
+        if 'external_force' in data:
+            output.update({'radius': data['rad'], 'external_force': data['external_force']})
+        self.visualizeParticle(current_print, output['position'], output['velocity'], output['volume'], state_vars)
+        self.savez(self.particle_path+f'/MPMParticle{current_print:06d}', **output)
 
     def MonitorParticleBase(self, sims: Simulation, scene: myScene, particle_num):
         position = scene.particle.x.to_numpy()[0:scene.particleNum[0]]
@@ -244,11 +292,11 @@ class WriteFile:
         contact_force = scene.node.contact_force.to_numpy()
         norm = scene.node.grad_domain.to_numpy()
         self.visualizeGrid(sims, coords, {})
-        np.savez(self.grid_path+f'/MPMGrid{sims.current_print:06d}', t_current=sims.current_time, dims=scene.element.gnum, coords=coords, contact_force=contact_force, normal=norm)
+        self.savez(self.grid_path+f'/MPMGrid{sims.current_print:06d}', t_current=sims.current_time, dims=scene.element.gnum, coords=coords, contact_force=contact_force, normal=norm)
 
     def MonitorGrid(self, sims: Simulation, scene: myScene):
         coords = scene.element.get_nodal_coords()
         #typex = np.ascontiguousarray(scene.element.boundary_type.to_numpy()[:,0][:,0])
         #typey = np.ascontiguousarray(scene.element.boundary_type.to_numpy()[:,0][:,1])
         self.visualizeGrid(sims, coords, {})
-        np.savez(self.grid_path+f'/MPMGrid{sims.current_print:06d}', t_current=sims.current_time, dims=scene.element.gnum, coords=coords)
+        self.savez(self.grid_path+f'/MPMGrid{sims.current_print:06d}', t_current=sims.current_time, dims=scene.element.gnum, coords=coords)
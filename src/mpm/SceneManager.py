@@ -33,6 +33,7 @@ class myScene(object):
         self.element = None
         self.node = None
         self.grid = []
+        self.grid_parent = []
         self.is_rigid = None
         self.pid = None
         self.grandparent = None
@@ -243,27 +244,6 @@ class myScene(object):
                         self.node = Nodes.field(shape=self.element.gridSum)
         else:'''
         gtemp = self.find_grid_class(sims)
-        if sims.sparse_grid:
-            if sims.AOSOA:
-                self.parent = ti.root.pointer(ti.ij, (int(np.ceil(self.element.gridSum / sims.block_size[0])), grid_level))
-                temp_tree = self.parent
-                for i in range(1, len(sims.block_size)):
-                    temp_tree = temp_tree.pointer(ti.i, int(sims.block_size[i-1] // sims.block_size[i]))
-                self.child = temp_tree.dense(ti.i, int(sims.block_size[len(sims.block_size)-1]))
-            else:
-                self.child = ti.root.pointer(ti.ij, (self.element.gridSum, grid_level))
-                self.parent = self.child
-        else: 
-            if sims.AOSOA:
-                self.parent = ti.root.dense(ti.ij, (int(np.ceil(self.element.gridSum / sims.block_size[0])), grid_level))
-                temp_tree = self.parent
-                for i in range(1, len(sims.block_size)):
-                    temp_tree = temp_tree.dense(ti.i, int(sims.block_size[i-1] // sims.block_size[i]))
-                self.parent = self.grandparent.dense(ti.i, int(sims.block_size[0] // sims.block_size[1]))
-                self.child = self.parent.dense(ti.i, int(sims.block_size[1]))
-            else:
-                self.child = ti.root.dense(ti.ij, (self.element.gridSum, grid_level))
-
         if sims.stabilize == 'F-Bar Method':
             if sims.material_type == "Solid":
                 gtemp.members.update({"jacobian": float})
@@ -275,6 +255,7 @@ class myScene(object):
                 gtemp.members.update({"pressure": float})
         if sims.particle_shifting is True:
             gtemp.members.update({"vol": float})
+        self.parent, self.child = self.allocate_grid_layout(sims, grid_level)
         self.node = gtemp.field()
         self.child.place(self.node)
         self.node.fill(0)
@@ -284,23 +265,43 @@ class myScene(object):
         #    self.parent.dynamic(ti.i, 1024 * 1024, chunk_size=sims.block_size[1] ** sims.dimension * 8).place(self.pid)
         
         if sims.mapping == "G2P2G":
-            self.grandparent = [self.grandparent]
-            self.parent = [self.parent]
-            self.child = [self.child]
-            output_grid = self.find_grid_class(sims, grid_level)
-            if sims.sparse_grid:
-                grandparent = ti.root.pointer(ti.ij, (int(np.ceil(self.element.gridSum // sims.block_size[0])), grid_level))
-                parent = self.grandparent[1].pointer(ti.i, int(sims.block_size[0] // sims.block_size[1]))
-                child = self.parent[1].dense(ti.i, int(sims.block_size[1]))
-                self.grandparent.append(grandparent)
-                self.parent.append(parent)
-                self.child.append(child)
-            else: 
-                self.child = ti.root.dense(ti.ij, (self.element.gridSum, grid_level))
-            self.grid = [self.node, self.child[1].place(output_grid)]
+            # G2P2G reads one grid while scattering into the other, switch_grid swaps them after each step
+            parent, child = self.allocate_grid_layout(sims, grid_level)
+            output_node = gtemp.field()
+            child.place(output_node)
+            output_node.fill(0)
+            self.grid = [self.node, output_node]
+            self.grid_parent = [self.parent, parent]
         self.element.calculate_basis_function(sims, grid_level)
         self.print_grid_message(sims, grid_level, cut_off)
  
+    def allocate_grid_layout(self, sims: Simulation, grid_level):
+        if sims.AOSOA:
+            block_num = int(np.ceil(self.element.gridSum / sims.block_size[0]))
+            if sims.sparse_grid:
+                parent = ti.root.pointer(ti.ij, (block_num, grid_level))
+            else:
+                parent = ti.root.dense(ti.ij, (block_num, grid_level))
+            temp_tree = parent
+            for i in range(1, len(sims.block_size)):
+                if sims.sparse_grid:
+                    temp_tree = temp_tree.pointer(ti.i, int(sims.block_size[i-1] // sims.block_size[i]))
+                else:
+                    temp_tree = temp_tree.dense(ti.i, int(sims.block_size[i-1] // sims.block_size[i]))
+            child = temp_tree.dense(ti.i, int(sims.block_size[len(sims.block_size)-1]))
+        else:
+            if sims.sparse_grid:
+                child = ti.root.pointer(ti.ij, (self.element.gridSum, grid_level))
+            else:
+                child = ti.root.dense(ti.ij, (self.element.gridSum, grid_level))
+            parent = child
+        return parent, child
+
+    def switch_grid(self):
+        self.grid.reverse()
+        self.grid_parent.reverse()
+        self.node, self.parent = self.grid[0], self.grid_parent[0]
+
     def check_grid_inputs(self, sims: Simulation, grid_level):
         if grid_level > 2:
             raise ValueError("The mpm only support two body contact detection")
@@ -361,6 +362,10 @@ class myScene(object):
         max_vel = find_max_velocity_(int(self.particleNum[0]), self.particle)
         max_vel += self.material.find_max_sound_speed()
         return self.element.calc_critical_timestep(max_vel)
+
+    def get_stable_timestep(self):
+        max_wave_speed = self.material.find_max_wave_speed(int(self.particleNum[0]), self.particle)
+        return self.element.calc_critical_timestep(max_wave_speed)
     
     def find_min_density(self):
         mindensity = 1e15
@@ -399,7 +404,8 @@ class myScene(object):
         if property_name == "bodyID":
             modify_particle_bodyID_in_region(value, int(self.particleNum[0]), self.particle, is_in_region)
         elif property_name == "materialID":
-            modify_particle_materialID_in_region(value, int(self.particleNum[0]), self.particle, self.material.matProps, is_in_region)
+            modify_particle_materialID_in_region(value, int(self.particleNum[0]), self.particle, self.material.get_material_props(value), is_in_region)
+            self.material.reset_particle_order()
         elif property_name == "position":
             if sims.dimension == 3:
                 modify_particle_position_in_region(factor, value, int(self.particleNum[0]), self.particle, is_in_region)
@@ -434,7 +440,8 @@ class myScene(object):
         if property_name == "bodyID":
             modify_particle_bodyID(value, int(self.particleNum[0]), self.particle, bodyID)
         elif property_name == "materialID":
-            modify_particle_materialID(value, int(self.particleNum[0]), self.particle, self.material.matProps, bodyID)
+            modify_particle_materialID(value, int(self.particleNum[0]), self.particle, self.material.get_material_props(value), bodyID)
+            self.material.reset_particle_order()
         elif property_name == "position":
             if sims.dimension == 3:
                 modify_particle_position(factor, value, int(self.particleNum[0]), self.particle, bodyID)
@@ -460,21 +467,21 @@ class myScene(object):
 
     def check_overlap_coupling(self):
         initial_particle = self.particleNum[0]
-        self.particleNum[0] = update_particle_storage_(int(int(self.particleNum[0])), self.particle, self.material.stateVars)
+        self.particleNum[0] = self.material.update_particle_storage(int(self.particleNum[0]), self.particle)
         finial_particle = self.particleNum[0]
         print(f"Total {-finial_particle + initial_particle} particles has been deleted", '\n')
         
     def delete_particles(self, bodyID):
         initial_particle = self.particleNum[0]
         kernel_delete_particles(self.particleNum[0], self.particle, bodyID)
-        self.particleNum[0] = update_particle_storage_(int(self.particleNum[0]), self.particle, self.material.stateVars)
+        self.particleNum[0] = self.material.update_particle_storage(int(self.particleNum[0]), self.particle)
         finial_particle = self.particleNum[0]
         print(f"Total {-finial_particle + initial_particle} particles has been deleted", '\n')
 
     def delete_particles_in_region(self, is_in_region):
         initial_particle = self.particleNum[0]
         kernel_delete_particles_in_region(self.particleNum[0], self.particle, is_in_region)
-        self.particleNum[0] = update_particle_storage_(int(self.particleNum[0]), self.particle, self.material.stateVars)
+        self.particleNum[0] = self.material.update_particle_storage(int(self.particleNum[0]), self.particle)
         finial_particle = self.particleNum[0]
         print(f"Total {-finial_particle + initial_particle} particles has been deleted", '\n')
 
@@ -513,7 +520,8 @@ class myScene(object):
 
     def set_boundary_condition(self, sims: Simulation):
         self.domain_boundary = DomainBoundary(sims.domain)
-        self.domain_boundary.set_boundary_condition(sims.boundary)
+        # only periodic axes are wrapped, the remaining axes are handled by the grid boundary constraints
+        self.domain_boundary.set_boundary_condition([int(b) if int(b) == 2 else -1 for b in sims.boundary])
         if self.domain_boundary.need_run:
             self.apply_boundary_conditions = self.apply_boundary_condition
         else:
@@ -521,4 +529,4 @@ class myScene(object):
 
     def apply_boundary_condition(self):
         if self.domain_boundary.apply_boundary_conditions(int(self.particleNum[0]), self.particle):
-            update_particle_storage_(self.particleNum, self.particle, self.material.stateVars)
\ No newline at end of file
+            self.particleNum[0] = self.material.update_particle_storage(int(self.particleNum[0]), self.particle)
\ No newline at end of file
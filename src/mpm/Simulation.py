@@ -29,6 +29,7 @@ class Simulation(object):
         self.stabilize = None
         self.pressure_smoothing = False
         self.strain_smoothing = False
+        self.elastic_predictor = False
         self.mapping = None
         self.shape_function = None
         self.wall_type = None
@@ -46,6 +47,7 @@ class Simulation(object):
 
         self.dt = ti.field(float, shape=())
         self.delta = 0.
+        self.max_timestep = 0.
         self.current_time = 0.
         self.current_step = 0
         self.current_print = 0
@@ -53,6 +55,7 @@ class Simulation(object):
         
         self.max_body_num = 2
         self.max_material_num = 0
+        self.constitutive_model_num = 1
         self.max_particle_num = 0
         self.verlet_distance_multiplier = 0
         self.verlet_distance = 0.
@@ -72,6 +75,14 @@ class Simulation(object):
         self.isadaptive = False
         self.save_interval = 1e6
         self.path = None
+        self.async_output = False
+        self.output_queue_size = 2
+        self.output_format = "npz"
+        self.output_compression = 1
+        self.output_downcast = False
+        self.profile = False
+        self.profile_interval = 0
+        self.reorder_interval = 0
         self.contact_detection = None
 
         self.visualize_interval = 0.
@@ -179,7 +190,7 @@ class Simulation(object):
             if self.stabilize == "B-Bar Method":
                 GlobalVariable.BBAR = True
             elif self.stabilize == "F-Bar Method":
-                raise RuntimeError("F-bar method should be actived under normal mode:: mode=str(Normal)")
+                GlobalVariable.FBAR = True
 
     def set_shape_smoothing(self, shape_smooth):
         if self.shape_function == "SmoothLinear":
@@ -191,6 +202,9 @@ class Simulation(object):
     def set_strain_smoothing(self, strain_smoothing):
         self.strain_smoothing = strain_smoothing
 
+    def set_elastic_predictor(self, elastic_predictor):
+        self.elastic_predictor = elastic_predictor
+
     def set_configuration(self, configuration):
         config = ["TLMPM", "ULMPM"]
         if not configuration in config:
@@ -237,8 +251,6 @@ class Simulation(object):
 
     def set_moving_least_square(self, mls):
         self.mls = mls
-        if self.mapping == "G2P2G":
-            self.mls = True
         if mls is True:
             self.set_velocity_projection_scheme("Affine")
             self.alphaPIC = 1.
@@ -254,8 +266,6 @@ class Simulation(object):
         if not shape_function in typelist:
             raise RuntimeError(f"KeyWord:: /mapping: {shape_function}/ is invalid. The valid type are given as follows: {typelist}")
         self.shape_function = shape_function
-        if self.mapping == "G2P2G":
-            self.shape_function == "QuadBSpline"
         if self.mode == "Lightweight":
             if self.shape_function == "Linear":
                 GlobalVariable.SHAPEFUNCTION = 0
@@ -297,10 +307,13 @@ class Simulation(object):
 
     def activate_period_boundary(self):
         self.pbc = True
+        GlobalVariable.PERIODIC = [int(b) == 2 for b in self.boundary]
+        GlobalVariable.DOMAIN = [float(d) for d in self.domain]
 
     def set_timestep(self, timestep):
         self.dt[None] = timestep
         self.delta = timestep
+        self.max_timestep = timestep
 
     def set_simulation_time(self, time):
         self.time = time
@@ -309,6 +322,8 @@ class Simulation(object):
         self.CFL = CFL
 
     def set_adaptive_timestep(self, isadaptive):
+        if isadaptive and self.solver_type != "Explicit":
+            raise RuntimeError("Keyword:: /AdaptiveTimestep/ is only supported by the explicit MPM solver")
         self.isadaptive = isadaptive
 
     def set_save_interval(self, save_interval):
@@ -323,11 +338,46 @@ class Simulation(object):
     def set_save_path(self, path):
         self.path = path
 
+    def set_async_output(self, async_output, output_queue_size=2):
+        if output_queue_size < 1:
+            raise ValueError("Keyword:: /OutputQueueSize/ should be larger than 0")
+        self.async_output = async_output
+        self.output_queue_size = int(output_queue_size)
+
+    def set_output_format(self, output_format, compression=1, downcast=False):
+        valid_format = ["npz", "chunked"]
+        if output_format not in valid_format:
+            raise ValueError(f"Keyword:: /OutputFormat/ {output_format} is invalid, only the following is valid: {valid_format}")
+        if not 0 <= compression <= 9:
+            raise ValueError("Keyword:: /Compression/ should be an integer between 0 and 9")
+        self.output_format = output_format
+        self.output_compression = int(compression)
+        self.output_downcast = downcast
+
+    def set_profile(self, profile, profile_interval=0):
+        if profile_interval < 0:
+            raise ValueError("Keyword:: /ProfileInterval/ should not be smaller than 0")
+        self.profile = profile
+        self.profile_interval = int(profile_interval)
+
+    def set_reorder_interval(self, reorder_interval):
+        if reorder_interval < 0:
+            raise ValueError("Keyword:: /ReorderInterval/ should be larger than or equal to 0!")
+        if reorder_interval > 0:
+            if self.configuration != "ULMPM" or self.solver_type == "Implicit":
+                raise RuntimeError("Keyword:: /ReorderInterval/ Morton reordering is only supported by the explicit ULMPM")
+            if self.coupling:
+                raise RuntimeError("Keyword:: /ReorderInterval/ Morton reordering is not supported for coupling MPDEM")
+        self.reorder_interval = int(reorder_interval)
+
     def set_material_num(self, material_num):
         if material_num <= 0:
             raise ValueError("Max material number should be larger than 0!")
         self.max_material_num = int(material_num + 1)
 
+    def set_constitutive_model_num(self, constitutive_model_num):
+        self.constitutive_model_num = int(constitutive_model_num)
+
     def set_body_num(self, body_num):
         if body_num <= 0:
             raise ValueError("Max Baterial number should be larger than 0!")
@@ -38,7 +38,8 @@ class SpatialHashGrid(object):
             self.igrid_size = 1. / self.grid_size
 
             if self.sims.pbc:
-                pass
+                # the binning and the neighbor sweep do not wrap the cell index nor the branch vector across periodic boundaries
+                raise RuntimeError("Keyword:: /boundary/ Period boundary is not supported with free surface or boundary direction detection")
 
             self.cnum = ti.Vector([max(1, int(domain * self.igrid_size) + 1) for domain in self.sims.domain])
             self.cellSum = reduce((lambda x, y: int(max(1, x) * max(1, y))), list(self.cnum))
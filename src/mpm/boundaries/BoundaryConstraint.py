@@ -33,12 +33,11 @@ class BoundaryConstraints(object):
         self.ptraction_list = np.zeros(1, dtype=np.int32)
         self.displacement_list = np.zeros(1, dtype=np.int32)
 
-        self.velocity_dict = {}
-        self.reflection_dict = {}
-        self.friction_dict = {}
-        self.absorbing_dict = {}
-        self.traction_dict = {}
-        self.displacement_dict = {}
+        self.velocity_table = None
+        self.reflection_table = None
+        self.friction_table = None
+        self.traction_table = None
+        self.displacement_table = None
 
         self.axis = {0: "X", 1: "Y", 2: "Z"}
 
@@ -188,10 +187,33 @@ class BoundaryConstraints(object):
         elif norm.endswith("Z"): dirs = 2
         return dirs, signs
     
-    def build_constraint_dict(self, values, *args):
-        keys = np.array(np.meshgrid(*args)).T.reshape(-1, len(args))
-        values_repeated = np.tile(values, len(args[-1]) * len(args[0]))
-        return dict(zip(map(tuple, keys), values_repeated))
+    def build_constraint_table(self, values, *args):
+        # one row of keys (node, direction, ..., level) per constraint, the values being given along the directions
+        columns = np.meshgrid(*[np.atleast_1d(arg) for arg in args], indexing='ij')
+        keys = np.stack([column.ravel() for column in columns], axis=1).astype(np.int64)
+        values = np.broadcast_to(np.reshape(values, (1, -1) + (1,) * (len(args) - 2)), columns[0].shape)
+        return keys, np.ravel(values).astype(float)
+
+    def merge_constraint_table(self, table, keys, values):
+        # the rows are sorted by their keys and a later constraint on the same key replaces the former one
+        if table is not None:
+            keys = np.concatenate((table[0], keys))
+            values = np.concatenate((table[1], values))
+        if keys.shape[0] == 0:
+            return keys, values
+        lower = keys.min(axis=0)
+        packed = np.ravel_multi_index(tuple((keys - lower).T), tuple(keys.max(axis=0) - lower + 1))
+        order = np.argsort(packed, kind='stable')
+        packed = packed[order]
+        order = order[np.append(packed[1:] != packed[:-1], True)]
+        return keys[order], values[order]
+
+    def remove_constraint_table(self, table, inodes, level, nlevel):
+        if table is None:
+            return table
+        keys, values = table
+        is_removed = np.isin(keys[:, 0], inodes) & (keys[:, -1] >= level) & (keys[:, -1] < level + nlevel)
+        return keys[~is_removed], values[~is_removed]
     
     def set_velocity_constraints(self, sims: Simulation, boundary, level, nlevel, start_point, end_point, inodes):
         if self.velocity_boundary is None:
@@ -205,7 +227,7 @@ class BoundaryConstraints(object):
         freedoms = self.get_freedoms(sims, velocity)
 
         dirs, values = zip(*freedoms)
-        self.velocity_dict.update(self.build_constraint_dict(np.array(values), inodes, np.array(dirs), np.arange(level, level + nlevel, 1)))
+        self.velocity_table = self.merge_constraint_table(self.velocity_table, *self.build_constraint_table(np.array(values), inodes, np.array(dirs), np.arange(level, level + nlevel, 1)))
 
         expected_dirs = {0: "X", 1: "Y", 2: "Z"}
         print("Boundary Type: Velocity Constraint")
@@ -224,7 +246,7 @@ class BoundaryConstraints(object):
         sign = DictIO.GetAlternative(boundary, "Sign", None)
         norms = self.get_norms(sims, norm, sign)
         dirs, signs = self.get_dirs_and_signs(norms)
-        self.reflection_dict.update(self.build_constraint_dict(np.zeros(1), inodes, dirs, signs, np.arange(level, level + nlevel, 1)))
+        self.reflection_table = self.merge_constraint_table(self.reflection_table, *self.build_constraint_table(np.zeros(1), inodes, dirs, signs, np.arange(level, level + nlevel, 1)))
         
         print("Boundary Type: Reflection Constraint")
         print("Start Point: ", start_point)
@@ -241,7 +263,7 @@ class BoundaryConstraints(object):
         sign = DictIO.GetAlternative(boundary, "Sign", None)
         norms = self.get_norms(sims, norm, sign)
         dirs, signs = self.get_dirs_and_signs(norms)
-        self.friction_dict.update(self.build_constraint_dict(np.zeros(1) + mu, inodes, dirs, signs, np.arange(level, level + nlevel, 1)))
+        self.friction_table = self.merge_constraint_table(self.friction_table, *self.build_constraint_table(np.zeros(1) + mu, inodes, dirs, signs, np.arange(level, level + nlevel, 1)))
 
         print("Boundary Type: Friction Constraint")
         print("Start Point: ", start_point)
@@ -272,7 +294,7 @@ class BoundaryConstraints(object):
         freedoms = self.get_freedoms(sims, fext)
 
         dirs, values = zip(*freedoms)
-        self.traction_dict.update(self.build_constraint_dict(np.array(values), inodes, np.array(dirs), np.arange(level, level + nlevel, 1)))
+        self.traction_table = self.merge_constraint_table(self.traction_table, *self.build_constraint_table(np.array(values), inodes, np.array(dirs), np.arange(level, level + nlevel, 1)))
         
         expected_dirs = {0: "X", 1: "Y", 2: "Z"}
         print("Boundary Type: Traction Constraint")
@@ -298,7 +320,7 @@ class BoundaryConstraints(object):
         freedoms = self.get_freedoms(sims, displacement)
 
         dirs, values = zip(*freedoms)
-        self.displacement_dict.update(self.build_constraint_dict(np.array(values), inodes, np.array(dirs), np.arange(level, level + nlevel, 1)))
+        self.displacement_table = self.merge_constraint_table(self.displacement_table, *self.build_constraint_table(np.array(values), inodes, np.array(dirs), np.arange(level, level + nlevel, 1)))
         
         expected_dirs = {0: "X", 1: "Y", 2: "Z"}
         print("Boundary Type: Displacement Constraint")
@@ -310,29 +332,32 @@ class BoundaryConstraints(object):
             print(f"Prescribed Displacement along {expected_dirs.get(freedom[0])} axis = ", float(freedom[1]))
         print('\n')
 
-    def split_dict_to_arrays(self, input_dict):
-        if not input_dict:
-            return [], np.array([])
-        
-        split_keys = np.array(list(input_dict.keys()))
-        values = np.array(list(input_dict.values()))
-        return split_keys, values
-
-    def copy_dict_to_field(self, sims):
-        nvelocity = len(self.velocity_dict)
+    def reset_constraint_list(self, lists, constraint, constraint_num):
+        # the table is copied from the first entry on, the entries left from a longer table are cleared
+        if lists[0] > constraint_num:
+            kernel_clear_boundary(constraint, constraint_num, int(lists[0]))
+        lists[0] = 0
+
+    def copy_velocity_constraints(self, sims: Simulation):
+        if self.velocity_table is None: return
+        keys, values = self.velocity_table
+        nvelocity = keys.shape[0]
+        self.reset_constraint_list(self.velocity_list, self.velocity_boundary, nvelocity)
         if nvelocity > 0:
             self.check_velocity_constraint_num(sims, nvelocity)
-            keys, values = self.split_dict_to_arrays(dict(sorted(self.velocity_dict.items(), key=lambda item: item)))
             nodeID = np.ascontiguousarray(keys[:, 0])
             levels = np.ascontiguousarray(keys[:, 2])
             dirs = np.ascontiguousarray(keys[:, 1])
             set_contraints(self.velocity_boundary, nodeID, levels, dirs, values)
             self.velocity_list[0] = nvelocity
 
-        nreflection = len(self.reflection_dict)
+    def copy_reflection_constraints(self, sims: Simulation):
+        if self.reflection_table is None: return
+        keys, values = self.reflection_table
+        nreflection = keys.shape[0]
+        self.reset_constraint_list(self.reflection_list, self.reflection_boundary, nreflection)
         if nreflection > 0:
             self.check_reflection_constraint_num(sims, nreflection)
-            keys, values = self.split_dict_to_arrays(dict(sorted(self.reflection_dict.items(), key=lambda item: item)))
             nodeID = np.ascontiguousarray(keys[:, 0])
             levels = np.ascontiguousarray(keys[:, 3])
             dirs = np.ascontiguousarray(keys[:, 1])
@@ -340,37 +365,53 @@ class BoundaryConstraints(object):
             set_reflection_constraint(self.reflection_boundary, nodeID, levels, dirs, signs)
             self.reflection_list[0] = nreflection
 
-        nfriction = len(self.friction_dict)
+    def copy_friction_constraints(self, sims: Simulation):
+        if self.friction_table is None: return
+        keys, values = self.friction_table
+        nfriction = keys.shape[0]
+        self.reset_constraint_list(self.friction_list, self.friction_boundary, nfriction)
         if nfriction > 0:
             self.check_friction_constraint_num(sims, nfriction)
-            keys, values = self.split_dict_to_arrays(dict(sorted(self.friction_dict.items(), key=lambda item: item)))
             nodeID = np.ascontiguousarray(keys[:, 0])
             levels = np.ascontiguousarray(keys[:, 3])
             dirs = np.ascontiguousarray(keys[:, 1])
             signs = np.ascontiguousarray(keys[:, 2])
             set_friction_constraint(self.friction_boundary, nodeID, levels, dirs, signs, values)
             self.friction_list[0] = nfriction
-        
-        ntraction = len(self.traction_dict)
+
+    def copy_traction_constraints(self, sims: Simulation):
+        if self.traction_table is None: return
+        keys, values = self.traction_table
+        ntraction = keys.shape[0]
+        self.reset_constraint_list(self.traction_list, self.traction_boundary, ntraction)
         if ntraction > 0:
             self.check_traction_constraint_num(sims, ntraction)
-            keys, values = self.split_dict_to_arrays(dict(sorted(self.traction_dict.items(), key=lambda item: item)))
             nodeID = np.ascontiguousarray(keys[:, 0])
             levels = np.ascontiguousarray(keys[:, 2])
             dirs = np.ascontiguousarray(keys[:, 1])
             set_contraints(self.traction_boundary, nodeID, levels, dirs, values)
             self.traction_list[0] = ntraction
 
-        ndisplacement = len(self.displacement_dict)
+    def copy_displacement_constraints(self, sims: Simulation):
+        if self.displacement_table is None: return
+        keys, values = self.displacement_table
+        ndisplacement = keys.shape[0]
+        self.reset_constraint_list(self.displacement_list, self.displacement_boundary, ndisplacement)
         if ndisplacement > 0:
             self.check_displacement_constraint_num(sims, ndisplacement)
-            keys, values = self.split_dict_to_arrays(dict(sorted(self.displacement_dict.items(), key=lambda item: item)))
             nodeID = np.ascontiguousarray(keys[:, 0])
             levels = np.ascontiguousarray(keys[:, 2])
             dirs = np.ascontiguousarray(keys[:, 1])
-            set_contraints(self.displacement_boundary, nodeID, levels, dirs, values) 
+            set_contraints(self.displacement_boundary, nodeID, levels, dirs, values)
             self.displacement_list[0] = ndisplacement
 
+    def copy_constraints_to_field(self, sims: Simulation):
+        self.copy_velocity_constraints(sims)
+        self.copy_reflection_constraints(sims)
+        self.copy_friction_constraints(sims)
+        self.copy_traction_constraints(sims)
+        self.copy_displacement_constraints(sims)
+
     def set_particle_traction(self, sims: Simulation, boundary, particleNum, startNum, particle, psize, region: RegionFunction=None):
         if sims.ptraction_method == "Virtual":
             raise RuntimeError("Please input virtual stress field from function /mainMPM -> MPM().add_virtual_stress_field/")
@@ -408,15 +449,17 @@ class BoundaryConstraints(object):
                 elif len(fluid_traction) == 3:
                     fluid_traction = vec3f(fluid_traction)
 
-        ptraction_num = prefind_particle_traction_contraint(self.ptraction_list, self.particle_traction, startNum, particleNum, particle, region_function)
-        self.check_particle_traction_constraint_num(sims, ptraction_num)
+        location = np.zeros(max(particleNum, 1), dtype=np.int32)
+        locate_particle_traction_contraint(self.ptraction_list, self.particle_traction, startNum, particleNum, location)
+        ptraction_num = prefind_particle_traction_contraint(self.ptraction_list, startNum, particleNum, particle, region_function, location)
+        self.check_particle_traction_constraint_num(sims, ptraction_num - self.ptraction_list[0])
         if sims.dimension == 3:
-            set_particle_traction_contraint(self.ptraction_list, self.particle_traction, startNum, particleNum, particle, region_function, traction_force, psize)
+            set_particle_traction_contraint(self.ptraction_list, self.particle_traction, startNum, particleNum, particle, region_function, traction_force, psize, location)
         elif sims.dimension == 2:
             if sims.material_type == "TwoPhaseSingleLayer":
-                set_particle_traction_contraint_twophase_2D(self.ptraction_list, self.particle_traction, startNum, particleNum, particle, region_function, traction_force, fluid_traction, psize)
+                set_particle_traction_contraint_twophase_2D(self.ptraction_list, self.particle_traction, startNum, particleNum, particle, region_function, traction_force, fluid_traction, psize, location)
             else:
-                set_particle_traction_contraint_2D(self.ptraction_list, self.particle_traction, startNum, particleNum, particle, region_function, traction_force, psize)
+                set_particle_traction_contraint_2D(self.ptraction_list, self.particle_traction, startNum, particleNum, particle, region_function, traction_force, psize, location)
 
         print("Boundary Type: Particle Traction Constraint")
         print("Total involved nodes: ", ptraction_num)
@@ -489,10 +532,10 @@ class BoundaryConstraints(object):
         elif mode == 1:
             print('#', "Boundary Earse".center(67, "="), '-')
             if type(boundary_constraint) is dict:
-                self.clear_boundary_constraint(sims, boundary_constraint)
+                self.clear_boundary_constraint(sims, element, boundary_constraint)
             elif type(boundary_constraint) is list:
                 for boundary in boundary_constraint:
-                    self.clear_boundary_constraint(sims, boundary) 
+                    self.clear_boundary_constraint(sims, element, boundary)
 
     def set_boundary_conditions(self, sims: Simulation, element: ElementBase, boundary):
         self.new_boundaries = True
@@ -505,10 +548,9 @@ class BoundaryConstraints(object):
         inodes = element.get_boundary_nodes(start_point, end_point)
         level, nlevel = self.check_nlevel(level)
 
-        if sims.mode == "Normal":
-            if sims.shape_function == "QuadBSpline" or sims.shape_function == "CubicBSpline":
-                for nl in range(level, level + nlevel):
-                    add_boundary_flags(nl, element.gridSum, inodes, element.boundary_flag)
+        if sims.shape_function == "QuadBSpline" or sims.shape_function == "CubicBSpline":
+            for nl in range(level, level + nlevel):
+                add_boundary_flags(nl, element.gridSum, inodes, element.boundary_flag)
 
         if boundary_type == "VelocityConstraint":
             self.set_velocity_constraints(sims, boundary, level, nlevel, start_point, end_point, inodes)
@@ -526,38 +568,31 @@ class BoundaryConstraints(object):
     def clear_boundary_constraint(self, sims: Simulation, element: ElementBase, boundary):
         boundary_type = DictIO.GetEssential(boundary, "BoundaryType")
         level = DictIO.GetAlternative(boundary, "NLevel", "All")
-        start_point = DictIO.GetAlternative(boundary, "StartPoint", vec3f(0, 0, 0))
-        end_point = DictIO.GetEssential(boundary, "EndPoint", sims.domain)
+        start_point = DictIO.GetAlternative(boundary, "StartPoint", vec3f(0, 0, 0) if sims.dimension == 3 else vec2f(0, 0))
+        end_point = DictIO.GetAlternative(boundary, "EndPoint", sims.domain)
         inodes = element.get_boundary_nodes(start_point, end_point)
+        level, nlevel = self.check_nlevel(level)
+        print("Boundary Type: ", boundary_type)
         print("Start Point: ", start_point)
         print("End Point: ", end_point, '\n')
 
         if boundary_type == "VelocityConstraint":
-            level, nlevel = self.check_nlevel()
-            for i in range(level, level + nlevel):
-                clear_constraint(self.velocity_list, self.velocity_boundary, inodes, i)
-            copy_valid_constraint(self.velocity_list, self.velocity_boundary)
+            self.velocity_table = self.remove_constraint_table(self.velocity_table, inodes, level, nlevel)
+            self.copy_velocity_constraints(sims)
         elif boundary_type == "ReflectionConstraint":
-            level, nlevel = self.check_nlevel()
-            for i in range(level, level + nlevel):
-                clear_constraint(self.reflection_list, self.reflection_boundary, inodes, i)
-            copy_valid_constraint(self.reflection_list, self.reflection_boundary)
+            self.reflection_table = self.remove_constraint_table(self.reflection_table, inodes, level, nlevel)
+            self.copy_reflection_constraints(sims)
         elif boundary_type == "FrictionConstraint":
-            level, nlevel = self.check_nlevel()
-            for i in range(level, level + nlevel):
-                clear_constraint(self.friction_list, self.friction_boundary, inodes, i)
-            copy_valid_constraint(self.friction_list, self.friction_boundary)
+            self.friction_table = self.remove_constraint_table(self.friction_table, inodes, level, nlevel)
+            self.copy_friction_constraints(sims)
         elif boundary_type == "AbsorbingConstraint":
             pass
         elif boundary_type == "TractionConstraint":
-            level, nlevel = self.check_nlevel()
-            for i in range(level, level + nlevel):
-                clear_constraint(self.traction_list, self.traction_boundary, inodes, i) 
-            copy_valid_constraint(self.traction_list, self.traction_boundary)
+            self.traction_table = self.remove_constraint_table(self.traction_table, inodes, level, nlevel)
+            self.copy_traction_constraints(sims)
         elif boundary_type == "DisplacementConstraint":
-            level, nlevel = self.check_nlevel()
-            for i in range(level, level + nlevel):
-                clear_displacement_constraint(self.displacement_boundary, inodes, i) 
+            self.displacement_table = self.remove_constraint_table(self.displacement_table, inodes, level, nlevel)
+            self.copy_displacement_constraints(sims)
         elif boundary_type == "ParticleTractionConstraint":
             pass
 
@@ -37,35 +37,39 @@ def set_contraints(constraint: ti.template(), nodeID: ti.types.ndarray(), levels
         constraint[offset].set_boundary_condition(nodeID[offset], levels[offset], dirs[offset], values[offset])
 
 
-@ti.func
-def find_pre_location(start_index, pid, constraint):
-    locate = -1
-    for pre in range(start_index):
-        if pid == constraint[pre].pid:
-            locate = pre
-            break
-    return locate
+@ti.kernel
+def kernel_clear_boundary(constraint: ti.template(), start_index: int, end_index: int):
+    for i in range(start_index, end_index):
+        constraint[i].clear_boundary_condition()
 
 
 @ti.kernel
-def prefind_particle_traction_contraint(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template()) -> int:
+def locate_particle_traction_contraint(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, location: ti.types.ndarray()):
+    # slot of the traction already applied to the particles startNum ... startNum + particleNum, -1 otherwise
+    for i in range(particleNum):
+        location[i] = -1
+    for pre in range(lists[0]):
+        pid = constraint[pre].pid
+        if startNum <= pid < startNum + particleNum:
+            location[pid - startNum] = pre
+
+
+@ti.kernel
+def prefind_particle_traction_contraint(lists: ti.types.ndarray(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template(), location: ti.types.ndarray()) -> int:
     start_index = lists[0]
-    pre_number = lists[0]
     for np in range(startNum, startNum + particleNum):
         if is_in_region(particle[np].x):
-            temp = find_pre_location(pre_number, np, constraint)
-            if temp == -1:
-                temp = ti.atomic_add(start_index, 1)
+            if location[np - startNum] == -1:
+                ti.atomic_add(start_index, 1)
     return start_index
 
 
 @ti.kernel
-def set_particle_traction_contraint(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template(), value: ti.types.vector(3, float), psize: ti.types.ndarray()):
+def set_particle_traction_contraint(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template(), value: ti.types.vector(3, float), psize: ti.types.ndarray(), location: ti.types.ndarray()):
     start_index = lists[0]
-    pre_number = lists[0]
     for np in range(startNum, startNum + particleNum):
         if is_in_region(particle[np].x):
-            temp = find_pre_location(pre_number, np, constraint)
+            temp = location[np - startNum]
             if temp == -1:
                 temp = ti.atomic_add(start_index, 1)
             constraint[temp].set_boundary_condition(np, value, vec3f(psize[np, 0], psize[np, 1], psize[np, 2]))
@@ -73,12 +77,11 @@ def set_particle_traction_contraint(lists: ti.types.ndarray(), constraint: ti.te
 
 
 @ti.kernel
-def set_particle_traction_contraint_2D(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template(), value: ti.types.vector(2, float), psize: ti.types.ndarray()):
+def set_particle_traction_contraint_2D(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template(), value: ti.types.vector(2, float), psize: ti.types.ndarray(), location: ti.types.ndarray()):
     start_index = lists[0]
-    pre_number = lists[0]
     for np in range(startNum, startNum + particleNum):
         if is_in_region(particle[np].x):
-            temp = find_pre_location(pre_number, np, constraint)
+            temp = location[np - startNum]
             if temp == -1:
                 temp = ti.atomic_add(start_index, 1)
             constraint[temp].set_boundary_condition(np, value, 0.25 * particle[np].vol / vec2f(psize[np, 1], psize[np, 0]))
@@ -86,12 +89,11 @@ def set_particle_traction_contraint_2D(lists: ti.types.ndarray(), constraint: ti
 
 
 @ti.kernel
-def set_particle_traction_contraint_twophase_2D(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template(), value: ti.types.vector(2, float), pvalue: ti.types.vector(2, float), psize: ti.types.ndarray()):
+def set_particle_traction_contraint_twophase_2D(lists: ti.types.ndarray(), constraint: ti.template(), startNum: int, particleNum: int, particle: ti.template(), is_in_region: ti.template(), value: ti.types.vector(2, float), pvalue: ti.types.vector(2, float), psize: ti.types.ndarray(), location: ti.types.ndarray()):
     start_index = lists[0]
-    pre_number = lists[0]
     for np in range(startNum, startNum + particleNum):
         if is_in_region(particle[np].x):
-            temp = find_pre_location(pre_number, np, constraint)
+            temp = location[np - startNum]
             if temp == -1:
                 temp = ti.atomic_add(start_index, 1)
             constraint[temp].set_boundary_condition(np, value, pvalue, vec2f(psize[np, 0], psize[np, 1]))
@@ -99,32 +101,11 @@ def set_particle_traction_contraint_twophase_2D(lists: ti.types.ndarray(), const
 
 
 @ti.kernel
-def clear_constraint(lists: ti.types.ndarray(), constraint: ti.template(), inodes: ti.types.ndarray(), nlevel: int):
-    for nodeID in range(inodes.shape[0]):
-        for offset in range(lists[0]):
-            if constraint[offset].node == inodes[nodeID] and constraint[offset].level == nlevel:
-                constraint[offset].clear_boundary_condition()
-
-
-@ti.kernel
-def clear_displacement_constraint(constraint: ti.template(), inodes: ti.types.ndarray(), level: int):
-    for i in range(inodes.shape[0]):
-        constraint[3 * inodes[i], level].dof = ti.u8(0)
-        constraint[3 * inodes[i] + 1, level].dof = ti.u8(0)
-        constraint[3 * inodes[i] + 2, level].dof = ti.u8(0)
-
-
-@ti.kernel
-def copy_valid_constraint(lists: ti.types.ndarray(), constraint: ti.template()):   
-    remain_num = 0
-    ti.loop_config(serialize=True)
-    for nboundary in range(lists[0]):
-        if constraint[nboundary].level != ti.u8(255):
-            constraint[remain_num] = constraint[nboundary]
-            if remain_num < nboundary:
-                constraint[nboundary].clear_boundary_condition()
-            remain_num += 1
-    lists[0] = remain_num
+def reorder_particle_traction_constraint(lists: int, constraint: ti.template(), particle_map: ti.template()):
+    for i in range(lists):
+        pid = constraint[i].pid
+        if pid >= 0:
+            constraint[i].pid = particle_map[pid]
 
 
 @ti.kernel
@@ -243,7 +224,7 @@ def apply_traction_constraint(lists: int, constraints: ti.template(), node: ti.t
         if node[nodeID, grid_level].m > Threshold:
             direction = int(constraints[nboundary].dirs)
             traction = constraints[nboundary].traction
-            node[nodeID, grid_level].force += ti.Vector([(direction == j) * traction for j in ti.static(range(3))], float) 
+            node[nodeID, grid_level]._update_nodal_force(ti.Vector([(direction == j) * traction for j in ti.static(range(3))], float))
 
 
 @ti.kernel
@@ -254,7 +235,7 @@ def apply_traction_constraint_2D(lists: int, constraints: ti.template(), node: t
         if node[nodeID, grid_level].m > Threshold:
             direction = int(constraints[nboundary].dirs)
             traction = constraints[nboundary].traction
-            node[nodeID, grid_level].force += ti.Vector([(direction == j) * traction for j in ti.static(range(2))], float) 
+            node[nodeID, grid_level]._update_nodal_force(ti.Vector([(direction == j) * traction for j in ti.static(range(2))], float))
 
 
 @ti.kernel
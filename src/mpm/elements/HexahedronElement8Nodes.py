@@ -42,6 +42,7 @@ class HexahedronElement8Nodes(ElementBase):
         self.b_matrix = None
         self.node_size = None
         self.calculate = None
+        self.update_shape_fn = None
         self.calLength = None
         self.calLength_lower_order = None
 
@@ -229,12 +230,14 @@ class HexahedronElement8Nodes(ElementBase):
                     self.calculate = self.calc_shape_fn_spline_without
                 else:
                     self.calculate = self.calc_shape_fn_spline
+                    self.update_shape_fn = update_particle_shape_fn_spline
             elif shape_function == "CPDI1" or shape_function == "CPDI2":
                 self.calculate = self.calc_shape_fn_cpdi
             elif shape_function == "SmoothLinear":
                 self.calculate = self.calc_shape_fn_smooth
             else:
                 self.calculate = self.calc_shape_fn
+                self.update_shape_fn = update_particle_shape_fn
 
             self.LnID = ti.field(int)
             self.shape_fn = ti.field(float)
@@ -305,8 +308,8 @@ class HexahedronElement8Nodes(ElementBase):
         ynode = np.arange(start_bound[1], end_bound[1], 1)
         znode = np.arange(start_bound[2], end_bound[2], 1)
         
-        total_nodes = np.array(list(product(xnode, ynode, znode)))
-        return np.array([n[0] + n[1] * self.gnum[0] + n[2] * self.gnum[0] * self.gnum[1] for n in total_nodes], dtype=np.int32)
+        xnode, ynode, znode = np.meshgrid(xnode, ynode, znode, indexing='ij')
+        return (xnode + ynode * self.gnum[0] + znode * self.gnum[0] * self.gnum[1]).ravel().astype(np.int32)
     
     def get_cell_number(self):
         return self.gnum - 1
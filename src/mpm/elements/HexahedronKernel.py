@@ -5,6 +5,7 @@ from src.utils.constants import ZEROMAT3x3, ZEROVEC3f, Threshold
 from src.utils.ShapeFunctions import local_linear_shapefn
 from src.utils.ScalarFunction import linearize3D, vectorize_id, linearize
 from src.utils.TypeDefination import vec3f, vec3i, vec3u8, vec2f
+from src.utils.DomainBoundary import periodic_cell_index, is_out_of_grid
 
 @ti.func
 def set_connectivity(cell_id, gnum, node_connectivity):
@@ -95,6 +96,12 @@ def set_node_position_(position: ti.template(), gnum: ti.types.vector(3, int), g
 def get_node_id(i, j, k, gnum):
     return int(i + j * gnum[0] + k * gnum[0] * gnum[1])
 
+@ti.func
+def get_periodic_node_id(i, j, k, gnum):
+    # the last node of a periodic axis coincides with the first one
+    node = periodic_cell_index(vec3i(i, j, k), gnum - 1)
+    return get_node_id(node[0], node[1], node[2], gnum)
+
 @ti.kernel
 def find_nodes_per_element_(current_offset: int, cellSum: int, gnum: ti.types.vector(3, int), 
                             node_connectivity: ti.template(), set_connectivity: ti.template()):
@@ -295,31 +302,63 @@ def assemble_shape(particle_position, node_position, element_size, natural_parti
     grad_shape = vec3f([dshapen0 * shapen1 * shapen2, shapen0 * dshapen1 * shapen2, shapen0 * shapen1 * dshapen2])
     return shape, grad_shape
 
+@ti.func
+def update_particle_shape_fn(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, 
+                             shape_function: ti.template(), grad_shape_function: ti.template(), boundtype: ti.template()):
+    position, psize = particle[np].x, calLength[int(particle[np].bodyID)]
+    base_bound = calc_base_cell(ielement_size, psize, position)
+    activeID = np * total_nodes
+    for k in range(base_bound[2], base_bound[2] + influenced_node):
+        if is_out_of_grid(k, gnum, 2): continue
+        for j in range(base_bound[1], base_bound[1] + influenced_node):
+            if is_out_of_grid(j, gnum, 1): continue
+            for i in range(base_bound[0], base_bound[0] + influenced_node):
+                if is_out_of_grid(i, gnum, 0): continue
+                nodeID = get_periodic_node_id(i, j, k, gnum)
+                node_coords = vec3i(i, j, k) * element_size
+                shapen0, shapen1, shapen2 = shapefn(particle[np].x, node_coords, ielement_size, psize, shape_function)
+                shapeval = shapen0 * shapen1 * shapen2
+                if shapeval > Threshold:
+                    dshapen0, dshapen1, dshapen2 = grad_shapefn(particle[np].x, node_coords, ielement_size, psize, grad_shape_function)
+                    grad_shapeval = vec3f([dshapen0 * shapen1 * shapen2, shapen0 * dshapen1 * shapen2, shapen0 * shapen1 * dshapen2])
+                    LnID[activeID] = nodeID
+                    shape_fn[activeID]=shapeval
+                    dshape_fn[activeID]=grad_shapeval
+                    activeID += 1
+    node_size[np] = ti.u8(activeID - np * total_nodes)
+
+@ti.func
+def update_particle_shape_fn_spline(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, 
+                                    shape_function: ti.template(), grad_shape_function: ti.template(), boundtype: ti.template()):
+    bodyID = int(particle[np].bodyID)
+    position, psize = particle[np].x, calLength[bodyID]
+    base_bound = calc_base_cell(ielement_size, psize, position)
+    activeID = np * total_nodes
+    for k in range(base_bound[2], base_bound[2] + influenced_node):
+        if is_out_of_grid(k, gnum, 2): continue
+        for j in range(base_bound[1], base_bound[1] + influenced_node):
+            if is_out_of_grid(j, gnum, 1): continue
+            for i in range(base_bound[0], base_bound[0] + influenced_node):
+                if is_out_of_grid(i, gnum, 0): continue
+                nodeID = get_periodic_node_id(i, j, k, gnum)
+                node_coords = vec3i(i, j, k) * element_size
+                btype = boundtype[nodeID, bodyID]
+                shapen0, shapen1, shapen2 = shapefn_spline(particle[np].x, node_coords, ielement_size, btype, shape_function)
+                shapeval = shapen0 * shapen1 * shapen2
+                if shapeval > Threshold:
+                    dshapen0, dshapen1, dshapen2 = grad_shapefn_spline(particle[np].x, node_coords, ielement_size, btype, grad_shape_function)
+                    grad_shapeval = vec3f([dshapen0 * shapen1 * shapen2, shapen0 * dshapen1 * shapen2, shapen0 * shapen1 * dshapen2])
+                    LnID[activeID] = nodeID
+                    shape_fn[activeID]=shapeval
+                    dshape_fn[activeID]=grad_shapeval
+                    activeID += 1
+    node_size[np] = ti.u8(activeID - np * total_nodes)
+
 @ti.kernel
 def global_update(total_nodes: int, influenced_node: int, element_size: ti.types.vector(3, float), ielement_size: ti.types.vector(3, float), gnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), 
                   calLength: ti.template(), node_size: ti.template(), LnID: ti.template(), shape_fn: ti.template(), dshape_fn: ti.template(), shape_function: ti.template(), grad_shape_function: ti.template()):
     for np in range(particleNum):
-        position, psize = particle[np].x, calLength[int(particle[np].bodyID)]
-        base_bound = calc_base_cell(ielement_size, psize, position)
-        activeID = np * total_nodes
-        for k in range(base_bound[2], base_bound[2] + influenced_node):
-            if k < 0 or k >= gnum[2]: continue
-            for j in range(base_bound[1], base_bound[1] + influenced_node):
-                if j < 0 or j >= gnum[1]: continue
-                for i in range(base_bound[0], base_bound[0] + influenced_node):
-                    if i < 0 or i >= gnum[0]: continue
-                    nodeID = int(i + j * gnum[0] + k * gnum[0] * gnum[1])
-                    node_coords = vec3i(i, j, k) * element_size
-                    shapen0, shapen1, shapen2 = shapefn(particle[np].x, node_coords, ielement_size, psize, shape_function)
-                    shapeval = shapen0 * shapen1 * shapen2
-                    if shapeval > Threshold:
-                        dshapen0, dshapen1, dshapen2 = grad_shapefn(particle[np].x, node_coords, ielement_size, psize, grad_shape_function)
-                        grad_shapeval = vec3f([dshapen0 * shapen1 * shapen2, shapen0 * dshapen1 * shapen2, shapen0 * shapen1 * dshapen2])
-                        LnID[activeID] = nodeID
-                        shape_fn[activeID]=shapeval
-                        dshape_fn[activeID]=grad_shapeval
-                        activeID += 1
-        node_size[np] = ti.u8(activeID - np * total_nodes)
+        update_particle_shape_fn(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, shape_function, grad_shape_function, None)
 
 @ti.kernel
 def global_update_smooth(total_nodes: int, influenced_node: int, element_size: ti.types.vector(3, float), ielement_size: ti.types.vector(3, float), gnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), calLength: ti.template(), 
@@ -330,12 +369,12 @@ def global_update_smooth(total_nodes: int, influenced_node: int, element_size: t
         activeID = np * total_nodes
         total_volume = 8. * psize[0] * psize[1] * psize[2]
         for k in range(base_bound[2], base_bound[2] + influenced_node):
-            if k < 0 or k >= gnum[2]: continue
+            if is_out_of_grid(k, gnum, 2): continue
             for j in range(base_bound[1], base_bound[1] + influenced_node):
-                if j < 0 or j >= gnum[1]: continue
+                if is_out_of_grid(j, gnum, 1): continue
                 for i in range(base_bound[0], base_bound[0] + influenced_node):
-                    if i < 0 or i >= gnum[0]: continue
-                    nodeID = int(i + j * gnum[0] + k * gnum[0] * gnum[1])
+                    if is_out_of_grid(i, gnum, 0): continue
+                    nodeID = get_periodic_node_id(i, j, k, gnum)
                     node_coords = vec3i(i, j, k) * element_size
 
                     shapen0, shapen1, shapen2 = shapefn(position, node_coords, ielement_size, psize, shape_function)
@@ -401,29 +440,7 @@ def global_cpdi(total_nodes: int, element_size: ti.types.vector(3, float), ielem
 def global_update_spline(total_nodes: int, influenced_node: int, element_size: ti.types.vector(3, float), ielement_size: ti.types.vector(3, float), gnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), calLength: ti.template(), 
                          node_size: ti.template(), LnID: ti.template(), shape_fn: ti.template(), dshape_fn: ti.template(), shape_function: ti.template(), grad_shape_function: ti.template(), boundtype: ti.template()):
     for np in range(particleNum):
-        bodyID = int(particle[np].bodyID)
-        position, psize = particle[np].x, calLength[bodyID]
-        base_bound = calc_base_cell(ielement_size, psize, position)
-        activeID = np * total_nodes
-        for k in range(base_bound[2], base_bound[2] + influenced_node):
-            if k < 0 or k >= gnum[2]: continue
-            for j in range(base_bound[1], base_bound[1] + influenced_node):
-                if j < 0 or j >= gnum[1]: continue
-                for i in range(base_bound[0], base_bound[0] + influenced_node):
-                    if i < 0 or i >= gnum[0]: continue
-                    nodeID = int(i + j * gnum[0] + k * gnum[0] * gnum[1])
-                    node_coords = vec3i(i, j, k) * element_size
-                    btype = boundtype[nodeID, bodyID]
-                    shapen0, shapen1, shapen2 = shapefn_spline(particle[np].x, node_coords, ielement_size, btype, shape_function)
-                    shapeval = shapen0 * shapen1 * shapen2
-                    if shapeval > Threshold:
-                        dshapen0, dshapen1, dshapen2 = grad_shapefn_spline(particle[np].x, node_coords, ielement_size, btype, grad_shape_function)
-                        grad_shapeval = vec3f([dshapen0 * shapen1 * shapen2, shapen0 * dshapen1 * shapen2, shapen0 * shapen1 * dshapen2])
-                        LnID[activeID] = nodeID
-                        shape_fn[activeID]=shapeval
-                        dshape_fn[activeID]=grad_shapeval
-                        activeID += 1
-        node_size[np] = ti.u8(activeID - np * total_nodes)
+        update_particle_shape_fn_spline(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, shape_function, grad_shape_function, boundtype)
 
 @ti.kernel
 def global_update_spline_fn(total_nodes: int, influenced_node: int, element_size: ti.types.vector(3, float), ielement_size: ti.types.vector(3, float), gnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), calLength: ti.template(), 
@@ -434,12 +451,12 @@ def global_update_spline_fn(total_nodes: int, influenced_node: int, element_size
         base_bound = calc_base_cell(ielement_size, psize, position)
         activeID = np * total_nodes
         for k in range(base_bound[2], base_bound[2] + influenced_node):
-            if k < 0 or k >= gnum[2]: continue
+            if is_out_of_grid(k, gnum, 2): continue
             for j in range(base_bound[1], base_bound[1] + influenced_node):
-                if j < 0 or j >= gnum[1]: continue
+                if is_out_of_grid(j, gnum, 1): continue
                 for i in range(base_bound[0], base_bound[0] + influenced_node):
-                    if i < 0 or i >= gnum[0]: continue
-                    nodeID = int(i + j * gnum[0] + k * gnum[0] * gnum[1])
+                    if is_out_of_grid(i, gnum, 0): continue
+                    nodeID = get_periodic_node_id(i, j, k, gnum)
                     node_coords = vec3i(i, j, k) * element_size
                     btype = boundtype[nodeID, bodyID]
                     shapen0, shapen1, shapen2 = shapefn_spline(particle[np].x, node_coords, ielement_size, btype, shape_function)
@@ -458,11 +475,11 @@ def global_updatebbar(total_nodes: int, influenced_node: int, element_size: ti.t
         base_bound = calc_base_cell(ielement_size, psize, position)
         activeID = np * total_nodes
         for k, j, i in ti.ndrange((base_bound[2], base_bound[2] + influenced_node), (base_bound[1], base_bound[1] + influenced_node), (base_bound[0], base_bound[0] + influenced_node)):
-            if i < 0 or i >= gnum[0]: continue
-            if j < 0 or j >= gnum[1]: continue
-            if k < 0 or k >= gnum[2]: continue
+            if is_out_of_grid(i, gnum, 0): continue
+            if is_out_of_grid(j, gnum, 1): continue
+            if is_out_of_grid(k, gnum, 2): continue
 
-            nodeID = int(i + j * gnum[0] + k * gnum[0] * gnum[1])
+            nodeID = get_periodic_node_id(i, j, k, gnum)
             node_coords = vec3i(i, j, k) * element_size
             shapen0, shapen1, shapen2 = shapefn(particle[np].x, node_coords, ielement_size, psize, shape_function)
             shapeval = shapen0 * shapen1 * shapen2
@@ -47,6 +47,7 @@ class QuadrilateralElement4Nodes(ElementBase):
         self.node_size = None
         self.nodal_coords = None
         self.calculate = None
+        self.update_shape_fn = None
         self.calLength = None
         self.calLength_lower_order = None
         self.inertia_tensor = vec2f(0., 0.)
@@ -221,8 +222,10 @@ class QuadrilateralElement4Nodes(ElementBase):
             if not sims.is_2DAxisy:
                 if not sims.isTHB:
                     self.calculate = self.calc_shape_fn
+                    self.update_shape_fn = update_particle_shape_fn
                     if sims.shape_function == "QuadBSpline" or sims.shape_function == "CubicBSpline":
                         self.calculate = self.calc_shape_fn_spline
+                        self.update_shape_fn = update_particle_shape_fn_spline
                 elif sims.isTHB:
                     self.calculate = self.calc_shape_fn_THB
             elif sims.is_2DAxisy:
@@ -304,8 +307,8 @@ class QuadrilateralElement4Nodes(ElementBase):
         xnode = np.arange(start_bound[0], end_bound[0], 1)
         ynode = np.arange(start_bound[1], end_bound[1], 1)
         
-        total_nodes = np.array(list(product(xnode, ynode)))
-        return np.array([n[0] + n[1] * self.gnum[0] for n in total_nodes], dtype=np.int32)
+        xnode, ynode = np.meshgrid(xnode, ynode, indexing='ij')
+        return (xnode + ynode * self.gnum[0]).ravel().astype(np.int32)
     
     def get_cell_number(self):
         return self.gnum - 1
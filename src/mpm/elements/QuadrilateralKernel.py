@@ -4,6 +4,7 @@ import taichi as ti
 from src.utils.constants import ZEROMAT2x2, ZEROVEC2f, Threshold, ZEROVEC2i
 from src.utils.ShapeFunctions import local_linear_shapefn
 from src.utils.TypeDefination import vec2f, vec2i, vec2u8
+from src.utils.DomainBoundary import periodic_cell_index, is_out_of_grid
 from src.utils.ScalarFunction import linearize2D, vectorize_id, linearize
 
 @ti.func
@@ -50,6 +51,12 @@ def get_node_index(ng, gnum):
 def get_node_id(i, j, gnum):
     return int(i + j * gnum[0])
 
+@ti.func
+def get_periodic_node_id(i, j, gnum):
+    # the last node of a periodic axis coincides with the first one
+    node = periodic_cell_index(vec2i(i, j), gnum - 1)
+    return get_node_id(node[0], node[1], gnum)
+
 
 @ti.kernel
 def find_nodes_per_element_(current_offset: int, cellSum: int, gnum: ti.types.vector(2, int), 
@@ -245,29 +252,59 @@ def assemble_shape(particle_position, node_position, element_size, natural_parti
     grad_shape = vec2f([dshapen0 * shapen1, shapen0 * dshapen1])
     return shape, grad_shape
 
+@ti.func
+def update_particle_shape_fn(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, 
+                             shape_function: ti.template(), grad_shape_function: ti.template(), boundtype: ti.template()):
+    position, psize = particle[np].x, calLength[int(particle[np].bodyID)]
+    base_bound = calc_base_cell(ielement_size, psize, position)
+    activeID = np * total_nodes
+    for j in range(base_bound[1], base_bound[1] + influenced_node):
+        if is_out_of_grid(j, gnum, 1): continue
+        for i in range(base_bound[0], base_bound[0] + influenced_node):
+            if is_out_of_grid(i, gnum, 0): continue
+            nodeID = get_periodic_node_id(i, j, gnum)
+            node_coords = vec2i(i, j) * element_size
+            shapen0, shapen1 = shapefn(particle[np].x, node_coords, ielement_size, psize, shape_function)
+            shapeval = shapen0 * shapen1
+            if shapeval > Threshold:
+                dshapen0, dshapen1 = grad_shapefn(particle[np].x, node_coords, ielement_size, psize, grad_shape_function)
+                grad_shapeval = vec2f([dshapen0 * shapen1, shapen0 * dshapen1])
+                LnID[activeID] = nodeID
+                shape_fn[activeID]=shapeval
+                dshape_fn[activeID]=grad_shapeval
+                activeID += 1
+    node_size[np] = ti.u8(activeID - np * total_nodes)
+
+@ti.func
+def update_particle_shape_fn_spline(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, 
+                                    shape_function: ti.template(), grad_shape_function: ti.template(), boundtype: ti.template()):
+    bodyID = int(particle[np].bodyID)
+    position, psize = particle[np].x, calLength[bodyID]
+    base_bound = calc_base_cell(ielement_size, psize, position)
+    activeID = np * total_nodes
+    for j in range(base_bound[1], base_bound[1] + influenced_node):
+        if is_out_of_grid(j, gnum, 1): continue
+        for i in range(base_bound[0], base_bound[0] + influenced_node):
+            if is_out_of_grid(i, gnum, 0): continue
+            nodeID = get_periodic_node_id(i, j, gnum)
+            node_coords = vec2i(i, j) * element_size
+            btype = boundtype[nodeID, bodyID]
+            shapen0, shapen1 = shapefn(particle[np].x, node_coords, ielement_size, btype, shape_function)
+            shapeval = shapen0 * shapen1
+            if shapeval > Threshold:
+                dshapen0, dshapen1 = grad_shapefn(particle[np].x, node_coords, ielement_size, btype, grad_shape_function)
+                grad_shapeval = vec2f([dshapen0 * shapen1, shapen0 * dshapen1])
+                LnID[activeID] = nodeID
+                shape_fn[activeID]=shapeval
+                dshape_fn[activeID]=grad_shapeval
+                activeID += 1
+    node_size[np] = ti.u8(activeID - np * total_nodes)
+
 @ti.kernel
 def global_update(total_nodes: int, influenced_node: int, element_size: ti.types.vector(2, float), ielement_size: ti.types.vector(2, float), gnum: ti.types.vector(2, int), particleNum: int, particle: ti.template(), calLength: ti.template(), 
                   node_size: ti.template(), LnID: ti.template(), shape_fn: ti.template(), dshape_fn: ti.template(), shape_function: ti.template(), grad_shape_function: ti.template()):
     for np in range(particleNum):
-        position, psize = particle[np].x, calLength[int(particle[np].bodyID)]
-        base_bound = calc_base_cell(ielement_size, psize, position)
-        activeID = np * total_nodes
-        for j in range(base_bound[1], base_bound[1] + influenced_node):
-            if j < 0 or j >= gnum[1]: continue
-            for i in range(base_bound[0], base_bound[0] + influenced_node):
-                if i < 0 or i >= gnum[0]: continue
-                nodeID = int(i + j * gnum[0])
-                node_coords = vec2i(i, j) * element_size
-                shapen0, shapen1 = shapefn(particle[np].x, node_coords, ielement_size, psize, shape_function)
-                shapeval = shapen0 * shapen1
-                if shapeval > Threshold:
-                    dshapen0, dshapen1 = grad_shapefn(particle[np].x, node_coords, ielement_size, psize, grad_shape_function)
-                    grad_shapeval = vec2f([dshapen0 * shapen1, shapen0 * dshapen1])
-                    LnID[activeID] = nodeID
-                    shape_fn[activeID]=shapeval
-                    dshape_fn[activeID]=grad_shapeval
-                    activeID += 1
-        node_size[np] = ti.u8(activeID - np * total_nodes)
+        update_particle_shape_fn(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, shape_function, grad_shape_function, None)
 
 @ti.kernel
 def global_update_THB(elem_nbInfNode: ti.template(), elem_influenNode: ti.template(), element_size: ti.types.vector(2, float), gnum: ti.types.vector(2, int), particleNum: int, particle: ti.template(), calLength: ti.template(), nLevel:int, elem_childElem: ti.template(), nodal_coords: ti.template(), Nlevel: ti.template(), Ntype: ti.template(),
@@ -349,10 +386,10 @@ def global_update_2DAxisy(total_nodes: int, influenced_node: int, element_size:
         base_bound = calc_base_cell(ielement_size, psize, position)
         activeID = np * total_nodes
         for j in range(base_bound[1], base_bound[1] + influenced_node):
-            if j < 0 or j >= gnum[1]: continue
+            if is_out_of_grid(j, gnum, 1): continue
             for i in range(base_bound[0], base_bound[0] + influenced_node):
-                if i < 0 or i >= gnum[0]: continue
-                nodeID = int(i + j * gnum[0])
+                if is_out_of_grid(i, gnum, 0): continue
+                nodeID = get_periodic_node_id(i, j, gnum)
                 node_coords = vec2i(i, j) * element_size
                 shapen0, shapen1 = shapefn2DAxisy(particle[np].x, node_coords, ielement_size, psize, shape_function_r, shape_function_z)
                 shapeval = shapen0 * shapen1
@@ -434,10 +471,10 @@ def global_updatebbar(total_nodes: int, influenced_node: int, element_size: ti.t
         base_bound = calc_base_cell(ielement_size, psize, position)
         activeID = np * total_nodes
         for j, i in ti.ndrange((base_bound[1], base_bound[1] + influenced_node), (base_bound[0], base_bound[0] + influenced_node)):
-            if i < 0 or i >= gnum[0]: continue
-            if j < 0 or j >= gnum[1]: continue
+            if is_out_of_grid(i, gnum, 0): continue
+            if is_out_of_grid(j, gnum, 1): continue
 
-            nodeID = int(i + j * gnum[0])
+            nodeID = get_periodic_node_id(i, j, gnum)
             node_coords = vec2i(i, j) * element_size
             shapen0, shapen1 = shapefn(particle[np].x, node_coords, ielement_size, psize, shape_function)
             shapeval = shapen0 * shapen1
@@ -461,10 +498,10 @@ def global_updatebbar_axisy(total_nodes: int, influenced_node: int, element_size
         base_bound = calc_base_cell(ielement_size, psize, position)
         activeID = np * total_nodes
         for j, i in ti.ndrange((base_bound[1], base_bound[1] + influenced_node), (base_bound[0], base_bound[0] + influenced_node)):
-            if i < 0 or i >= gnum[0]: continue
-            if j < 0 or j >= gnum[1]: continue
+            if is_out_of_grid(i, gnum, 0): continue
+            if is_out_of_grid(j, gnum, 1): continue
 
-            nodeID = int(i + j * gnum[0])
+            nodeID = get_periodic_node_id(i, j, gnum)
             node_coords = vec2i(i, j) * element_size
             shapen0, shapen1 = shapefn2DAxisy(particle[np].x, node_coords, ielement_size, psize, shape_function_r, shape_function_z)
             shapeval = shapen0 * shapen1
@@ -485,27 +522,7 @@ def global_updatebbar_axisy(total_nodes: int, influenced_node: int, element_size
 def global_update_spline(total_nodes: int, influenced_node: int, element_size: ti.types.vector(2, float), ielement_size: ti.types.vector(2, float), gnum: ti.types.vector(2, int), particleNum: int, particle: ti.template(), calLength: ti.template(), 
                          node_size: ti.template(), LnID: ti.template(), shape_fn: ti.template(), dshape_fn: ti.template(), shape_function: ti.template(), grad_shape_function: ti.template(), boundtype: ti.template()):
     for np in range(particleNum):
-        bodyID = int(particle[np].bodyID)
-        position, psize = particle[np].x, calLength[bodyID]
-        base_bound = calc_base_cell(ielement_size, psize, position)
-        activeID = np * total_nodes
-        for j in range(base_bound[1], base_bound[1] + influenced_node):
-            if j < 0 or j >= gnum[1]: continue
-            for i in range(base_bound[0], base_bound[0] + influenced_node):
-                if i < 0 or i >= gnum[0]: continue
-                nodeID = int(i + j * gnum[0])
-                node_coords = vec2i(i, j) * element_size
-                btype = boundtype[nodeID, bodyID]
-                shapen0, shapen1 = shapefn(particle[np].x, node_coords, ielement_size, btype, shape_function)
-                shapeval = shapen0 * shapen1
-                if shapeval > Threshold:
-                    dshapen0, dshapen1 = grad_shapefn(particle[np].x, node_coords, ielement_size, btype, grad_shape_function)
-                    grad_shapeval = vec2f([dshapen0 * shapen1, shapen0 * dshapen1])
-                    LnID[activeID] = nodeID
-                    shape_fn[activeID]=shapeval
-                    dshape_fn[activeID]=grad_shapeval
-                    activeID += 1
-        node_size[np] = ti.u8(activeID - np * total_nodes)
+        update_particle_shape_fn_spline(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shape_fn, dshape_fn, shape_function, grad_shape_function, boundtype)
 
 @ti.kernel
 def global_update_spline_fn(total_nodes: int, influenced_node: int, element_size: ti.types.vector(3, float), ielement_size: ti.types.vector(3, float), gnum: ti.types.vector(3, int), particleNum: int, particle: ti.template(), calLength: ti.template(), 
@@ -516,10 +533,10 @@ def global_update_spline_fn(total_nodes: int, influenced_node: int, element_size
         base_bound = calc_base_cell(ielement_size, psize, position)
         activeID = np * total_nodes
         for j in range(base_bound[1], base_bound[1] + influenced_node):
-            if j < 0 or j >= gnum[1]: continue
+            if is_out_of_grid(j, gnum, 1): continue
             for i in range(base_bound[0], base_bound[0] + influenced_node):
-                if i < 0 or i >= gnum[0]: continue
-                nodeID = int(i + j * gnum[0])
+                if is_out_of_grid(i, gnum, 0): continue
+                nodeID = get_periodic_node_id(i, j, gnum)
                 node_coords = vec2i(i, j) * element_size
                 btype = boundtype[nodeID, bodyID]
                 shapen0, shapen1 = shapefn(particle[np].x, node_coords, ielement_size, btype, shape_function)
@@ -31,12 +31,20 @@ class Engine(object):
         self.compute_forces = None
         self.execute_board_serach = None
         self.calculate_interpolation = None
+        self.free_surface_by_density = None
+        self.compute_lightweight_stress = None
+        self.compute_lightweight_particle = None
         self.manage_function(sims)
 
         self.reset_grid_messages = self.reset_grid_message
         if sims.sparse_grid:
             self.reset_grid_messages = self.deactivate_grid
 
+        self.reorderer = None
+        self.reorder_particles = no_operation
+        if sims.reorder_interval > 0:
+            self.reorder_particles = self.morton_reorder
+
         self.limit = 0.
         
     def choose_engine(self, sims: Simulation):
@@ -49,6 +57,9 @@ class Engine(object):
                 self.compute = self.musl_updating
             elif sims.mapping == "G2P2G":
                 self.compute = self.g2p2g
+                # the fused scheme clears its own output grid, the other one still holds the grid velocities read by G2P
+                self.reset_g2p2g_grid = self.deactivate_grid if sims.sparse_grid else self.reset_grid_message
+                self.reset_grid_messages = no_operation
             else:
                 raise ValueError(f"The mapping scheme {sims.mapping} is not supported yet")
             
@@ -58,7 +69,14 @@ class Engine(object):
             if sims.TESTMODE:
                 self.compute = self.test
         elif sims.mode == "Lightweight":
-            self.compute = self.lightweight
+            if sims.mapping == "USL":
+                self.compute = self.lightweight
+            elif sims.mapping == "USF":
+                self.compute = self.lightweight_usf
+            elif sims.mapping == "MUSL":
+                self.compute = self.lightweight_musl
+            else:
+                raise ValueError(f"The mapping scheme {sims.mapping} is not supported by the lightweight mode")
 
     def choose_boundary_constraints(self, sims: Simulation, scene: myScene):
         self.apply_traction_constraints = no_operation
@@ -250,6 +268,7 @@ class Engine(object):
                 self.system_resolve = self.compute_nodal_kinematic
             self.bulid_neighbor_list = self.board_search
 
+            self.free_surface_by_density = self.find_free_surface_by_density
             self.free_surface_by_geometry = no_operation
             if sims.free_surface_detection:
                 self.free_surface_by_geometry = self.detection_free_surface
@@ -258,11 +277,34 @@ class Engine(object):
             if sims.boundary_direction_detection:
                 self.compute_boundary_direction = self.detection_boundary_direction
 
+        if sims.mapping == "G2P2G":
+            self.valid_g2p2g(sims)
+        if sims.mode == "Lightweight":
+            self.choose_lightweight(sims)
+
+        if sims.constitutive_model_num > 1:
+            self.dispatch_by_model(sims)
+        if sims.elastic_predictor:
+            self.choose_elastic_predictor(sims)
+
+    def valid_g2p2g(self, sims: Simulation):
+        raise RuntimeError(f"Keyword:: /mapping/ G2P2G is not supported by {type(self).__name__}")
+
+    def choose_lightweight(self, sims: Simulation):
+        raise RuntimeError(f"Keyword:: /mode/ Lightweight is not supported by {type(self).__name__}")
+
+    def dispatch_by_model(self, sims: Simulation):
+        raise RuntimeError(f"Several constitutive models are not supported by {type(self).__name__}")
+
+    def choose_elastic_predictor(self, sims: Simulation):
+        raise RuntimeError(f"Keyword:: /elastic_predictor/ is not supported by {type(self).__name__}")
+
     def reset_particle_message(self, scene: myScene):
         contact_force_reset(int(scene.particleNum[0]), scene.particle)
 
     def reset_grid_message(self, scene: myScene):
-        grid_reset(scene.mass_cut_off, scene.node)
+        # every node is cleared as the sparse grid is deactivated, the sub-cutoff mass would otherwise pile up over the steps
+        grid_full_reset(scene.node)
 
     def deactivate_grid(self, scene: myScene):
         scene.parent.deactivate_all()
@@ -272,6 +314,9 @@ class Engine(object):
             if scene.is_rigid[0] == 0 and scene.is_rigid[1] == 0:
                 raise RuntimeError("GeoContact is only suitable for soil-structure interaction")
 
+    def calculate_critical_timestep(self, sims: Simulation, scene: myScene):
+        return scene.get_stable_timestep()
+
     def calculate_interpolations(self, sims: Simulation, scene: myScene):
         scene.element.calculate(scene.particleNum, scene.particle)
 
@@ -292,7 +337,7 @@ class Engine(object):
 
     def update_verlet_table(self, sims: Simulation, scene: myScene, neighbor: SpatialHashGrid):
         scene.check_in_domain(sims)
-        self.find_free_surface_by_density(sims, scene)
+        self.free_surface_by_density(sims, scene)
         neighbor.place_particles(scene)
         self.compute_boundary_direction(scene, neighbor)
         self.free_surface_by_geometry(scene, neighbor)
@@ -316,6 +361,14 @@ class Engine(object):
         kernel_mass_g2p(scene.element.grid_nodes, scene.element.cell_volume, scene.element.node_size, scene.element.LnID, scene.element.shape_fn, scene.node, int(scene.particleNum[0]), scene.particle)
         assign_particle_free_surface(int(scene.particleNum[0]), scene.particle, scene.material.matProps)
 
+    def lightweight_free_surface_by_density(self, sims, scene: myScene):
+        grid_mass_reset(scene.mass_cut_off, scene.node)
+        lightweight_mass_p2g(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, scene.element.calLength, scene.element.boundary_type, scene.node, scene.particle)
+        lightweight_mass_g2p(int(scene.particleNum[0]), scene.element.cell_volume, scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, scene.element.calLength, 
+                             scene.element.boundary_type, scene.node, scene.particle)
+        assign_particle_free_surface(int(scene.particleNum[0]), scene.particle, scene.material.matProps)
+        grid_mass_reset(scene.mass_cut_off, scene.node)
+
     def calculate_precontact_2DAxisy(self, sims: Simulation, scene: myScene):
         raise NotImplementedError
 
@@ -477,6 +530,12 @@ class Engine(object):
     
     def lightweight(self, sims, scene):
         raise NotImplementedError
+
+    def lightweight_usf(self, sims, scene):
+        raise NotImplementedError
+
+    def lightweight_musl(self, sims, scene):
+        raise NotImplementedError
     
     def test(self, sims, scene):
         raise NotImplementedError
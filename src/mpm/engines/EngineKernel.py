@@ -1,13 +1,14 @@
 import taichi as ti
 
 from src.consititutive_model.MaterialKernel import MeanStress, get_angular_velocity
-from src.utils.constants import Threshold, ZEROMAT4x4, ZEROMAT6x3, ZEROVEC2f, ZEROVEC3f, ZEROMAT2x2, ZEROMAT3x3, DELTA2D, DELTA, EYE
+from src.utils.constants import Threshold, ZEROMAT4x4, ZEROMAT6x3, ZEROVEC2f, ZEROVEC3f, ZEROVEC6f, ZEROMAT2x2, ZEROMAT3x3, DELTA2D, DELTA, EYE
 from src.utils.MatrixFunction import truncation, trace
-from src.utils.ScalarFunction import vectorize_id, linearize, sgn
+from src.utils.ScalarFunction import vectorize_id, linearize
 from src.utils.ShapeFunctions import ShapeLinear, GShapeLinear, ShapeLinearCenter, ShapeGIMP, GShapeGIMP, ShapeGIMPCenter, ShapeBsplineQ, GShapeBsplineQ, ShapeBsplineC, GShapeBsplineC
 from src.utils.TypeDefination import vec2f, vec3f, vec4f, vec6f, mat3x3, mat4x4, vec2i, vec3i, mat2x2
 from src.utils.VectorFunction import Normalize, outer_product, MeanValue, Squared, outer_product2D, dot2
 import src.utils.GlobalVariable as GlobalVariable
+from src.utils.DomainBoundary import periodic_distance, periodic_cell_index, is_out_of_grid
 
 
 @ti.func
@@ -47,6 +48,12 @@ def grid_reset(cutoff: float, node: ti.template()):
             node[ng, nb]._grid_reset()
 
 
+@ti.kernel
+def grid_full_reset(node: ti.template()):
+    for ng, nb in node:
+        node[ng, nb]._grid_reset()
+
+
 @ti.kernel
 def grid_mass_reset(cutoff: float, node: ti.template()):
     for ng, nb in node:
@@ -76,6 +83,12 @@ def contact_force_reset(particleNum: int, particle: ti.template()):
         particle[np]._reset_contact_force()
 
 
+@ti.kernel
+def contact_force_average(particleNum: int, substep: int, particle: ti.template()):
+    for np in range(particleNum):
+        particle[np].external_force /= substep
+
+
 @ti.kernel
 def particle_mass_density_reset(particleNum: int, particle: ti.template()):
     for np in range(particleNum):
@@ -91,413 +104,434 @@ def contact_normal(ng, bodyID1, bodyID2, node):
 
 
 # ======================================== Explicit MPM ======================================== #
+@ti.func
+def lightweight_node_id(grid_id, gnum):
+    nodeID = -1
+    in_grid = True
+    for d in ti.static(range(GlobalVariable.DIMENSION)):
+        if is_out_of_grid(grid_id[d], gnum, d):
+            in_grid = False
+    if in_grid:
+        nodeID = linearize(periodic_cell_index(grid_id, gnum - 1), gnum)
+    return nodeID
+
+@ti.func
+def lightweight_shape_table(position, base, grid_size, igrid_size, psize):
+    # the linear and GIMP weights are separable, so each direction only takes INFLUENCENODE values over the influenced nodes
+    shape_table = ti.Matrix.zero(float, GlobalVariable.INFLUENCENODE, GlobalVariable.DIMENSION)
+    dshape_table = ti.Matrix.zero(float, GlobalVariable.INFLUENCENODE, GlobalVariable.DIMENSION)
+    shape_tablec = ti.Matrix.zero(float, GlobalVariable.INFLUENCENODE, GlobalVariable.DIMENSION)
+    for i, d in ti.static(ti.ndrange(GlobalVariable.INFLUENCENODE, GlobalVariable.DIMENSION)):
+        grid_pos = (base[d] + i) * grid_size[d]
+        if ti.static(GlobalVariable.SHAPEFUNCTION == 0):
+            shape_table[i, d] = ShapeLinear(position[d], grid_pos, igrid_size[d], psize[d])
+            dshape_table[i, d] = GShapeLinear(position[d], grid_pos, igrid_size[d], psize[d])
+            if ti.static(GlobalVariable.BBAR):
+                shape_tablec[i, d] = ShapeLinearCenter(position[d], grid_pos, igrid_size[d], psize[d])
+        elif ti.static(GlobalVariable.SHAPEFUNCTION == 1):
+            shape_table[i, d] = ShapeGIMP(position[d], grid_pos, igrid_size[d], psize[d])
+            dshape_table[i, d] = GShapeGIMP(position[d], grid_pos, igrid_size[d], psize[d])
+            if ti.static(GlobalVariable.BBAR):
+                shape_tablec[i, d] = ShapeGIMPCenter(position[d], grid_pos, igrid_size[d], psize[d])
+    return shape_table, dshape_table, shape_tablec
+
+@ti.func
+def lightweight_shape_fn(offset: ti.template(), shape_table, dshape_table, shape_tablec, position, grid_pos, igrid_size, nodeID, bodyID, boundary_types):
+    shape_fn = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    dshape_fn = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    shape_fnc = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    if ti.static(GlobalVariable.SHAPEFUNCTION == 0 or GlobalVariable.SHAPEFUNCTION == 1):
+        for d in ti.static(range(GlobalVariable.DIMENSION)):
+            shape_fn[d] = shape_table[offset[d], d]
+            dshape_fn[d] = dshape_table[offset[d], d]
+            if ti.static(GlobalVariable.BBAR):
+                shape_fnc[d] = shape_tablec[offset[d], d]
+    elif ti.static(GlobalVariable.SHAPEFUNCTION == 2):
+        boundary_type = boundary_types[nodeID, bodyID]
+        for d in ti.static(range(GlobalVariable.DIMENSION)):
+            btypes = int(boundary_type[d])
+            shape_fn[d] = ShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
+            dshape_fn[d] = GShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
+    elif ti.static(GlobalVariable.SHAPEFUNCTION == 3):
+        boundary_type = boundary_types[nodeID, bodyID]
+        for d in ti.static(range(GlobalVariable.DIMENSION)):
+            btypes = int(boundary_type[d])
+            shape_fn[d] = ShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
+            dshape_fn[d] = GShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
+    return shape_fn, dshape_fn, shape_fnc
+
+@ti.func
+def lightweight_weight(shape_fn):
+    weight = 1.
+    for d in ti.static(range(GlobalVariable.DIMENSION)):
+        weight *= shape_fn[d]
+    return weight
+
+@ti.func
+def lightweight_weight_gradient(shape_fn, dshape_fn):
+    weight_grad = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    if ti.static(GlobalVariable.DIMENSION == 2):
+        weight_grad = vec2f([dshape_fn[0] * shape_fn[1], shape_fn[0] * dshape_fn[1]])
+    elif ti.static(GlobalVariable.DIMENSION == 3):
+        weight_grad = vec3f([dshape_fn[0] * shape_fn[1] * shape_fn[2],
+                             shape_fn[0] * dshape_fn[1] * shape_fn[2],
+                             shape_fn[0] * shape_fn[1] * dshape_fn[2]])
+    return weight_grad
+
+@ti.func
+def lightweight_outer_product(vec1, vec2):
+    matrix = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
+    if ti.static(GlobalVariable.DIMENSION == 2):
+        matrix = outer_product2D(vec1, vec2)
+    elif ti.static(GlobalVariable.DIMENSION == 3):
+        matrix = outer_product(vec1, vec2)
+    return matrix
+
+@ti.func
+def lightweight_internal_force(shape_fn, dshape_fn, shape_fnc, fInt):
+    dshape = lightweight_weight_gradient(shape_fn, dshape_fn)
+    internal_force = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    if ti.static(GlobalVariable.DIMENSION == 2):
+        if ti.static(GlobalVariable.BBAR):
+            temp_dshape = 0.5 * (lightweight_weight_gradient(shape_fnc, dshape_fn) - dshape)
+            internal_force = vec2f([(dshape[0] + temp_dshape[0]) * fInt[0] + temp_dshape[0] * fInt[1] + temp_dshape[0] * fInt[2] + dshape[1] * fInt[3],
+                                    temp_dshape[1] * fInt[0] + (dshape[1] + temp_dshape[1]) * fInt[1] + temp_dshape[1] * fInt[2] + dshape[0] * fInt[3]])
+        else:
+            internal_force = vec2f([dshape[0] * fInt[0] + dshape[1] * fInt[3],
+                                    dshape[1] * fInt[1] + dshape[0] * fInt[3]])
+    elif ti.static(GlobalVariable.DIMENSION == 3):
+        if ti.static(GlobalVariable.BBAR):
+            temp_dshape = (lightweight_weight_gradient(shape_fnc, dshape_fn) - dshape) / 3.
+            internal_force = vec3f([(dshape[0] + temp_dshape[0]) * fInt[0] + temp_dshape[0] * fInt[1] + temp_dshape[0] * fInt[2] + dshape[1] * fInt[3] + dshape[2] * fInt[5],
+                                    temp_dshape[1] * fInt[0] + (dshape[1] + temp_dshape[1]) * fInt[1] + temp_dshape[1] * fInt[2] + dshape[0] * fInt[3] + dshape[2] * fInt[4],
+                                    temp_dshape[2] * fInt[0] + temp_dshape[2] * fInt[1] + (dshape[2] + temp_dshape[2]) * fInt[2] + dshape[1] * fInt[4] + dshape[0] * fInt[5]])
+        else:
+            internal_force = vec3f([dshape[0] * fInt[0] + dshape[1] * fInt[3] + dshape[2] * fInt[5],
+                                    dshape[1] * fInt[1] + dshape[0] * fInt[3] + dshape[2] * fInt[4],
+                                    dshape[2] * fInt[2] + dshape[1] * fInt[4] + dshape[0] * fInt[5]])
+    return internal_force
+
+@ti.kernel
+def lightweight_p2g(particleNum: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float), gravity: ti.types.vector(3, float),
+                    particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template(), kinematic: ti.template(), force: ti.template()):
+    if ti.static(kinematic):
+        ti.block_local(node.m)
+        for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.momentum.get_scalar_field(d))
+    if ti.static(force):
+        for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.force.get_scalar_field(d))
+    for np in range(particleNum):
+        if int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            materialID = int(particle[np].materialID)
+            position = particle[np].x
+            velocity = particle[np].v
+            mass = particle[np].m
+            velocity_gradient = particle[np].velocity_gradient
+            psize = particle_lengths[bodyID]
+            fex = particle[np]._compute_external_force(gravity)
+            fInt = particle[np]._compute_internal_force()
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
+            for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
+                grid_id = base + offset
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
+                    grid_pos = grid_id * grid_size
+                    shape_fn, dshape_fn, shape_fnc = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_pos, igrid_size, nodeID, bodyID, boundary_types)
+                    weight = lightweight_weight(shape_fn)
+                    if ti.static(kinematic):
+                        nmass = weight * mass
+                        momentum = nmass * velocity
+                        if ti.static(GlobalVariable.APIC or GlobalVariable.TPIC):
+                            momentum += nmass * velocity_gradient @ periodic_distance(grid_pos - position)
+                        node[nodeID, bodyID]._update_nodal_mass(nmass)
+                        node[nodeID, bodyID]._update_nodal_momentum(momentum)
+                    if ti.static(force):
+                        if materialID > 0:
+                            node[nodeID, bodyID]._update_nodal_force(weight * fex + lightweight_internal_force(shape_fn, dshape_fn, shape_fnc, fInt))
+
+@ti.kernel
+def lightweight_postmapping_p2g(particleNum: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                                particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template()):
+    for np in range(particleNum):
+        if int(particle[np].materialID) > 0 and int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            position = particle[np].x
+            psize = particle_lengths[bodyID]
+            momentum = particle[np].m * particle[np].v
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
+            for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
+                grid_id = base + offset
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
+                    shape_fn, _, _ = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_id * grid_size, igrid_size, nodeID, bodyID, boundary_types)
+                    node[nodeID, bodyID]._update_nodal_momentum(lightweight_weight(shape_fn) * momentum)
+
 @ti.kernel
-def lightweight_p2g(particleNum: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float), gravity: ti.types.vector(3, float), 
-                    particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template()):
+def lightweight_jacobian_p2g(particleNum: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                             dt: ti.template(), particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template()):
+    ti.block_local(node.jacobian)
+    for np in range(particleNum):
+        if int(particle[np].materialID) > 0 and int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            position = particle[np].x
+            psize = particle_lengths[bodyID]
+            djacobian = (ti.Matrix.identity(float, GlobalVariable.DIMENSION) + dt[None] * particle[np].velocity_gradient).determinant()
+            transfer_var = particle[np].m * djacobian
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
+            for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
+                grid_id = base + offset
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
+                    shape_fn, _, _ = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_id * grid_size, igrid_size, nodeID, bodyID, boundary_types)
+                    node[nodeID, bodyID].jacobian += lightweight_weight(shape_fn) * transfer_var
+
+@ti.kernel
+def lightweight_mass_p2g(particleNum: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                         particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template()):
     ti.block_local(node.m)
-    for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.momentum.get_scalar_field(d))
-    for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.force.get_scalar_field(d))
     for np in range(particleNum):
-        bodyID = int(particle[np].bodyID)
-        position = particle[np].x
-        velocity = particle[np].v
-        p_mass = particle[np].m
-        velocity_gradient = particle[np].velocity_gradient
-        previous_stress, volume = particle[np].stress, particle[np].vol
-        psize = particle_lengths[bodyID]
+        if int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            position = particle[np].x
+            psize = particle_lengths[bodyID]
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
+            for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
+                grid_id = base + offset
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
+                    shape_fn, _, _ = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_id * grid_size, igrid_size, nodeID, bodyID, boundary_types)
+                    node[nodeID, bodyID]._update_nodal_mass(lightweight_weight(shape_fn) * particle[np].m)
 
-        internal_force = -volume * previous_stress
-        external_force = particle[np]._compute_external_force(gravity)
-        for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
-            base = ti.floor((position - psize) * igrid_size).cast(int)
-            grid_id = base + offset
-            if all(grid_id >= 0):
-                nodeID = linearize(grid_id, gnum)
-                grid_pos = grid_id * grid_size
-                shape_fn, dshape_fn = ti.Vector.zero(float, GlobalVariable.DIMENSION), ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                shape_fnc = ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                if ti.static(GlobalVariable.SHAPEFUNCTION == 0): 
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        shape_fn[d] = ShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
-                        dshape_fn[d] = GShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
-                        if ti.static(GlobalVariable.BBAR):
-                            shape_fnc[d] = ShapeLinearCenter(position[d], grid_pos[d], igrid_size[d], 0)
-                elif ti.static(GlobalVariable.SHAPEFUNCTION == 1): 
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        shape_fn[d] = ShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                        dshape_fn[d] = GShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                        if ti.static(GlobalVariable.BBAR):
-                            shape_fnc[d] = ShapeGIMPCenter(position[d], grid_pos[d], igrid_size[d], psize[d])
-                elif ti.static(GlobalVariable.SHAPEFUNCTION == 2): 
-                    boundary_type = boundary_types[nodeID, bodyID]
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        btypes = int(boundary_type[d])
-                        shape_fn[d] = ShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                        dshape_fn[d] = GShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                elif ti.static(GlobalVariable.SHAPEFUNCTION == 3): 
-                    boundary_type = boundary_types[nodeID, bodyID]
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        btypes = int(boundary_type[d])
-                        shape_fn[d] = ShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
-                        dshape_fn[d] = GShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
+@ti.kernel
+def lightweight_mass_g2p(particleNum: int, cell_volume: float, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                         particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template()):
+    for np in range(particleNum):
+        if int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            position = particle[np].x
+            psize = particle_lengths[bodyID]
+            mdensity = 0.
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
+            for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
+                grid_id = base + offset
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
+                    shape_fn, _, _ = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_id * grid_size, igrid_size, nodeID, bodyID, boundary_types)
+                    mdensity += lightweight_weight(shape_fn) * node[nodeID, bodyID].m / cell_volume
+            particle[np].mass_density = mdensity
 
-                dpos = position - grid_pos
-                weight = 1.0
-                for d in ti.static(range(GlobalVariable.DIMENSION)):
-                    weight *= shape_fn[d]
-                pforce = weight * external_force
-                
-                if ti.static(GlobalVariable.DIMENSION == 2):
-                    weight_grad = ti.Vector([dshape_fn[0] * shape_fn[1], shape_fn[0] * dshape_fn[1]]) 
-                    if ti.static(GlobalVariable.BBAR):
-                        weight_gradc = vec3f([dshape_fn[0] * shape_fnc[1], shape_fnc[0] * dshape_fn[1]])
-                        temp_dshape = 0.5 * (weight_gradc - weight_grad)
-                        pforce += vec2f([(weight_grad[0] + temp_dshape[0]) * internal_force[0] + temp_dshape[0] * internal_force[1] + temp_dshape[0] * internal_force[2] + weight_grad[1] * internal_force[3],
-                                          temp_dshape[1] * internal_force[0] + (weight_grad[1] + temp_dshape[1]) * internal_force[1] + temp_dshape[1] * internal_force[2] + weight_grad[0] * internal_force[3]])
-                    else:
-                        pforce += vec2f([weight_grad[0] * internal_force[0] + weight_grad[1] * internal_force[3], weight_grad[1] * internal_force[1] + weight_grad[0] * internal_force[3]])
-                elif ti.static(GlobalVariable.DIMENSION == 3):
-                    weight_grad = ti.Vector([dshape_fn[0] * shape_fn[1] * shape_fn[2], 
-                                             shape_fn[0] * dshape_fn[1] * shape_fn[2], 
-                                             shape_fn[0] * shape_fn[1] * dshape_fn[2]]) 
-                    if ti.static(GlobalVariable.BBAR):
-                        weight_gradc = vec3f([dshape_fn[0] * shape_fnc[1] * shape_fnc[2], 
-                                             shape_fnc[0] * dshape_fn[1] * shape_fnc[2], 
-                                             shape_fnc[0] * shape_fnc[1] * dshape_fn[2]])
-                        temp_dshape = (weight_gradc - weight_grad) / 3.
-                        pforce += vec3f([(weight_grad[0] + temp_dshape[0]) * internal_force[0] + temp_dshape[0] * internal_force[1] + temp_dshape[0] * internal_force[2] + weight_grad[1] * internal_force[3] + weight_grad[2] * internal_force[5],
-                                          temp_dshape[1] * internal_force[0] + (weight_grad[1] + temp_dshape[1]) * internal_force[1] + temp_dshape[1] * internal_force[2] + weight_grad[0] * internal_force[3] + weight_grad[2] * internal_force[4],
-                                          temp_dshape[2] * internal_force[0] + temp_dshape[2] * internal_force[1] + (weight_grad[2] + temp_dshape[2]) * internal_force[2] + weight_grad[1] * internal_force[4] + weight_grad[0] * internal_force[5]])
-                    else:
-                        pforce += vec3f([weight_grad[0] * internal_force[0] + weight_grad[1] * internal_force[3] + weight_grad[2] * internal_force[5],
-                                         weight_grad[1] * internal_force[1] + weight_grad[0] * internal_force[3] + weight_grad[2] * internal_force[4],
-                                         weight_grad[2] * internal_force[2] + weight_grad[1] * internal_force[4] + weight_grad[0] * internal_force[5]])
-                nmass = weight * p_mass
-                momentum = nmass * velocity
-                if ti.static(GlobalVariable.APIC or GlobalVariable.TPIC):
-                    momentum -= nmass * velocity_gradient @ dpos
-                node[nodeID, bodyID].m += nmass
-                node[nodeID, bodyID].momentum += momentum
-                node[nodeID, bodyID].force += pforce
-
-@ti.kernel
-def lightweight_g2p(particleNum: int, alpha: float, cutoff: float, fraction: float, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float), 
-                    dt: ti.template(), particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template()):
-    for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.momentum.get_scalar_field(d))
-    for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.force.get_scalar_field(d))
+@ti.kernel
+def lightweight_contact_normal(particleNum: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                               particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template()):
     for np in range(particleNum):
-        #np = particleID[pid]
-        bodyID = int(particle[np].bodyID)
-        materialID = int(particle[np].materialID)
-        position = particle[np].x
-        vFLIP = particle[np].v
+        if int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            position = particle[np].x
+            psize = particle_lengths[bodyID]
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
+            for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
+                grid_id = base + offset
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
+                    shape_fn, dshape_fn, _ = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_id * grid_size, igrid_size, nodeID, bodyID, boundary_types)
+                    node[nodeID, bodyID]._update_nodal_grad_domain(lightweight_weight_gradient(shape_fn, dshape_fn) * particle[np].vol)
+
+@ti.kernel
+def lightweight_particle_traction(lists: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                                  dt: ti.template(), particle_lengths: ti.template(), boundary_types: ti.template(), constraints: ti.template(), node: ti.template(), particle: ti.template()):
+    for nboundary in range(lists):
+        particleID = constraints[nboundary].pid
+        bodyID = int(particle[particleID].bodyID)
+        position = particle[particleID].x
         psize = particle_lengths[bodyID]
-
-        vPIC = ti.Vector.zero(float, GlobalVariable.DIMENSION)
-        Wp = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
-        velocity_gradient = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
-        velocity_gradient_bar = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
+        constraints[nboundary]._calc_psize_cp(dt, particle[particleID].velocity_gradient)
+        traction = constraints[nboundary]._compute_traction_force()
+        base = ti.floor((position - psize) * igrid_size, int)
+        shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
         for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
-            base = ti.floor((position - psize) * igrid_size).cast(int)
             grid_id = base + offset
-            if all(grid_id >= 0):
-                nodeID = linearize(grid_id, gnum)
-                grid_pos = grid_id * grid_size
-                shape_fn, dshape_fn = ti.Vector.zero(float, GlobalVariable.DIMENSION), ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                shape_fnc = ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                if ti.static(GlobalVariable.SHAPEFUNCTION == 0): 
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        shape_fn[d] = ShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
-                        if ti.static(not GlobalVariable.APIC):
-                            dshape_fn[d] = GShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
-                        if ti.static(GlobalVariable.BBAR):
-                            shape_fnc[d] = ShapeLinearCenter(position[d], grid_pos[d], igrid_size[d], 0)
-                elif ti.static(GlobalVariable.SHAPEFUNCTION == 1): 
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        shape_fn[d] = ShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                        if ti.static(not GlobalVariable.APIC):
-                            dshape_fn[d] = GShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                        if ti.static(GlobalVariable.BBAR):
-                            shape_fnc[d] = ShapeGIMPCenter(position[d], grid_pos[d], igrid_size[d], psize[d])
-                elif ti.static(GlobalVariable.SHAPEFUNCTION == 2): 
-                    boundary_type = boundary_types[nodeID, bodyID]
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        btypes = int(boundary_type[d])
-                        shape_fn[d] = ShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                        if ti.static(not GlobalVariable.APIC):
-                            dshape_fn[d] = GShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                elif ti.static(GlobalVariable.SHAPEFUNCTION == 3): 
-                    boundary_type = boundary_types[nodeID, bodyID]
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        btypes = int(boundary_type[d])
-                        shape_fn[d] = ShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
-                        if ti.static(not GlobalVariable.APIC):
-                            dshape_fn[d] = GShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
-
-                velocity = node[nodeID, bodyID].momentum
-                acceleration = node[nodeID, bodyID].force
-                weight = 1.0
-                for d in ti.static(range(GlobalVariable.DIMENSION)):
-                    weight *= shape_fn[d]
-                vPIC += weight * velocity
-                vFLIP += weight * acceleration * dt[None]
-
-                if ti.static(GlobalVariable.APIC):
-                    dpos = position - grid_pos
-                    if ti.static(GlobalVariable.DIMENSION == 2):
-                        Wp += weight * outer_product2D(dpos, dpos)
-                        velocity_gradient += weight * outer_product2D(dpos, velocity)
-                    elif ti.static(GlobalVariable.DIMENSION == 3):
-                        Wp += weight * outer_product(dpos, dpos)
-                        velocity_gradient += weight * outer_product(dpos, velocity)
-                else:
-                    if ti.static(GlobalVariable.DIMENSION == 2):
-                        weight_grad = ti.Vector([dshape_fn[0] * shape_fn[1], shape_fn[0] * dshape_fn[1]]) 
-                        velocity_gradient_increment = outer_product2D(weight_grad, velocity)
-                        velocity_gradient += velocity_gradient_increment
-                        if ti.static(GlobalVariable.BBAR):
-                            weight_gradc = vec3f([dshape_fn[0] * shape_fnc[1], shape_fnc[0] * dshape_fn[1]])
-                            temp_dshape = 0.5 * (weight_gradc - weight_grad)
-                            average_bmatrix = temp_dshape[0] * velocity[0] + temp_dshape[1] * velocity[1]
-                            velocity_gradient_bar += velocity_gradient_increment
-                            velocity_gradient_bar[0, 0] += average_bmatrix
-                            velocity_gradient_bar[1, 1] += average_bmatrix
-                    elif ti.static(GlobalVariable.DIMENSION == 3):
-                        weight_grad = ti.Vector([dshape_fn[0] * shape_fn[1] * shape_fn[2], 
-                                                shape_fn[0] * dshape_fn[1] * shape_fn[2], 
-                                                shape_fn[0] * shape_fn[1] * dshape_fn[2]])
-                        velocity_gradient_increment = outer_product(weight_grad, velocity)
-                        velocity_gradient += velocity_gradient_increment
-                        if ti.static(GlobalVariable.BBAR):
-                            weight_gradc = vec3f([dshape_fn[0] * shape_fnc[1] * shape_fnc[2], 
-                                                  shape_fnc[0] * dshape_fn[1] * shape_fnc[2], 
-                                                  shape_fnc[0] * shape_fnc[1] * dshape_fn[2]])
-                            temp_dshape = (weight_gradc - weight_grad) / 3.
-                            average_bmatrix = temp_dshape[0] * velocity[0] + temp_dshape[1] * velocity[1] + temp_dshape[2] * velocity[2]
-                            velocity_gradient_bar += velocity_gradient_increment
-                            velocity_gradient_bar[0, 0] += average_bmatrix
-                            velocity_gradient_bar[1, 1] += average_bmatrix
-                            velocity_gradient_bar[2, 2] += average_bmatrix
-
-        if ti.static(not GlobalVariable.BBAR):
-            velocity_gradient_bar = velocity_gradient
-                    
-        if ti.static(GlobalVariable.APIC):
-            velocity_gradient = Wp.inverse() @ velocity_gradient
-
-        particle[np].velocity_gradient = velocity_gradient_bar
-        particle[np].v = alpha * vPIC + (1. - alpha) * vFLIP
-        particle[np].x += vPIC * dt[None]
-        
-        if ti.static(not GlobalVariable.FBAR):
-            previous_stress, volume = particle[np].stress, particle[np].vol
-            volume *= (ti.Matrix.identity(float, GlobalVariable.DIMENSION) + dt[None] * velocity_gradient).determinant()
-            stress = ti.Vector.zero(float, 6)
-            for matID in ti.static(range(1, matProps.shape[0])):
-                if materialID == matID:
-                    if ti.static(GlobalVariable.DIMENSION == 2):
-                        stress = matProps[1].ComputeStress2D(np, previous_stress, velocity_gradient_bar, stateVars, dt)
-                    elif ti.static(GlobalVariable.DIMENSION == 3):
-                        stress = matProps[1].ComputeStress(np, previous_stress, velocity_gradient_bar, stateVars, dt)
-            particle[np].stress = stress
-            particle[np].vol = volume
+            nodeID = lightweight_node_id(grid_id, gnum)
+            if nodeID >= 0:
+                shape_fn, _, _ = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_id * grid_size, igrid_size, nodeID, bodyID, boundary_types)
+                node[nodeID, bodyID]._update_nodal_force(lightweight_weight(shape_fn) * traction)
 
-    if ti.static(GlobalVariable.FBAR):
-        node.jacobian.fill(0)
-        for np in range(particleNum):
+@ti.kernel
+def lightweight_g2p(particleNum: int, alpha: float, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                    dt: ti.template(), particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template(),
+                    kinematic: ti.template(), constitutive: ti.template()):
+    for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.momentum.get_scalar_field(d))
+    if ti.static(kinematic):
+        for d in ti.static(range(GlobalVariable.DIMENSION)): ti.block_local(node.force.get_scalar_field(d))
+    for np in range(particleNum):
+        if int(particle[np].active) == 1:
             bodyID = int(particle[np].bodyID)
-            mass = particle[np].m
+            materialID = int(particle[np].materialID)
             position = particle[np].x
-            velocity_gradient_bar = particle[np].velocity_gradient
             psize = particle_lengths[bodyID]
-            djacobian = (ti.Matrix.identity(float, GlobalVariable.DIMENSION) + dt[None] * velocity_gradient_bar).determinant()
-            transfer_var = mass * djacobian
+
+            vPIC, vFLIP = ti.Vector.zero(float, GlobalVariable.DIMENSION), ti.Vector.zero(float, GlobalVariable.DIMENSION)
+            Wp = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
+            velocity_gradient = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
+            strain_rate_trace = ZEROVEC3f
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
             for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
-                base = ti.floor((position - psize) * igrid_size).cast(int)
                 grid_id = base + offset
-                if all(grid_id >= 0):
-                    nodeID = linearize(grid_id, gnum)
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
                     grid_pos = grid_id * grid_size
-                    shape_fn, dshape_fn = ti.Vector.zero(float, GlobalVariable.DIMENSION), ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                    shape_fnc = ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                    if ti.static(GlobalVariable.SHAPEFUNCTION == 0): 
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            shape_fn[d] = ShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
+                    shape_fn, dshape_fn, shape_fnc = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_pos, igrid_size, nodeID, bodyID, boundary_types)
+                    weight = lightweight_weight(shape_fn)
+                    velocity = node[nodeID, bodyID].momentum
+                    if ti.static(kinematic):
+                        vPIC += weight * velocity
+                        vFLIP += weight * node[nodeID, bodyID].force
+                    if ti.static(constitutive):
+                        if ti.static(GlobalVariable.APIC):
+                            pointer = periodic_distance(grid_pos - position)
+                            Wp += weight * lightweight_outer_product(pointer, pointer)
+                            velocity_gradient += weight * lightweight_outer_product(pointer, velocity)
+                        else:
+                            weight_grad = lightweight_weight_gradient(shape_fn, dshape_fn)
+                            velocity_gradient += lightweight_outer_product(weight_grad, velocity)
                             if ti.static(GlobalVariable.BBAR):
-                                shape_fnc[d] = ShapeLinearCenter(position[d], grid_pos[d], igrid_size[d], 0)
-                    elif ti.static(GlobalVariable.SHAPEFUNCTION == 1): 
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            shape_fn[d] = ShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                            if ti.static(GlobalVariable.BBAR):
-                                shape_fnc[d] = ShapeGIMPCenter(position[d], grid_pos[d], igrid_size[d], psize[d])
-                    elif ti.static(GlobalVariable.SHAPEFUNCTION == 2): 
-                        boundary_type = boundary_types[nodeID, bodyID]
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            btypes = int(boundary_type[d])
-                            shape_fn[d] = ShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                    elif ti.static(GlobalVariable.SHAPEFUNCTION == 3): 
-                        boundary_type = boundary_types[nodeID, bodyID]
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            btypes = int(boundary_type[d])
-                            shape_fn[d] = ShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
-
-                    weight = 1.0
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        weight *= shape_fn[d]
-                    node[nodeID, bodyID].jacobian += weight * transfer_var
-
-        for ng in range(node.shape[0]):
-            for nb in range(node.shape[1]):
-                if node[ng, nb].m > cutoff:
-                    node[ng, nb].jacobian /= node[ng, nb].m
-
-        for np in range(particleNum):
+                                temp_dshape = (lightweight_weight_gradient(shape_fnc, dshape_fn) - weight_grad) / 3.
+                                average_bmatrix = temp_dshape.dot(velocity)
+                                for d in ti.static(range(GlobalVariable.DIMENSION)):
+                                    velocity_gradient[d, d] += average_bmatrix
+                                    strain_rate_trace[d] += weight_grad[d] * velocity[d]
+
+            if ti.static(constitutive):
+                if materialID > 0:
+                    if ti.static(GlobalVariable.APIC):
+                        velocity_gradient = velocity_gradient @ Wp.inverse()
+                    particle[np].velocity_gradient = truncation(velocity_gradient)
+                    if ti.static(GlobalVariable.BBAR):
+                        particle[np].vol *= matProps[materialID].update_particle_volume_bbar(np, strain_rate_trace, stateVars, dt)
+                    elif ti.static(GlobalVariable.DIMENSION == 2):
+                        particle[np].vol *= matProps[materialID].update_particle_volume_2D(np, velocity_gradient, stateVars, dt)
+                    elif ti.static(GlobalVariable.DIMENSION == 3):
+                        particle[np].vol *= matProps[materialID].update_particle_volume(np, velocity_gradient, stateVars, dt)
+
+                    # the F-bar method corrects the velocity gradient by the nodal jacobian before the stress update
+                    if ti.static(not GlobalVariable.FBAR):
+                        previous_stress = particle[np].stress
+                        if ti.static(GlobalVariable.DIMENSION == 2):
+                            particle[np].stress = matProps[materialID].ComputeStress2D(np, previous_stress, particle[np].velocity_gradient, stateVars, dt)
+                        elif ti.static(GlobalVariable.DIMENSION == 3):
+                            particle[np].stress = matProps[materialID].ComputeStress(np, previous_stress, particle[np].velocity_gradient, stateVars, dt)
+            if ti.static(kinematic):
+                particle[np]._update_particle_state(dt, alpha, vPIC, vFLIP)
+
+@ti.kernel
+def lightweight_fbar_g2p(particleNum: int, alpha: float, fraction: float, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float),
+                         dt: ti.template(), particle_lengths: ti.template(), boundary_types: ti.template(), node: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template(),
+                         kinematic: ti.template()):
+    eyes = ti.Matrix.identity(float, GlobalVariable.DIMENSION)
+    for np in range(particleNum):
+        if int(particle[np].active) == 1:
             bodyID = int(particle[np].bodyID)
-            mass = particle[np].m
+            materialID = int(particle[np].materialID)
             position = particle[np].x
-            velocity_gradient_bar = particle[np].velocity_gradient
             psize = particle_lengths[bodyID]
-            djacobian = (ti.Matrix.identity(float, GlobalVariable.DIMENSION) + dt[None] * velocity_gradient_bar).determinant()
-            transfer_var = mass * djacobian
+
+            vPIC, vFLIP = ti.Vector.zero(float, GlobalVariable.DIMENSION), ti.Vector.zero(float, GlobalVariable.DIMENSION)
             djacobian_bar = 0.
+            base = ti.floor((position - psize) * igrid_size, int)
+            shape_table, dshape_table, shape_tablec = lightweight_shape_table(position, base, grid_size, igrid_size, psize)
             for offset in ti.static(ti.grouped(ti.ndrange(*((GlobalVariable.INFLUENCENODE, ) * GlobalVariable.DIMENSION)))):
-                base = ti.floor((position - psize) * igrid_size).cast(int)
                 grid_id = base + offset
-                if all(grid_id >= 0):
-                    nodeID = linearize(grid_id, gnum)
-                    grid_pos = grid_id * grid_size
-                    shape_fn, dshape_fn = ti.Vector.zero(float, GlobalVariable.DIMENSION), ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                    shape_fnc = ti.Vector.zero(float, GlobalVariable.DIMENSION)
-                    if ti.static(GlobalVariable.SHAPEFUNCTION == 0): 
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            shape_fn[d] = ShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeLinear(position[d], grid_pos[d], igrid_size[d], 0)
-                            if ti.static(GlobalVariable.BBAR):
-                                shape_fnc[d] = ShapeLinearCenter(position[d], grid_pos[d], igrid_size[d], 0)
-                    elif ti.static(GlobalVariable.SHAPEFUNCTION == 1): 
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            shape_fn[d] = ShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeGIMP(position[d], grid_pos[d], igrid_size[d], psize[d])
-                            if ti.static(GlobalVariable.BBAR):
-                                shape_fnc[d] = ShapeGIMPCenter(position[d], grid_pos[d], igrid_size[d], psize[d])
-                    elif ti.static(GlobalVariable.SHAPEFUNCTION == 2): 
-                        boundary_type = boundary_types[nodeID, bodyID]
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            btypes = int(boundary_type[d])
-                            shape_fn[d] = ShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeBsplineQ(position[d], grid_pos[d], igrid_size[d], btypes)
-                    elif ti.static(GlobalVariable.SHAPEFUNCTION == 3): 
-                        boundary_type = boundary_types[nodeID, bodyID]
-                        for d in ti.static(range(GlobalVariable.DIMENSION)):
-                            btypes = int(boundary_type[d])
-                            shape_fn[d] = ShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
-                            if ti.static(not GlobalVariable.APIC):
-                                dshape_fn[d] = GShapeBsplineC(position[d], grid_pos[d], igrid_size[d], btypes)
-                    
-                    jacobian = node[nodeID, bodyID].jacobian
-                    weight = 1.0
-                    for d in ti.static(range(GlobalVariable.DIMENSION)):
-                        weight *= shape_fn[d]
-                    djacobian_bar += jacobian
-
-            velocity_gradient = particle[np].velocity_gradient
-            ddeformation_gradient = ti.Matrix.identity(float, GlobalVariable.DIMENSION) + dt[None] * velocity_gradient
-            djacobian = ddeformation_gradient.determinant()
-            djacobian_bar_new = fraction * djacobian_bar + (1. - fraction) * djacobian
+                nodeID = lightweight_node_id(grid_id, gnum)
+                if nodeID >= 0:
+                    shape_fn, _, _ = lightweight_shape_fn(offset, shape_table, dshape_table, shape_tablec, position, grid_id * grid_size, igrid_size, nodeID, bodyID, boundary_types)
+                    weight = lightweight_weight(shape_fn)
+                    djacobian_bar += weight * node[nodeID, bodyID].jacobian
+                    if ti.static(kinematic):
+                        vPIC += weight * node[nodeID, bodyID].momentum
+                        vFLIP += weight * node[nodeID, bodyID].force
+
+            if materialID > 0:
+                velocity_gradient = particle[np].velocity_gradient
+                djacobian = (eyes + dt[None] * velocity_gradient).determinant()
+                djacobian_bar_new = fraction * djacobian_bar + (1. - fraction) * djacobian
+                multiplier = (djacobian_bar_new / djacobian) ** (1. / GlobalVariable.DIMENSION)
+                updated_velocity_gradient = (multiplier - 1.) * eyes / dt[None] + multiplier * velocity_gradient
+                particle[np].velocity_gradient = updated_velocity_gradient
+
+                previous_stress = particle[np].stress
+                if ti.static(GlobalVariable.DIMENSION == 2):
+                    particle[np].stress = matProps[materialID].ComputeStress2D(np, previous_stress, updated_velocity_gradient, stateVars, dt)
+                elif ti.static(GlobalVariable.DIMENSION == 3):
+                    particle[np].stress = matProps[materialID].ComputeStress(np, previous_stress, updated_velocity_gradient, stateVars, dt)
+            if ti.static(kinematic):
+                particle[np]._update_particle_state(dt, alpha, vPIC, vFLIP)
 
-            multiplier = (djacobian_bar_new / djacobian) ** (1. / GlobalVariable.DIMENSION)
-            updated_velocity_gradient = (multiplier - 1.) * ti.Matrix.identity(float, GlobalVariable.DIMENSION) / dt[None] + multiplier * velocity_gradient
-            
-            particle[np].velocity_gradient = updated_velocity_gradient
+@ti.kernel
+def kernel_g2p2g(total_nodes: int, influenced_node: int, element_size: ti.types.vector(GlobalVariable.DIMENSION, float), ielement_size: ti.types.vector(GlobalVariable.DIMENSION, float), 
+                 gnum: ti.types.vector(GlobalVariable.DIMENSION, int), particleNum: int, alpha: float, gravity: ti.types.vector(3, float), dt: ti.template(), node_in: ti.template(), node_out: ti.template(), 
+                 particle: ti.template(), matProps: ti.template(), stateVars: ti.template(), calLength: ti.template(), LnID: ti.template(), shapefn: ti.template(), dshapefn: ti.template(), 
+                 node_size: ti.template(), boundtype: ti.template(), shape_function: ti.template(), grad_shape_function: ti.template(), update_shape_fn: ti.template()):
+    for np in range(particleNum):
+        if int(particle[np].active) == 1:
+            materialID = int(particle[np].materialID)
+            bodyID = int(particle[np].bodyID)
+            offset = np * total_nodes
 
-    if ti.static(GlobalVariable.PARTICLESHIFTING):
-        pass
+            # G2P with the shape functions of the previous mapping
+            vPIC, vFLIP = ti.Vector.zero(float, GlobalVariable.DIMENSION), ti.Vector.zero(float, GlobalVariable.DIMENSION)
+            velocity_gradient = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
+            for ln in range(offset, offset + int(node_size[np])):
+                nodeID = LnID[ln]
+                shape_fn = shapefn[ln]
+                velocity = node_in[nodeID, bodyID].momentum
+                vPIC += shape_mapping(shape_fn, velocity)
+                vFLIP += shape_mapping(shape_fn, node_in[nodeID, bodyID].force)
+                if ti.static(GlobalVariable.DIMENSION == 2):
+                    velocity_gradient += outer_product2D(dshapefn[ln], velocity)
+                elif ti.static(GlobalVariable.DIMENSION == 3):
+                    velocity_gradient += outer_product(dshapefn[ln], velocity)
+            particle[np]._update_particle_state(dt, alpha, vPIC, vFLIP)
 
+            if materialID > 0:
+                particle[np].velocity_gradient = truncation(velocity_gradient)
+                previous_stress = particle[np].stress
+                if ti.static(GlobalVariable.DIMENSION == 2):
+                    particle[np].vol *= matProps[materialID].update_particle_volume_2D(np, velocity_gradient, stateVars, dt)
+                    particle[np].stress = matProps[materialID].ComputeStress2D(np, previous_stress, particle[np].velocity_gradient, stateVars, dt)
+                elif ti.static(GlobalVariable.DIMENSION == 3):
+                    particle[np].vol *= matProps[materialID].update_particle_volume(np, velocity_gradient, stateVars, dt)
+                    particle[np].stress = matProps[materialID].ComputeStress(np, previous_stress, particle[np].velocity_gradient, stateVars, dt)
 
-@ti.kernel
-def lightweight_grid_operation(cutoff: float, damp: float, node: ti.template(), dt: ti.template()):
-    for ng in range(node.shape[0]):
-        for nb in range(node.shape[1]):
-            if node[ng, nb].m > cutoff:
-                mass = node[ng, nb].m
-                acceleration = node[ng, nb].force  / mass
-                velocity = node[ng, nb].momentum / mass
-                for d in ti.static(range(GlobalVariable.DIMENSION)):
-                    if velocity[d] * acceleration[d] > 0.: 
-                        acceleration[d] -= damp * ti.abs(acceleration[d]) * sgn(velocity[d])
-                node[ng, nb].momentum = velocity + acceleration * dt[None]
-                node[ng, nb].force = acceleration 
-
-@ti.kernel
-def g2p2g(particleNum: int, p_mass: float, grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), igrid_size: ti.types.vector(GlobalVariable.DIMENSION, float), gravity: ti.types.vector(3, float), 
-          dt: ti.template(), node_in: ti.template(), node_out: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template(), particleID: ti.template()):
-    for np in range(particleNum):
-        pid = particleID[np]
-        position = particle[pid].x
-        velocity = particle[pid].v
-        base = ti.floor(position * igrid_size - 0.5).cast(int)
-        fx = position * igrid_size - base.cast(float)
-        w = [0.5 * (1.5 - fx)**2, 0.75 - (fx - 1.0)**2, 0.5 * (fx - 0.5)**2]
-        new_v = ti.Vector.zero(float, GlobalVariable.DIMENSION)
-        velocity_gradient = ti.Matrix.zero(float, GlobalVariable.DIMENSION, GlobalVariable.DIMENSION)
-        # Loop over 3x3 grid node neighborhood
-        for offset in ti.static(ti.grouped(ti.ndrange(*((3, ) * GlobalVariable.DIMENSION)))):
-            dpos = offset.cast(float) - fx
-            g_v = node_in[base + offset, 0].momentum
-            weight = 1.0
-            for d in ti.static(range(GlobalVariable.DIMENSION)):
-                weight *= w[offset[d]][d]
-            new_v += weight * g_v
-            velocity_gradient += 4 * igrid_size * weight * g_v.outer_product(dpos)
-
-        # P2G
-        base = ti.floor(position * igrid_size - 0.5).cast(int)
-        fx = position * igrid_size - float(base)
-        w2 = [0.5 * (1.5 - fx) ** 2, 0.75 - (fx - 1) ** 2, 0.5 * (fx - 0.5) ** 2]
-        w_grad = [fx - 1.5, -2 * (fx - 1), fx - 0.5]
-        # Deformation gradient update
-        previous_stress, volume = particle[np].stress, particle[np].vol
-        volume *= (ti.Matrix.identity(float, GlobalVariable.DIMENSION) + dt[None] * velocity).determinant()
-        stress = ti.Vector.zero(float, 6)
-        if ti.static(GlobalVariable.DIMENSION == 2):
-            stress = matProps[1].ComputeStress2D(np, previous_stress, velocity_gradient, stateVars, dt)
-        elif ti.static(GlobalVariable.DIMENSION == 3):
-            stress = matProps[1].ComputeStress(np, previous_stress, velocity_gradient, stateVars, dt)
-        particle[np].stress = stress
-        particle[np].vol = volume
-        fInt = volume * stress
-        # Loop over 3x3 grid node neighborhood
-        for offset in ti.static(ti.grouped(ti.ndrange(*((3, ) * GlobalVariable.DIMENSION)))):
-            dpos = (offset.cast(float) - fx) * grid_size
-            weight = 1.0
-            for d in ti.static(range(GlobalVariable.DIMENSION)):
-                weight *= w2[offset[d]][d]
-                
-            pforce = particle[np]._compute_external_force(gravity)
-            if ti.static(GlobalVariable.DIMENSION == 2):
-                weight_grad = ti.Vector([w_grad[offset[0]][0] * w[offset[1]][1], w[offset[0]][0] * w_grad[offset[1]][1]]) * igrid_size
-                pforce += vec2f([weight_grad[0] * fInt[0] + weight_grad[1] * fInt[3],
-                                weight_grad[1] * fInt[1] + weight_grad[0] * fInt[3]]) + p_mass * vec2f(gravity[0], gravity[1]) 
-            elif ti.static(GlobalVariable.DIMENSION == 3):
-                weight_grad = ti.Vector([w_grad[offset[0]][0] * w[offset[1]][1] * w[offset[2]][2], 
-                                         w[offset[0]][0] * w_grad[offset[1]][1] * w[offset[2]][2], 
-                                         w[offset[0]][0] * w[offset[1]][1] * w_grad[offset[2]][2]]) * igrid_size
-                pforce += vec3f([weight_grad[0] * fInt[0] + weight_grad[1] * fInt[3] + weight_grad[2] * fInt[5],
-                                weight_grad[1] * fInt[1] + weight_grad[0] * fInt[3] + weight_grad[2] * fInt[4],
-                                weight_grad[2] * fInt[2] + weight_grad[1] * fInt[4] + weight_grad[0] * fInt[5]]) + p_mass * gravity
-            node_out[base + offset, 0].momentum += weight * (p_mass * velocity + velocity_gradient @ dpos + pforce)
-            node_out[base + offset, 0].mass += weight * p_mass
+            # P2G with the shape functions of the updated position
+            update_shape_fn(np, total_nodes, influenced_node, element_size, ielement_size, gnum, particle, calLength, node_size, LnID, shapefn, dshapefn, 
+                            shape_function, grad_shape_function, boundtype)
+            mass = particle[np].m
+            velocity = particle[np].v
+            fex = particle[np]._compute_external_force(gravity)
+            fInt = particle[np]._compute_internal_force()
+            for ln in range(offset, offset + int(node_size[np])):
+                nodeID = LnID[ln]
+                nmass = shape_mapping(shapefn[ln], mass)
+                node_out[nodeID, bodyID]._update_nodal_mass(nmass)
+                node_out[nodeID, bodyID]._update_nodal_momentum(nmass * velocity)
+                if materialID > 0:
+                    dshape_fn = dshapefn[ln]
+                    external_force = shape_mapping(shapefn[ln], fex)
+                    if ti.static(GlobalVariable.DIMENSION == 2):
+                        internal_force = vec2f([dshape_fn[0] * fInt[0] + dshape_fn[1] * fInt[3],
+                                                dshape_fn[1] * fInt[1] + dshape_fn[0] * fInt[3]])
+                        node_out[nodeID, bodyID]._update_nodal_force(external_force + internal_force)
+                    elif ti.static(GlobalVariable.DIMENSION == 3):
+                        internal_force = vec3f([dshape_fn[0] * fInt[0] + dshape_fn[1] * fInt[3] + dshape_fn[2] * fInt[5],
+                                                dshape_fn[1] * fInt[1] + dshape_fn[0] * fInt[3] + dshape_fn[2] * fInt[4],
+                                                dshape_fn[2] * fInt[2] + dshape_fn[1] * fInt[4] + dshape_fn[0] * fInt[5]])
+                        node_out[nodeID, bodyID]._update_nodal_force(external_force + internal_force)
 
 # ========================================================= #
 #                  Moving Least Square                      #
@@ -613,7 +647,7 @@ def kernel_mass_momentum_taylor_p2g(total_nodes: int, particleNum: int, gnum: ti
                 nodal_coord = grid_size * ti.Vector(vectorize_id(nodeID, gnum))
                 nmass = shape_mapping(shapefn[ln], mass)
                 node[nodeID, bodyID]._update_nodal_mass(nmass)
-                node[nodeID, bodyID]._update_nodal_momentum(nmass * (velocity + gradv @ (nodal_coord - xp)))
+                node[nodeID, bodyID]._update_nodal_momentum(nmass * (velocity + gradv @ periodic_distance(nodal_coord - xp)))
 
 @ti.kernel
 def kernel_mass_momentum_taylor_p2g_2DAxisy(total_nodes: int, particleNum: int, gnum: ti.types.vector(GlobalVariable.DIMENSION, int), grid_size: ti.types.vector(GlobalVariable.DIMENSION, float), 
@@ -634,7 +668,7 @@ def kernel_mass_momentum_taylor_p2g_2DAxisy(total_nodes: int, particleNum: int,
                 nodal_coord = grid_size * ti.Vector(vectorize_id(nodeID, gnum))
                 nmass = shape_mapping(shapefn[ln], mass)
                 node[nodeID, bodyID]._update_nodal_mass(nmass)
-                node[nodeID, bodyID]._update_nodal_momentum(nmass * (velocity + gradv @ (nodal_coord - xp)))
+                node[nodeID, bodyID]._update_nodal_momentum(nmass * (velocity + gradv @ periodic_distance(nodal_coord - xp)))
 
 @ti.kernel
 def kernel_mass_momentum_p2g_twophase(total_nodes: int, particleNum: int, node: ti.template(), particle: ti.template(), LnID: ti.template(), shapefn: ti.template(), node_size: ti.template()):
@@ -825,7 +859,7 @@ def kernel_force_mls_p2g(total_nodes: int, particleNum: int, gravity: ti.types.v
             for ln in range(offset, offset + int(node_size[np])):
                 nodeID = LnID[ln]
                 shape_fn = shapefn[ln]
-                pointer = grid_size * ti.Vector([*vectorize_id(nodeID, gnum)]) - position
+                pointer = periodic_distance(grid_size * ti.Vector([*vectorize_id(nodeID, gnum)]) - position)
                 internal_force = vec3f(fInt[0] * inertia_tensor[0] * pointer[0] + fInt[3] * inertia_tensor[1] * pointer[1] + fInt[5] * inertia_tensor[2] * pointer[2],
                                        fInt[3] * inertia_tensor[0] * pointer[0] + fInt[1] * inertia_tensor[1] * pointer[1] + fInt[4] * inertia_tensor[2] * pointer[2],
                                        fInt[5] * inertia_tensor[0] * pointer[0] + fInt[4] * inertia_tensor[1] * pointer[1] + fInt[2] * inertia_tensor[2] * pointer[2])
@@ -845,7 +879,7 @@ def kernel_force_mls_p2g_2D(total_nodes: int, particleNum: int, gravity: ti.type
             for ln in range(offset, offset + int(node_size[np])):
                 nodeID = LnID[ln]
                 shape_fn = shapefn[ln]
-                pointer = grid_size * ti.Vector([*vectorize_id(nodeID, gnum)]) - position
+                pointer = periodic_distance(grid_size * ti.Vector([*vectorize_id(nodeID, gnum)]) - position)
                 internal_force = vec2f(fInt[0] * inertia_tensor[0] * pointer[0] + fInt[3] * inertia_tensor[1] * pointer[1],
                                        fInt[3] * inertia_tensor[0] * pointer[0] + fInt[1] * inertia_tensor[1] * pointer[1])
                 node[nodeID, bodyID]._update_nodal_force(shape_fn * (fex + internal_force))
@@ -1527,6 +1561,21 @@ def kernel_find_sound_speed(particleNum: int, particle: ti.template(), matProps:
         materialID = particle[np].materialID
         matProps[materialID]._set_modulus(Squared(particle[np].v))
 
+@ti.kernel
+def kernel_find_max_wave_speed_twophase(particleNum: int, particle: ti.template(), matProps: ti.template()) -> float:
+    # undrained P-wave, the pore fluid stiffens the mixture by Kf / n
+    max_wave_speed = 0.
+    for np in range(particleNum):
+        materialID = int(particle[np].materialID)
+        if materialID > 0 and int(particle[np].active) == 1:
+            sound_speed = matProps[materialID]._get_sound_speed()
+            porosity = particle[np].porosity
+            if porosity > 0. and matProps[materialID].density > 0.:
+                sound_speed = ti.sqrt(sound_speed * sound_speed + matProps[materialID].fluid_bulk / porosity / matProps[materialID].density)
+            velocity = ti.max(particle[np].vs.norm(), particle[np].vf.norm())
+            ti.atomic_max(max_wave_speed, velocity + sound_speed)
+    return max_wave_speed
+
 @ti.kernel
 def kernel_compute_reference_stress_strain(total_nodes: int, dt: ti.template(), particleNum: int, node: ti.template(), particle: ti.template(), 
                                            matProps: ti.template(), stateVars: ti.template(), LnID: ti.template(), dshapefn: ti.template(), node_size: ti.template()):
@@ -1561,6 +1610,84 @@ def kernel_compute_stress_strain_2D(particleNum: int, dt: ti.template(), particl
             previous_stress = particle[np].stress
             particle[np].stress = matProps[materialID].ComputeStress2D(np, previous_stress, velocity_gradient, stateVars, dt)
 
+@ti.kernel
+def kernel_elastic_predictor(particleNum: int, dt: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template(), plastic_flag: ti.template()):
+    for np in range(particleNum):
+        is_plastic = 0
+        materialID = int(particle[np].materialID)
+        if materialID > 0 and int(particle[np].active) == 1:
+            velocity_gradient = particle[np].velocity_gradient
+            previous_stress = particle[np].stress
+            is_plastic, stress = matProps[materialID].ElasticPredictor(np, previous_stress, velocity_gradient, stateVars, dt)
+            if is_plastic == 0:
+                particle[np].stress = stress
+        plastic_flag[np] = is_plastic
+
+@ti.kernel
+def kernel_elastic_predictor_2D(particleNum: int, dt: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template(), plastic_flag: ti.template()):
+    for np in range(particleNum):
+        is_plastic = 0
+        materialID = int(particle[np].materialID)
+        if materialID > 0 and int(particle[np].active) == 1:
+            velocity_gradient = particle[np].velocity_gradient
+            previous_stress = particle[np].stress
+            is_plastic, stress = matProps[materialID].ElasticPredictor2D(np, previous_stress, velocity_gradient, stateVars, dt)
+            if is_plastic == 0:
+                particle[np].stress = stress
+        plastic_flag[np] = is_plastic
+
+@ti.kernel
+def kernel_compact_plastic_particles(particleNum: int, plastic_flag: ti.template(), plastic_list: ti.template()) -> int:
+    # plastic_flag holds the inclusive prefix sum of the yielding flags
+    for np in range(particleNum):
+        previous = 0
+        if np > 0:
+            previous = plastic_flag[np - 1]
+        if plastic_flag[np] > previous:
+            plastic_list[previous] = np
+    plastic_num = 0
+    if particleNum > 0:
+        plastic_num = plastic_flag[particleNum - 1]
+    return plastic_num
+
+@ti.kernel
+def kernel_return_mapping(plastic_num: int, plastic_list: ti.template(), dt: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template()):
+    for index in range(plastic_num):
+        np = plastic_list[index]
+        materialID = int(particle[np].materialID)
+        velocity_gradient = particle[np].velocity_gradient
+        previous_stress = particle[np].stress
+        particle[np].stress = matProps[materialID].ComputeStress(np, previous_stress, velocity_gradient, stateVars, dt)
+
+@ti.kernel
+def kernel_return_mapping_2D(plastic_num: int, plastic_list: ti.template(), dt: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template()):
+    for index in range(plastic_num):
+        np = plastic_list[index]
+        materialID = int(particle[np].materialID)
+        velocity_gradient = particle[np].velocity_gradient
+        previous_stress = particle[np].stress
+        particle[np].stress = matProps[materialID].ComputeStress2D(np, previous_stress, velocity_gradient, stateVars, dt)
+
+@ti.kernel
+def kernel_compute_stress_strain_by_model(start_index: int, end_index: int, particle_index: ti.template(), dt: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template()):
+    for index in range(start_index, end_index):
+        np = particle_index[index]
+        if int(particle[np].active) == 1:
+            materialID = int(particle[np].materialID)
+            velocity_gradient = particle[np].velocity_gradient
+            previous_stress = particle[np].stress
+            particle[np].stress = matProps[materialID].ComputeStress(np, previous_stress, velocity_gradient, stateVars, dt)
+
+@ti.kernel
+def kernel_compute_stress_strain_by_model_2D(start_index: int, end_index: int, particle_index: ti.template(), dt: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template()):
+    for index in range(start_index, end_index):
+        np = particle_index[index]
+        if int(particle[np].active) == 1:
+            materialID = int(particle[np].materialID)
+            velocity_gradient = particle[np].velocity_gradient
+            previous_stress = particle[np].stress
+            particle[np].stress = matProps[materialID].ComputeStress2D(np, previous_stress, velocity_gradient, stateVars, dt)
+
 @ti.kernel
 def kernel_compute_stress_strain_twophase(particleNum: int, dt: ti.template(), particle: ti.template(), matProps: ti.template(), stateVars: ti.template()):
     # ti.block_local(dt)
@@ -1631,6 +1758,24 @@ def kernel_update_velocity_gradient(total_nodes: int, particleNum: int, dt: ti.t
             particle[np].velocity_gradient = truncation(velocity_gradient)
             particle[np].vol *= matProps[materialID].update_particle_volume(np, velocity_gradient, stateVars, dt)
 
+@ti.kernel
+def kernel_update_velocity_gradient_by_model(start_index: int, end_index: int, particle_index: ti.template(), total_nodes: int, dt: ti.template(), node: ti.template(), particle: ti.template(), 
+                                             matProps: ti.template(), stateVars: ti.template(), LnID: ti.template(), dshapefn: ti.template(), node_size: ti.template()):
+    for index in range(start_index, end_index):
+        np = particle_index[index]
+        if int(particle[np].active) == 1:
+            materialID = int(particle[np].materialID)
+            bodyID = int(particle[np].bodyID)
+            velocity_gradient = ZEROMAT3x3
+            offset = np * total_nodes
+            for ln in range(offset, offset + int(node_size[np])):
+                nodeID = LnID[ln]
+                gv = node[nodeID, bodyID].momentum
+                dshape_fn = dshapefn[ln]
+                velocity_gradient += outer_product(dshape_fn, gv)
+            particle[np].velocity_gradient = truncation(velocity_gradient)
+            particle[np].vol *= matProps[materialID].update_particle_volume(np, velocity_gradient, stateVars, dt)
+
 @ti.kernel
 def kernel_update_velocity_gradient_affine(total_nodes: int, particleNum: int, gnum: ti.types.vector(3, int), grid_size: ti.types.vector(3, float), dt: ti.template(), node: ti.template(), particle: ti.template(), 
                                            matProps: ti.template(), stateVars: ti.template(),  LnID: ti.template(), shapefn: ti.template(), node_size: ti.template()):
@@ -1645,7 +1790,7 @@ def kernel_update_velocity_gradient_affine(total_nodes: int, particleNum: int, g
             for ln in range(offset, offset + int(node_size[np])):
                 nodeID = LnID[ln]
                 grid_coord = grid_size * vec3f(vectorize_id(nodeID, gnum))
-                pointer = grid_coord - position
+                pointer = periodic_distance(grid_coord - position)
                 gv = node[nodeID, bodyID].momentum
                 shape_fn = shapefn[ln]
 
@@ -1701,6 +1846,24 @@ def kernel_update_velocity_gradient_2D(total_nodes: int, particleNum: int, dt: t
             particle[np].velocity_gradient = truncation(velocity_gradient)
             particle[np].vol *= matProps[materialID].update_particle_volume_2D(np, velocity_gradient, stateVars, dt)
 
+@ti.kernel
+def kernel_update_velocity_gradient_by_model_2D(start_index: int, end_index: int, particle_index: ti.template(), total_nodes: int, dt: ti.template(), node: ti.template(), particle: ti.template(), 
+                                                matProps: ti.template(), stateVars: ti.template(), LnID: ti.template(), dshapefn: ti.template(), node_size: ti.template()):
+    for index in range(start_index, end_index):
+        np = particle_index[index]
+        if int(particle[np].active) == 1:
+            materialID = int(particle[np].materialID)
+            bodyID = int(particle[np].bodyID)
+            velocity_gradient = ZEROMAT2x2
+            offset = np * total_nodes
+            for ln in range(offset, offset + int(node_size[np])):
+                nodeID = LnID[ln]
+                gv = node[nodeID, bodyID].momentum
+                dshape_fn = dshapefn[ln]
+                velocity_gradient += outer_product2D(dshape_fn, gv)
+            particle[np].velocity_gradient = truncation(velocity_gradient)
+            particle[np].vol *= matProps[materialID].update_particle_volume_2D(np, velocity_gradient, stateVars, dt)
+
 @ti.kernel
 def kernel_update_velocity_gradient_affine_2D(total_nodes: int, particleNum: int, gnum: ti.types.vector(2, int), grid_size: ti.types.vector(2, float), dt: ti.template(), node: ti.template(), particle: ti.template(), 
                                        matProps: ti.template(), stateVars: ti.template(),  LnID: ti.template(), shapefn: ti.template(), node_size: ti.template()):
@@ -1715,7 +1878,7 @@ def kernel_update_velocity_gradient_affine_2D(total_nodes: int, particleNum: int
             for ln in range(offset, offset + int(node_size[np])):
                 nodeID = LnID[ln]
                 grid_coord = grid_size * vec2f(vectorize_id(nodeID, gnum))
-                pointer = grid_coord - position
+                pointer = periodic_distance(grid_coord - position)
                 gv = node[nodeID, bodyID].momentum
                 shape_fn = shapefn[ln]
                 Wp += shape_fn * outer_product2D(pointer, pointer)
@@ -2182,7 +2345,7 @@ def kernel_calc_geocontact(cut_off: float, mu: float, alpha: float, beta: float,
                 ############# Geo-contact #############
                 gsize = MeanValue(grid_size)
                 node_coord = grid_size * ti.Vector(vectorize_id(ng, gnum), dt=int)
-                dext = (xm - node_coord).dot(norm)
+                dext = periodic_distance(xm - node_coord).dot(norm)
 
                 # Reference: Hammerquist, C. C., Nairn, J. A., 2018. Modeling nanoindentation using the material point method. J. Mater. Res. 33, 1369-1381
                 dist = 0.
@@ -2549,7 +2712,7 @@ def kernel_update_displacement_gradient_affine(total_nodes: int, particleNum: in
             for ln in range(offset, offset + int(node_size[np])):
                 nodeID = LnID[ln]
                 grid_coord = grid_size * vec3f(vectorize_id(nodeID, gnum))
-                pointer = grid_coord - position
+                pointer = periodic_distance(grid_coord - position)
                 gu = node[nodeID, bodyID].displacement
                 shape_fn = shapefn[ln]
 
@@ -2626,7 +2789,7 @@ def kernel_update_displacement_gradient_affine_2D(total_nodes: int, particleNum:
             for ln in range(offset, offset + int(node_size[np])):
                 nodeID = LnID[ln]
                 grid_coord = grid_size * vec2f(vectorize_id(nodeID, gnum))
-                pointer = grid_coord - position
+                pointer = periodic_distance(grid_coord - position)
                 gu = node[nodeID, bodyID].displacement
                 shape_fn = shapefn[ln]
                 Wp += shape_fn * outer_product2D(pointer, pointer)
@@ -2667,6 +2830,388 @@ def kernel_update_displacement_gradient_bbar_2D(total_nodes: int, particleNum: i
             previous_volume = particle[np].vol0
             particle[np].vol = previous_volume * matProps[materialID].update_particle_volume_bbar(np, strain_incre_trace / dt[None], stateVars, dt)
 
+# ========================================================= #
+#             Matrix-free Newton-Raphson Solver             #
+# ========================================================= #
+@ti.func
+def voigt_strain(dshape_fn, displacement):
+    strain = ZEROVEC6f
+    if ti.static(GlobalVariable.DIMENSION == 2):
+        strain = vec6f([dshape_fn[0] * displacement[0], dshape_fn[1] * displacement[1], 0., 
+                        dshape_fn[1] * displacement[0] + dshape_fn[0] * displacement[1], 0., 0.])
+    elif ti.static(GlobalVariable.DIMENSION == 3):
+        strain = vec6f([dshape_fn[0] * displacement[0], dshape_fn[1] * displacement[1], dshape_fn[2] * displacement[2],
+                        dshape_fn[1] * displacement[0] + dshape_fn[0] * displacement[1],
+                        dshape_fn[2] * displacement[1] + dshape_fn[1] * displacement[2],
+                        dshape_fn[2] * displacement[0] + dshape_fn[0] * displacement[2]])
+    return strain
+
+@ti.func
+def voigt_nodal_force(dshape_fn, stress):
+    force = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    if ti.static(GlobalVariable.DIMENSION == 2):
+        force = vec2f([dshape_fn[0] * stress[0] + dshape_fn[1] * stress[3],
+                       dshape_fn[1] * stress[1] + dshape_fn[0] * stress[3]])
+    elif ti.static(GlobalVariable.DIMENSION == 3):
+        force = vec3f([dshape_fn[0] * stress[0] + dshape_fn[1] * stress[3] + dshape_fn[2] * stress[5],
+                       dshape_fn[1] * stress[1] + dshape_fn[0] * stress[3] + dshape_fn[2] * stress[4],
+                       dshape_fn[2] * stress[2] + dshape_fn[1] * stress[4] + dshape_fn[0] * stress[5]])
+    return force
+
+@ti.func
+def get_free_vector(dof0, fixed_dofs, vector):
+    return ti.Vector([vector[dof0 + d] * float(1 - fixed_dofs[dof0 + d]) for d in ti.static(range(GlobalVariable.DIMENSION))], float)
+
+@ti.kernel
+def kernel_find_displacement_dofs(cutoff: float, lists: int, constraints: ti.template(), node: ti.template(), fixed_dofs: ti.template(), prescribed_value: ti.template()):
+    for nboundary in range(lists):
+        nodeID = constraints[nboundary].node
+        grid_level = int(constraints[nboundary].level)
+        if nodeID >= 0 and node[nodeID, grid_level].m > cutoff:
+            dof = node[nodeID, grid_level].dof + int(constraints[nboundary].dof)
+            fixed_dofs[dof] = 1
+            prescribed_value[dof] = constraints[nboundary].value
+
+@ti.kernel
+def kernel_find_velocity_dofs(cutoff: float, lists: int, constraints: ti.template(), node: ti.template(), fixed_dofs: ti.template(), prescribed_value: ti.template(), dt: ti.template()):
+    for nboundary in range(lists):
+        nodeID = constraints[nboundary].node
+        grid_level = int(constraints[nboundary].level)
+        if nodeID >= 0 and node[nodeID, grid_level].m > cutoff:
+            dof = node[nodeID, grid_level].dof + int(constraints[nboundary].dirs)
+            fixed_dofs[dof] = 1
+            prescribed_value[dof] = constraints[nboundary].velocity * dt[None]
+
+@ti.kernel
+def kernel_compute_dof_mass(cutoff: float, mass_coeff: float, node: ti.template(), dof_mass: ti.template()):
+    for ng in range(node.shape[0]):
+        for nb in range(node.shape[1]):
+            if node[ng, nb].m > cutoff:
+                dof0 = node[ng, nb].dof
+                for d in ti.static(range(GlobalVariable.DIMENSION)):
+                    dof_mass[dof0 + d] = mass_coeff * node[ng, nb].m
+
+@ti.kernel
+def kernel_assemble_residual_force(cutoff: float, beta: float, is_dynamic: int, dt: ti.template(), node: ti.template(), fixed_dofs: ti.template(), prescribed_value: ti.template(), residual: ti.template()) -> float:
+    rnorm = 0.
+    for ng in range(node.shape[0]):
+        for nb in range(node.shape[1]):
+            if node[ng, nb].m > cutoff:
+                dof0 = node[ng, nb].dof
+                force = node[ng, nb].ext_force + node[ng, nb].int_force
+                if is_dynamic == 1:
+                    force -= node[ng, nb].m * node[ng, nb]._compute_acceleration_newmark(beta, dt)
+                for d in ti.static(range(GlobalVariable.DIMENSION)):
+                    if fixed_dofs[dof0 + d] == 1:
+                        residual[dof0 + d] = prescribed_value[dof0 + d] - node[ng, nb].displacement[d]
+                    else:
+                        residual[dof0 + d] = force[d]
+                        rnorm += force[d] * force[d]
+    return ti.sqrt(rnorm)
+
+@ti.kernel
+def kernel_matrix_free_tangent(total_nodes: int, particleNum: int, length: int, node: ti.template(), particle: ti.template(), stiffness_matrix: ti.template(), LnID: ti.template(), 
+                               dshapefn: ti.template(), node_size: ti.template(), dof_mass: ti.template(), fixed_dofs: ti.template(), vector: ti.template(), result: ti.template()):
+    # K v = sum_p vol_p B_p^T D_p B_p v + M / (beta * dt^2) v, rows of prescribed dofs are replaced by identity
+    for i in range(length):
+        result[i] = 0.
+
+    for np in range(particleNum):
+        if int(particle[np].materialID) > 0 and int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            offset = np * total_nodes
+            strain = ZEROVEC6f
+            for ln in range(offset, offset + int(node_size[np])):
+                dof0 = node[LnID[ln], bodyID].dof
+                if dof0 >= 0:
+                    strain += voigt_strain(dshapefn[ln], get_free_vector(dof0, fixed_dofs, vector))
+            stress = particle[np].vol * (stiffness_matrix[np] @ strain)
+            for ln in range(offset, offset + int(node_size[np])):
+                dof0 = node[LnID[ln], bodyID].dof
+                if dof0 >= 0:
+                    force = voigt_nodal_force(dshapefn[ln], stress)
+                    for d in ti.static(range(GlobalVariable.DIMENSION)):
+                        if fixed_dofs[dof0 + d] == 0:
+                            result[dof0 + d] += force[d]
+
+    for i in range(length):
+        if fixed_dofs[i] == 1:
+            result[i] = vector[i]
+        else:
+            result[i] += dof_mass[i] * vector[i]
+
+@ti.kernel
+def kernel_matrix_free_diagonal(total_nodes: int, particleNum: int, length: int, node: ti.template(), particle: ti.template(), stiffness_matrix: ti.template(), LnID: ti.template(), 
+                                dshapefn: ti.template(), node_size: ti.template(), dof_mass: ti.template(), fixed_dofs: ti.template(), diagonal: ti.template()):
+    for i in range(length):
+        diagonal[i] = 0.
+
+    for np in range(particleNum):
+        if int(particle[np].materialID) > 0 and int(particle[np].active) == 1:
+            bodyID = int(particle[np].bodyID)
+            offset = np * total_nodes
+            for ln in range(offset, offset + int(node_size[np])):
+                dof0 = node[LnID[ln], bodyID].dof
+                if dof0 >= 0:
+                    for d in ti.static(range(GlobalVariable.DIMENSION)):
+                        bvector = voigt_strain(dshapefn[ln], ti.Vector.unit(GlobalVariable.DIMENSION, d, float))
+                        diagonal[dof0 + d] += particle[np].vol * bvector.dot(stiffness_matrix[np] @ bvector)
+
+    for i in range(length):
+        if fixed_dofs[i] == 1 or diagonal[i] + dof_mass[i] <= 0.:
+            diagonal[i] = 1.
+        else:
+            diagonal[i] += dof_mass[i]
+
+@ti.kernel
+def kernel_compute_displacement_error(cutoff: float, length: int, node: ti.template(), increment: ti.template()) -> float:
+    delta_u = 0.
+    for i in range(length):
+        delta_u += increment[i] * increment[i]
+    u = 0.
+    for ng in range(node.shape[0]):
+        for nb in range(node.shape[1]):
+            if node[ng, nb].m > cutoff:
+                u += node[ng, nb].displacement.norm_sqr()
+    error = 0.
+    if u > 0.:
+        error = ti.sqrt(delta_u / u)
+    return error
+
+@ti.kernel
+def kernel_reset_internal_force(cutoff: float, node: ti.template()):
+    for ng in range(node.shape[0]):
+        for nb in range(node.shape[1]):
+            if node[ng, nb].m > cutoff:
+                node[ng, nb]._reset_internal_force()
+
+# ========================================================= #
+#              Geometric Multigrid Preconditioner           #
+# ========================================================= #
+@ti.func
+def get_grid_index(linear_id, gnum):
+    index = ti.Vector.zero(int, GlobalVariable.DIMENSION)
+    if ti.static(GlobalVariable.DIMENSION == 2):
+        index = vec2i(vectorize_id(linear_id, gnum))
+    elif ti.static(GlobalVariable.DIMENSION == 3):
+        index = vec3i(vectorize_id(linear_id, gnum))
+    return index
+
+@ti.func
+def linear_shape_function(position, grid_index, grid_size):
+    shape = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    grad_shape = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+    for d in ti.static(range(GlobalVariable.DIMENSION)):
+        shape[d] = ShapeLinear(position[d], grid_index[d] * grid_size[d], 1. / grid_size[d], 0.)
+        grad_shape[d] = GShapeLinear(position[d], grid_index[d] * grid_size[d], 1. / grid_size[d], 0.)
+    shape_fn = 1.
+    dshape_fn = grad_shape
+    for d in ti.static(range(GlobalVariable.DIMENSION)):
+        shape_fn *= shape[d]
+        for e in ti.static(range(GlobalVariable.DIMENSION)):
+            if ti.static(e != d):
+                dshape_fn[d] *= shape[e]
+    return shape_fn, dshape_fn
+
+@ti.func
+def get_coarse_weight(fine_index, offset):
+    # fine node 2I coincides with coarse node I, odd fine nodes sit halfway between two coarse nodes
+    weight = 1.
+    coarse_index = fine_index // 2 + offset
+    for d in ti.static(range(GlobalVariable.DIMENSION)):
+        if fine_index[d] % 2 == 1:
+            weight *= 0.5
+        elif offset[d] == 1:
+            weight = 0.
+    return coarse_index, weight
+
+@ti.kernel
+def kernel_multigrid_coarse_mass(particleNum: int, level: int, gnum: ti.template(), grid_size: ti.template(), particle: ti.template(), mass: ti.template()):
+    for i in range(mass.shape[0]):
+        mass[i] = 0.
+    for np in range(particleNum):
+        if int(particle[np].materialID) > 0 and int(particle[np].active) == 1:
+            position = particle[np].x
+            base = ti.floor(position / grid_size[level], int)
+            for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+                grid_index = base + offset
+                if all(grid_index >= 0) and all(grid_index < gnum[level]):
+                    shape_fn, _ = linear_shape_function(position, grid_index, grid_size[level])
+                    mass[linearize(grid_index, gnum[level])] += shape_fn * particle[np].m
+
+@ti.kernel
+def kernel_multigrid_coarse_operator(particleNum: int, level: int, mass_coeff: float, gnum: ti.template(), grid_size: ti.template(), particle: ti.template(), 
+                                     stiffness_matrix: ti.template(), mass: ti.template(), fixed_dofs: ti.template(), vector: ti.template(), result: ti.template()):
+    for i in range(result.shape[0]):
+        result[i] = 0.
+    for np in range(particleNum):
+        if int(particle[np].materialID) > 0 and int(particle[np].active) == 1:
+            position = particle[np].x
+            base = ti.floor(position / grid_size[level], int)
+            strain = ZEROVEC6f
+            for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+                grid_index = base + offset
+                if all(grid_index >= 0) and all(grid_index < gnum[level]):
+                    _, dshape_fn = linear_shape_function(position, grid_index, grid_size[level])
+                    dof0 = GlobalVariable.DIMENSION * linearize(grid_index, gnum[level])
+                    strain += voigt_strain(dshape_fn, get_free_vector(dof0, fixed_dofs, vector))
+            stress = particle[np].vol * (stiffness_matrix[np] @ strain)
+            for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+                grid_index = base + offset
+                if all(grid_index >= 0) and all(grid_index < gnum[level]):
+                    _, dshape_fn = linear_shape_function(position, grid_index, grid_size[level])
+                    dof0 = GlobalVariable.DIMENSION * linearize(grid_index, gnum[level])
+                    force = voigt_nodal_force(dshape_fn, stress)
+                    for d in ti.static(range(GlobalVariable.DIMENSION)):
+                        if fixed_dofs[dof0 + d] == 0:
+                            result[dof0 + d] += force[d]
+    for i in range(result.shape[0]):
+        if fixed_dofs[i] == 1:
+            result[i] = vector[i]
+        else:
+            result[i] += mass_coeff * mass[i // GlobalVariable.DIMENSION] * vector[i]
+
+@ti.kernel
+def kernel_multigrid_coarse_diagonal(particleNum: int, level: int, mass_coeff: float, gnum: ti.template(), grid_size: ti.template(), particle: ti.template(), 
+                                     stiffness_matrix: ti.template(), mass: ti.template(), fixed_dofs: ti.template(), diagonal: ti.template()):
+    for i in range(diagonal.shape[0]):
+        diagonal[i] = 0.
+    for np in range(particleNum):
+        if int(particle[np].materialID) > 0 and int(particle[np].active) == 1:
+            position = particle[np].x
+            base = ti.floor(position / grid_size[level], int)
+            for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+                grid_index = base + offset
+                if all(grid_index >= 0) and all(grid_index < gnum[level]):
+                    _, dshape_fn = linear_shape_function(position, grid_index, grid_size[level])
+                    dof0 = GlobalVariable.DIMENSION * linearize(grid_index, gnum[level])
+                    for d in ti.static(range(GlobalVariable.DIMENSION)):
+                        bvector = voigt_strain(dshape_fn, ti.Vector.unit(GlobalVariable.DIMENSION, d, float))
+                        diagonal[dof0 + d] += particle[np].vol * bvector.dot(stiffness_matrix[np] @ bvector)
+    for i in range(diagonal.shape[0]):
+        diagonal[i] += mass_coeff * mass[i // GlobalVariable.DIMENSION]
+        if fixed_dofs[i] == 1 or diagonal[i] <= 0.:
+            diagonal[i] = 1.
+
+@ti.kernel
+def kernel_multigrid_fixed_from_nodes(cutoff: float, gnum: ti.template(), node: ti.template(), fine_fixed_dofs: ti.template(), fixed_dofs: ti.template()):
+    # a coarse dof is constrained as soon as one fine dof within its prolongation stencil is, otherwise
+    # the coarse grid would see soft modes that the constrained fine problem does not have
+    for nc in range(fixed_dofs.shape[0] // GlobalVariable.DIMENSION):
+        center = 2 * get_grid_index(nc, gnum[1])
+        fixed = ti.Vector.zero(int, GlobalVariable.DIMENSION)
+        for offset in ti.grouped(ti.ndrange(*([3] * GlobalVariable.DIMENSION))):
+            fine_index = center + offset - 1
+            if all(fine_index >= 0) and all(fine_index < gnum[0]):
+                nodeID = linearize(fine_index, gnum[0])
+                if node[nodeID, 0].m > cutoff:
+                    dof0 = node[nodeID, 0].dof
+                    for d in ti.static(range(GlobalVariable.DIMENSION)):
+                        fixed[d] = ti.max(fixed[d], fine_fixed_dofs[dof0 + d])
+        for d in ti.static(range(GlobalVariable.DIMENSION)):
+            fixed_dofs[GlobalVariable.DIMENSION * nc + d] = fixed[d]
+
+@ti.kernel
+def kernel_multigrid_fixed_from_grid(level: int, gnum: ti.template(), fine_fixed_dofs: ti.template(), fixed_dofs: ti.template()):
+    for nc in range(fixed_dofs.shape[0] // GlobalVariable.DIMENSION):
+        center = 2 * get_grid_index(nc, gnum[level])
+        fixed = ti.Vector.zero(int, GlobalVariable.DIMENSION)
+        for offset in ti.grouped(ti.ndrange(*([3] * GlobalVariable.DIMENSION))):
+            fine_index = center + offset - 1
+            if all(fine_index >= 0) and all(fine_index < gnum[level - 1]):
+                fine_dof0 = GlobalVariable.DIMENSION * linearize(fine_index, gnum[level - 1])
+                for d in ti.static(range(GlobalVariable.DIMENSION)):
+                    fixed[d] = ti.max(fixed[d], fine_fixed_dofs[fine_dof0 + d])
+        for d in ti.static(range(GlobalVariable.DIMENSION)):
+            fixed_dofs[GlobalVariable.DIMENSION * nc + d] = fixed[d]
+
+@ti.kernel
+def kernel_multigrid_restrict_from_nodes(cutoff: float, gnum: ti.template(), node: ti.template(), fine_fixed_dofs: ti.template(), fixed_dofs: ti.template(), fine_residual: ti.template(), rhs: ti.template()):
+    for i in range(rhs.shape[0]):
+        rhs[i] = 0.
+    for ng in range(node.shape[0]):
+        if node[ng, 0].m > cutoff:
+            fine_index = get_grid_index(ng, gnum[0])
+            residual = get_free_vector(node[ng, 0].dof, fine_fixed_dofs, fine_residual)
+            for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+                coarse_index, weight = get_coarse_weight(fine_index, offset)
+                if weight > 0.:
+                    dof0 = GlobalVariable.DIMENSION * linearize(coarse_index, gnum[1])
+                    for d in ti.static(range(GlobalVariable.DIMENSION)):
+                        rhs[dof0 + d] += weight * residual[d]
+    for i in range(rhs.shape[0]):
+        rhs[i] *= float(1 - fixed_dofs[i])
+
+@ti.kernel
+def kernel_multigrid_restrict_from_grid(level: int, gnum: ti.template(), fine_fixed_dofs: ti.template(), fixed_dofs: ti.template(), fine_residual: ti.template(), rhs: ti.template()):
+    for i in range(rhs.shape[0]):
+        rhs[i] = 0.
+    for nf in range(fine_residual.shape[0] // GlobalVariable.DIMENSION):
+        fine_index = get_grid_index(nf, gnum[level - 1])
+        residual = get_free_vector(GlobalVariable.DIMENSION * nf, fine_fixed_dofs, fine_residual)
+        for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+            coarse_index, weight = get_coarse_weight(fine_index, offset)
+            if weight > 0.:
+                dof0 = GlobalVariable.DIMENSION * linearize(coarse_index, gnum[level])
+                for d in ti.static(range(GlobalVariable.DIMENSION)):
+                    rhs[dof0 + d] += weight * residual[d]
+    for i in range(rhs.shape[0]):
+        rhs[i] *= float(1 - fixed_dofs[i])
+
+@ti.kernel
+def kernel_multigrid_prolongate_to_nodes(cutoff: float, gnum: ti.template(), node: ti.template(), fine_fixed_dofs: ti.template(), solution: ti.template(), fine_solution: ti.template()):
+    for ng in range(node.shape[0]):
+        if node[ng, 0].m > cutoff:
+            fine_index = get_grid_index(ng, gnum[0])
+            correction = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+            for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+                coarse_index, weight = get_coarse_weight(fine_index, offset)
+                if weight > 0.:
+                    dof0 = GlobalVariable.DIMENSION * linearize(coarse_index, gnum[1])
+                    for d in ti.static(range(GlobalVariable.DIMENSION)):
+                        correction[d] += weight * solution[dof0 + d]
+            fine_dof0 = node[ng, 0].dof
+            for d in ti.static(range(GlobalVariable.DIMENSION)):
+                fine_solution[fine_dof0 + d] += correction[d] * float(1 - fine_fixed_dofs[fine_dof0 + d])
+
+@ti.kernel
+def kernel_multigrid_prolongate_to_grid(level: int, gnum: ti.template(), fine_fixed_dofs: ti.template(), solution: ti.template(), fine_solution: ti.template()):
+    for nf in range(fine_solution.shape[0] // GlobalVariable.DIMENSION):
+        fine_index = get_grid_index(nf, gnum[level - 1])
+        correction = ti.Vector.zero(float, GlobalVariable.DIMENSION)
+        for offset in ti.grouped(ti.ndrange(*([2] * GlobalVariable.DIMENSION))):
+            coarse_index, weight = get_coarse_weight(fine_index, offset)
+            if weight > 0.:
+                dof0 = GlobalVariable.DIMENSION * linearize(coarse_index, gnum[level])
+                for d in ti.static(range(GlobalVariable.DIMENSION)):
+                    correction[d] += weight * solution[dof0 + d]
+        fine_dof0 = GlobalVariable.DIMENSION * nf
+        for d in ti.static(range(GlobalVariable.DIMENSION)):
+            fine_solution[fine_dof0 + d] += correction[d] * float(1 - fine_fixed_dofs[fine_dof0 + d])
+
+@ti.kernel
+def kernel_weighted_jacobi(length: int, omega: float, diagonal: ti.template(), rhs: ti.template(), product: ti.template(), solution: ti.template()):
+    for i in range(length):
+        solution[i] += omega * (rhs[i] - product[i]) / diagonal[i]
+
+@ti.kernel
+def kernel_vector_residual(length: int, rhs: ti.template(), product: ti.template(), residual: ti.template()):
+    for i in range(length):
+        residual[i] = rhs[i] - product[i]
+
+@ti.kernel
+def kernel_jacobi_power_iteration(length: int, diagonal: ti.template(), product: ti.template(), vector: ti.template()) -> float:
+    norm = 0.
+    for i in range(length):
+        vector[i] = product[i] / diagonal[i]
+        norm += vector[i] * vector[i]
+    return ti.sqrt(norm)
+
+@ti.kernel
+def kernel_vector_scale(length: int, factor: float, vector: ti.template()):
+    for i in range(length):
+        vector[i] *= factor
+
 # ========================================================= #
 #                  Incompressible flows                     #
 # ========================================================= #
@@ -0,0 +1,170 @@
+import taichi as ti
+
+from src.mpm.engines.EngineKernel import *
+from src.mpm.SceneManager import myScene
+from src.mpm.Simulation import Simulation
+from src.utils.MatrixSolver.LinearOperator import LinearOperator
+
+
+class MultigridPreconditioner(object):
+    """Geometric multigrid V-cycle used as preconditioner of the matrix-free tangent
+
+    Level 0 is the active background grid, coarser levels are dense grids with spacing h * 2^l
+    whose operators are rediscretized from the particle stiffness with linear hat functions.
+    Restriction is the transpose of the (bi/tri)linear prolongation and weighted Jacobi is used
+    for the symmetric pre/post smoothing, so that the V-cycle remains a valid PCG preconditioner.
+    Material points close to a node make rho(D^-1 A) vary strongly, hence the Jacobi weight of
+    each level is set from a short power iteration instead of the textbook 2/3.
+    """
+    sims: Simulation
+
+    def __init__(self, sims: Simulation, scene: myScene, fine_operator: LinearOperator, fine_length) -> None:
+        self.sims = sims
+        self.power_iteration = 10
+        self.omega = []
+        self.fine_operator = fine_operator
+        self.level_num = 0
+        self.length = []
+        self.mass = []
+        self.fixed_dofs = []
+        self.diagonal = []
+        self.rhs = []
+        self.solution = []
+        self.product = []
+        self.residual = []
+        self.mass_coeff = 0.
+        self.fine_length = 0
+        self.fine_fixed_dofs = None
+        self.fine_diagonal = None
+        self.operator = LinearOperator(self.vcycle)
+        self.initialize(scene, fine_length)
+
+    def initialize(self, scene: myScene, fine_length):
+        if scene.node.shape[1] > 1:
+            raise RuntimeError("Keyword:: /linear_solver/ MGPCG only supports a single grid layer")
+
+        gnums = [[int(n) for n in scene.element.gnum]]
+        grid_sizes = [[float(h) for h in scene.element.grid_size]]
+        for _ in range(self.sims.multilevel):
+            coarse_gnum = [n // 2 + 1 for n in gnums[-1]]
+            if min(coarse_gnum) < 3: break
+            gnums.append(coarse_gnum)
+            grid_sizes.append([2. * h for h in grid_sizes[-1]])
+        self.level_num = len(gnums) - 1
+        if self.level_num == 0:
+            raise RuntimeError("Keyword:: /multilevel/ The background grid is too coarse to build a multigrid hierarchy")
+
+        self.gnum = ti.Vector.field(self.sims.dimension, int, shape=self.level_num + 1)
+        self.grid_size = ti.Vector.field(self.sims.dimension, float, shape=self.level_num + 1)
+        for level in range(self.level_num + 1):
+            self.gnum[level] = gnums[level]
+            self.grid_size[level] = grid_sizes[level]
+
+        self.omega = [2. / 3.] * (self.level_num + 1)
+        self.residual.append(ti.field(float, shape=fine_length))
+        self.product.append(ti.field(float, shape=fine_length))
+        for level in range(1, self.level_num + 1):
+            node_num = 1
+            for n in gnums[level]: node_num *= n
+            length = self.sims.dimension * node_num
+            self.length.append(length)
+            self.mass.append(ti.field(float, shape=node_num))
+            self.fixed_dofs.append(ti.field(int, shape=length))
+            self.diagonal.append(ti.field(float, shape=length))
+            self.rhs.append(ti.field(float, shape=length))
+            self.solution.append(ti.field(float, shape=length))
+            self.product.append(ti.field(float, shape=length))
+            self.residual.append(ti.field(float, shape=length))
+        self.print_info(gnums)
+
+    def print_info(self, gnums):
+        print(" Multigrid Preconditioner Initialize ".center(71,"-"))
+        print("Number of coarse levels: ", self.level_num)
+        print("Pre- and post-smoothing steps: ", self.sims.pre_and_post_smoothing)
+        print("Bottom smoothing steps: ", self.sims.bottom_smoothing)
+        print("Coarsest grid nodes: ", gnums[-1], '\n')
+
+    def update(self, scene: myScene, mass_coeff, fine_length, fine_fixed_dofs, fine_diagonal, stiffness_matrix):
+        self.scene = scene
+        self.mass_coeff = mass_coeff
+        self.fine_length = fine_length
+        self.fine_fixed_dofs = fine_fixed_dofs
+        self.fine_diagonal = fine_diagonal
+        self.stiffness_matrix = stiffness_matrix
+        particleNum = int(scene.particleNum[0])
+        for level in range(1, self.level_num + 1):
+            kernel_multigrid_coarse_mass(particleNum, level, self.gnum, self.grid_size, scene.particle, self.mass[level - 1])
+            if level == 1:
+                kernel_multigrid_fixed_from_nodes(scene.mass_cut_off, self.gnum, scene.node, fine_fixed_dofs, self.fixed_dofs[0])
+            else:
+                kernel_multigrid_fixed_from_grid(level, self.gnum, self.fixed_dofs[level - 2], self.fixed_dofs[level - 1])
+            kernel_multigrid_coarse_diagonal(particleNum, level, mass_coeff, self.gnum, self.grid_size, scene.particle, stiffness_matrix,
+                                             self.mass[level - 1], self.fixed_dofs[level - 1], self.diagonal[level - 1])
+        for level in range(self.level_num + 1):
+            self.omega[level] = 4. / 3. / max(self.estimate_spectral_radius(level), 1.)
+
+    def matvec(self, level, x, Ax):
+        if level == 0:
+            self.fine_operator.matvec(x, Ax)
+        else:
+            self.coarse_matvec(level, x, Ax)
+
+    def estimate_spectral_radius(self, level):
+        # power iteration on D^-1 A, slightly enlarged since it approaches the largest eigenvalue from below
+        length = self.fine_length if level == 0 else self.length[level - 1]
+        diagonal = self.fine_diagonal if level == 0 else self.diagonal[level - 1]
+        vector = self.residual[level]
+        vector.fill(1)
+        kernel_vector_scale(length, 1. / max(length, 1) ** 0.5, vector)
+        spectral_radius = 0.
+        for _ in range(self.power_iteration):
+            self.matvec(level, vector, self.product[level])
+            spectral_radius = kernel_jacobi_power_iteration(length, diagonal, self.product[level], vector)
+            if spectral_radius == 0.: break
+            kernel_vector_scale(length, 1. / spectral_radius, vector)
+        return 1.1 * spectral_radius
+
+    def coarse_matvec(self, level, x, Ax):
+        kernel_multigrid_coarse_operator(int(self.scene.particleNum[0]), level, self.mass_coeff, self.gnum, self.grid_size, self.scene.particle, self.stiffness_matrix,
+                                         self.mass[level - 1], self.fixed_dofs[level - 1], x, Ax)
+
+    def smooth(self, level, iterations, rhs, solution):
+        length = self.fine_length if level == 0 else self.length[level - 1]
+        diagonal = self.fine_diagonal if level == 0 else self.diagonal[level - 1]
+        for _ in range(iterations):
+            self.matvec(level, solution, self.product[level])
+            kernel_weighted_jacobi(length, self.omega[level], diagonal, rhs, self.product[level], solution)
+
+    def compute_residual(self, level, rhs, solution):
+        length = self.fine_length if level == 0 else self.length[level - 1]
+        self.matvec(level, solution, self.product[level])
+        kernel_vector_residual(length, rhs, self.product[level], self.residual[level])
+
+    def restrict(self, level):
+        if level == 1:
+            kernel_multigrid_restrict_from_nodes(self.scene.mass_cut_off, self.gnum, self.scene.node, self.fine_fixed_dofs, self.fixed_dofs[0], self.residual[0], self.rhs[0])
+        else:
+            kernel_multigrid_restrict_from_grid(level, self.gnum, self.fixed_dofs[level - 2], self.fixed_dofs[level - 1], self.residual[level - 1], self.rhs[level - 1])
+
+    def prolongate(self, level, fine_solution):
+        if level == 1:
+            kernel_multigrid_prolongate_to_nodes(self.scene.mass_cut_off, self.gnum, self.scene.node, self.fine_fixed_dofs, self.solution[0], fine_solution)
+        else:
+            kernel_multigrid_prolongate_to_grid(level, self.gnum, self.fixed_dofs[level - 2], self.solution[level - 1], fine_solution)
+
+    def cycle(self, level, rhs, solution):
+        if level == self.level_num:
+            self.smooth(level, self.sims.bottom_smoothing, rhs, solution)
+            return
+
+        self.smooth(level, self.sims.pre_and_post_smoothing, rhs, solution)
+        self.compute_residual(level, rhs, solution)
+        self.restrict(level + 1)
+        self.solution[level].fill(0)
+        self.cycle(level + 1, self.rhs[level], self.solution[level])
+        self.prolongate(level + 1, solution)
+        self.smooth(level, self.sims.pre_and_post_smoothing, rhs, solution)
+
+    def vcycle(self, r, z):
+        z.fill(0)
+        self.cycle(0, r, z)
@@ -1,14 +1,16 @@
 from src.mpm.boundaries.BoundaryCore import *
 from src.mpm.engines.Engine import Engine
 from src.mpm.engines.EngineKernel import *
+from src.mpm.MortonReorder import MortonReorder
 from src.mpm.SceneManager import myScene
 from src.mpm.Simulation import Simulation
 from src.mpm.SpatialHashGrid import SpatialHashGrid
+from src.utils.linalg import no_operation
+from src.utils.PrefixSum import PrefixSumExecutor
 
 @ti.data_oriented
 class ULExplicitEngine(Engine):
     def __init__(self, sims) -> None:
-        self.input_layer = 0
         self.compute = None
         self.compute_stress_strains = None
         self.bulid_neighbor_list = None
@@ -31,6 +33,11 @@ class ULExplicitEngine(Engine):
         self.free_surface_by_geometry = None
         self.compute_velocity_gradient = None
         self.calculate_velocity_gradient = None
+        self.plastic_pse = None
+        self.plastic_flag = None
+        self.plastic_list = None
+        self.reset_g2p2g_grid = None
+        self.g2p2g_particle_num = -1
         super().__init__(sims)
 
     def choose_boundary_constraints(self, sims: Simulation, scene: myScene):
@@ -46,6 +53,8 @@ class ULExplicitEngine(Engine):
             self.apply_friction_constraints = self.friction_constraints
         if int(scene.boundary.absorbing_list[0]) > 0:
             self.apply_absorbing_constraints = self.absorbing_constraints
+        if sims.mode == "Lightweight" and int(scene.boundary.ptraction_list[0]) > 0:
+            self.apply_particle_traction_constraints = self.lightweight_particle_traction_constraints
 
     def calculate_precontact_2DAxisy(self, sims: Simulation, scene: myScene):
         kernel_calc_contact_normal_2DAxisy(scene.element.grid_nodes, int(scene.particleNum[0]), scene.node, scene.particle, scene.element.LnID, scene.element.dshape_fn, scene.element.node_size)
@@ -137,6 +146,122 @@ class ULExplicitEngine(Engine):
         kernel_update_velocity_gradient_bbar_2DAxisy(scene.element.grid_nodes, int(scene.particleNum[0]), sims.dt, scene.node, scene.particle, scene.material.matProps, scene.material.stateVars,
                                                      scene.element.LnID, scene.element.shape_fn, scene.element.shape_fnc, scene.element.dshape_fn, scene.element.dshape_fnc, scene.element.node_size)
 
+    def valid_g2p2g(self, sims: Simulation):
+        if sims.configuration != "ULMPM" or sims.material_type == "TwoPhaseSingleLayer":
+            raise RuntimeError("Keyword:: /mapping/ G2P2G is only supported by the single phase ULMPM")
+        if sims.dimension == 2 and sims.is_2DAxisy:
+            raise RuntimeError("Keyword:: /mapping/ G2P2G is not supported by the axisymmetric condition")
+        if sims.shape_function not in ["Linear", "GIMP", "QuadBSpline", "CubicBSpline"] or sims.isTHB:
+            raise RuntimeError(f"Keyword:: /mapping/ G2P2G is not supported by the {sims.shape_function} shape function")
+        if sims.stabilize is not None or sims.gauss_number > 0:
+            raise RuntimeError("Keyword:: /mapping/ G2P2G is not supported by the B-bar, F-bar and gauss cell stabilizations")
+        if sims.mls or sims.velocity_projection_scheme == "Affine" or sims.velocity_projection_scheme == "Taylor":
+            raise RuntimeError("Keyword:: /mapping/ G2P2G is not supported by the affine and taylor velocity projections")
+        if sims.contact_detection or sims.neighbor_detection or sims.coupling:
+            raise RuntimeError("Keyword:: /mapping/ G2P2G is not supported with contact detection and coupling")
+        if sims.pressure_smoothing:
+            raise RuntimeError("Keyword:: /mapping/ G2P2G is not supported with pressure smoothing")
+
+    def choose_lightweight(self, sims: Simulation):
+        if sims.configuration != "ULMPM" or sims.material_type == "TwoPhaseSingleLayer":
+            raise RuntimeError("Keyword:: /mode/ Lightweight is only supported by the single phase ULMPM")
+        if sims.dimension == 2 and sims.is_2DAxisy:
+            raise RuntimeError("Keyword:: /mode/ Lightweight is not supported by the axisymmetric condition")
+        if sims.shape_function not in ["Linear", "GIMP", "QuadBSpline", "CubicBSpline"] or sims.isTHB:
+            raise RuntimeError(f"Keyword:: /mode/ Lightweight is not supported by the {sims.shape_function} shape function")
+        if sims.stabilize == "B-Bar Method" and sims.shape_function not in ["Linear", "GIMP"]:
+            raise RuntimeError("Keyword:: /stabilize/ B-bar method is only supported by the Linear and GIMP shape functions in lightweight mode")
+        if sims.stabilize == "F-Bar Method" and sims.material_type != "Solid":
+            raise RuntimeError("Keyword:: /stabilize/ F-bar method is only supported by solid materials in lightweight mode")
+        if sims.gauss_number > 0 or sims.pressure_smoothing or sims.particle_shifting:
+            raise RuntimeError("Keyword:: /mode/ Lightweight is not supported with gauss cells, pressure smoothing and particle shifting")
+        if sims.mls:
+            raise RuntimeError("Keyword:: /mode/ Lightweight is not supported by moving least squares, use /velocity_projection_scheme/ Affine instead")
+        if sims.contact_detection and sims.contact_detection != "MPMContact":
+            raise RuntimeError(f"Keyword:: /contact_detection/ {sims.contact_detection} is not supported by lightweight mode")
+        if sims.ptraction_method == "Virtual":
+            raise RuntimeError("Keyword:: /ptraction_method/ Virtual is not supported by lightweight mode")
+
+        if sims.stabilize == "F-Bar Method":
+            self.compute_lightweight_stress = self.lightweight_stress_fbar
+            self.compute_lightweight_particle = self.lightweight_particle_fbar
+        else:
+            self.compute_lightweight_stress = self.lightweight_stress
+            self.compute_lightweight_particle = self.lightweight_particle
+        if sims.contact_detection == "MPMContact":
+            self.pre_contact_calculate = self.lightweight_precontact
+        if sims.neighbor_detection:
+            self.free_surface_by_density = self.lightweight_free_surface_by_density
+
+    def dispatch_by_model(self, sims: Simulation):
+        if sims.configuration != "ULMPM" or sims.material_type == "TwoPhaseSingleLayer":
+            raise RuntimeError("Several constitutive models are only supported by the single phase ULMPM")
+        if sims.mode != "Normal" or sims.mapping == "G2P2G":
+            raise RuntimeError("Keyword:: /mapping/ Several constitutive models are not supported by G2P2G and lightweight modes")
+        if sims.neighbor_detection:
+            raise RuntimeError("Neighbor detection is not supported with several constitutive models")
+        if sims.contact_detection == "DEMContact":
+            raise RuntimeError("Keyword:: /contact_detection/ DEMContact is not supported with several constitutive models")
+
+        dispatch = {self.compute_stress_strain: self.compute_stress_strain_by_model, self.compute_stress_strain_2D: self.compute_stress_strain_by_model_2D,
+                    self.update_velocity_gradient: self.update_velocity_gradient_by_model, self.update_velocity_gradient_2D: self.update_velocity_gradient_by_model_2D}
+        valid = [no_operation, self.update_velocity_gradient_fbar]
+        for name in ["compute_stress_strains", "compute_velocity_gradient", "calculate_velocity_gradient"]:
+            function = getattr(self, name)
+            if function in dispatch:
+                setattr(self, name, dispatch[function])
+            elif function not in valid:
+                raise RuntimeError(f"{function.__name__} is not supported with several constitutive models")
+
+    def choose_elastic_predictor(self, sims: Simulation):
+        if sims.configuration != "ULMPM" or sims.material_type == "TwoPhaseSingleLayer":
+            raise RuntimeError("Keyword:: /elastic_predictor/ is only supported by the single phase ULMPM")
+        if sims.mode != "Normal" or sims.mapping == "G2P2G":
+            raise RuntimeError("Keyword:: /elastic_predictor/ is not supported by G2P2G and lightweight modes")
+        if self.compute_stress_strains == self.compute_stress_strain:
+            self.compute_stress_strains = self.compute_stress_strain_elastic_predictor
+        elif self.compute_stress_strains == self.compute_stress_strain_2D:
+            self.compute_stress_strains = self.compute_stress_strain_elastic_predictor_2D
+        else:
+            raise RuntimeError(f"Keyword:: /elastic_predictor/ is not supported with {self.compute_stress_strains.__name__}")
+
+        # yielding particles are compacted by an inclusive prefix sum of their flags
+        self.plastic_pse = PrefixSumExecutor(sims.max_particle_num + 1)
+        self.plastic_flag = ti.field(int, shape=self.plastic_pse.get_length())
+        self.plastic_list = ti.field(int, shape=sims.max_particle_num)
+
+    def compute_stress_strain_elastic_predictor(self, sims: Simulation, scene: myScene):
+        kernel_elastic_predictor(int(scene.particleNum[0]), sims.dt, scene.particle, scene.material.matProps, scene.material.stateVars, self.plastic_flag)
+        self.plastic_pse.run(self.plastic_flag)
+        plastic_num = kernel_compact_plastic_particles(int(scene.particleNum[0]), self.plastic_flag, self.plastic_list)
+        if plastic_num > 0:
+            kernel_return_mapping(plastic_num, self.plastic_list, sims.dt, scene.particle, scene.material.matProps, scene.material.stateVars)
+
+    def compute_stress_strain_elastic_predictor_2D(self, sims: Simulation, scene: myScene):
+        kernel_elastic_predictor_2D(int(scene.particleNum[0]), sims.dt, scene.particle, scene.material.matProps, scene.material.stateVars, self.plastic_flag)
+        self.plastic_pse.run(self.plastic_flag)
+        plastic_num = kernel_compact_plastic_particles(int(scene.particleNum[0]), self.plastic_flag, self.plastic_list)
+        if plastic_num > 0:
+            kernel_return_mapping_2D(plastic_num, self.plastic_list, sims.dt, scene.particle, scene.material.matProps, scene.material.stateVars)
+
+    def compute_stress_strain_by_model(self, sims: Simulation, scene: myScene):
+        for start_index, end_index, model in scene.material.particle_ranges(int(scene.particleNum[0]), scene.particle):
+            kernel_compute_stress_strain_by_model(start_index, end_index, scene.material.particle_index, sims.dt, scene.particle, model.matProps, model.stateVars)
+
+    def compute_stress_strain_by_model_2D(self, sims: Simulation, scene: myScene):
+        for start_index, end_index, model in scene.material.particle_ranges(int(scene.particleNum[0]), scene.particle):
+            kernel_compute_stress_strain_by_model_2D(start_index, end_index, scene.material.particle_index, sims.dt, scene.particle, model.matProps, model.stateVars)
+
+    def update_velocity_gradient_by_model(self, sims: Simulation, scene: myScene):
+        for start_index, end_index, model in scene.material.particle_ranges(int(scene.particleNum[0]), scene.particle):
+            kernel_update_velocity_gradient_by_model(start_index, end_index, scene.material.particle_index, scene.element.grid_nodes, sims.dt, scene.node, scene.particle, model.matProps, 
+                                                     model.stateVars, scene.element.LnID, scene.element.dshape_fn, scene.element.node_size)
+
+    def update_velocity_gradient_by_model_2D(self, sims: Simulation, scene: myScene):
+        for start_index, end_index, model in scene.material.particle_ranges(int(scene.particleNum[0]), scene.particle):
+            kernel_update_velocity_gradient_by_model_2D(start_index, end_index, scene.material.particle_index, scene.element.grid_nodes, sims.dt, scene.node, scene.particle, model.matProps, 
+                                                        model.stateVars, scene.element.LnID, scene.element.dshape_fn, scene.element.node_size)
+
     def particle_shifting(self, sims: Simulation, scene: myScene):
         scene.node.vol.fill(0)
         kernel_volume_p2g(scene.element.grid_nodes, int(scene.particleNum[0]), scene.node, scene.particle, scene.element.LnID, scene.element.shape_fn, scene.element.node_size)
@@ -245,13 +370,27 @@ class ULExplicitEngine(Engine):
         if sims.neighbor_detection:
             grid_mass_reset(scene.mass_cut_off, scene.node)
             scene.check_in_domain(sims)
-            self.find_free_surface_by_density(sims, scene)
+            self.free_surface_by_density(sims, scene)
             neighbor.place_particles(scene)
             self.compute_boundary_direction(scene, neighbor)
             self.free_surface_by_geometry(scene, neighbor)
             grid_mass_reset(scene.mass_cut_off, scene.node)
+        self.reorder_initialize(sims, scene)
         self.limit = sims.verlet_distance * sims.verlet_distance
 
+    def reorder_initialize(self, sims: Simulation, scene: myScene):
+        if sims.reorder_interval > 0 and self.reorderer is None:
+            self.reorderer = MortonReorder(sims)
+            self.reorderer.reorder_initialize(scene)
+
+    def morton_reorder(self, sims: Simulation, scene: myScene, neighbor: SpatialHashGrid):
+        if self.reorderer.update(scene):
+            # the particle bins and the shape functions kept by G2P2G refer to the previous particle order, the grid is kept as it is
+            if sims.neighbor_detection:
+                neighbor.place_particles(scene)
+            if sims.mapping == "G2P2G":
+                self.calculate_interpolation(sims, scene)
+
     def usl_updating(self, sims: Simulation, scene: myScene):
         self.calculate_interpolation(sims, scene)
         self.compute_nodal_kinematic(sims, scene)
@@ -325,24 +464,128 @@ class ULExplicitEngine(Engine):
         self.compute_velocity_gradient(sims, scene)
         self.compute_particle_kinematic(sims, scene)
 
-    def g2p2g(self, sims: Simulation, scene: myScene, neighbor: SpatialHashGrid):
-        self.output_layer = 1 - self.input_layer
-        g2p2g(scene.element.grid_nodes, int(scene.particleNum[0]), scene.element.grid_size, scene.element.igrid_size, sims.gravity, sims.dt, scene.node[self.output_layer],
-              scene.node[self.input_layer], scene.particle, scene.element.LnID, scene.element.shape_fn, scene.element.node_size, scene.material.matProps, scene.material.stateVars, neighbor.sorted.object_list)
+    def g2p2g_grid_update(self, sims: Simulation, scene: myScene):
+        self.compute_grid_velcity(sims, scene)
+        self.apply_particle_traction_constraints(sims, scene)
+        self.apply_traction_constraints(sims, scene)
+        self.apply_absorbing_constraints(sims, scene)
         self.compute_grid_kinematic(sims, scene)
         self.apply_kinematic_constraints(sims, scene)
-        self.input_layer = self.output_layer
+
+    def g2p2g(self, sims: Simulation, scene: myScene):
+        # the first step (or any change of the particle storage) starts from a plain P2G, so that the grid read by G2P matches the particles
+        if self.g2p2g_particle_num != int(scene.particleNum[0]):
+            self.g2p2g_particle_num = int(scene.particleNum[0])
+            self.reset_g2p2g_grid(scene)
+            self.calculate_interpolation(sims, scene)
+            self.compute_nodal_kinematic(sims, scene)
+            self.compute_forces(sims, scene)
+            self.g2p2g_grid_update(sims, scene)
+
+        scene.switch_grid()
+        self.reset_g2p2g_grid(scene)
+        kernel_g2p2g(scene.element.grid_nodes, scene.element.influenced_node, scene.element.grid_size, scene.element.igrid_size, scene.element.gnum, int(scene.particleNum[0]), sims.alphaPIC, 
+                     sims.gravity, sims.dt, scene.grid[1], scene.node, scene.particle, scene.material.matProps, scene.material.stateVars, scene.element.calLength, scene.element.LnID, 
+                     scene.element.shape_fn, scene.element.dshape_fn, scene.element.node_size, scene.element.boundary_type, scene.element.shape_function, scene.element.grad_shape_function, 
+                     scene.element.update_shape_fn)
+        self.g2p2g_grid_update(sims, scene)
+
+    def lightweight_mass_momentum_p2g(self, sims: Simulation, scene: myScene):
+        lightweight_p2g(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.gravity, scene.element.calLength, scene.element.boundary_type, 
+                        scene.node, scene.particle, True, False)
+
+    def lightweight_force_p2g(self, sims: Simulation, scene: myScene):
+        lightweight_p2g(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.gravity, scene.element.calLength, scene.element.boundary_type, 
+                        scene.node, scene.particle, False, True)
+
+    def lightweight_mass_momentum_force_p2g(self, sims: Simulation, scene: myScene):
+        lightweight_p2g(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.gravity, scene.element.calLength, scene.element.boundary_type, 
+                        scene.node, scene.particle, True, True)
+
+    def lightweight_kinematic_g2p(self, sims: Simulation, scene: myScene):
+        lightweight_g2p(int(scene.particleNum[0]), sims.alphaPIC, scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, scene.element.boundary_type, 
+                        scene.node, scene.particle, scene.material.matProps, scene.material.stateVars, True, False)
+
+    def lightweight_stress(self, sims: Simulation, scene: myScene):
+        lightweight_g2p(int(scene.particleNum[0]), sims.alphaPIC, scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, scene.element.boundary_type, 
+                        scene.node, scene.particle, scene.material.matProps, scene.material.stateVars, False, True)
+
+    def lightweight_particle(self, sims: Simulation, scene: myScene):
+        lightweight_g2p(int(scene.particleNum[0]), sims.alphaPIC, scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, scene.element.boundary_type, 
+                        scene.node, scene.particle, scene.material.matProps, scene.material.stateVars, True, True)
+
+    def lightweight_jacobian(self, sims: Simulation, scene: myScene):
+        self.lightweight_stress(sims, scene)
+        scene.node.jacobian.fill(0)
+        lightweight_jacobian_p2g(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, scene.element.boundary_type, 
+                                 scene.node, scene.particle)
+        kernel_grid_jacobian(scene.volume_cut_off, scene.is_rigid, scene.node)
+
+    def lightweight_stress_fbar(self, sims: Simulation, scene: myScene):
+        self.lightweight_jacobian(sims, scene)
+        lightweight_fbar_g2p(int(scene.particleNum[0]), sims.alphaPIC, sims.fbar_fraction, scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, 
+                             scene.element.boundary_type, scene.node, scene.particle, scene.material.matProps, scene.material.stateVars, False)
+
+    def lightweight_particle_fbar(self, sims: Simulation, scene: myScene):
+        self.lightweight_jacobian(sims, scene)
+        lightweight_fbar_g2p(int(scene.particleNum[0]), sims.alphaPIC, sims.fbar_fraction, scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, 
+                             scene.element.boundary_type, scene.node, scene.particle, scene.material.matProps, scene.material.stateVars, True)
+
+    def lightweight_postmapping_grid_velocity(self, sims: Simulation, scene: myScene):
+        kernel_reset_grid_velocity(scene.node)
+        lightweight_postmapping_p2g(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, scene.element.calLength, scene.element.boundary_type, 
+                                    scene.node, scene.particle)
+
+    def lightweight_precontact(self, sims: Simulation, scene: myScene):
+        lightweight_contact_normal(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, scene.element.calLength, scene.element.boundary_type, 
+                                   scene.node, scene.particle)
+
+    def lightweight_particle_traction_constraints(self, sims: Simulation, scene: myScene):
+        lightweight_particle_traction(int(scene.boundary.ptraction_list[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, 
+                                      scene.element.boundary_type, scene.boundary.particle_traction, scene.node, scene.particle)
 
     def lightweight(self, sims: Simulation, scene: myScene):
-        lightweight_p2g(int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.gravity, scene.element.calLength, scene.element.boundary_type, scene.node, scene.particle)
+        self.lightweight_mass_momentum_force_p2g(sims, scene)
+        self.compute_grid_velcity(sims, scene)
+        self.apply_particle_traction_constraints(sims, scene)
+        self.apply_traction_constraints(sims, scene)
+        self.apply_absorbing_constraints(sims, scene)
+        self.compute_grid_kinematic(sims, scene)
+        self.pre_contact_calculate(sims, scene)
+        self.apply_kinematic_constraints(sims, scene)
+        self.compute_contact_force_(sims, scene)
+        self.compute_lightweight_particle(sims, scene)
+
+    def lightweight_usf(self, sims: Simulation, scene: myScene):
+        self.lightweight_mass_momentum_p2g(sims, scene)
+        self.compute_grid_velcity(sims, scene)
+        self.apply_dirichlet_constraints(sims, scene)
+        self.compute_lightweight_stress(sims, scene)
         self.apply_particle_traction_constraints(sims, scene)
+        self.lightweight_force_p2g(sims, scene)
         self.apply_traction_constraints(sims, scene)
         self.apply_absorbing_constraints(sims, scene)
-        lightweight_grid_operation(scene.mass_cut_off, sims.background_damping, scene.node, sims.dt)
+        self.compute_grid_kinematic(sims, scene)
         self.pre_contact_calculate(sims, scene)
         self.apply_kinematic_constraints(sims, scene)
         self.compute_contact_force_(sims, scene)
-        lightweight_g2p(int(scene.particleNum[0]), sims.alphaPIC, scene.mass_cut_off, sims.fbar_fraction, scene.element.gnum, scene.element.grid_size, scene.element.igrid_size, sims.dt, scene.element.calLength, scene.element.boundary_type, scene.node, scene.particle, scene.material.matProps, scene.material.stateVars)
+        self.lightweight_kinematic_g2p(sims, scene)
+
+    def lightweight_musl(self, sims: Simulation, scene: myScene):
+        self.lightweight_mass_momentum_force_p2g(sims, scene)
+        self.compute_grid_velcity(sims, scene)
+        self.apply_particle_traction_constraints(sims, scene)
+        self.apply_traction_constraints(sims, scene)
+        self.apply_absorbing_constraints(sims, scene)
+        self.compute_grid_kinematic(sims, scene)
+        self.pre_contact_calculate(sims, scene)
+        self.apply_kinematic_constraints(sims, scene)
+        self.compute_contact_force_(sims, scene)
+        self.lightweight_kinematic_g2p(sims, scene)
+        self.lightweight_postmapping_grid_velocity(sims, scene)
+        self.compute_grid_velcity(sims, scene)
+        self.apply_kinematic_constraints(sims, scene)
+        self.compute_lightweight_stress(sims, scene)
 
     def test(self, sims: Simulation, scene: myScene):
         pass
\ No newline at end of file
@@ -12,6 +12,10 @@ class ULExplicitTwoPhaseEngine(ULExplicitEngine):
     def __init__(self, sims) -> None:
         super().__init__(sims)
 
+    def calculate_critical_timestep(self, sims: Simulation, scene: myScene):
+        max_wave_speed = kernel_find_max_wave_speed_twophase(int(scene.particleNum[0]), scene.particle, scene.material.matProps)
+        return scene.element.calc_critical_timestep(max_wave_speed)
+
     def compute_particle_kinematics(self, sims: Simulation, scene: myScene):
         kernel_kinemaitc_g2p_twophase(scene.element.grid_nodes, sims.alphaPIC, sims.dt, int(scene.particleNum[0]), scene.node, scene.particle, scene.element.LnID, scene.element.shape_fn, scene.element.node_size)
 
@@ -81,9 +85,10 @@ class ULExplicitTwoPhaseEngine(ULExplicitEngine):
         if sims.neighbor_detection:
             grid_mass_reset(scene.mass_cut_off, scene.node)
             scene.check_in_domain(sims)
-            self.find_free_surface_by_density(sims, scene)
+            self.free_surface_by_density(sims, scene)
             neighbor.place_particles(scene)
             self.compute_boundary_direction(scene, neighbor)
             self.free_surface_by_geometry(scene, neighbor)
             grid_mass_reset(scene.mass_cut_off, scene.node)
+        self.reorder_initialize(sims, scene)
         self.limit = sims.verlet_distance * sims.verlet_distance
\ No newline at end of file
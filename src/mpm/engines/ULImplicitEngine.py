@@ -0,0 +1,294 @@
+import taichi as ti
+
+from src.mpm.boundaries.BoundaryCore import *
+from src.mpm.engines.Engine import Engine
+from src.mpm.engines.EngineKernel import *
+from src.mpm.engines.MultigridPreconditioner import MultigridPreconditioner
+from src.mpm.SceneManager import myScene
+from src.mpm.Simulation import Simulation
+from src.mpm.SpatialHashGrid import SpatialHashGrid
+from src.utils.constants import Threshold
+from src.utils.linalg import no_operation
+from src.utils.MatrixSolver.LinearOperator import LinearOperator
+from src.utils.MatrixSolver.MatrixFreePCG import MatrixFreePCG
+
+
+class ImplicitEngine(Engine):
+    """Implicit updated Lagrangian MPM with Newmark time integration
+
+    Each step solves the nodal displacement increment with a Newton-Raphson loop. The tangent
+    K = sum_p vol_p B_p^T D_p B_p + M / (beta * dt^2) is never assembled: its action is evaluated
+    particle by particle from the consistent stiffness returned by the constitutive model, and the
+    linear systems are solved by PCG with either a Jacobi or a geometric multigrid preconditioner.
+    Prescribed displacement (and velocity * dt) increments are imposed before the Newton loop, so
+    the corresponding rows are identity in the tangent and zero in the residual.
+    """
+    def __init__(self, sims) -> None:
+        self.compute_stress_strains = None
+        self.compute_displacement_gradient = None
+        self.compute_internal_forces = None
+        self.apply_traction_constraints = None
+        self.apply_velocity_constraints = None
+        self.apply_displacement_constraints = None
+        self.precondition = None
+
+        self.max_dofs = 0
+        self.total_dofs = 0
+        self.mass_coeff = 0.
+        self.is_dynamic = 0
+        self.fixed_dofs = None
+        self.prescribed_value = None
+        self.residual = None
+        self.increment = None
+        self.diagonal = None
+        self.dof_mass = None
+        self.state_vars_backup = {}
+        self.linear_solver = None
+        self.multigrid = None
+        self.tangent_operator = LinearOperator(self.tangent_matvec)
+        super().__init__(sims)
+
+    def choose_engine(self, sims: Simulation):
+        if sims.mode != "Normal":
+            raise RuntimeError(f"Keyword:: /mode/ {sims.mode} is not supported by the implicit engine")
+        if sims.integration_scheme == "Newmark":
+            self.compute = self.newmark_integrate
+        else:
+            raise ValueError(f"Keyword:: /integration_scheme/ {sims.integration_scheme} is not supported yet")
+
+    def choose_boundary_constraints(self, sims: Simulation, scene: myScene):
+        super().choose_boundary_constraints(sims, scene)
+        if int(scene.boundary.reflection_list[0]) > 0 or int(scene.boundary.friction_list[0]) > 0 or int(scene.boundary.absorbing_list[0]) > 0:
+            raise RuntimeError("Reflection, friction and absorbing constraints are not supported by the implicit engine")
+
+        self.apply_displacement_constraints = no_operation
+        if int(scene.boundary.displacement_list[0]) > 0:
+            self.apply_displacement_constraints = self.displacement_constraints
+
+    def manage_function(self, sims: Simulation):
+        if sims.contact_detection:
+            raise RuntimeError("Keyword:: /contact_detection/ Contact is not supported by the implicit engine")
+        if sims.sparse_grid:
+            raise RuntimeError("Keyword:: /sparse_grid/ Sparse grid is not supported by the implicit engine")
+        if sims.neighbor_detection:
+            raise RuntimeError("Neighbor detection is not supported by the implicit engine")
+        if sims.stabilize == "B-Bar Method" or sims.stabilize == "F-Bar Method":
+            raise RuntimeError(f"Keyword:: /stabilize/ {sims.stabilize} is not supported by the implicit engine")
+        if sims.is_2DAxisy:
+            raise RuntimeError("Axisymmetric condition is not supported by the implicit engine")
+        if sims.constitutive_model_num > 1:
+            raise RuntimeError("Several constitutive models are not supported by the implicit engine")
+        if sims.elastic_predictor:
+            raise RuntimeError("Keyword:: /elastic_predictor/ is not supported by the implicit engine")
+        if sims.assemble_type != "MatrixFree":
+            raise RuntimeError(f"Keyword:: /assemble_type/ {sims.assemble_type} is not supported yet")
+        if sims.linear_solver == "BiCG":
+            raise RuntimeError("Keyword:: /linear_solver/ The matrix-free tangent is symmetric, CG/PCG/MGPCG should be used")
+
+        self.pre_contact_calculate = no_operation
+        self.compute_contact_force_ = no_operation
+        self.pressure_smoothing_ = no_operation
+        self.bulid_neighbor_list = no_operation
+        self.execute_board_serach = no_operation
+        self.system_resolve = no_operation
+        self.compute_nodal_kinematic = no_operation
+        self.calculate_interpolation = self.calculate_interpolations
+
+        if sims.dimension == 3:
+            self.compute_stress_strains = self.compute_stress_strain
+            self.compute_displacement_gradient = self.update_displacement_gradient
+            self.compute_internal_forces = self.compute_internal_force
+            self.update_nodal_displacements = self.update_nodal_displacement
+        elif sims.dimension == 2:
+            self.compute_stress_strains = self.compute_stress_strain_2D
+            self.compute_displacement_gradient = self.update_displacement_gradient_2D
+            self.compute_internal_forces = self.compute_internal_force_2D
+            self.update_nodal_displacements = self.update_nodal_displacement_2D
+
+        if sims.velocity_projection_scheme == "Affine":
+            if sims.dimension == 3:
+                self.compute_displacement_gradient = self.update_displacement_gradient_affine
+            elif sims.dimension == 2:
+                self.compute_displacement_gradient = self.update_displacement_gradient_affine_2D
+
+        self.precondition = self.jacobi_preconditioner
+        if sims.linear_solver == "CG":
+            self.precondition = self.identity_preconditioner
+        elif sims.linear_solver == "MGPCG":
+            self.precondition = self.multigrid_preconditioner
+
+    def pre_calculation(self, sims: Simulation, scene: myScene, neighbor: SpatialHashGrid):
+        scene.element.calculate_characteristic_length(sims, int(scene.particleNum[0]), scene.particle, scene.psize)
+        self.mass_coeff = 0. if sims.quasi_static else 1. / (sims.newmark_beta * sims.delta * sims.delta)
+        self.is_dynamic = 0 if sims.quasi_static else 1
+        if self.linear_solver is None:
+            self.calculate_interpolation(sims, scene)
+            self.compute_nodal_kinematics(sims, scene)
+            estimate_dofs = int(scene.element.initial_estimate_active_dofs(scene.mass_cut_off, scene.node))
+            self.reset_grid_message(scene)
+
+            self.max_dofs = min(sims.dimension * scene.element.gridSum * scene.node.shape[1], max(int(sims.dof_multiplier * estimate_dofs), 1))
+            self.fixed_dofs = ti.field(int, shape=self.max_dofs)
+            self.prescribed_value = ti.field(float, shape=self.max_dofs)
+            self.residual = ti.field(float, shape=self.max_dofs)
+            self.increment = ti.field(float, shape=self.max_dofs)
+            self.diagonal = ti.field(float, shape=self.max_dofs)
+            self.dof_mass = ti.field(float, shape=self.max_dofs)
+            self.linear_solver = MatrixFreePCG(self.max_dofs)
+            self.allocate_state_vars_backup(scene.material.stateVars)
+            if sims.linear_solver == "MGPCG":
+                self.multigrid = MultigridPreconditioner(sims, scene, self.tangent_operator, self.max_dofs)
+            self.print_info(sims)
+
+    def print_info(self, sims: Simulation):
+        print(" Implicit Solver Initialize ".center(71,"-"))
+        print("Integration scheme: ", sims.integration_scheme, "(quasi-static)" if sims.quasi_static else "")
+        print("Newmark parameters [gamma, beta]: ", [sims.newmark_gamma, sims.newmark_beta])
+        print("Linear solver: ", sims.linear_solver)
+        print("Maximum number of unknowns: ", self.max_dofs, '\n')
+
+    def allocate_state_vars_backup(self, state_vars):
+        # plastic models update their internal variables in place, so each Newton iteration must restart from the converged state
+        for name, member in state_vars.field_dict.items():
+            if isinstance(member, ti.lang.matrix.MatrixField):
+                if member.ndim == 1:
+                    self.state_vars_backup[name] = ti.Vector.field(member.n, member.dtype, shape=member.shape)
+                else:
+                    self.state_vars_backup[name] = ti.Matrix.field(member.n, member.m, member.dtype, shape=member.shape)
+            else:
+                self.state_vars_backup[name] = ti.field(member.dtype, shape=member.shape)
+
+    def backup_state_vars(self, scene: myScene):
+        for name, backup in self.state_vars_backup.items():
+            backup.copy_from(scene.material.stateVars.field_dict[name])
+
+    def restore_state_vars(self, scene: myScene):
+        for name, backup in self.state_vars_backup.items():
+            scene.material.stateVars.field_dict[name].copy_from(backup)
+
+    def reset_grid_message(self, scene: myScene):
+        grid_reset(scene.mass_cut_off, scene.node)
+        scene.node.dof.fill(-1)
+
+    def compute_nodal_kinematics(self, sims: Simulation, scene: myScene):
+        kernel_mass_momentum_acceleration_force_ip2g(scene.element.grid_nodes, int(scene.particleNum[0]), sims.gravity, scene.node, scene.particle, scene.element.LnID, scene.element.shape_fn, scene.element.node_size)
+
+    def compute_grid_velocity_acceleration(self, sims: Simulation, scene: myScene):
+        kernel_compute_grid_velocity_acceleration(scene.mass_cut_off, scene.node)
+
+    def traction_constraints(self, sims: Simulation, scene: myScene):
+        apply_traction_constraint(int(scene.boundary.traction_list[0]), scene.boundary.traction_boundary, scene.node)
+
+    def traction_constraints_2D(self, sims: Simulation, scene: myScene):
+        apply_traction_constraint_2D(int(scene.boundary.traction_list[0]), scene.boundary.traction_boundary, scene.node)
+
+    def velocity_constraints(self, sims: Simulation, scene: myScene):
+        kernel_find_velocity_dofs(scene.mass_cut_off, int(scene.boundary.velocity_list[0]), scene.boundary.velocity_boundary, scene.node, self.fixed_dofs, self.prescribed_value, sims.dt)
+
+    def displacement_constraints(self, sims: Simulation, scene: myScene):
+        kernel_find_displacement_dofs(scene.mass_cut_off, int(scene.boundary.displacement_list[0]), scene.boundary.displacement_boundary, scene.node, self.fixed_dofs, self.prescribed_value)
+
+    def find_active_dofs(self, sims: Simulation, scene: myScene):
+        self.total_dofs = int(scene.element.find_active_nodes(scene.mass_cut_off, scene.node))
+        if self.total_dofs > self.max_dofs:
+            raise RuntimeError(f"Keyword:: /dof_multiplier/ The number of unknowns {self.total_dofs} exceeds the allocated size {self.max_dofs}, please enlarge /dof_multiplier/")
+        self.fixed_dofs.fill(0)
+        self.prescribed_value.fill(0)
+        self.apply_velocity_constraints(sims, scene)
+        self.apply_displacement_constraints(sims, scene)
+        kernel_compute_dof_mass(scene.mass_cut_off, self.mass_coeff, scene.node, self.dof_mass)
+        self.update_nodal_displacements(sims, scene, self.prescribed_value)
+
+    def update_nodal_displacement(self, sims: Simulation, scene: myScene, unknown_vector):
+        kernel_update_nodal_disp(scene.mass_cut_off, scene.node, unknown_vector)
+
+    def update_nodal_displacement_2D(self, sims: Simulation, scene: myScene, unknown_vector):
+        kernel_update_nodal_disp_2D(scene.mass_cut_off, scene.node, unknown_vector)
+
+    def update_displacement_gradient(self, sims: Simulation, scene: myScene):
+        kernel_update_displacement_gradient(scene.element.grid_nodes, int(scene.particleNum[0]), sims.dt, scene.node, scene.particle, scene.material.matProps, scene.material.stateVars,
+                                            scene.element.LnID, scene.element.dshape_fn, scene.element.node_size)
+
+    def update_displacement_gradient_2D(self, sims: Simulation, scene: myScene):
+        kernel_update_displacement_gradient_2D(scene.element.grid_nodes, int(scene.particleNum[0]), sims.dt, scene.node, scene.particle, scene.material.matProps, scene.material.stateVars,
+                                               scene.element.LnID, scene.element.dshape_fn, scene.element.node_size)
+
+    def update_displacement_gradient_affine(self, sims: Simulation, scene: myScene):
+        kernel_update_displacement_gradient_affine(scene.element.grid_nodes, int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, sims.dt, scene.node, scene.particle,
+                                                   scene.material.matProps, scene.material.stateVars, scene.element.LnID, scene.element.shape_fn, scene.element.node_size)
+
+    def update_displacement_gradient_affine_2D(self, sims: Simulation, scene: myScene):
+        kernel_update_displacement_gradient_affine_2D(scene.element.grid_nodes, int(scene.particleNum[0]), scene.element.gnum, scene.element.grid_size, sims.dt, scene.node, scene.particle,
+                                                      scene.material.matProps, scene.material.stateVars, scene.element.LnID, scene.element.shape_fn, scene.element.node_size)
+
+    def compute_stress_strain(self, sims: Simulation, scene: myScene):
+        kernel_compute_stress_strain_newmark(sims.dt, int(scene.particleNum[0]), scene.particle, scene.material.matProps, scene.material.stateVars, scene.material.stiffness_matrix)
+
+    def compute_stress_strain_2D(self, sims: Simulation, scene: myScene):
+        kernel_compute_stress_strain_newmark_2D(sims.dt, int(scene.particleNum[0]), scene.particle, scene.material.matProps, scene.material.stateVars, scene.material.stiffness_matrix)
+
+    def compute_internal_force(self, sims: Simulation, scene: myScene):
+        kernel_internal_force_p2g(scene.element.grid_nodes, int(scene.particleNum[0]), scene.node, scene.particle, scene.element.LnID, scene.element.dshape_fn, scene.element.node_size)
+
+    def compute_internal_force_2D(self, sims: Simulation, scene: myScene):
+        kernel_internal_force_p2g_2D(scene.element.grid_nodes, int(scene.particleNum[0]), scene.node, scene.particle, scene.element.LnID, scene.element.dshape_fn, scene.element.node_size)
+
+    def update_internal_state(self, sims: Simulation, scene: myScene):
+        self.restore_state_vars(scene)
+        self.compute_displacement_gradient(sims, scene)
+        self.compute_stress_strains(sims, scene)
+        kernel_reset_internal_force(scene.mass_cut_off, scene.node)
+        self.compute_internal_forces(sims, scene)
+
+    def tangent_matvec(self, x, Ax):
+        kernel_matrix_free_tangent(self.scene.element.grid_nodes, int(self.scene.particleNum[0]), self.total_dofs, self.scene.node, self.scene.particle, self.scene.material.stiffness_matrix,
+                                   self.scene.element.LnID, self.scene.element.dshape_fn, self.scene.element.node_size, self.dof_mass, self.fixed_dofs, x, Ax)
+
+    def compute_diagonal(self, sims: Simulation, scene: myScene):
+        kernel_matrix_free_diagonal(scene.element.grid_nodes, int(scene.particleNum[0]), self.total_dofs, scene.node, scene.particle, scene.material.stiffness_matrix,
+                                    scene.element.LnID, scene.element.dshape_fn, scene.element.node_size, self.dof_mass, self.fixed_dofs, self.diagonal)
+
+    def jacobi_preconditioner(self, sims: Simulation, scene: myScene):
+        self.compute_diagonal(sims, scene)
+        return None
+
+    def identity_preconditioner(self, sims: Simulation, scene: myScene):
+        self.diagonal.fill(1)
+        return None
+
+    def multigrid_preconditioner(self, sims: Simulation, scene: myScene):
+        self.compute_diagonal(sims, scene)
+        self.multigrid.update(scene, self.mass_coeff, self.total_dofs, self.fixed_dofs, self.diagonal, scene.material.stiffness_matrix)
+        return self.multigrid.operator
+
+    def newton_raphson(self, sims: Simulation, scene: myScene):
+        self.scene = scene
+        iter_num, initial_residual, displacement_error = 0, 0., 1.
+        while True:
+            self.update_internal_state(sims, scene)
+            residual = kernel_assemble_residual_force(scene.mass_cut_off, sims.newmark_beta, self.is_dynamic, sims.dt, scene.node, self.fixed_dofs, self.prescribed_value, self.residual)
+            if iter_num == 0: initial_residual = residual
+            if residual <= sims.residual_tolerance * initial_residual or residual < Threshold or displacement_error < sims.displacement_tolerance or iter_num >= sims.iter_max:
+                break
+
+            preconditioner = self.precondition(sims, scene)
+            self.increment.fill(0)
+            self.linear_solver.solve(self.tangent_operator, self.residual, self.increment, self.diagonal, self.total_dofs, maxiter=max(self.total_dofs, 1),
+                                     tol=min(1e-2 * sims.residual_tolerance, 1e-6), preconditioner=preconditioner)
+            self.update_nodal_displacements(sims, scene, self.increment)
+            displacement_error = kernel_compute_displacement_error(scene.mass_cut_off, self.total_dofs, scene.node, self.increment)
+            iter_num += 1
+        return iter_num
+
+    def newmark_integrate(self, sims: Simulation, scene: myScene):
+        self.calculate_interpolation(sims, scene)
+        self.compute_nodal_kinematics(sims, scene)
+        self.apply_particle_traction_constraints(sims, scene)
+        self.apply_traction_constraints(sims, scene)
+        self.compute_grid_velocity_acceleration(sims, scene)
+        self.find_active_dofs(sims, scene)
+        self.backup_state_vars(scene)
+        self.newton_raphson(sims, scene)
+        kernel_update_stress_strain_newmark(int(scene.particleNum[0]), scene.particle, sims.dt)
+        kernel_compute_nodal_kinematics_newmark(sims.newmark_beta, sims.newmark_gamma, scene.mass_cut_off, scene.node, sims.dt)
+        kernel_kinemaitc_ig2p(scene.element.grid_nodes, sims.alphaPIC, sims.dt, int(scene.particleNum[0]), scene.node, scene.particle, scene.element.LnID, scene.element.shape_fn, scene.element.node_size)
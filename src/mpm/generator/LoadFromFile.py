@@ -5,6 +5,7 @@ from src.mpm.generator.InsertionKernel import *
 from src.mpm.Contact import DEMContact
 from src.mpm.SceneManager import myScene
 from src.mpm.Simulation import Simulation
+from src.utils.ChunkedStore import frame_exists, load_frame
 from src.utils.ObjectIO import DictIO
 from src.utils.RegionFunction import RegionFunction
 from src.utils.TypeDefination import vec2u8, vec3f, vec6f
@@ -208,11 +209,11 @@ class BodyReader(object):
   
     def add_npz_body(self, scene: myScene, template):
         particle_file = DictIO.GetEssential(template, "File")
-        if not os.path.exists(particle_file):
+        if not frame_exists(particle_file):
             raise EOFError("Invaild path")
         
         if DictIO.GetAlternative(template, "Restart", False):
-            particle_info = np.load(particle_file, allow_pickle=True) 
+            particle_info = load_frame(particle_file) 
             if self.sims.is_continue:
                 self.sims.current_time = DictIO.GetEssential(particle_info, 't_current')
                 self.sims.CurrentTime[None] = DictIO.GetEssential(particle_info, 't_current')
@@ -275,7 +276,7 @@ class BodyReader(object):
             fix_v = vec3u8([DictIO.GetEssential(self.FIX, is_fix) for is_fix in fix_v_str])
             init_particle_num = int(scene.particleNum[0])
 
-            particle_cloud = np.load(particle_file, allow_pickle=True) 
+            particle_cloud = load_frame(particle_file) 
             coords = DictIO.GetEssential(particle_cloud, "position")
             psize = DictIO.GetEssential(particle_cloud, "psize")
             volume = DictIO.GetEssential(particle_cloud, "volume")
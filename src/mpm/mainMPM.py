@@ -6,7 +6,7 @@ from src.mpm.SpatialHashGrid import SpatialHashGrid
 from src.mpm.engines.ULExplicitEngine import ULExplicitEngine
 from src.mpm.engines.ULExplicitTwoPhaseEngine import ULExplicitTwoPhaseEngine
 from src.mpm.engines.TLExplicitEngine import TLExplicitEngine
-# from src.mpm.engines.ULImplicitEngine import ImplicitEngine
+from src.mpm.engines.ULImplicitEngine import ImplicitEngine
 # from src.mpm.engines.IncompressibleEngine import IncompressibleEngine
 from src.mpm.MaterialManager import ConstitutiveModel
 from src.mpm.GenerateManager import GenerateManager
@@ -61,6 +61,7 @@ class MPM(object):
         self.sims.set_shape_smoothing(DictIO.GetAlternative(kwargs, "shape_smooth", 0.))
         self.sims.set_pressure_smoothing(DictIO.GetAlternative(kwargs, "pressure_smoothing", False))
         self.sims.set_strain_smoothing(DictIO.GetAlternative(kwargs, "strain_smoothing", False))
+        self.sims.set_elastic_predictor(DictIO.GetAlternative(kwargs, "elastic_predictor", False))
         self.sims.set_configuration(DictIO.GetAlternative(kwargs, "configuration", "ULMPM"))
         self.sims.set_material_type(DictIO.GetAlternative(kwargs, "material_type", "Solid"))
         self.sims.set_visualize(DictIO.GetAlternative(kwargs, "visualize", True))
@@ -105,6 +106,10 @@ class MPM(object):
         self.sims.set_adaptive_timestep(DictIO.GetAlternative(solver, "AdaptiveTimestep", False))
         self.sims.set_save_interval(DictIO.GetAlternative(solver, "SaveInterval", self.sims.time / 20.))
         self.sims.set_save_path(DictIO.GetAlternative(solver, "SavePath", 'OutputData'))
+        self.sims.set_async_output(DictIO.GetAlternative(solver, "AsyncOutput", False), DictIO.GetAlternative(solver, "OutputQueueSize", 2))
+        self.sims.set_output_format(DictIO.GetAlternative(solver, "OutputFormat", "npz"), DictIO.GetAlternative(solver, "Compression", 1), DictIO.GetAlternative(solver, "Downcast", False))
+        self.sims.set_profile(DictIO.GetAlternative(solver, "Profile", False), DictIO.GetAlternative(solver, "ProfileInterval", 0))
+        self.sims.set_reorder_interval(DictIO.GetAlternative(solver, "ReorderInterval", 0))
         if log: 
             self.print_solver_info()
             print('\n')
@@ -139,14 +144,26 @@ class MPM(object):
         print(("Mapping Scheme: " + str(self.sims.mapping)).ljust(67))
         print(("Shape Function: " + str(self.sims.shape_function)).ljust(67))
         print(("Velocity Projection: " + str(self.sims.velocity_projection_scheme)).ljust(67))
+        if self.sims.elastic_predictor:
+            print(("Stress Update: elastic predictor + return mapping").ljust(67))
 
     def print_solver_info(self):
         print(" MPM Solver Information ".center(71,"-"))
         print(("Initial Simulation Time: " + str(self.sims.current_time)).ljust(67))
         print(("Finial Simulation Time: " + str(self.sims.current_time + self.sims.time)).ljust(67))
         print(("Time Step: " + str(self.sims.dt[None])).ljust(67))
+        if self.sims.isadaptive:
+            print(("Adaptive Time Step: CFL = " + str(self.sims.CFL)).ljust(67))
         print(("Save Interval: " + str(self.sims.save_interval)).ljust(67))
         print(("Save Path: " + str(self.sims.path)).ljust(67))
+        if self.sims.async_output:
+            print(("Asynchronous Output Queue: " + str(self.sims.output_queue_size)).ljust(67))
+        if self.sims.output_format == "chunked":
+            print(("Chunked Output Compression: " + str(self.sims.output_compression) + (", float32" if self.sims.output_downcast else "")).ljust(67))
+        if self.sims.profile:
+            print(("Profile Report Interval: " + str(self.sims.profile_interval)).ljust(67))
+        if self.sims.reorder_interval > 0:
+            print(("Morton Reorder Interval: " + str(self.sims.reorder_interval)).ljust(67))
 
     def add_contact(self, contact_type, **contact_phys):
         self.sims.set_contact_detection(contact_type)
@@ -254,10 +271,13 @@ class MPM(object):
                         self.enginer = ULExplicitTwoPhaseEngine(self.sims)
                     else:
                         self.enginer = ULExplicitEngine(self.sims)
-                """ elif self.sims.solver_type == "Implicit":
+                elif self.sims.solver_type == "Implicit":
                     if self.sims.material_type == "Solid":
                         self.enginer = ImplicitEngine(self.sims)
-                    elif self.sims.material_type == "Fluid":
+                    else:
+                        raise RuntimeError("Keyword:: /material_type/ Only solid materials are supported by the implicit engine")
+                """ elif self.sims.solver_type == "Implicit":
+                    if self.sims.material_type == "Fluid":
                         self.enginer = IncompressibleEngine(self.sims)
                 elif self.sims.solver_type == "SimiImplicit":
                     if self.sims.material_type == "TwoPhaseDoubleLayer":
@@ -289,7 +309,7 @@ class MPM(object):
         self.sims.set_window_parameters(window)
 
     def add_essentials(self, kwargs):
-        self.scene.boundary.copy_dict_to_field(self.sims)
+        self.scene.boundary.copy_constraints_to_field(self.sims)
         self.add_spatial_grid()
         self.add_engine()
         self.add_recorder()
@@ -298,8 +318,8 @@ class MPM(object):
         self.scene.calc_mass_cutoff(self.sims)
         if self.first_run:
             self.scene.boundary.set_boundary(self.sims)
-        if self.sims.mode == "Normal":
-            self.scene.boundary.set_boundary_types(self.sims, self.scene.element)
+        self.scene.boundary.set_boundary_types(self.sims, self.scene.element)
+        self.scene.set_boundary_condition(self.sims)
 
     def run(self, visualize=False, **kwargs):
         self.add_essentials(kwargs)
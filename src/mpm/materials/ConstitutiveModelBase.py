@@ -1,6 +1,7 @@
 import numpy as np
 
 from src.consititutive_model.ConstitutiveModelBase import ConstitutiveBase
+from src.mpm.BaseKernel import update_particle_storage_
 from src.utils.ObjectIO import DictIO
 
 
@@ -24,7 +25,16 @@ class ConstitutiveModelBase(ConstitutiveBase):
             if len(list(stiffness)) != 2:
                 raise RuntimeError("The dimension of Keyword:: /Stiffness/ should be 2")
             self.matProps[materialID].add_contact_parameter(friction, stiffness[0], stiffness[1])
-    
-        
 
+    def get_material_props(self, materialID):
+        return self.matProps
 
+    def update_particle_storage(self, particleNum, particle):
+        return update_particle_storage_(particleNum, particle, self.stateVars)
+
+    def reorder_particle_storage(self, particleNum, reorder_storage):
+        if self.stateVars is not None:
+            reorder_storage(particleNum, self.stateVars)
+
+    def reset_particle_order(self):
+        pass
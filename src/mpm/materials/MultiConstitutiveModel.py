@@ -0,0 +1,147 @@
+import numpy as np
+import taichi as ti
+
+from src.consititutive_model.MaterialKernel import find_max_wave_speed_by_model_
+from src.mpm.BaseKernel import kernel_sort_particles_by_model, update_particle_storage_, update_state_vars_storage_
+from src.mpm.materials.ConstitutiveModelBase import ConstitutiveModelBase
+from src.mpm.Simulation import Simulation
+from src.utils.ObjectIO import DictIO
+
+
+class MaterialPropertyView(object):
+    """Python-scope access to the material properties of all models, indexed by material ID"""
+    def __init__(self, material) -> None:
+        self.material = material
+        self.shape = (material.max_material_num,)
+
+    def __getitem__(self, materialID):
+        return self.material.get_material_props(int(materialID))[materialID]
+
+    def size(self):
+        return self.shape[0]
+
+
+class MultiConstitutiveModel(ConstitutiveModelBase):
+    """Several constitutive models in one simulation
+
+    Every model keeps its own material properties and state variables and owns the material IDs given to it. The
+    particles are grouped by model with a counting sort of their material IDs, redone only when particles are added,
+    deleted or change material. The velocity gradient and stress updates then run one kernel per model over its range
+    of the sorted particle index, so that each kernel is compiled for a single model instead of branching per particle.
+    """
+    def __init__(self, sims: Simulation, models: dict):
+        super().__init__()
+        self.model_names = list(models.keys())
+        self.models = list(models.values())
+        self.model_num = len(self.models)
+        self.max_material_num = sims.max_material_num
+        self.is_elastic = all(model.is_elastic for model in self.models)
+        self.matProps = MaterialPropertyView(self)
+        self.stateVars = None
+        self.owner = {}
+        self.particle = None
+
+        self.model_of_material = ti.field(int, shape=sims.max_material_num)
+        self.model_offset = ti.field(int, shape=self.model_num + 1)
+        self.particle_index = ti.field(int, shape=sims.max_particle_num)
+        self.model_of_material.fill(-1)
+        self.offsets = np.zeros(self.model_num + 1, dtype=np.int32)
+        self.sorted_particle_num = -1
+        self.need_sort = True
+
+    def model_initialization(self, materials):
+        for index, name in enumerate(self.model_names):
+            model_materials = DictIO.GetEssential(materials, name)
+            model_materials = [model_materials] if type(model_materials) is dict else model_materials
+            for material in model_materials:
+                materialID = DictIO.GetEssential(material, 'MaterialID')
+                if materialID in self.owner and self.owner[materialID] != index:
+                    raise RuntimeError(f"MaterialID {materialID} is assigned to both /{self.model_names[self.owner[materialID]]}/ and /{name}/")
+                self.owner[materialID] = index
+                self.model_of_material[materialID] = index
+            self.models[index].model_initialization(model_materials)
+        self.print_info()
+
+    def print_info(self):
+        print(" Constitutive Model Dispatch ".center(71, '-'))
+        for index, name in enumerate(self.model_names):
+            print(f"{name}: MaterialID", sorted(materialID for materialID, owner in self.owner.items() if owner == index))
+        print('')
+
+    def get_model(self, materialID):
+        if materialID not in self.owner:
+            raise RuntimeError(f"MaterialID {materialID} is not assigned to any constitutive model")
+        return self.models[self.owner[materialID]]
+
+    def get_material_props(self, materialID):
+        if materialID not in self.owner:
+            return self.models[0].matProps
+        return self.get_model(materialID).matProps
+
+    def get_particle_model(self, start_particle, end_particle):
+        if self.particle is None:
+            return np.zeros(max(end_particle - start_particle, 0), dtype=np.int32)
+        materialID = self.particle.materialID.to_numpy()[start_particle:end_particle].astype(np.int32)
+        return self.model_of_material.to_numpy()[materialID]
+
+    def get_state_vars_dict(self, start_particle, end_particle):
+        particle_model = self.get_particle_model(start_particle, end_particle)
+        state_vars = {}
+        for index, model in enumerate(self.models):
+            for name, value in model.get_state_vars_dict(start_particle, end_particle).items():
+                if name not in state_vars:
+                    state_vars[name] = np.zeros_like(value)
+                is_owned = particle_model == index
+                state_vars[name][is_owned] = value[is_owned]
+        return state_vars
+
+    def reload_state_variables(self, state_vars):
+        for model in self.models:
+            model.reload_state_variables(state_vars)
+
+    def state_vars_initialize(self, start_particle, end_particle, particle):
+        self.particle = particle
+        for model in self.models:
+            model.state_vars_initialize(start_particle, end_particle, particle)
+        self.need_sort = True
+
+    def update_particle_storage(self, particleNum, particle):
+        self.particle = particle
+        for model in self.models[1:]:
+            update_state_vars_storage_(particleNum, particle, model.stateVars)
+        self.need_sort = True
+        return update_particle_storage_(particleNum, particle, self.models[0].stateVars)
+
+    def reorder_particle_storage(self, particleNum, reorder_storage):
+        for model in self.models:
+            model.reorder_particle_storage(particleNum, reorder_storage)
+        self.need_sort = True
+
+    def reset_particle_order(self):
+        self.need_sort = True
+
+    def find_max_sound_speed(self):
+        return max(model.find_max_sound_speed() for model in self.models)
+
+    def find_max_wave_speed(self, particleNum, particle):
+        max_wave_speed = 0.
+        for start_index, end_index, model in self.particle_ranges(particleNum, particle):
+            max_wave_speed = max(max_wave_speed, find_max_wave_speed_by_model_(start_index, end_index, self.particle_index, particle, model.matProps))
+        return max_wave_speed
+
+    def get_lateral_coefficient(self, materialID):
+        return self.get_model(materialID).get_lateral_coefficient(materialID)
+
+    def sort_particles(self, particleNum, particle):
+        if self.need_sort or particleNum != self.sorted_particle_num:
+            self.particle = particle
+            kernel_sort_particles_by_model(particleNum, self.model_num, particle, self.model_of_material, self.model_offset, self.particle_index)
+            self.offsets = self.model_offset.to_numpy()
+            self.sorted_particle_num = particleNum
+            self.need_sort = False
+
+    def particle_ranges(self, particleNum, particle):
+        self.sort_particles(particleNum, particle)
+        for index, model in enumerate(self.models):
+            if self.offsets[index + 1] > self.offsets[index]:
+                yield int(self.offsets[index]), int(self.offsets[index + 1]), model
@@ -10,6 +10,7 @@ from src.utils.ObjectIO import DictIO
 class StateDependentMohrCoulomb(ConstitutiveModelBase):
     def __init__(self, sims: Simulation):
         super().__init__()
+        self.elastic_predictor = True
         self.add_material(sims.max_material_num, sims.material_type, sims.contact_detection, StateDependentMohrCoulombModel)
         if sims.configuration == "ULMPM":
             self.stateVars = ULStateVariable.field(shape=sims.max_particle_num) 
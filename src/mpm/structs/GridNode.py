@@ -865,6 +865,14 @@ class ImplicitNodes:
         self.momentum = gamma / beta / dt[None] * self.displacement - (gamma / beta - 1.) * previous_velocity - 0.5 * dt[None] * (gamma / beta - 2.) * previous_acceleration
         self.inertia = 1. / beta / dt[None] / dt[None] * self.displacement - 1. / beta / dt[None] * previous_velocity - (0.5 / beta - 1.) * previous_acceleration
 
+    @ti.func
+    def _compute_acceleration_newmark(self, beta, dt):
+        return 1. / beta / dt[None] / dt[None] * self.displacement - 1. / beta / dt[None] * self.momentum - (0.5 / beta - 1.) * self.inertia
+
+    @ti.func
+    def _update_nodal_force(self, force):
+        self.ext_force += force
+
     @ti.func
     def _update_nodal_disp(self, disp):
         self.displacement += disp
@@ -936,6 +944,14 @@ class ImplicitNodes2D:
         self.momentum = gamma / beta / dt[None] * self.displacement - (gamma / beta - 1.) * previous_velocity - 0.5 * dt[None] * (gamma / beta - 2.) * previous_acceleration
         self.inertia = 1. / beta / dt[None] / dt[None] * self.displacement - 1. / beta / dt[None] * previous_velocity - (0.5 / beta - 1.) * previous_acceleration
 
+    @ti.func
+    def _compute_acceleration_newmark(self, beta, dt):
+        return 1. / beta / dt[None] / dt[None] * self.displacement - 1. / beta / dt[None] * self.momentum - (0.5 / beta - 1.) * self.inertia
+
+    @ti.func
+    def _update_nodal_force(self, force):
+        self.ext_force += force
+
     @ti.func
     def _update_nodal_disp(self, disp):
         self.displacement += disp
@@ -659,7 +659,8 @@ class Surface(BasicShape):
         # First order approximation
         fxyz = self.fx(p)
         grad_f = self.dfx(p)
-        dnorm = np.select([np.linalg.norm(grad_f) > (self.upper_bound - self.lower_bound) * DBL_EPSILON], [np.linalg.norm(grad_f)], default=1.)
+        grad_norm = np.linalg.norm(np.asarray(grad_f).reshape((-1, 3)), axis=1)
+        dnorm = np.select([grad_norm > np.linalg.norm(self.upper_bound - self.lower_bound) * DBL_EPSILON], [grad_norm], default=1.)
         returnVal = np.select([np.abs(fxyz) > DBL_EPSILON], [fxyz / dnorm], default=0.)
         return returnVal
     
@@ -667,7 +668,7 @@ class Surface(BasicShape):
         nodal_coords = self.grid.node_coord.copy()
         step = self.grid.grid_space
         gnum = self.grid.gnum.copy()
-        fmm = FastMarchingMethod(step, gnum, nodal_coords)
+        fmm = FastMarchingMethod(step, nodal_coords, gnum)
         fmm.phiIni(self)
         fmm.phi()
         self.grid.generate_sdf(fmm.phiField.copy().reshape(-1))
@@ -1,9 +1,8 @@
 import numpy as np
-import math, copy, warnings
+import math, warnings
 
 from src.sdf.LevelSetGrid import LocalGrid
-from src.utils.Root import newton
-from src.utils.linalg import Sphere2Certesian, linearize, vectorize
+from src.utils.linalg import Sphere2Certesian, linearize
 
 DBL_EPSILON = 2.2204460492503131e-16
 
@@ -40,9 +39,9 @@ class RayTracing(object):
     def run(self, mass_center, simple_shape, objects):
         if simple_shape == 3:
             objects.generate_sdf(estimate=True)
-            for i in range(self.surface_node_number):
-                theta, phi = self.node_path(i)
-                self.ray_trace(mass_center, Sphere2Certesian(np.array([1, theta, phi])))
+            theta, phi = self.node_path(np.arange(self.surface_node_number))
+            rays = Sphere2Certesian(np.array([np.ones(self.surface_node_number), theta, phi])).T
+            self.ray_trace(mass_center, rays)
         elif simple_shape == 2:
             for i in range(self.surface_node_number):
                 theta, phi = self.node_path(i)
@@ -51,9 +50,8 @@ class RayTracing(object):
             raise RuntimeError("This SDF primitive does not support ray tracing!")
 
     def rectangular_partition_method(self, node):
-        theta, phi = 0., 0.
-        if (node - 2) / self.nangle >= self.nangle: 
-            raise RuntimeError(f"Problems may come soon, please define nSurfNodes as a squared integer + 2. Otherwise you will get phi = {2 * math.pi * (node - 2) / self.nangle / self.nangle}")
+        if np.any((node - 2) / self.nangle >= self.nangle): 
+            raise RuntimeError(f"Problems may come soon, please define nSurfNodes as a squared integer + 2. Otherwise you will get phi = {2 * math.pi * (np.max(node) - 2) / self.nangle / self.nangle}")
         theta = ((node - 2) % self.nangle + 1) * math.pi / (self.nangle + 1.)
         phi = (node - 2) / self.nangle * 2. * math.pi / self.nangle
         return theta, phi
@@ -68,79 +66,74 @@ class RayTracing(object):
         radial_distance = objects.radial(theta, phi)
         self.surface_node.append(Sphere2Certesian(np.array([radial_distance, theta, phi])))
 
-    def ray_trace(self, mass_center, ray):
-        nGPx, nGPy, nGPz = self.grid.gnum[0], self.grid.gnum[1], self.grid.gnum[2]
-        indices = self.grid.closet_corner(mass_center.reshape(-1, 3)).reshape(3)
-        pointP = copy.deepcopy(mass_center)
-        move = np.zeros(3, dtype=np.int32)
-        kVal = np.zeros(3)
-        signs, touched, touchedInCell = False, False, False
-        minOtherAxes, gpDist = -1., 0.
-        while True:
-            linearInd = linearize(indices[0], indices[1], indices[2], nGPx, nGPy)
-            point0 = self.grid.node_coord[linearInd]
-            diffSign = False
-            for gp in range(8):
-                vectorInd = vectorize(gp, 2, 2) + indices
-                Ind = linearize(vectorInd[0], vectorInd[1], vectorInd[2], nGPx, nGPy)
-                gpDist = self.grid.distance_field[Ind]
-                if gp == 0:
-                    signs = gpDist > 0.
-                if gp > 0. and (gpDist > 0.) != signs:
-                    diffSign = diffSign or True
-                if gpDist == 0:
-                    diffSign = diffSign or True
-
-            if diffSign:
-                touchedInCell = self.ray_trace_in_cell(ray, pointP, point0, indices)
-                touched = touched or touchedInCell
-
-            if indices[0] == nGPx - 2 or indices[1] == nGPy - 2 or indices[2] == nGPz - 2 \
-                or indices[0] == 0 or indices[1] == 0 or indices[2] == 0:
-                if not touched: warnings.warn(f"Ray {ray} did not create a boundary node")
-                break
-
-            for axis in range(3):
-                if ray[axis] > 0.:
-                    kVal[axis] = (point0[axis] + self.grid.grid_space - pointP[axis]) / ray[axis]
-                elif ray[axis] < 0.:
-                    kVal[axis] = (point0[axis] - pointP[axis]) / ray[axis]
-                else:
-                    kVal[axis] = math.inf
-
-            move = np.zeros(3, dtype=np.int32)
+    def ray_trace(self, mass_center, rays):
+        # all rays march together, one cell per pass; the nodes found are then kept in the order of the rays
+        nGPx, nGPy = self.grid.gnum[0], self.grid.gnum[1]
+        rayNum = rays.shape[0]
+        indices = np.repeat(self.grid.closet_corner(mass_center.reshape(-1, 3)), rayNum, axis=0)
+        pointP = np.repeat(np.array(mass_center, dtype=float).reshape(-1, 3), rayNum, axis=0)
+        active = np.arange(rayNum)
+        trialRays, trialSteps, trialNodes = [], [], []
+        step = 0
+        while active.shape[0] > 0:
+            ray, cell = rays[active], indices[active]
+            point0 = self.grid.node_coord[linearize(cell[:, 0], cell[:, 1], cell[:, 2], nGPx, nGPy)]
+            gpDist = np.array([self.grid.distance_field[linearize(cell[:, 0] + gp % 2, cell[:, 1] + (gp // 2) % 2, cell[:, 2] + gp // 4, nGPx, nGPy)] for gp in range(8)]).T
+            diffSign = np.any((gpDist > 0.) != (gpDist[:, 0:1] > 0.), axis=1) | np.any(gpDist == 0, axis=1)
+
+            if np.any(diffSign):
+                found, trialNode = self.ray_trace_in_cell(ray[diffSign], pointP[active[diffSign]], point0[diffSign], cell[diffSign])
+                trialRays.append(active[diffSign][found])
+                trialSteps.append(np.full(int(np.count_nonzero(found)), step))
+                trialNodes.append(trialNode[found])
+
+            boundary = np.any((cell == self.grid.gnum - 2) | (cell == 0), axis=1)
+            active, ray, cell, point0 = active[~boundary], ray[~boundary], cell[~boundary], point0[~boundary]
+
+            kVal = np.full(ray.shape, math.inf)
+            positive, negative = ray > 0., ray < 0.
+            kVal[positive] = ((point0 + self.grid.grid_space - pointP[active]) / np.where(positive, ray, 1.))[positive]
+            kVal[negative] = ((point0 - pointP[active]) / np.where(negative, ray, 1.))[negative]
+
+            move = np.zeros(ray.shape, dtype=np.int32)
             for axis in range(3):
-                minOtherAxes = min(kVal[(axis + 1) % 3], kVal[(axis + 2) % 3])
-                if kVal[axis] - minOtherAxes < DBL_EPSILON * self.grid.grid_space:
-                    move[axis] = int(np.sign(ray[axis]))
-                    for j in range(1, 3):
-                        if abs(kVal[axis] - kVal[(axis + j) % 3]) < DBL_EPSILON * self.grid.grid_space:
-                            move[(axis + j) % 3] = int(np.sign(ray[(axis + j) % 3]))
-
-            pointP += ray * np.min(kVal)
-            indices += move
-            if np.linalg.norm(move) == 0.:
+                minOtherAxes = np.minimum(kVal[:, (axis + 1) % 3], kVal[:, (axis + 2) % 3])
+                moveAxis = kVal[:, axis] - minOtherAxes < DBL_EPSILON * self.grid.grid_space
+                move[moveAxis, axis] = np.sign(ray[moveAxis, axis])
+                for j in range(1, 3):
+                    moveOther = moveAxis & (np.abs(kVal[:, axis] - kVal[:, (axis + j) % 3]) < DBL_EPSILON * self.grid.grid_space)
+                    move[moveOther, (axis + j) % 3] = np.sign(ray[moveOther, (axis + j) % 3])
+
+            pointP[active] += ray * np.min(kVal, axis=1).reshape(-1, 1)
+            indices[active] += move
+            if np.any(np.all(move == 0, axis=1)):
                 raise RuntimeError("We're stuck in the same cell !!!")
+            step += 1
+
+        touched = np.zeros(rayNum, dtype=bool)
+        if len(trialRays) > 0:
+            trialRays, trialSteps, trialNodes = np.concatenate(trialRays), np.concatenate(trialSteps), np.concatenate(trialNodes)
+            for trial in np.lexsort((trialSteps, trialRays)):
+                touched[trialRays[trial]] |= self.add_surface_node(trialNodes[trial])
+        for nray in np.flatnonzero(~touched):
+            warnings.warn(f"Ray {rays[nray]} did not create a boundary node")
 
     def ray_trace_in_cell(self, ray, pointP, point0, indices):
-        normNode = -1
-        trialNode = np.zeros(3)
-        touched = False
         space = self.grid.grid_space
 
-        xP, yP, zP = pointP[0], pointP[1], pointP[2]
-        ux, uy, uz = ray[0], ray[1], ray[2]
-        x0, y0, z0 = point0[0], point0[1], point0[2]
+        xP, yP, zP = pointP[:, 0], pointP[:, 1], pointP[:, 2]
+        ux, uy, uz = ray[:, 0], ray[:, 1], ray[:, 2]
+        x0, y0, z0 = point0[:, 0], point0[:, 1], point0[:, 2]
         nGPx, nGPy = self.grid.gnum[0], self.grid.gnum[1]
 
-        f000 = self.grid.distance_field[linearize(indices[0], indices[1], indices[2], nGPx, nGPy)]
-        f111 = self.grid.distance_field[linearize(indices[0]+1, indices[1]+1, indices[2]+1, nGPx, nGPy)]
-        f100 = self.grid.distance_field[linearize(indices[0]+1, indices[1], indices[2], nGPx, nGPy)]
-        f010 = self.grid.distance_field[linearize(indices[0], indices[1]+1, indices[2], nGPx, nGPy)]
-        f001 = self.grid.distance_field[linearize(indices[0], indices[1], indices[2]+1, nGPx, nGPy)]
-        f101 = self.grid.distance_field[linearize(indices[0]+1, indices[1], indices[2]+1, nGPx, nGPy)]
-        f011 = self.grid.distance_field[linearize(indices[0], indices[1]+1, indices[2]+1, nGPx, nGPy)]
-        f110 = self.grid.distance_field[linearize(indices[0]+1, indices[1]+1, indices[2], nGPx, nGPy)]
+        f000 = self.grid.distance_field[linearize(indices[:, 0], indices[:, 1], indices[:, 2], nGPx, nGPy)]
+        f111 = self.grid.distance_field[linearize(indices[:, 0]+1, indices[:, 1]+1, indices[:, 2]+1, nGPx, nGPy)]
+        f100 = self.grid.distance_field[linearize(indices[:, 0]+1, indices[:, 1], indices[:, 2], nGPx, nGPy)]
+        f010 = self.grid.distance_field[linearize(indices[:, 0], indices[:, 1]+1, indices[:, 2], nGPx, nGPy)]
+        f001 = self.grid.distance_field[linearize(indices[:, 0], indices[:, 1], indices[:, 2]+1, nGPx, nGPy)]
+        f101 = self.grid.distance_field[linearize(indices[:, 0]+1, indices[:, 1], indices[:, 2]+1, nGPx, nGPy)]
+        f011 = self.grid.distance_field[linearize(indices[:, 0], indices[:, 1]+1, indices[:, 2]+1, nGPx, nGPy)]
+        f110 = self.grid.distance_field[linearize(indices[:, 0]+1, indices[:, 1]+1, indices[:, 2], nGPx, nGPy)]
 
         A = f111 + f100 + f010 + f001 - f101 - f110 - f011 - f000
         B = f110 - f100 - f010 + f000
@@ -154,43 +147,55 @@ class RayTracing(object):
         Cg2 = C / pow(space, 2)
         Dg2 = D / pow(space, 2)
 
-        coeffs = np.array([float(self.grid.distance(pointP.reshape(-1, 3))) / space,
+        coeffs = np.array([self.grid.distance(pointP) / space,
 		                   Ag3 * (uz * (xP - x0) * (yP - y0) + uy * (xP - x0) * (zP - z0) + ux * (yP - y0) * (zP - z0)) + Bg2 * (ux * (yP - y0) + uy * (xP - x0)) \
 		                   + Cg2 * (uy * (zP - z0) + uz * (yP - y0)) + Dg2 * (ux * (zP - z0) + uz * (xP - x0)) + E / space * ux + F / space * uy + G / space * uz,
 		                  (Ag3 * ((xP - x0) * uy * uz + (yP - y0) * ux * uz + (zP - z0) * ux * uy) + Bg2 * ux * uy + Cg2 * uy * uz + Dg2 * ux * uz) * space,
 		                  (Ag3 * ux * uy * uz) * pow(space, 2)])
         
-        def rootFunc(k, coeff):
-            return coeff[0] + coeff[1] * k + coeff[2] * k * k + coeff[3] * k * k * k
-        
-        def DerRootFunc(k, coeff):
-            return coeff[1] + 2 * coeff[2] * k + 3 * coeff[3] * k * k
-        
-        def DDerRootFunc(k, coeff):
-            return 2 * coeff[2] + 6 * coeff[3] * k 
-        
-        root = newton(func=rootFunc, x0=-np.sqrt(3), args=(coeffs,), fprime=DerRootFunc, fprime2=DDerRootFunc, tol=1e-12)
-        if root >= DBL_EPSILON: trialNode = pointP + space * root * ray
-        elif abs(root) <= DBL_EPSILON:
-            trialNode = pointP
-        else:
+        root = self.cubic_root(coeffs, -np.sqrt(3), tol=1e-12)
+        trialNode = np.where((root >= DBL_EPSILON).reshape(-1, 1), pointP + space * root.reshape(-1, 1) * ray, pointP)
+        found = (root >= DBL_EPSILON) | (np.abs(root) <= DBL_EPSILON)
+        found &= self.isInBox(trialNode)
+        found[found] = np.abs(self.grid.distance(trialNode[found])) / self.lengthChar < self.nodesTol * DBL_EPSILON
+        return found, trialNode
+
+    def cubic_root(self, coeffs, x0, tol, maxiter=50):
+        # Halley's method of src.utils.Root.newton applied to every cubic coeff[0] + coeff[1] * k + coeff[2] * k^2 + coeff[3] * k^3 at once
+        root = np.full(coeffs.shape[1], x0)
+        remains = np.arange(coeffs.shape[1])
+        for _ in range(maxiter):
+            coeff, k = coeffs[:, remains], root[remains]
+            fval = coeff[0] + coeff[1] * k + coeff[2] * k * k + coeff[3] * k * k * k
+            fder = coeff[1] + 2 * coeff[2] * k + 3 * coeff[3] * k * k
+            fder2 = 2 * coeff[2] + 6 * coeff[3] * k 
+            solved = fval == 0
+            if np.any(fder[~solved] == 0):
+                raise RuntimeError("Derivative was zero.")
+            
+            fder = np.where(solved, 1., fder)
+            newton_step = fval / fder
+            adj = newton_step * fder2 / fder / 2
+            newton_step = np.where(np.abs(adj) < 1, newton_step / (1.0 - adj), newton_step)
+            k_new = np.where(solved, k, k - newton_step)
+            root[remains] = k_new
+            remains = remains[~(solved | np.isclose(k_new, k, rtol=0., atol=tol))]
+            if remains.shape[0] == 0:
+                return root
+        raise RuntimeError("Failed to converge after %d iterations" % maxiter)
+
+    def add_surface_node(self, trialNode):
+        if len(self.surface_node) > 0 and np.linalg.norm(trialNode - np.array(self.surface_node[-1])) / self.lengthChar <= self.nodesTol * DBL_EPSILON:
             return False
-        
-        if not self.isInBox(trialNode):
-            return False
-        
-        if abs(float(self.grid.distance(trialNode.reshape(-1, 3)))) / self.lengthChar < self.nodesTol * DBL_EPSILON \
-           and (len(self.surface_node) == 0 or (np.linalg.norm(trialNode - np.array(self.surface_node[-1])) / self.lengthChar > self.nodesTol * DBL_EPSILON)):
-            self.surface_node.append(list(trialNode))
-            touched = True
-            normNode = np.linalg.norm(trialNode)
-            if normNode > self.minRad: self.minRad = normNode
-            elif normNode > self.maxRad: self.maxRad = normNode
-        return touched
+        self.surface_node.append(list(trialNode))
+        normNode = np.linalg.norm(trialNode)
+        if normNode > self.minRad: self.minRad = normNode
+        elif normNode > self.maxRad: self.maxRad = normNode
+        return True
     
     def isInBox(self, point):
         bmin = self.grid.start_point
         bmax = self.grid.start_point + self.grid.region_size
-        return point[0] > bmin[0] and point[0] < bmax[0] and point[1] > bmin[1] and point[1] < bmax[1] and point[2] > bmin[2] and point[2] < bmax[2]
+        return np.all((point > bmin) & (point < bmax), axis=-1)
 
 
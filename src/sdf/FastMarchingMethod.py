@@ -1,12 +1,16 @@
-import copy, math
+import heapq, math
 import numpy as np
-from functools import partial
-from multiprocessing.pool import ThreadPool as Pool
 
-from src.utils.linalg import Certesian2Sphere, linearize, vectorize
+from src.utils.linalg import Certesian2Sphere
 
 
 class FastMarchingMethod(object):
+    """Signed distance field on a regular grid, marched from the gridpoints next to the surface
+
+    The narrow band is a binary heap keyed by the distance and by the order in which a gridpoint became trial,
+    so that gridpoints are confirmed in the same order as a linear scan over the band would pick them. A trial
+    gridpoint updated again is pushed again; the outdated entries are skipped when they are popped.
+    """
     def __init__(self, space, coords, gnum) -> None:
         self.speed = 1
 
@@ -14,56 +18,43 @@ class FastMarchingMethod(object):
         # - knownState (0): that gp has a distance value we're sure about / can not modify anymore anyway
         # - trialState (1): for a gp in the narrow band, with at least one "known" neighbour. It carries some finite (no longer infinite) distance value we are unsure of
         # - farState   (2): just the initial state for all gridpoints
-        self.gpStates = np.zeros(coords.shape[0]) + 2
-        self.trials = np.array([], dtype=np.int32)
-        self.known = np.array([])
-        self.pool = Pool()
+        self.gpStates = np.zeros(coords.shape[0], dtype=np.int32) + 2
+        self.known = np.array([], dtype=np.int32)
         self.phiField = None
 
         self.grid_space = space
-        self.coords = copy.deepcopy(coords)
-        self.gnum = gnum
-        self.gridSum = int(gnum[0] * gnum[1] * gnum[2])
+        self.coords = np.array(coords, dtype=float)
+        self.gnum = [int(n) for n in gnum]
+        self.gridSum = int(self.gnum[0] * self.gnum[1] * self.gnum[2])
 
     def clear(self):
-        del self.gpStates, self.trials, self.known, self.phiField, self.grid_space, self.coords, self.gnum, self.gridSum
+        del self.gpStates, self.known, self.phiField, self.grid_space, self.coords, self.gnum, self.gridSum
+
+    def adjacent_to(self, mask):
+        # gridpoints having at least one of their six neighbors in mask, the array being indexed as [z, y, x]
+        adjacent = np.zeros_like(mask)
+        adjacent[1:, :, :] |= mask[:-1, :, :]
+        adjacent[:-1, :, :] |= mask[1:, :, :]
+        adjacent[:, 1:, :] |= mask[:, :-1, :]
+        adjacent[:, :-1, :] |= mask[:, 1:, :]
+        adjacent[:, :, 1:] |= mask[:, :, :-1]
+        adjacent[:, :, :-1] |= mask[:, :, 1:]
+        return adjacent
 
     def phiIni(self, objects):
+        nGPx, nGPy, nGPz = self.gnum
         sides = objects.side(self.coords)
         self.phiField = np.select([sides > 0., sides < 0.], [math.inf, -math.inf], default=0.)
 
-        for side in range(2):
-            for i in range(self.gridSum):
-                self.find_neighbors(i, side, objects)
-
-    def find_neighbor(self, i, xyz, xInd, yInd, zInd, otherVal):
-        nGPx, nGPy, nGPz = self.gnum
-        if xyz == 0:
-            otherVal = self.phiField[i] if xInd == 0 else self.phiField[linearize(xInd-1, yInd, zInd, nGPx, nGPy)]
-        elif xyz == 1:
-            otherVal = self.phiField[i] if xInd == nGPx - 1 else self.phiField[linearize(xInd+1, yInd, zInd, nGPx, nGPy)]
-        elif xyz == 2:
-            otherVal = self.phiField[i] if yInd == 0 else self.phiField[linearize(xInd, yInd-1, zInd, nGPx, nGPy)]
-        elif xyz == 3:
-            otherVal = self.phiField[i] if yInd == nGPy - 1 else self.phiField[linearize(xInd, yInd+1, zInd, nGPx, nGPy)]
-        elif xyz == 4:
-            otherVal = self.phiField[i] if zInd == 0 else self.phiField[linearize(xInd, yInd, zInd-1, nGPx, nGPy)]
-        elif xyz == 5:
-            otherVal = self.phiField[i] if zInd == nGPz - 1 else self.phiField[linearize(xInd, yInd, zInd+1, nGPx, nGPy)]
-        return otherVal
-    
-    def find_neighbors(self, i, exterior, objects):
-        xInd, yInd, zInd = vectorize(i, self.gnum[0], self.gnum[1])
-        otherVal = 0.
-        if (self.phiField[i] < 0. and exterior == 0) or (self.phiField[i] > 0. and exterior == 1): 
-            for xyz in range(6):
-                otherVal = self.find_neighbor(i, xyz, xInd, yInd, zInd, otherVal)
+        interior = (self.phiField < 0.).reshape((nGPz, nGPy, nGPx))
+        exterior = (self.phiField > 0.).reshape((nGPz, nGPy, nGPx))
+        front = np.flatnonzero((interior & self.adjacent_to(exterior)) | (exterior & self.adjacent_to(interior)))
+        if front.shape[0] > 0:
+            distance = np.asarray(objects._approximate_distance(self.coords[front]), dtype=float).reshape(-1)
+            if np.any((distance < 0.) & (self.phiField[front] > 0.)) or np.any((distance > 0.) & (self.phiField[front] < 0.)):
+                raise RuntimeError("Not on the good side !")
+            self.phiField[front] = distance
 
-                if (otherVal < 0. and exterior == 1) or (otherVal > 0. and exterior == 0):
-                    self.phiField[i] = objects._approximate_distance(self.coords[i])
-                    if (self.phiField[i] < 0. and exterior == 1) or (self.phiField[i] > 0. and exterior == 0):
-                        raise RuntimeError("Not on the good side !")
-    
     # =============================================================================================================================== #
     def fioRose(self, grid_point):
         gp = Certesian2Sphere(grid_point)
@@ -77,186 +68,119 @@ class FastMarchingMethod(object):
             raise RuntimeError("theta = 0 [pi], gradient of rose fction not defined for its z component")
         return np.array(1, -7.5 / r * np.cos(5 * theta) * np.sin(4 * phi), -6 / r * np.sin(5 * theta) / np.sin(theta) * np.cos(4 * phi))
 
-    def iniFront(self, exterior, phiField, i):
-        returnVal = -1
-        phiVal = phiField[i]
-        if math.isfinite(phiVal):
-            if (phiVal >= 0 and exterior == 1) or (phiVal <= 0 and exterior == 0):
-                returnVal = i
-        return returnVal
-    
-    def iniStates(self, exterior, phiField, gpStates, i):
-        returnVal = gpStates[i]
-        phiVal = phiField[i]
-        if math.isfinite(phiVal):
-            if (phiVal >= 0 and exterior == 1) or (phiVal <= 0 and exterior == 0):
-                returnVal = 0
-        return int(returnVal)
-    
-    def trializeFromKnown(self, i, exterior):
-        nGPx, nGPy, nGPz = self.gnum
-        xInd, yInd, zInd = vectorize(i, nGPx, nGPy)
-        if xInd > 0:   self.trialize(linearize(xInd - 1, yInd, zInd, nGPx, nGPy), exterior)                 # looking at the x- neighbor, if possible test whether that gp actually needs to be trialized will be performed therein
-        if xInd < nGPx - 1: self.trialize(linearize(xInd + 1, yInd, zInd, nGPx, nGPy), exterior)            # the x+ neighbor, if possible
-        if yInd > 0: self.trialize(linearize(xInd, yInd-1, zInd, nGPx, nGPy), exterior)                     # y- neighbor if possible
-        if yInd < nGPy - 1: self.trialize(linearize(xInd, yInd+1, zInd, nGPx, nGPy), exterior)              # y+
-        if zInd > 0: self.trialize(linearize(xInd, yInd, zInd-1, nGPx, nGPy), exterior)                     # z-
-        if zInd < nGPz - 1: self.trialize(linearize(xInd, yInd, zInd+1, nGPx, nGPy), exterior)              # z+
-
-    def trialize(self, i, exterior):
-        if self.gpStates[i] != 0 and ((exterior == 1 and self.phiField[i] > 0) or (exterior == 0 and self.phiField[i] < 0)):
-            if self.gpStates[i] != 1:
-                self.gpStates[i] = 1
-                self.trials = np.append(self.trials, int(i))
-            self.updateFastMarchingMethod(i, exterior)
-
-    def phiWhenKnown(self, i, exterior):
-        ret = 0.
-        if self.gpStates[i] == 0:
-            ret = self.phiField[i]
-        else:
-            ret = math.inf if exterior == 1 else -math.inf
-        return ret
-    
     def eikDiscr2(self, space, m0, m1):
         return 2 * space * space - math.pow(m0 - m1, 2)
-    
+
     def eikDiscr3(self, space, m0, m1, m2):
         return 3 * space * space - (math.pow(m0 - m1, 2) + math.pow(m0 - m2, 2) + math.pow(m1 - m2, 2))
-    
-    def surroundings(self, i, exterior):
-        knownSurrVal = []
-        neigh = np.zeros(3)
 
-        nGPx, nGPy, nGPz = self.gnum
-        xInd, yInd, zInd = vectorize(i, nGPx, nGPy)
+    def phiFromEik2(self, m0, m1, disc, exterior):
+        return (m0 + m1 + math.sqrt(disc)) / 2 if exterior else (m0 + m1 - math.sqrt(disc)) / 2
 
-        if xInd == 0:
-            neigh[0] = self.phiWhenKnown(linearize(xInd + 1, yInd, zInd, nGPx, nGPy), exterior)
-        elif xInd == nGPx - 1:
-            neigh[0] = self.phiWhenKnown(linearize(xInd - 1, yInd, zInd, nGPx, nGPy), exterior)
-        else:
-            neigh[0] = min(self.phiWhenKnown(linearize(xInd - 1, yInd, zInd, nGPx, nGPy), exterior), 
-                           self.phiWhenKnown(linearize(xInd + 1, yInd, zInd, nGPx, nGPy), exterior)) if exterior == 1 else \
-                       max(self.phiWhenKnown(linearize(xInd - 1, yInd, zInd, nGPx, nGPy), exterior), 
-                           self.phiWhenKnown(linearize(xInd + 1, yInd, zInd, nGPx, nGPy), exterior))
-            
-        if yInd == 0:
-            neigh[1] = self.phiWhenKnown(linearize(xInd, yInd+1, zInd, nGPx, nGPy), exterior)
-        elif yInd == nGPy - 1:
-            neigh[1] = self.phiWhenKnown(linearize(xInd, yInd-1, zInd, nGPx, nGPy), exterior)
-        else:
-            neigh[1] = min(self.phiWhenKnown(linearize(xInd, yInd-1, zInd, nGPx, nGPy), exterior), 
-                           self.phiWhenKnown(linearize(xInd, yInd+1, zInd, nGPx, nGPy), exterior)) if exterior == 1 else \
-                       max(self.phiWhenKnown(linearize(xInd, yInd-1, zInd, nGPx, nGPy), exterior), 
-                           self.phiWhenKnown(linearize(xInd, yInd+1, zInd, nGPx, nGPy), exterior))
-            
-        if zInd == 0:
-            neigh[2] = self.phiWhenKnown(linearize(xInd, yInd, zInd+1, nGPx, nGPy), exterior)
-        elif zInd == nGPz - 1:
-            neigh[2] = self.phiWhenKnown(linearize(xInd, yInd, zInd-1, nGPx, nGPy), exterior)
-        else:
-            neigh[2] = min(self.phiWhenKnown(linearize(xInd, yInd, zInd-1, nGPx, nGPy), exterior), 
-                           self.phiWhenKnown(linearize(xInd, yInd, zInd+1, nGPx, nGPy), exterior)) if exterior == 1 else \
-                       max(self.phiWhenKnown(linearize(xInd, yInd, zInd-1, nGPx, nGPy), exterior), 
-                           self.phiWhenKnown(linearize(xInd, yInd, zInd+1, nGPx, nGPy), exterior))
-            
-        for cpt in range(3):
-            if math.isfinite(neigh[cpt]):
-                knownSurrVal.append(neigh[cpt])
+    def phiFromEik3(self, m0, m1, m2, disc, exterior):
+        return (m0 + m1 + m2 + math.sqrt(disc)) / 3 if exterior else (m0 + m1 + m2 - math.sqrt(disc)) / 3
 
-        deltaPr = 0.
-        space = self.grid_space if self.speed == 1 else self.grid_space * np.linalg.norm(self.grad_fioRose(self.coords[i]))
-        if len(knownSurrVal) == 1:
-            deltaPr = -1                         # no need for a discriminant in 1D propagation anyway
-        elif len(knownSurrVal) == 2:
-            deltaPr = self.eikDiscr2(space, knownSurrVal[0], knownSurrVal[1])
-        elif len(knownSurrVal) == 3:
-            deltaPr = self.eikDiscr3(space, knownSurrVal[0], knownSurrVal[1], knownSurrVal[2])
-        return np.array(knownSurrVal), deltaPr, space
+    def surroundings(self, i, exterior, phiField, gpStates):
+        nGPx, nGPy, nGPz = self.gnum
+        far = math.inf if exterior == 1 else -math.inf
+        xInd = i % nGPx
+        yInd = (i // nGPx) % nGPy
+        zInd = i // (nGPx * nGPy)
 
-    def updateFastMarchingMethod(self, i, exterior):
-        knownPhi, deltaPr, space = self.surroundings(i, exterior)
-        nKnown = knownPhi.shape[0]
+        knownSurrVal = []
+        for ind, n, stride in ((xInd, nGPx, 1), (yInd, nGPy, nGPx), (zInd, nGPz, nGPx * nGPy)):
+            if ind == 0:
+                neigh = phiField[i + stride] if gpStates[i + stride] == 0 else far
+            elif ind == n - 1:
+                neigh = phiField[i - stride] if gpStates[i - stride] == 0 else far
+            else:
+                lower = phiField[i - stride] if gpStates[i - stride] == 0 else far
+                upper = phiField[i + stride] if gpStates[i + stride] == 0 else far
+                neigh = min(lower, upper) if exterior == 1 else max(lower, upper)
+            if math.isfinite(neigh):
+                knownSurrVal.append(neigh)
+        return knownSurrVal
+
+    def updateFastMarchingMethod(self, i, exterior, phiField, gpStates):
+        knownPhi = self.surroundings(i, exterior, phiField, gpStates)
+        space = self.grid_space if self.speed == 1 else self.grid_space * np.linalg.norm(self.grad_fioRose(self.coords[i]))
+        nKnown = len(knownPhi)
         if nKnown == 0: raise RuntimeError(f"Gridpoint {i} goes through updateFastMarchingMethod no any known gp")
         elif nKnown == 1:
-            self.phiField[i] = knownPhi[0] + space if exterior == 1 else knownPhi[0] - space
+            phiVal = knownPhi[0] + space if exterior == 1 else knownPhi[0] - space
         elif nKnown == 2:
-            m0, m1 = knownPhi[0], knownPhi[1]
+            m0, m1 = knownPhi
+            deltaPr = self.eikDiscr2(space, m0, m1)
             if deltaPr >= 0:
-                self.phiField[i] = self.phiFromEik2(m0, m1, deltaPr, exterior)
+                phiVal = self.phiFromEik2(m0, m1, deltaPr, exterior)
             else:
-                self.phiField[i] = min(m0, m1) + space if exterior == 1 else max(m0, m1) - space
-        elif nKnown == 3:
-            m0, m1, m2 = knownPhi[0], knownPhi[1], knownPhi[2]
+                phiVal = min(m0, m1) + space if exterior == 1 else max(m0, m1) - space
+        else:
+            m0, m1, m2 = knownPhi
+            deltaPr = self.eikDiscr3(space, m0, m1, m2)
             if deltaPr >= 0.:
-                self.phiField[i] = self.phiFromEik3(m0, m1, m2, deltaPr, exterior)
+                phiVal = self.phiFromEik3(m0, m1, m2, deltaPr, exterior)
             else:
-                twoDdiscr = np.array([self.eikDiscr2(space, m0, m1), self.eikDiscr2(space, m0, m2), self.eikDiscr2(space, m1, m2)])
-                possiblePhi = np.array([])
-                for iBis in range(3):
-                    if twoDdiscr[iBis] >= 0:
-                        secondInd = 2 if iBis > 1 else iBis + 1
-                        possiblePhi = np.append(possiblePhi, self.phiFromEik3(knownPhi[iBis / 2.], knownPhi[secondInd], twoDdiscr[iBis], exterior))
-                if possiblePhi.shape[0] > 0:
-                    self.phiField[i] = np.min(possiblePhi) if exterior == 1 else np.max(possiblePhi)
+                # fall back to the 2D solutions of the pairs of known neighbors
+                possiblePhi = []
+                for first, second in ((0, 1), (0, 2), (1, 2)):
+                    twoDdiscr = self.eikDiscr2(space, knownPhi[first], knownPhi[second])
+                    if twoDdiscr >= 0:
+                        possiblePhi.append(self.phiFromEik2(knownPhi[first], knownPhi[second], twoDdiscr, exterior))
+                if len(possiblePhi) > 0:
+                    phiVal = min(possiblePhi) if exterior == 1 else max(possiblePhi)
                 else:
-                    self.phiField[i] = np.min(possiblePhi) + space if exterior == 1 else np.max(possiblePhi) - space
-        else:
-            raise RuntimeError(f"Unexpected case of {nKnown} known neighbors around gp {i}")
-        
-        if (self.phiField[i] < 0 and exterior == 1) or (self.phiField[i] > 0 and exterior == 0):
-            strings = "exterior" if exterior else "interior"
-            raise RuntimeError(f"We finally assigned phi = {self.phiField[i]} to {i} supposed to be in the {strings}.")
-        
-    def phiFromEik2(self, m0, m1, disc, exterior):
-        return (m0 + m1 + np.sqrt(disc)) / 2 if exterior else (m0 + m1 - np.sqrt(disc)) / 2
-    
-    def phiFromEik3(self, m0, m1, m2, disc, exterior):
-        return (m0 + m1 + m2 + np.sqrt(disc)) / 3 if exterior else (m0 + m1 + m2 - np.sqrt(disc)) / 3
+                    phiVal = min(knownPhi) + space if exterior == 1 else max(knownPhi) - space
 
-    def confirm(self, i, phiVal, exterior, checkState=True):
-        if checkState and self.gpStates[i] != 1:
-            raise RuntimeError(f"How comes ?? Current status is {self.gpStates[i]}")
-        self.phiField[i] = phiVal
-        self.gpStates[i] = 0
-        self.trializeFromKnown(i, exterior)
+        if (phiVal < 0 and exterior == 1) or (phiVal > 0 and exterior == 0):
+            strings = "exterior" if exterior else "interior"
+            raise RuntimeError(f"We finally assigned phi = {phiVal} to {i} supposed to be in the {strings}.")
+        return phiVal
 
-    def loopTrials(self, exterior):
-        trialGP = np.zeros(3, dtype=np.int32)
-        closest = np.zeros(3, dtype=np.int32)
-        while self.trials.shape[0] != 0:
-            closestIt = 0
-            closestPhi = self.phiField[int(self.trials[0])]
-            currPhiValue = copy.deepcopy(closestPhi)
-            for i in range(self.trials.shape[0]):
-                trialGP = int(self.trials[i])
-                currPhiValue = self.phiField[trialGP]
-                if (exterior == 1 and currPhiValue == math.inf) or (exterior == 0 and currPhiValue == -math.inf):
-                    raise RuntimeError(f"Skipping GP {trialGP} in the loop because it still carries an +/- infinite value")
-                if (exterior == 1 and currPhiValue < closestPhi) or (exterior == 0 and currPhiValue > closestPhi):
-                    closestIt  = i
-                    closestPhi = currPhiValue
-            closest = int(self.trials[closestIt])
-            self.trials = np.delete(self.trials, closestIt)
-            self.confirm(closest, closestPhi, exterior)
+    def march(self, exterior, knownTmp, phiField, gpStates):
+        nGPx, nGPy, nGPz = self.gnum
+        sign = 1. if exterior == 1 else -1.
+        narrow_band = []
+        trial_order = {}
+
+        def trialize(i):
+            if gpStates[i] != 0 and sign * phiField[i] > 0:
+                if gpStates[i] != 1:
+                    gpStates[i] = 1
+                    trial_order[i] = len(trial_order)
+                phiField[i] = self.updateFastMarchingMethod(i, exterior, phiField, gpStates)
+                heapq.heappush(narrow_band, (sign * phiField[i], trial_order[i], i))
+
+        def trializeFromKnown(i):
+            xInd = i % nGPx
+            yInd = (i // nGPx) % nGPy
+            zInd = i // (nGPx * nGPy)
+            if xInd > 0: trialize(i - 1)
+            if xInd < nGPx - 1: trialize(i + 1)
+            if yInd > 0: trialize(i - nGPx)
+            if yInd < nGPy - 1: trialize(i + nGPx)
+            if zInd > 0: trialize(i - nGPx * nGPy)
+            if zInd < nGPz - 1: trialize(i + nGPx * nGPy)
+
+        for gpKnown in knownTmp:
+            trializeFromKnown(gpKnown)
+        while narrow_band:
+            key, _, closest = heapq.heappop(narrow_band)
+            if gpStates[closest] != 1 or key != sign * phiField[closest]: continue
+            gpStates[closest] = 0
+            trializeFromKnown(closest)
 
     def phi(self):
+        phiField = self.phiField.tolist()
+        gpStates = self.gpStates.tolist()
         for side in range(2):
-            func1 = partial(self.iniStates, side, self.phiField, self.gpStates)
-            self.gpStates = np.array(self.pool.map(func1, range(self.gridSum)))
-            func2 = partial(self.iniFront, side, self.phiField)
-            knownTmp = np.array(self.pool.map(func2, range(self.gridSum)))
-            knownTmp = knownTmp[knownTmp > -1]
-
-            for gpKnown in range(knownTmp.shape[0]):
-                self.trializeFromKnown(knownTmp[gpKnown], side)
-            self.loopTrials(side)
+            phiArray = np.array(phiField)
+            onSide = np.isfinite(phiArray) & ((phiArray >= 0.) if side == 1 else (phiArray <= 0.))
+            knownTmp = np.flatnonzero(onSide)
+            for gpKnown in knownTmp.tolist():
+                gpStates[gpKnown] = 0
 
+            self.march(side, knownTmp.tolist(), phiField, gpStates)
             self.known = np.append(self.known, knownTmp)
-            del knownTmp
-        self.pool.close()
-        self.pool.join()
-
-        
-
+        self.phiField = np.array(phiField)
+        self.gpStates = np.array(gpStates, dtype=np.int32)
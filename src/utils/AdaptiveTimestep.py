@@ -0,0 +1,40 @@
+class AdaptiveTimestep(object):
+    """Adaptive time step shared by the DEM and MPM solvers
+
+    The stable step is ``CFL`` times the critical step of the engine, re-evaluated every ``interval`` steps and bounded by
+    the prescribed step. The steps are cut to land on the saves, which are scheduled from the time the stepping starts.
+    """
+    def __init__(self, sims, engine, interval=1):
+        self.sims = sims
+        self.engine = engine
+        self.interval = interval
+        self.stable_timestep = sims.max_timestep
+        self.min_timestep = sims.max_timestep
+        self.start_time = sims.current_time
+        self.start_step = sims.current_step
+
+    def update(self, scene, last_save_time):
+        if (self.sims.current_step - self.start_step) % self.interval == 0:
+            self.stable_timestep = min(self.sims.CFL * self.engine.calculate_critical_timestep(self.sims, scene), self.sims.max_timestep)
+            self.min_timestep = min(self.min_timestep, self.stable_timestep)
+        timestep = self.land_on_save(self.stable_timestep, last_save_time)
+        self.sims.dt[None] = timestep
+        self.sims.delta = timestep
+
+    def land_on_save(self, timestep, last_save_time):
+        # a save falls on this step when the remaining time is a roundoff, the step then aims at the next one
+        remaining = last_save_time + self.sims.save_interval - self.sims.current_time
+        if remaining < 0.01 * timestep:
+            remaining += self.sims.save_interval
+        # two steps before a save are balanced instead of leaving a sliver step behind
+        if timestep >= remaining:
+            timestep = remaining
+        elif 2. * timestep > remaining:
+            timestep = 0.5 * remaining
+        return timestep
+
+    def print_info(self):
+        # compared with a fixed step run at the smallest stable step met so far
+        fixed_steps = int((self.sims.current_time - self.start_time) / self.min_timestep)
+        saved_steps = max(fixed_steps - (self.sims.current_step - self.start_step), 0)
+        print('# Time step =', self.sims.delta, '   ', 'Minimum time step =', self.min_timestep, '   ', 'Saved steps =', saved_steps, '\n')
@@ -0,0 +1,155 @@
+import atexit
+import queue
+import threading
+
+import numpy as np
+import taichi as ti
+from taichi.lang.util import to_numpy_type
+
+
+class SnapshotBuffer(object):
+    """Host copy of selected members of a struct field
+
+    All members are packed into one preallocated float64 host buffer by a single kernel launch,
+    so that taking a snapshot costs one device-to-host transfer instead of one ``to_numpy`` per member.
+    Several buffers are kept in a pool: a snapshot owns its buffer until :meth:`release` is called,
+    and :meth:`snapshot` blocks while all buffers are still held by pending writes.
+    """
+    def __init__(self, field, members, buffer_num=2):
+        self.members = list(members)
+        self.fields = [getattr(field, name) for name in self.members]
+        self.shapes = [self.get_member_shape(f) for f in self.fields]
+        self.dtypes = [to_numpy_type(f.dtype) for f in self.fields]
+        self.offsets = []
+        self.column_num = 0
+        for shape in self.shapes:
+            self.offsets.append(self.column_num)
+            self.column_num += int(np.prod(shape, dtype=np.int32))
+
+        self.buffers = [np.zeros((0, self.column_num)) for _ in range(buffer_num)]
+        self.free_buffers = queue.Queue()
+        for nb in range(buffer_num):
+            self.free_buffers.put(nb)
+        self.kernel_pack = self.build_kernel()
+
+    def get_member_shape(self, field):
+        if isinstance(field, ti.lang.matrix.MatrixField):
+            if field.ndim == 1:
+                return (field.n,)
+            return (field.n, field.m)
+        return ()
+
+    def build_kernel(self):
+        fields, shapes, offsets = self.fields, self.shapes, self.offsets
+
+        @ti.kernel
+        def kernel_pack_snapshot(num: int, buffer: ti.types.ndarray()):
+            for i in range(num):
+                for k in ti.static(range(len(fields))):
+                    if ti.static(len(shapes[k]) == 2):
+                        for a, b in ti.static(ti.ndrange(shapes[k][0], shapes[k][1])):
+                            buffer[i, offsets[k] + a * shapes[k][1] + b] = fields[k][i][a, b]
+                    elif ti.static(len(shapes[k]) == 1):
+                        for a in ti.static(range(shapes[k][0])):
+                            buffer[i, offsets[k] + a] = fields[k][i][a]
+                    else:
+                        buffer[i, offsets[k]] = fields[k][i]
+        return kernel_pack_snapshot
+
+    def snapshot(self, num):
+        num = int(num)
+        index = self.free_buffers.get()
+        if self.buffers[index].shape[0] < num:
+            self.buffers[index] = np.zeros((num, self.column_num))
+        if num > 0:
+            self.kernel_pack(num, self.buffers[index])
+        return Snapshot(self, index, num)
+
+    def release(self, index):
+        self.free_buffers.put(index)
+
+
+class Snapshot(object):
+    def __init__(self, owner: SnapshotBuffer, index, num):
+        self.owner = owner
+        self.index = index
+        self.num = num
+
+    def to_dict(self):
+        buffer = self.owner.buffers[self.index]
+        output = {}
+        for name, shape, offset, dtype in zip(self.owner.members, self.owner.shapes, self.owner.offsets, self.owner.dtypes):
+            width = int(np.prod(shape, dtype=np.int32))
+            output[name] = np.ascontiguousarray(buffer[0: self.num, offset: offset + width].reshape((self.num,) + shape), dtype=dtype)
+        return output
+
+    def release(self):
+        self.owner.release(self.index)
+
+    def collect(self):
+        try:
+            return self.to_dict()
+        finally:
+            self.release()
+
+
+class AsyncWriter(object):
+    """Background writer for simulation output
+
+    Tasks are executed by worker threads in submission order per worker. The task queue is bounded:
+    :meth:`submit` blocks once ``max_queue_size`` tasks are pending, which throttles the solver instead
+    of accumulating snapshots in host memory. Pending tasks are flushed at interpreter exit.
+    """
+    def __init__(self, max_queue_size=2, worker_num=1):
+        if max_queue_size < 1:
+            raise ValueError("Keyword:: /OutputQueueSize/ should be larger than 0")
+        if worker_num < 1:
+            raise ValueError("Keyword:: /OutputWorkers/ should be larger than 0")
+        self.tasks = queue.Queue(maxsize=max_queue_size)
+        self.errors = []
+        self.workers = []
+        for _ in range(worker_num):
+            worker = threading.Thread(target=self.run, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        atexit.register(self.close)
+
+    def run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                self.tasks.task_done()
+                break
+            function, args, kwargs = task
+            try:
+                function(*args, **kwargs)
+            except Exception as error:
+                self.errors.append(error)
+            finally:
+                self.tasks.task_done()
+
+    def submit(self, function, *args, **kwargs):
+        if not self.workers:
+            raise RuntimeError("The asynchronous writer has been closed")
+        self.check_errors()
+        self.tasks.put((function, args, kwargs))
+
+    def check_errors(self):
+        if self.errors:
+            error = self.errors[0]
+            self.errors = []
+            raise RuntimeError("Asynchronous output failed") from error
+
+    def flush(self):
+        self.tasks.join()
+        self.check_errors()
+
+    def close(self):
+        if not self.workers:
+            return
+        self.flush()
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
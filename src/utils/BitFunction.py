@@ -43,6 +43,24 @@ def morton3d32(x, y, z):
     return md
 
 
+@ti.func
+def morton2d32(x, y):
+    # 15 bits per axis, so that the code stays a non-negative int32
+    md = 0
+    x &= 0x7fff
+    x = (x | x << 8) & 0x00ff00ff
+    x = (x | x << 4) & 0x0f0f0f0f
+    x = (x | x << 2) & 0x33333333
+    x = (x | x << 1) & 0x55555555
+    y &= 0x7fff
+    y = (y | y << 8) & 0x00ff00ff
+    y = (y | y << 4) & 0x0f0f0f0f
+    y = (y | y << 2) & 0x33333333
+    y = (y | y << 1) & 0x55555555
+    md |= x | y << 1
+    return md
+
+
 @ti.func
 def demorton3d32(md):
     x = md &        0x09249249
@@ -0,0 +1,251 @@
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+
+FRAME_PATTERN = re.compile(r"^(.*?)(\d{6})(\.npz)?$")
+RECORD_SIZE = 7          # append_id, frame, row_start, row_num, offset, nbytes, ndim
+
+
+def split_frame_file(file):
+    """Split an output file name such as ``.../particles/DEMParticle000012.npz`` into its series prefix and frame number"""
+    matched = FRAME_PATTERN.match(str(file))
+    if matched is None:
+        raise ValueError(f"{file} does not end with a six-digit frame number")
+    return matched.group(1), int(matched.group(2))
+
+
+def frame_exists(file):
+    if os.path.exists(file):
+        return True
+    try:
+        prefix, frame = split_frame_file(file)
+    except ValueError:
+        return False
+    return os.path.isdir(prefix) and frame in FrameSeries(prefix).frames()
+
+
+def load_frame(file, allow_pickle=True):
+    """Read one saved frame either from the per-frame ``.npz`` file or from the chunked series it belongs to"""
+    if os.path.exists(file):
+        return np.load(file, allow_pickle=allow_pickle)
+    prefix, frame = split_frame_file(file)
+    if not os.path.isdir(prefix):
+        raise EOFError(f"Neither {file} nor the chunked series {prefix} exists")
+    return FrameSeries(prefix).load(frame)
+
+
+class ChunkedDataset(object):
+    """Append-only on-disk dataset holding one field of a frame series
+
+    Every frame is split into chunks of ``chunk_rows`` rows, each compressed on its own and appended to ``<name>.bin``;
+    ``<name>.idx`` keeps one fixed-size record per chunk, so that a single row of a frame is read by seeking to and
+    inflating only the chunk that contains it.
+    """
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.data_file = os.path.join(path, name + ".bin")
+        self.index_file = os.path.join(path, name + ".idx")
+        self.meta_file = os.path.join(path, name + ".json")
+        self.meta = None
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, "r") as f:
+                self.meta = json.load(f)
+        # the index is read once, the records of later appends are kept here and merged when the index is queried
+        self.index = np.zeros((0, RECORD_SIZE), dtype=np.int64)
+        if os.path.exists(self.index_file):
+            self.index = np.fromfile(self.index_file, dtype=np.int64).reshape(-1, RECORD_SIZE)
+        self.new_records = []
+        self.append_id = int(self.index[:, 0].max()) + 1 if self.index.shape[0] > 0 else 0
+
+    def create(self, value: np.ndarray, compression, shuffle, chunk_rows):
+        self.meta = {"dtype": value.dtype.str, "shape": list(value.shape[1:]) if value.ndim > 0 else [],
+                     "compression": int(compression), "shuffle": bool(shuffle), "chunk_rows": int(chunk_rows)}
+        with open(self.meta_file, "w") as f:
+            json.dump(self.meta, f)
+
+    def get_index(self):
+        if len(self.new_records) > 0:
+            self.index = np.concatenate([self.index] + self.new_records)
+            self.new_records = []
+        return self.index
+
+    def encode(self, value: np.ndarray):
+        buffer = np.ascontiguousarray(value)
+        if self.meta["shuffle"] and buffer.dtype.itemsize > 1:
+            buffer = buffer.view(np.uint8).reshape(-1, buffer.dtype.itemsize).T
+        buffer = np.ascontiguousarray(buffer).tobytes()
+        if self.meta["compression"] > 0:
+            buffer = zlib.compress(buffer, self.meta["compression"])
+        return buffer
+
+    def decode(self, buffer, row_num):
+        dtype = np.dtype(self.meta["dtype"])
+        if self.meta["compression"] > 0:
+            buffer = zlib.decompress(buffer)
+        value = np.frombuffer(buffer, dtype=np.uint8)
+        if self.meta["shuffle"] and dtype.itemsize > 1:
+            value = np.ascontiguousarray(value.reshape(dtype.itemsize, -1).T)
+        return value.view(dtype).reshape([row_num] + self.meta["shape"])
+
+    def append(self, frame, value: np.ndarray):
+        ndim = value.ndim
+        if ndim == 0:
+            value = value.reshape(1)
+        if list(value.shape[1:]) != self.meta["shape"]:
+            raise ValueError(f"Field {self.name} changes its shape from {self.meta['shape']} to {list(value.shape[1:])}")
+        value = value.astype(np.dtype(self.meta["dtype"]), copy=False)
+
+        append_id = self.append_id
+        offset = os.path.getsize(self.data_file) if os.path.exists(self.data_file) else 0
+        chunk_rows = self.meta["chunk_rows"]
+        records = []
+        with open(self.data_file, "ab") as f:
+            for row_start in range(0, max(value.shape[0], 1), chunk_rows):
+                chunk = value[row_start: row_start + chunk_rows]
+                buffer = self.encode(chunk)
+                f.write(buffer)
+                records.append([append_id, frame, row_start, chunk.shape[0], offset, len(buffer), ndim])
+                offset += len(buffer)
+        records = np.asarray(records, dtype=np.int64)
+        with open(self.index_file, "ab") as f:
+            records.tofile(f)
+        self.new_records.append(records)
+        self.append_id += 1
+
+    def frame_records(self, frame, index=None):
+        index = self.get_index() if index is None else index
+        records = index[index[:, 1] == frame]
+        if records.shape[0] == 0:
+            return records
+        # a frame saved again (e.g. after a restart) supersedes the earlier copy
+        return records[records[:, 0] == records[:, 0].max()]
+
+    def frames(self):
+        return np.unique(self.get_index()[:, 1]).tolist()
+
+    def read_chunk(self, f, record):
+        f.seek(int(record[4]))
+        return self.decode(f.read(int(record[5])), int(record[3]))
+
+    def read(self, frame):
+        records = self.frame_records(frame)
+        if records.shape[0] == 0:
+            raise KeyError(f"Frame {frame} of field {self.name} does not exist")
+        with open(self.data_file, "rb") as f:
+            value = np.concatenate([self.read_chunk(f, record) for record in records[np.argsort(records[:, 2])]])
+        if records[0, 6] == 0:
+            value = value.reshape(())
+        return value
+
+    def read_row(self, row, frames=None):
+        index = self.get_index()
+        frames = np.unique(index[:, 1]).tolist() if frames is None else list(frames)
+        values = []
+        with open(self.data_file, "rb") as f:
+            for frame in frames:
+                records = self.frame_records(frame, index)
+                chunk = records[(records[:, 2] <= row) & (row < records[:, 2] + records[:, 3])]
+                if chunk.shape[0] == 0:
+                    raise IndexError(f"Row {row} is out of the range of field {self.name} at frame {frame}")
+                values.append(self.read_chunk(f, chunk[0])[row - int(chunk[0, 2])])
+        return frames, np.array(values)
+
+
+class FrameSeries(object):
+    """All fields of one output series, e.g. ``particles/DEMParticle``, stored as one chunked dataset per field"""
+    def __init__(self, path):
+        self.path = path
+        self.datasets = {}
+
+    def dataset(self, name):
+        if name not in self.datasets:
+            self.datasets[name] = ChunkedDataset(self.path, name)
+        return self.datasets[name]
+
+    def field_names(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(file[:-5] for file in os.listdir(self.path) if file.endswith(".json"))
+
+    def frames(self):
+        frames = set()
+        for name in self.field_names():
+            frames.update(self.dataset(name).frames())
+        return sorted(frames)
+
+    def flatten(self, data: dict, prefix=""):
+        fields = {}
+        for key, value in data.items():
+            if isinstance(value, np.ndarray) and value.dtype == object and value.ndim == 0:
+                value = value.item()
+            if isinstance(value, dict):
+                fields.update(self.flatten(value, prefix + key + "."))
+            else:
+                value = np.asarray(value)
+                if value.dtype == object:
+                    raise ValueError(f"Field {prefix + key} of type {type(value)} cannot be written to a chunked series")
+                fields[prefix + key] = value
+        return fields
+
+    def append(self, frame, data: dict, compression=1, downcast=False, shuffle=True, chunk_rows=65536):
+        os.makedirs(self.path, exist_ok=True)
+        for name, value in self.flatten(data).items():
+            if downcast and value.dtype == np.float64 and value.ndim > 0:
+                value = value.astype(np.float32)
+            dataset = self.dataset(name)
+            if dataset.meta is None:
+                dataset.create(value, compression, shuffle, chunk_rows)
+            dataset.append(frame, value)
+
+    def load(self, frame):
+        output = {}
+        for name in self.field_names():
+            dataset = self.dataset(name)
+            if dataset.frame_records(frame).shape[0] == 0: continue
+            keys = name.split(".")
+            entry = output
+            for key in keys[:-1]:
+                entry = entry.setdefault(key, {})
+            entry[keys[-1]] = dataset.read(frame)
+        if len(output) == 0:
+            raise KeyError(f"Frame {frame} is not saved in {self.path}")
+        for key, value in output.items():
+            if isinstance(value, dict):
+                output[key] = np.array(value, dtype=object)
+        return output
+
+    def trajectory(self, name, row, frames=None):
+        """History of one row (e.g. one particle) of field ``name``; only the chunk containing the row is read per frame"""
+        return self.dataset(name).read_row(row, frames)
+
+
+class ChunkedStore(object):
+    """Drop-in replacement of ``np.savez`` for the recorders
+
+    ``savez(".../particles/DEMParticle000012", **data)`` appends frame 12 to the series stored in the directory
+    ``.../particles/DEMParticle`` instead of creating a new file. Use :func:`load_frame` to read frames back.
+    """
+    def __init__(self, compression=1, downcast=False, shuffle=True, chunk_rows=65536):
+        if not 0 <= compression <= 9:
+            raise ValueError("Keyword:: /Compression/ should be an integer between 0 and 9")
+        if chunk_rows < 1:
+            raise ValueError("Keyword:: /ChunkRows/ should be larger than 0")
+        self.compression = compression
+        self.downcast = downcast
+        self.shuffle = shuffle
+        self.chunk_rows = chunk_rows
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def savez(self, file, **data):
+        prefix, frame = split_frame_file(file)
+        with self.lock:
+            if prefix not in self.series:
+                self.series[prefix] = FrameSeries(prefix)
+            self.series[prefix].append(frame, data, self.compression, self.downcast, self.shuffle, self.chunk_rows)
@@ -2,6 +2,62 @@ import taichi as ti
 
 from src.utils.constants import LThreshold
 from src.utils.linalg import no_operation
+from src.utils import GlobalVariable
+
+
+@ti.func
+def periodic_position(position):
+    # wrap a position back into [0, L) along the periodic axes
+    wrapped = position
+    for d in ti.static(range(position.n)):
+        if ti.static(GlobalVariable.PERIODIC[d]):
+            length = GlobalVariable.DOMAIN[d]
+            wrapped[d] -= length * ti.floor(position[d] / length)
+    return wrapped
+
+
+@ti.func
+def periodic_distance(distance):
+    # minimum image convention of a branch vector along the periodic axes
+    image = distance
+    for d in ti.static(range(distance.n)):
+        if ti.static(GlobalVariable.PERIODIC[d]):
+            length = GlobalVariable.DOMAIN[d]
+            image[d] -= length * ti.round(distance[d] / length)
+    return image
+
+
+@ti.func
+def periodic_image(reference, position):
+    # the periodic image of position closest to reference
+    return reference - periodic_distance(reference - position)
+
+
+@ti.func
+def periodic_cell_index(index, cnum):
+    # wrap cell/node indices along the periodic axes
+    wrapped = index
+    for d in ti.static(range(index.n)):
+        if ti.static(GlobalVariable.PERIODIC[d]):
+            wrapped[d] = index[d] % cnum[d]
+    return wrapped
+
+
+@ti.func
+def is_node_in_domain(grid_id):
+    in_domain = True
+    for d in ti.static(range(grid_id.n)):
+        if ti.static(not GlobalVariable.PERIODIC[d]):
+            in_domain &= grid_id[d] >= 0
+    return in_domain
+
+
+@ti.func
+def is_out_of_grid(index, gnum, axis: ti.template()):
+    out_of_grid = False
+    if ti.static(not GlobalVariable.PERIODIC[axis]):
+        out_of_grid = index < 0 or index >= gnum[axis]
+    return out_of_grid
 
 
 @ti.data_oriented
@@ -10,4 +10,7 @@ APIC = False
 PARTICLESHIFTING = False
 SHAPEFUNCTION = 0
 INFLUENCENODE = 2
-TWOPHASESINGLELAYER = False
\ No newline at end of file
+TWOPHASESINGLELAYER = False
+# periodic boundary
+PERIODIC = [False, False, False]
+DOMAIN = [0., 0., 0.]
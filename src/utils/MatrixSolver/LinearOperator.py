@@ -0,0 +1,16 @@
+import taichi as ti
+
+
+@ti.data_oriented
+class LinearOperator:
+    """Wrap a matrix-vector product so that solvers never touch an assembled matrix
+
+    The wrapped function is called as ``matvec(x, Ax)`` and should write the product into ``Ax``.
+    """
+    def __init__(self, matvec):
+        self._matvec = matvec
+
+    def matvec(self, x, Ax):
+        if x.shape != Ax.shape:
+            raise ValueError(f"Dimension mismatch x.shape{x.shape} != Ax.shape{Ax.shape}")
+        self._matvec(x, Ax)
@@ -0,0 +1,104 @@
+import taichi as ti
+
+from src.utils.MatrixSolver.LinearOperator import LinearOperator
+
+
+@ti.data_oriented
+class MatrixFreePCG:
+    """Matrix-free preconditioned conjugate gradient
+
+    Solve A x = b for a symmetric positive definite operator given as a :class:`LinearOperator`.
+    By default the Jacobi preconditioner is built from the diagonal ``M`` of ``A``; any other
+    symmetric preconditioner (e.g. a multigrid V-cycle) can be supplied as a :class:`LinearOperator`.
+
+    References:
+        Y. Saad, Iterative Methods for Sparse Linear Systems, 2nd ed., Algorithm 9.1
+    """
+    def __init__(self, length):
+        self.r = ti.field(float, shape=length)
+        self.d = ti.field(float, shape=length)
+        self.q = ti.field(float, shape=length)
+        self.z = ti.field(float, shape=length)
+
+    @ti.kernel
+    def initial_residual(self, length: int, b: ti.template()) -> float:
+        bnorm = 0.
+        for i in range(length):
+            self.r[i] = b[i] - self.q[i]
+            bnorm += b[i] * b[i]
+        return bnorm
+
+    @ti.kernel
+    def jacobi_preconditioner(self, length: int, M: ti.template()):
+        for i in range(length):
+            self.z[i] = self.r[i] / M[i] if M[i] != 0. else self.r[i]
+
+    @ti.kernel
+    def reset_direction(self, length: int) -> float:
+        rz = 0.
+        for i in range(length):
+            self.d[i] = self.z[i]
+            rz += self.r[i] * self.z[i]
+        return rz
+
+    @ti.kernel
+    def update_direction(self, length: int, beta: float):
+        for i in range(length):
+            self.d[i] = self.z[i] + beta * self.d[i]
+
+    @ti.kernel
+    def dot_direction(self, length: int) -> float:
+        dq = 0.
+        for i in range(length):
+            dq += self.d[i] * self.q[i]
+        return dq
+
+    @ti.kernel
+    def update_solution(self, length: int, alpha: float, x: ti.template()) -> float:
+        rnorm = 0.
+        for i in range(length):
+            x[i] += alpha * self.d[i]
+            self.r[i] -= alpha * self.q[i]
+            rnorm += self.r[i] * self.r[i]
+        return rnorm
+
+    @ti.kernel
+    def dot_residual(self, length: int) -> float:
+        rz = 0.
+        for i in range(length):
+            rz += self.r[i] * self.z[i]
+        return rz
+
+    def precondition(self, length, M, preconditioner: LinearOperator):
+        if preconditioner is None:
+            self.jacobi_preconditioner(length, M)
+        else:
+            preconditioner.matvec(self.r, self.z)
+
+    def solve(self, A: LinearOperator, b, x, M, length, maxiter=5000, tol=1e-12, preconditioner: LinearOperator=None):
+        if length > self.r.shape[0]:
+            raise RuntimeError(f"The number of unknowns {length} exceeds the allocated solver size {self.r.shape[0]}")
+
+        A.matvec(x, self.q)
+        bnorm = self.initial_residual(length, b)
+        if bnorm == 0.:
+            return 0
+
+        threshold = tol * tol * bnorm
+        self.precondition(length, M, preconditioner)
+        rz = self.reset_direction(length)
+        iter_num = 0
+        while iter_num < maxiter:
+            A.matvec(self.d, self.q)
+            dq = self.dot_direction(length)
+            if dq <= 0.: break
+            alpha = rz / dq
+            rnorm = self.update_solution(length, alpha, x)
+            iter_num += 1
+            if rnorm < threshold: break
+
+            self.precondition(length, M, preconditioner)
+            rz_new = self.dot_residual(length)
+            self.update_direction(length, rz_new / rz)
+            rz = rz_new
+        return iter_num
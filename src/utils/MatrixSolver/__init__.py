@@ -0,0 +1,11 @@
+# Copyright (c) 2023, multiscale geomechanics lab, Zhejiang University
+# This file is from the GeoTaichi project, released under the GNU General Public License v3.0
+
+__author__ = "Shi-Yihao, Guo-Ning"
+__version__ = "0.1.0"
+__license__ = "GNU License"
+
+
+
+        
+
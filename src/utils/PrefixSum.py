@@ -167,22 +167,20 @@ def serial(input:ti.template()):
 
 @ti.kernel
 def down_sweep(d: int, n: int, offset: int, output: ti.template()):
-    for i in range(n):
-        if i < d:
-            ai = offset * (2 * i + 1) - 1
-            bi = offset * (2 * i + 2) - 1
-            output[bi] += output[ai]
+    for i in range(d):
+        ai = offset * (2 * i + 1) - 1
+        bi = offset * (2 * i + 2) - 1
+        output[bi] += output[ai]
 
 
 @ti.kernel
 def up_sweep(d: int, n: int, offset: int, output: ti.template()):
-    for i in range(n):
-        if i < d:
-            ai = offset * (2 * i + 1) - 1
-            bi = offset * (2 * i + 2) - 1
-            tmp = output[ai]
-            output[ai] = output[bi]
-            output[bi] += tmp
+    for i in range(d):
+        ai = offset * (2 * i + 1) - 1
+        bi = offset * (2 * i + 2) - 1
+        tmp = output[ai]
+        output[ai] = output[bi]
+        output[bi] += tmp
 
 
     
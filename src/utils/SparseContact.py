@@ -0,0 +1,79 @@
+import numpy as np
+
+from src.utils.ChunkedStore import load_frame
+
+
+def pair_keys(end1, end2):
+    return (np.asarray(end1, dtype=np.int64) << 32) | np.asarray(end2, dtype=np.int64)
+
+
+class SparseContactEncoder(object):
+    """Writes contact frames that only keep pairs carrying a force
+
+    Pairs are sorted by (end1, end2). A pair that already existed in the previously written frame is
+    referenced by one bit of ``kept`` (a packed mask over the previous pairs); only pairs that are new
+    are written explicitly, as the increment of end1 and the value of end2. The first frame after
+    :meth:`reset` has no base and lists every pair explicitly. Such a keyframe is also written every
+    ``keyframe_interval`` frames, which bounds the chain a reader has to follow back.
+    """
+    def __init__(self, keyframe_interval=10):
+        self.keyframe_interval = keyframe_interval
+        self.keys = None
+        self.frame = -1
+        self.chain_length = 0
+
+    def reset(self):
+        self.keys = None
+        self.frame = -1
+        self.chain_length = 0
+
+    def write(self, file, current_time, current_print, end1, end2, normal_force, tangential_force, savez=np.savez):
+        active = np.any(normal_force != 0., axis=1)
+        keys = pair_keys(end1[active], end2[active])
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+
+        if self.chain_length >= self.keyframe_interval:
+            self.reset()
+        if self.keys is None:
+            kept = np.zeros(0, dtype=bool)
+            new_keys = keys
+        else:
+            kept = np.isin(self.keys, keys, assume_unique=True)
+            new_keys = keys[~np.isin(keys, self.keys, assume_unique=True)]
+        new_end1 = (new_keys >> 32).astype(np.int32)
+        new_end2 = (new_keys & 0xFFFFFFFF).astype(np.int32)
+
+        savez(file, t_current=current_time, base_frame=self.frame, contact_num=keys.shape[0], kept_num=kept.shape[0], kept=np.packbits(kept),
+              new_end1=np.diff(new_end1, prepend=0).astype(np.int32), new_end2=new_end2,
+              normal_force=np.ascontiguousarray(normal_force[active][order]), tangential_force=np.ascontiguousarray(tangential_force[active][order]))
+        self.keys = keys
+        self.frame = current_print
+        self.chain_length += 1
+
+
+def decode_keys(contact_info, base_keys):
+    new_end1 = np.cumsum(contact_info["new_end1"], dtype=np.int64)
+    new_keys = pair_keys(new_end1, contact_info["new_end2"])
+    if int(contact_info["base_frame"]) < 0:
+        return new_keys
+    kept = np.unpackbits(contact_info["kept"], count=int(contact_info["kept_num"])).astype(bool)
+    return np.union1d(base_keys[kept], new_keys)
+
+
+def read_sparse_contact(contact_path, current_print):
+    """Decode frame ``current_print`` of a sparse contact series, e.g. ``contact_path = ".../contacts/DEMContactPPSparse"``
+
+    The chain of base frames is followed back to the last frame written without base.
+    """
+    chain = [load_frame(contact_path + f"{current_print:06d}.npz")]
+    while int(chain[-1]["base_frame"]) >= 0:
+        chain.append(load_frame(contact_path + f"{int(chain[-1]['base_frame']):06d}.npz"))
+
+    keys = None
+    for contact_info in reversed(chain):
+        keys = decode_keys(contact_info, keys)
+    contact_info = chain[0]
+    return {"t_current": contact_info["t_current"], "contact_num": contact_info["contact_num"],
+            "end1": (keys >> 32).astype(np.int32), "end2": (keys & 0xFFFFFFFF).astype(np.int32),
+            "normal_force": contact_info["normal_force"], "tangential_force": contact_info["tangential_force"]}
@@ -1,4 +1,7 @@
-from time import time
+import json
+from time import perf_counter, time
+
+import taichi as ti
 
 class Timer(object):
     def __init__(self, description):
@@ -48,4 +51,130 @@ class FpsCounter:
 
             print(f"Avg FPS: {self.avg_fps}     (after {self.elapsed_secs}s)")
 
-        return (self.avg_fps, self.elapsed_secs)
\ No newline at end of file
+        return (self.avg_fps, self.elapsed_secs)
+
+
+class Profiler(object):
+    """Opt-in phase timer of the solvers
+
+    Phases are measured by wrapping the function pointers chosen in ``manage_function``/``choose_engine``
+    (see :meth:`instrument`), so the solvers keep their call structure. The device is synchronized around
+    every measured call, otherwise asynchronous kernel launches would be billed to the next phase.
+    Nested phases are reported exclusive of their children.
+    """
+    def __init__(self, report_interval=0):
+        self.report_interval = int(report_interval)
+        self.timings = dict()
+        self.calls = dict()
+        self.counters = dict()
+        self.gauges = dict()
+        self.stack = []
+        self.instrumented = []
+        self.steps = 0
+        self.start_time = 0.
+        self.wall_time = 0.
+
+    def begin(self, name):
+        ti.sync()
+        self.stack.append([name, perf_counter(), 0.])
+
+    def end(self):
+        ti.sync()
+        name, start, child = self.stack.pop()
+        elapsed = perf_counter() - start
+        if name not in self.timings:
+            self.timings[name] = 0.
+            self.calls[name] = 0
+        self.timings[name] += elapsed - child
+        self.calls[name] += 1
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def wrap(self, name, function, after=None):
+        def timed_function(*args, **kwargs):
+            self.begin(name)
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                self.end()
+            if after is not None:
+                after(result)
+            return result
+        return timed_function
+
+    def instrument(self, obj, attr, name, after=None):
+        function = getattr(obj, attr, None)
+        if function is None:
+            return
+        self.instrumented.append((obj, attr, attr in obj.__dict__, function))
+        setattr(obj, attr, self.wrap(name, function, after))
+
+    def restore(self):
+        for obj, attr, own_attribute, function in reversed(self.instrumented):
+            if own_attribute:
+                setattr(obj, attr, function)
+            else:
+                delattr(obj, attr)
+        self.instrumented = []
+
+    def count(self, name, number=1):
+        self.counters[name] = self.counters.get(name, 0) + int(number)
+
+    def gauge(self, name, value):
+        value = float(value)
+        if name not in self.gauges:
+            self.gauges[name] = {"last": value, "min": value, "max": value}
+        else:
+            gauge = self.gauges[name]
+            gauge["last"] = value
+            gauge["min"] = min(gauge["min"], value)
+            gauge["max"] = max(gauge["max"], value)
+
+    def start(self):
+        ti.sync()
+        self.start_time = perf_counter()
+
+    def stop(self):
+        ti.sync()
+        self.wall_time += perf_counter() - self.start_time
+        self.start_time = 0.
+
+    def step(self):
+        self.steps += 1
+        if self.report_interval > 0 and self.steps % self.report_interval == 0:
+            self.print_table()
+
+    def elapsed(self):
+        if self.start_time > 0.:
+            return self.wall_time + perf_counter() - self.start_time
+        return self.wall_time
+
+    def print_table(self):
+        total = max(self.elapsed(), 1e-15)
+        print(f" Profiler: {self.steps} steps ".center(71, "-"))
+        print("Phase".ljust(32) + "Calls".rjust(10) + "Time (s)".rjust(14) + "Share".rjust(10))
+        for name, timing in sorted(self.timings.items(), key=lambda item: -item[1]):
+            print(name.ljust(32) + str(self.calls[name]).rjust(10) + f"{timing:14.4f}" + f"{100. * timing / total:9.1f}%")
+        other = total - sum(self.timings.values())
+        print("others".ljust(32) + "".rjust(10) + f"{other:14.4f}" + f"{100. * other / total:9.1f}%")
+        for name, number in self.counters.items():
+            print((name + ": " + str(number)).ljust(67))
+        for name, gauge in self.gauges.items():
+            if name.endswith("usage"):
+                print((name + ": " + f"last {gauge['last']:.3f}, max {gauge['max']:.3f}, headroom {1. - gauge['max']:.3f}").ljust(67))
+            else:
+                print((name + ": " + f"last {gauge['last']:.4g}, min {gauge['min']:.4g}, max {gauge['max']:.4g}").ljust(67))
+        print('\n')
+
+    def summary(self):
+        total = self.elapsed()
+        return {"steps": self.steps, "wall_time": total,
+                "phases": {name: {"calls": self.calls[name], "time": timing, "time_per_step": timing / max(self.steps, 1),
+                                  "share": timing / total if total > 0. else 0.} for name, timing in self.timings.items()},
+                "others": total - sum(self.timings.values()),
+                "counters": dict(self.counters),
+                "gauges": {name: dict(gauge, headroom=1. - gauge["max"]) if name.endswith("usage") else dict(gauge) for name, gauge in self.gauges.items()}}
+
+    def dump(self, file):
+        with open(file, "w") as f:
+            json.dump(self.summary(), f, indent=2)
@@ -6,22 +6,48 @@ from src.utils.PrefixSum import PrefixSumExecutor
 
 # Reference: Ha, L., Krüger, J., & Silva, C. T. (2009, December). Fast Four‐Way Parallel Radix Sorting on GPUs. In Computer Graphics Forum (Vol. 28, No. 8, pp. 2368-2378). Oxford, UK: Blackwell Publishing Ltd.
 BLOCK_SZ = 256
+CPU_BLOCK_SZ = 4096
+RADIX_BITS = 8
+RADIX = 1 << RADIX_BITS
 class RadixSort(object):
-    def __init__(self, input_len) -> None:
+    def __init__(self, input_len, with_value=False) -> None:
+        self.with_value = with_value
         self.data_in = ti.field(dtype=ti.i32, shape=input_len)
         self.data_out = ti.field(dtype=ti.i32, shape=input_len)
+        self.value_in = ti.field(dtype=ti.i32, shape=input_len if with_value else 1)
+        self.value_out = ti.field(dtype=ti.i32, shape=input_len if with_value else 1)
 
-        if current_cfg().arch == ti.cuda:
+        if current_cfg().arch == ti.cuda and not with_value:
             self.grid_sz = int(input_len / BLOCK_SZ) if input_len % BLOCK_SZ == 0 else int(input_len / BLOCK_SZ) + 1
             self.pse = PrefixSumExecutor(4 * self.grid_sz)
             self.prefix_sums = ti.field(int, shape=input_len)
             self.block_sums = ti.field(int, shape=self.pse.get_length())
             self.run = self.radix_sort_gpu
-        elif current_cfg().arch == ti.cpu:
-            pass
+        elif current_cfg().arch == ti.cpu or current_cfg().arch == ti.cuda:
+            # Blocked LSD radix sort: each block is scanned serially, blocks run in parallel.
+            # Keys and values are moved together and the sort is stable, keys should be non-negative.
+            self.block_num = int(input_len / CPU_BLOCK_SZ) if input_len % CPU_BLOCK_SZ == 0 else int(input_len / CPU_BLOCK_SZ) + 1
+            self.pse = PrefixSumExecutor(RADIX * max(self.block_num, 1) + 1)
+            self.digit_count = ti.field(int, shape=self.pse.get_length())
+            self.run = self.radix_sort_cpu
         else:
             raise RuntimeError(f"{str(current_cfg().arch)} is not supported for radix sort.")
 
+    def radix_sort_cpu(self, input_len, key_bits=32):
+        block_num = int(input_len / CPU_BLOCK_SZ) if input_len % CPU_BLOCK_SZ == 0 else int(input_len / CPU_BLOCK_SZ) + 1
+        pass_num = (key_bits + RADIX_BITS - 1) // RADIX_BITS
+        for npass in range(pass_num):
+            shift_width = npass * RADIX_BITS
+            if npass % 2 == 0:
+                data_in, data_out, value_in, value_out = self.data_in, self.data_out, self.value_in, self.value_out
+            else:
+                data_in, data_out, value_in, value_out = self.data_out, self.data_in, self.value_out, self.value_in
+            radix_count_blocked(shift_width, input_len, block_num, data_in, self.digit_count)
+            self.pse.run(self.digit_count)
+            radix_scatter_blocked(shift_width, input_len, block_num, data_in, data_out, value_in, value_out, self.digit_count, self.with_value)
+        if pass_num % 2 == 1:
+            copy_sorted_data(input_len, self.data_out, self.data_in, self.value_out, self.value_in, self.with_value)
+
     def radix_sort_gpu(self, input_len):
         for shift_width in range(0, 31, 2):
             self.block_sums.fill(0)
@@ -115,3 +141,32 @@ def glbl_shuffle(shift_width: int, size: int, grid_sz: int, data_in: ti.template
         data_glbl_pos = offset + t_prefix_sum
         ti.simt.block.sync()
         data_out[data_glbl_pos] = t_data
+
+
+@ti.kernel
+def radix_count_blocked(shift_width: int, size: int, block_num: int, data_in: ti.template(), digit_count: ti.template()):
+    digit_count.fill(0)
+    for blid in range(block_num):
+        for i in range(blid * CPU_BLOCK_SZ, ti.min((blid + 1) * CPU_BLOCK_SZ, size)):
+            digit = (data_in[i] >> shift_width) & (RADIX - 1)
+            digit_count[digit * block_num + blid + 1] += 1
+
+@ti.kernel
+def radix_scatter_blocked(shift_width: int, size: int, block_num: int, data_in: ti.template(), data_out: ti.template(), value_in: ti.template(), value_out: ti.template(), 
+                          digit_count: ti.template(), with_value: ti.template()):
+    for blid in range(block_num):
+        for i in range(blid * CPU_BLOCK_SZ, ti.min((blid + 1) * CPU_BLOCK_SZ, size)):
+            t_data = data_in[i]
+            index = ((t_data >> shift_width) & (RADIX - 1)) * block_num + blid
+            data_glbl_pos = digit_count[index]
+            digit_count[index] = data_glbl_pos + 1
+            data_out[data_glbl_pos] = t_data
+            if ti.static(with_value):
+                value_out[data_glbl_pos] = value_in[i]
+
+@ti.kernel
+def copy_sorted_data(size: int, data_in: ti.template(), data_out: ti.template(), value_in: ti.template(), value_out: ti.template(), with_value: ti.template()):
+    for i in range(size):
+        data_out[i] = data_in[i]
+        if ti.static(with_value):
+            value_out[i] = value_in[i]
@@ -0,0 +1,92 @@
+import glob, json, os, shutil, subprocess, sys
+
+import numpy as np
+
+# Hertz-Mindlin spheres rain onto the floor of a box: the flight is bounded by the velocity over the smallest radius only,
+# the step then shrinks with the stiffness of the growing overlaps. Every step, the overlapping pairs are checked by brute
+# force against the contact list, a pair missed by the verlet check while the step varies would be counted.
+simulation_time = 0.6
+save_interval = 0.1
+
+
+def run_case(adaptive, timestep):
+    from geotaichi import DEM, init, ti
+    init(arch="cpu", log=False)
+
+    path = f"/tmp/dem_adaptive_timestep/{int(adaptive)}"
+    shutil.rmtree(path, ignore_errors=True)
+    dem = DEM()
+    dem.set_configuration(domain=ti.Vector([0.3, 0.3, 0.6]), boundary=["Destroy", "Destroy", "Destroy"], gravity=ti.Vector([0., 0., -9.8]),
+                          engine="SymplecticEuler", search="LinkedCell")
+    dem.set_solver({"Timestep": timestep, "SimulationTime": simulation_time, "SaveInterval": save_interval, "SavePath": path,
+                    "CFL": 0.2, "AdaptiveTimestep": adaptive})
+    dem.memory_allocate(memory={"max_material_number": 2, "max_particle_number": 2000, "max_sphere_number": 2000, "max_clump_number": 0,
+                                "max_plane_number": 5, "verlet_distance_multiplier": 0.2, "body_coordination_number": 16, "wall_coordination_number": 3})
+    dem.add_attribute(materialID=0, attribute={"Density": 2650., "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    dem.add_attribute(materialID=1, attribute={"Density": 26500., "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    dem.add_region(region={"Name": "cloud", "Type": "Rectangle", "BoundingBoxPoint": ti.Vector([0.02, 0.02, 0.25]),
+                           "BoundingBoxSize": ti.Vector([0.26, 0.26, 0.3]), "zdirection": ti.Vector([0., 0., 1.])})
+    dem.add_body(body={"GenerateType": "Generate", "RegionName": "cloud", "BodyType": "Sphere", "TryNumber": 10000,
+                       "Template": {"GroupID": 0, "MaterialID": 0, "MinRadius": 0.006, "MaxRadius": 0.01, "BodyNumber": 1200,
+                                    "InitialVelocity": ti.Vector([0., 0., 0.]), "InitialAngularVelocity": ti.Vector([0., 0., 0.])}})
+    dem.choose_contact_model(particle_particle_contact_model="Hertz Mindlin Model", particle_wall_contact_model="Hertz Mindlin Model")
+    dem.add_property(materialID1=0, materialID2=0, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    dem.add_property(materialID1=0, materialID2=1, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    for center, normal in [([0.15, 0.15, 0.], [0., 0., 1.]), ([0., 0.15, 0.3], [1., 0., 0.]), ([0.3, 0.15, 0.3], [-1., 0., 0.]),
+                           ([0.15, 0., 0.3], [0., 1., 0.]), ([0.15, 0.3, 0.3], [0., -1., 0.])]:
+        dem.add_wall(body={"WallType": "Plane", "MaterialID": 1, "WallCenter": ti.Vector(center), "OuterNormal": ti.Vector(normal)})
+    dem.select_save_data()
+
+    missed = ti.field(int, shape=())
+    max_overlap = ti.field(float, shape=())
+
+    def check_contact_list():
+        # every overlapping pair has to be found in the row of one of its particles
+        particle = ti.static(dem.scene.particle)
+        cplist = ti.static(dem.contactor.physpp.cplist)
+        particle_particle = ti.static(dem.contactor.neighbor.hist_particle_particle)
+        particleNum = dem.scene.particleNum[0]
+        for i, j in ti.ndrange(particleNum, particleNum):
+            if i < j:
+                gapn = (particle[i].x - particle[j].x).norm() - particle[i].rad - particle[j].rad
+                if gapn < 0.:
+                    ti.atomic_max(max_overlap[None], -gapn / ti.min(particle[i].rad, particle[j].rad))
+                    found = 0
+                    for nc in range(particle_particle[i], particle_particle[i + 1]):
+                        if cplist[nc].endID2 == j: found = 1
+                    for nc in range(particle_particle[j], particle_particle[j + 1]):
+                        if cplist[nc].endID2 == i: found = 1
+                    if found == 0:
+                        missed[None] += 1
+
+    dem.run(function=check_contact_list)
+    save_times = [float(np.load(name)["t_current"]) for name in sorted(glob.glob(path + "/particles/DEMParticle*.npz"))]
+    particleNum = int(dem.scene.particleNum[0])
+    x = dem.scene.particle.x.to_numpy()[:particleNum]
+    return {"steps": dem.sims.current_step, "min_timestep": dem.solver.timestepper.min_timestep if adaptive else dem.sims.delta, "save_times": save_times,
+            "mean_z": float(x[:, 2].mean()), "max_overlap": max_overlap[None], "missed": missed[None]}
+
+
+def launch(adaptive, timestep):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), str(adaptive), str(timestep)], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The run with AdaptiveTimestep = {bool(adaptive)} failed")
+    result = json.loads(lines[-1])
+    # the solver reports the time spent in its loop, without the compilation
+    result["elapsed"] = next(float(line.split("=")[1]) for line in lines if line.startswith("Physical time"))
+    return result
+
+
+if len(sys.argv) == 3:
+    print(json.dumps(run_case(sys.argv[1] == "1", float(sys.argv[2]))))
+else:
+    # the fixed step run uses the smallest step met by the adaptive run, the step it would need to be as safe
+    results = [launch(1, 1e-3)]
+    results.append(launch(0, results[0]["min_timestep"]))
+    print(f"{'adaptive':>10}{'steps':>8}{'min dt':>12}{'run s':>8}{'mean z':>9}{'overlap':>9}{'missed':>8}   save times")
+    for adaptive, result in zip([1, 0], results):
+        save_times = " ".join(f"{value:.6g}" for value in result["save_times"])
+        print(f"{adaptive:>10}{result['steps']:>8}{result['min_timestep']:>12.4e}{result['elapsed']:>8.2f}{result['mean_z']:>9.4f}"
+              f"{result['max_overlap']:>9.4f}{result['missed']:>8}   {save_times}")
@@ -0,0 +1,121 @@
+import glob, json, os, shutil, subprocess, sys
+
+import numpy as np
+
+# Chunked output against the legacy per-frame npz files. Spheres rain onto the floor of a box and the same run is saved in
+# both formats, then restarted from a middle frame with half the gravity and stopped before the end, so that the restart
+# rewrites some frames and leaves the trailing ones of the first run. Every frame read by load_frame from the chunked
+# series has to equal the npz file left on disk, the rewritten frames but the ones of the static wall have to differ from
+# the first run, and the trajectory of single particles has to equal the rows stacked from the npz files.
+timestep = 1e-4
+save_interval = 0.02
+simulation_time = 0.3
+restart_frame, restart_end = 5, 0.2
+root = "/tmp/chunked_output"
+
+
+def run_case(output_format, mode):
+    from geotaichi import DEM, init, ti
+    init(arch="cpu", log=False)
+
+    path = f"{root}/{output_format}"
+    restart = mode == "restart"
+    dem = DEM()
+    dem.set_configuration(domain=ti.Vector([0.2, 0.2, 0.4]), boundary=["Destroy", "Destroy", "Destroy"], gravity=ti.Vector([0., 0., -4.9 if restart else -9.8]),
+                          engine="SymplecticEuler", search="LinkedCell")
+    dem.set_solver({"Timestep": timestep, "SimulationTime": restart_end if restart else simulation_time, "SaveInterval": save_interval, "SavePath": path,
+                    "OutputFormat": output_format})
+    dem.memory_allocate(memory={"max_material_number": 2, "max_particle_number": 500, "max_sphere_number": 500, "max_clump_number": 0,
+                                "max_plane_number": 1, "verlet_distance_multiplier": 0.2, "body_coordination_number": 16, "wall_coordination_number": 3,
+                                "compaction_ratio": [0.4, 0.4]})
+    dem.add_attribute(materialID=0, attribute={"Density": 2650., "ForceLocalDamping": 0.1, "TorqueLocalDamping": 0.1})
+    dem.add_attribute(materialID=1, attribute={"Density": 26500., "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    if restart:
+        dem.read_restart(file_number=restart_frame, file_path=path, sphere=True, clump=False)
+    else:
+        dem.add_region(region={"Name": "cloud", "Type": "Rectangle", "BoundingBoxPoint": ti.Vector([0.01, 0.01, 0.01]),
+                               "BoundingBoxSize": ti.Vector([0.18, 0.18, 0.38]), "zdirection": ti.Vector([0., 0., 1.])})
+        dem.add_body(body={"GenerateType": "Generate", "RegionName": "cloud", "BodyType": "Sphere", "TryNumber": 10000,
+                           "Template": {"GroupID": 0, "MaterialID": 0, "MinRadius": 0.004, "MaxRadius": 0.006, "BodyNumber": 500,
+                                        "InitialVelocity": ti.Vector([0., 0., 0.]), "InitialAngularVelocity": ti.Vector([0., 0., 0.])}})
+        dem.add_wall(body={"WallType": "Plane", "MaterialID": 1, "WallCenter": ti.Vector([0.1, 0.1, 0.]), "OuterNormal": ti.Vector([0., 0., 1.])})
+    dem.choose_contact_model(particle_particle_contact_model="Hertz Mindlin Model", particle_wall_contact_model="Hertz Mindlin Model")
+    dem.add_property(materialID1=0, materialID2=0, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    dem.add_property(materialID1=0, materialID2=1, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    dem.select_save_data(particle=True, sphere=True, wall=True, particle_particle_contact=True, particle_wall_contact=True)
+    dem.run()
+    return {"particle_num": int(dem.scene.particleNum[0])}
+
+
+def launch(output_format, mode):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), output_format, mode], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The {mode} run with the {output_format} output failed")
+    return json.loads(lines[-1])
+
+
+def flatten(data, prefix=""):
+    fields = {}
+    for key in data:
+        value = data[key]
+        if isinstance(value, np.ndarray) and value.dtype == object and value.ndim == 0:
+            value = value.item()
+        if isinstance(value, dict):
+            fields.update(flatten(value, prefix + key + "."))
+        else:
+            fields[prefix + key] = np.asarray(value)
+    return fields
+
+
+def same_frame(frame1, frame2):
+    frame1, frame2 = flatten(frame1), flatten(frame2)
+    return frame1.keys() == frame2.keys() and all(frame1[key].shape == frame2[key].shape and np.array_equal(frame1[key], frame2[key]) for key in frame1)
+
+
+if len(sys.argv) == 3:
+    print(json.dumps(run_case(sys.argv[1], sys.argv[2])))
+else:
+    from src.utils.ChunkedStore import FrameSeries, load_frame, split_frame_file
+
+    shutil.rmtree(root, ignore_errors=True)
+    for output_format in ["npz", "chunked"]:
+        launch(output_format, "full")
+    shutil.copytree(f"{root}/npz", f"{root}/npz_full")
+    for output_format in ["npz", "chunked"]:
+        launch(output_format, "restart")
+
+    files = sorted(glob.glob(f"{root}/npz/**/*.npz", recursive=True))
+    series = {}
+    mismatch, rewritten, superseded = 0, 0, 0
+    for file in files:
+        legacy = np.load(file, allow_pickle=True)
+        chunked_file = file.replace(f"{root}/npz/", f"{root}/chunked/")
+        assert not os.path.exists(chunked_file)
+        mismatch += int(not same_frame(legacy, load_frame(chunked_file)))
+        prefix, frame = split_frame_file(chunked_file)
+        series.setdefault(prefix, []).append(frame)
+        full = np.load(file.replace(f"{root}/npz/", f"{root}/npz_full/"), allow_pickle=True)
+        if os.path.getmtime(file) > os.path.getmtime(file.replace(f"{root}/npz/", f"{root}/npz_full/")) and "DEMWall" not in file:
+            rewritten += 1
+            superseded += int(not same_frame(legacy, full))
+    print(f"{len(files)} frames in {len(series)} series, {mismatch} differ from the npz files, {rewritten} rewritten by the restart, "
+          f"{superseded} of them differ from the first run")
+    assert mismatch == 0 and rewritten > 0 and superseded == rewritten
+
+    frames_mismatch = sum(int(FrameSeries(prefix).frames() != sorted(frames)) for prefix, frames in series.items())
+    print(f"{frames_mismatch} series list other frames than the npz files")
+    assert frames_mismatch == 0
+
+    prefix = f"{root}/chunked/particles/DEMParticle"
+    legacy_frames = sorted(series[prefix])
+    legacy = [np.load(f"{root}/npz/particles/DEMParticle{frame:06d}.npz")["position"] for frame in legacy_frames]
+    rows = range(0, min(len(position) for position in legacy), 97)
+    trajectory_error = 0.
+    for row in rows:
+        frames, position = FrameSeries(prefix).trajectory("position", row)
+        assert frames == legacy_frames
+        trajectory_error = max(trajectory_error, float(np.abs(position - np.array([value[row] for value in legacy])).max()))
+    print(f"trajectories of {len(rows)} particles over {len(legacy_frames)} frames, max difference {trajectory_error:.2e}")
+    assert trajectory_error == 0.
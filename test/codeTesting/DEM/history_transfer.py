@@ -0,0 +1,71 @@
+import taichi as ti
+ti.init(arch=ti.cpu, default_fp=ti.f64, default_ip=ti.i32, debug=False)
+from time import time
+
+from src.dem.BaseStruct import ContactTable, HistoryContactTable
+from src.dem.contact.ContactKernel import kernel_inherit_contact_history, kernel_build_history_table, kernel_hash_contact_history
+
+particleNum = 20000
+repeat = 10
+
+
+@ti.kernel
+def setup(coordination: int, survive: float, cplist: ti.template(), hist_cplist: ti.template(), object_object: ti.template(), hist_object_object: ti.template()):
+    # The new list holds a random subset of old contacts plus fresh ones, both in shuffled order
+    for end1 in range(particleNum):
+        object_object[end1 + 1] = (end1 + 1) * coordination
+        hist_object_object[end1 + 1] = (end1 + 1) * coordination
+        for j in range(coordination):
+            hist_cplist[end1 * coordination + j]._copy(2 * j, ti.Vector([end1, j, 1.]))
+            end2 = 2 * j
+            if ti.random() > survive:
+                end2 = 2 * j + 1
+            cplist[end1 * coordination + j]._set_id(end1, end2)
+        for i in range(coordination - 1):
+            j = coordination - 1 - i
+            k = int(ti.random() * (j + 1))
+            temp1 = cplist[end1 * coordination + j].endID2
+            cplist[end1 * coordination + j].endID2 = cplist[end1 * coordination + k].endID2
+            cplist[end1 * coordination + k].endID2 = temp1
+            temp2 = hist_cplist[end1 * coordination + j]
+            hist_cplist[end1 * coordination + j] = hist_cplist[end1 * coordination + k]
+            hist_cplist[end1 * coordination + k] = temp2
+
+
+@ti.kernel
+def check(coordination: int, cplist: ti.template()) -> int:
+    error = 0
+    for nc in range(particleNum * coordination):
+        end1, end2 = cplist[nc].endID1, cplist[nc].endID2
+        expected = ti.Vector([0., 0., 0.])
+        if end2 % 2 == 0:
+            expected = ti.Vector([end1, end2 // 2, 1.])
+        if (cplist[nc].oldTangOverlap - expected).norm() > 1e-12:
+            error += 1
+    return error
+
+
+for coordination in [8, 32, 128]:
+    cplist = ContactTable.field(shape=particleNum * coordination)
+    hist_cplist = HistoryContactTable.field(shape=particleNum * coordination)
+    object_object = ti.field(int, shape=particleNum + 1)
+    hist_object_object = ti.field(int, shape=particleNum + 1)
+    history_table = ti.field(int, shape=2 * particleNum * coordination)
+
+    def linear_scan():
+        kernel_inherit_contact_history(particleNum, cplist, hist_cplist, object_object, hist_object_object)
+
+    def hash_table():
+        kernel_build_history_table(particleNum, hist_cplist, hist_object_object, history_table)
+        kernel_hash_contact_history(particleNum, cplist, hist_cplist, object_object, hist_object_object, history_table)
+
+    for name, transfer in [("LinearScan", linear_scan), ("HashTable", hash_table)]:
+        elapsed = 0.
+        for _ in range(repeat + 1):
+            setup(coordination, 0.8, cplist, hist_cplist, object_object, hist_object_object)
+            ti.sync()
+            start = time()
+            transfer()
+            ti.sync()
+            if _ > 0: elapsed += time() - start
+        print(f"coordination = {coordination}, {name}: {elapsed / repeat * 1000.:.3f} ms, mismatches = {check(coordination, cplist)}")
@@ -0,0 +1,161 @@
+import json, os, shutil, subprocess, sys
+
+import numpy as np
+
+# Spheres rain into a box and settle, the generator leaves them in random storage order. The check case reorders the
+# settled packing once along the Morton curve and compares every particle-particle and particle-wall contact, identified
+# by the positions of its ends, with the contact list before the reorder: the history has to survive and change sign
+# where the ends of a pair are swapped. The rolling models cannot settle a packing here (their surface property misses
+# the cut-off gap read by the force kernel), so their reorder kernels are checked on a random contact list and a random
+# permutation. The timing cases run the same packing without and with the periodic reorder.
+REORDER_INTERVALS = [0, 10, 1]
+
+
+def compare(before, after):
+    lost, swapped, error = 0, 0, 0.
+    for (end1, end2), value in before.items():
+        if (end1, end2) in after:
+            error = max(error, float(np.abs(after[(end1, end2)] - value).max(initial=0.)))
+        elif (end2, end1) in after:
+            swapped += 1
+            error = max(error, float(np.abs(after[(end2, end1)] + value).max(initial=0.)))
+        else:
+            lost += 1
+    return {"contacts": len(before), "kept": len(after), "lost": lost, "swapped": swapped, "error": error}
+
+
+def contact_history(table, total, keys, is_particle_particle):
+    history = np.concatenate([table[field][:total].reshape(total, -1) for field in ["oldTangOverlap", "oldRollAngle", "oldTwistAngle"] if field in table], axis=1)
+    end2 = [keys[end] if is_particle_particle else end for end in table["endID2"][:total]]
+    return {(keys[end1], end): value for end1, end, value in zip(table["endID1"][:total], end2, history)}
+
+
+def inverted_pairs(table, total):
+    # the neighbor search keeps endID1 < endID2, find_history only scans the segment of the smaller index
+    return int((table["endID1"][:total] > table["endID2"][:total]).sum())
+
+
+def run_case(particle_number, simulation_time, reorder_interval):
+    from geotaichi import DEM, init, ti
+    init(arch="cpu", log=False)
+
+    path = f"/tmp/morton_reorder/{reorder_interval}"
+    shutil.rmtree(path, ignore_errors=True)
+    dem = DEM()
+    dem.set_configuration(domain=ti.Vector([0.4, 0.4, 0.8]), boundary=["Destroy", "Destroy", "Destroy"], gravity=ti.Vector([0., 0., -9.8]),
+                          engine="SymplecticEuler", search="LinkedCell")
+    dem.set_solver({"Timestep": 5e-5, "SimulationTime": simulation_time, "SaveInterval": simulation_time, "SavePath": path, "ReorderInterval": reorder_interval})
+    dem.memory_allocate(memory={"max_material_number": 2, "max_particle_number": particle_number, "max_sphere_number": particle_number, "max_clump_number": 0,
+                                "max_plane_number": 5, "verlet_distance_multiplier": 0.2, "body_coordination_number": 16, "wall_coordination_number": 3,
+                                "compaction_ratio": [0.4, 0.4]})
+    dem.add_attribute(materialID=0, attribute={"Density": 2650., "ForceLocalDamping": 0.2, "TorqueLocalDamping": 0.2})
+    dem.add_attribute(materialID=1, attribute={"Density": 26500., "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    dem.add_region(region={"Name": "cloud", "Type": "Rectangle", "BoundingBoxPoint": ti.Vector([0.01, 0.01, 0.01]),
+                           "BoundingBoxSize": ti.Vector([0.38, 0.38, 0.78]), "zdirection": ti.Vector([0., 0., 1.])})
+    dem.add_body(body={"GenerateType": "Generate", "RegionName": "cloud", "BodyType": "Sphere", "TryNumber": 10000,
+                       "Template": {"GroupID": 0, "MaterialID": 0, "MinRadius": 0.004, "MaxRadius": 0.006, "BodyNumber": particle_number,
+                                    "InitialVelocity": ti.Vector([0., 0., 0.]), "InitialAngularVelocity": ti.Vector([0., 0., 0.])}})
+    dem.choose_contact_model(particle_particle_contact_model="Hertz Mindlin Model", particle_wall_contact_model="Hertz Mindlin Model")
+    dem.add_property(materialID1=0, materialID2=0, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    dem.add_property(materialID1=0, materialID2=1, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    for center, normal in [([0.2, 0.2, 0.], [0., 0., 1.]), ([0., 0.2, 0.4], [1., 0., 0.]), ([0.4, 0.2, 0.4], [-1., 0., 0.]),
+                           ([0.2, 0., 0.4], [0., 1., 0.]), ([0.2, 0.4, 0.4], [0., -1., 0.])]:
+        dem.add_wall(body={"WallType": "Plane", "MaterialID": 1, "WallCenter": ti.Vector(center), "OuterNormal": ti.Vector(normal)})
+    dem.select_save_data(particle=False, sphere=False, wall=False, particle_particle_contact=False, particle_wall_contact=False)
+    dem.run()
+    if reorder_interval == 0:
+        return {}
+
+    physpp, physpw, neighbor = dem.contactor.physpp, dem.contactor.physpw, dem.contactor.neighbor
+    def snapshot():
+        particleNum = int(dem.scene.particleNum[0])
+        keys = [row.tobytes() for row in dem.scene.particle.x.to_numpy()[:particleNum]]
+        return {"particle-particle": contact_history(physpp.cplist.to_numpy(), int(neighbor.hist_particle_particle[particleNum]), keys, True),
+                "particle-wall": contact_history(physpw.cplist.to_numpy(), int(neighbor.hist_particle_wall[particleNum]), keys, False)}
+
+    before = snapshot()
+    dem.enginer.reorderer.reorder(dem.scene, neighbor, physpp, physpw)
+    after = snapshot()
+    result = {name: compare(before[name], after[name]) for name in before}
+    result["particle-particle"]["inverted"] = inverted_pairs(physpp.cplist.to_numpy(), int(neighbor.hist_particle_particle[int(dem.scene.particleNum[0])]))
+    result["particle-wall"]["inverted"] = 0
+    return result
+
+
+def run_rolling_case(particle_number, coordination):
+    import taichi as ti
+    ti.init(arch=ti.cpu, default_fp=ti.f64, default_ip=ti.i32, debug=False)
+    from src.dem.BaseStruct import RollingContactTable, HistoryRollingContactTable
+    from src.dem.contact.ContactKernel import kernel_count_reorder_contact_, kernel_reorder_rolling_history_, kernel_restore_rolling_history_
+    from src.utils.PrefixSum import PrefixSumExecutor
+
+    # every particle touches the next ones in storage order, the history encodes the pair it was written for
+    rng = np.random.default_rng(0)
+    end1 = np.repeat(np.arange(particle_number), coordination)
+    end2 = end1 + np.tile(np.arange(1, coordination + 1), particle_number)
+    valid = end2 < particle_number
+    end1, end2 = end1[valid], end2[valid]
+    total = end1.shape[0]
+    history = rng.standard_normal((total, 9))
+    offsets = np.zeros(particle_number + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum(np.bincount(end1, minlength=particle_number))
+
+    cplist = RollingContactTable.field(shape=total)
+    hist_cplist = HistoryRollingContactTable.field(shape=total)
+    contact_pse = PrefixSumExecutor(particle_number + 1)
+    object_object = ti.field(int, shape=contact_pse.get_length())
+    hist_object_object = ti.field(int, shape=contact_pse.get_length())
+    particle_map = ti.field(int, shape=particle_number)
+    cplist.from_numpy({"endID1": end1.astype(np.int32), "endID2": end2.astype(np.int32), "cnforce": np.zeros((total, 3)), "csforce": np.zeros((total, 3)),
+                       "oldTangOverlap": history[:, 0:3], "oldRollAngle": history[:, 3:6], "oldTwistAngle": history[:, 6:9]})
+    hist_object_object.from_numpy(np.concatenate([offsets, np.zeros(contact_pse.get_length() - particle_number - 1, dtype=np.int32)]))
+    permutation = rng.permutation(particle_number).astype(np.int32)
+    particle_map.from_numpy(permutation)
+
+    kernel_count_reorder_contact_(particle_number, True, particle_map, cplist, object_object, hist_object_object)
+    contact_pse.run(object_object)
+    kernel_reorder_rolling_history_(particle_number, True, particle_map, cplist, hist_cplist, object_object, hist_object_object)
+    kernel_restore_rolling_history_(particle_number, cplist, hist_cplist, object_object)
+
+    # the new storage slot of a particle is mapped back to its old index, so that both lists share the same keys
+    inverse = np.empty_like(permutation)
+    inverse[permutation] = np.arange(particle_number, dtype=np.int32)
+    table = cplist.to_numpy()
+    before = contact_history({"endID1": end1, "endID2": end2, "oldTangOverlap": history[:, 0:3], "oldRollAngle": history[:, 3:6], "oldTwistAngle": history[:, 6:9]},
+                             total, np.arange(particle_number), True)
+    after = contact_history(table, int(object_object[particle_number]), inverse, True)
+    result = compare(before, after)
+    result["inverted"] = inverted_pairs(table, int(object_object[particle_number]))
+    return {"particle-particle": result}
+
+
+def launch(*args):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__)] + [str(arg) for arg in args], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The case {args} failed")
+    result = json.loads(lines[-1])
+    # the solver reports the time spent in its loop, without the compilation
+    result["elapsed"] = next((float(line.split("=")[1]) for line in lines if line.startswith("Physical time")), 0.)
+    return result
+
+
+if len(sys.argv) == 4:
+    print(json.dumps(run_case(int(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3]))))
+elif len(sys.argv) == 3:
+    print(json.dumps(run_rolling_case(int(sys.argv[1]), int(sys.argv[2]))))
+else:
+    print(f"{'history':<12}{'contacts':<18}{'before':>8}{'after':>8}{'lost':>6}{'swapped':>9}{'inverted':>10}{'max error':>12}")
+    for label, result in [("sliding", launch(3000, 0.3, 1000000)), ("rolling", launch(100000, 6))]:
+        for name in ["particle-particle", "particle-wall"]:
+            if name in result:
+                value = result[name]
+                print(f"{label:<12}{name:<18}{value['contacts']:>8}{value['kept']:>8}{value['lost']:>6}{value['swapped']:>9}{value['inverted']:>10}{value['error']:>12.2e}")
+                assert value["contacts"] == value["kept"] and value["lost"] == 0 and value["inverted"] == 0 and value["error"] == 0.
+
+    steps = 6000
+    print(f"\n{'reorder interval':>16}{'run s':>8}{'ms/step':>9}")
+    for reorder_interval in REORDER_INTERVALS:
+        result = launch(20000, steps * 5e-5, reorder_interval)
+        print(f"{reorder_interval:>16}{result['elapsed']:>8.2f}{result['elapsed'] / steps * 1000.:>9.3f}")
@@ -0,0 +1,177 @@
+import taichi as ti
+ti.init(arch=ti.cpu, default_fp=ti.f64, default_ip=ti.i32, debug=False)
+from time import time
+from types import SimpleNamespace
+
+from src.dem.BaseStruct import ParticleFamily, SphereFamily, ClumpFamily, ContactTable, HistoryContactTable
+from src.dem.ParticleCompaction import ParticleCompaction
+from src.dem.contact.ContactKernel import kernel_count_reorder_contact_, kernel_reorder_contact_history_, kernel_restore_contact_history_
+from src.utils.PrefixSum import PrefixSumExecutor
+
+bodyNum = 200000
+pebbles = 3
+coordination = 6
+repeat = 5
+
+# every fourth body is a clump of three pebbles, the others are spheres
+clumpNum = bodyNum // 4
+sphereNum = bodyNum - clumpNum
+particleNum = sphereNum + pebbles * clumpNum
+sims = SimpleNamespace(max_particle_num=particleNum, max_sphere_num=sphereNum, max_clump_num=clumpNum)
+scene = SimpleNamespace(particle=ParticleFamily.field(shape=particleNum), sphere=SphereFamily.field(shape=sphereNum), clump=ClumpFamily.field(shape=clumpNum),
+                        particleNum=[0], sphereNum=[0], clumpNum=[0])
+reference = SimpleNamespace(particle=ParticleFamily.field(shape=particleNum), sphere=SphereFamily.field(shape=sphereNum), clump=ClumpFamily.field(shape=clumpNum))
+cplist = ContactTable.field(shape=particleNum * coordination)
+hist_cplist = HistoryContactTable.field(shape=particleNum * coordination)
+contact_pse = PrefixSumExecutor(particleNum + 1)
+object_object = ti.field(int, shape=contact_pse.get_length())
+hist_object_object = ti.field(int, shape=contact_pse.get_length())
+
+
+@ti.kernel
+def setup(removal: float, particle: ti.template(), sphere: ti.template(), clump: ti.template()):
+    # x[0] tags the particle, sphere inv_I and clump m tag the body, so that the compacted storage can be checked
+    ti.loop_config(serialize=True)
+    for nb in range(bodyNum):
+        nclump = nb // 4
+        nsphere = nb - nclump
+        np = nsphere + pebbles * nclump
+        if nb % 4 == 3:
+            clump[nclump].startIndex = np
+            clump[nclump].endIndex = np + pebbles - 1
+            clump[nclump].m = nb
+            for i in range(pebbles):
+                particle[np + i].multisphereIndex = nclump
+        else:
+            sphere[nsphere].sphereIndex = np
+            sphere[nsphere].inv_I = nb
+            particle[np].multisphereIndex = -nsphere - 1
+    for np in range(particleNum):
+        # a fixed hash of the index, so that both compactions remove the same particles
+        particle[np].active = ti.u8(0) if (np * 7919 + 13) % 10007 < removal * 10007 else ti.u8(1)
+        particle[np].x = ti.Vector([np, 0., 0.])
+
+
+@ti.kernel
+def setup_contact(particle: ti.template(), cplist: ti.template(), object_object: ti.template()):
+    for np in range(particleNum):
+        object_object[np + 1] = (np + 1) * coordination
+        for j in range(coordination):
+            end2 = (np + 7 * j + 1) % particleNum
+            cplist[np * coordination + j]._set_id(np, end2)
+            cplist[np * coordination + j].oldTangOverlap = ti.Vector([particle[np].x[0], particle[end2].x[0], 1.])
+
+
+@ti.kernel
+def serial_compaction(particle: ti.template(), sphere: ti.template(), clump: ti.template()) -> ti.types.vector(3, int):
+    # the former update_particle_storage_, one entry at a time
+    remaining_sphere, remaining_clump, remaining_particle = 0, 0, 0
+    ti.loop_config(serialize=True)
+    for np in range(particleNum):
+        multisphereIndex = particle[np].multisphereIndex
+        if multisphereIndex < 0:
+            if int(particle[np].active) == 1:
+                particle[remaining_particle] = particle[np]
+                particle[remaining_particle].multisphereIndex = -remaining_sphere - 1
+                sphere[remaining_sphere] = sphere[-multisphereIndex - 1]
+                sphere[remaining_sphere].sphereIndex = remaining_particle
+                remaining_particle += 1
+                remaining_sphere += 1
+        elif np == clump[multisphereIndex].endIndex:
+            startIndex = clump[multisphereIndex].startIndex
+            active = 1
+            for npebble in range(startIndex, np + 1):
+                if int(particle[npebble].active) == 0: active = 0
+            if active == 1:
+                for npebble in range(startIndex, np + 1):
+                    particle[remaining_particle + npebble - startIndex] = particle[npebble]
+                    particle[remaining_particle + npebble - startIndex].multisphereIndex = remaining_clump
+                clump[remaining_clump] = clump[multisphereIndex]
+                clump[remaining_clump].startIndex = remaining_particle
+                clump[remaining_clump].endIndex = remaining_particle + np - startIndex
+                remaining_particle += np - startIndex + 1
+                remaining_clump += 1
+    return ti.Vector([remaining_particle, remaining_sphere, remaining_clump])
+
+
+@ti.kernel
+def copy_reference(particle: ti.template(), sphere: ti.template(), clump: ti.template(), particle_out: ti.template(), sphere_out: ti.template(), clump_out: ti.template()):
+    for np in range(particleNum):
+        particle_out[np] = particle[np]
+    for nsphere in range(sphereNum):
+        sphere_out[nsphere] = sphere[nsphere]
+    for nclump in range(clumpNum):
+        clump_out[nclump] = clump[nclump]
+
+
+@ti.kernel
+def check_storage(particleNum: int, sphereNum: int, clumpNum: int, particle: ti.template(), sphere: ti.template(), clump: ti.template(),
+                  particle_ref: ti.template(), sphere_ref: ti.template(), clump_ref: ti.template()) -> int:
+    error = 0
+    for np in range(particleNum):
+        if particle[np].x[0] != particle_ref[np].x[0] or particle[np].multisphereIndex != particle_ref[np].multisphereIndex or int(particle[np].active) == 0:
+            error += 1
+    for nsphere in range(sphereNum):
+        if sphere[nsphere].sphereIndex != sphere_ref[nsphere].sphereIndex or sphere[nsphere].inv_I != sphere_ref[nsphere].inv_I:
+            error += 1
+    for nclump in range(clumpNum):
+        if clump[nclump].startIndex != clump_ref[nclump].startIndex or clump[nclump].endIndex != clump_ref[nclump].endIndex or clump[nclump].m != clump_ref[nclump].m:
+            error += 1
+    return error
+
+
+@ti.kernel
+def check_contact(particleNum: int, particle: ti.template(), cplist: ti.template(), object_object: ti.template()) -> int:
+    # the surviving contacts keep the history written for their original end particles, the contacts whose ends
+    # are swapped to keep endID1 < endID2 carry the negated history
+    error = 0
+    for np in range(particleNum):
+        for nc in range(object_object[np], object_object[np + 1]):
+            end2 = cplist[nc].endID2
+            if cplist[nc].endID1 != np or end2 <= np or end2 >= particleNum:
+                error += 1
+            elif (cplist[nc].oldTangOverlap - ti.Vector([particle[np].x[0], particle[end2].x[0], 1.])).norm() > 1e-12 and \
+                 (cplist[nc].oldTangOverlap + ti.Vector([particle[end2].x[0], particle[np].x[0], 1.])).norm() > 1e-12:
+                error += 1
+    return error
+
+
+def reset(removal):
+    ti.sync()
+    setup(removal, scene.particle, scene.sphere, scene.clump)
+    scene.particleNum[0], scene.sphereNum[0], scene.clumpNum[0] = particleNum, sphereNum, clumpNum
+
+
+compaction = ParticleCompaction(sims)
+for removal in [0.001, 0.01, 0.1]:
+    serial_elapsed, parallel_elapsed, history_elapsed = 0., 0., 0.
+    for i in range(repeat + 1):
+        reset(removal)
+        ti.sync()
+        start = time()
+        remaining = serial_compaction(scene.particle, scene.sphere, scene.clump)
+        ti.sync()
+        if i > 0: serial_elapsed += time() - start
+        copy_reference(scene.particle, scene.sphere, scene.clump, reference.particle, reference.sphere, reference.clump)
+
+        reset(removal)
+        setup_contact(scene.particle, cplist, hist_object_object)
+        ti.sync()
+        start = time()
+        compaction.compact(scene)
+        ti.sync()
+        if i > 0: parallel_elapsed += time() - start
+
+        start = time()
+        kernel_count_reorder_contact_(particleNum, True, compaction.particle_map, cplist, object_object, hist_object_object)
+        contact_pse.run(object_object)
+        kernel_reorder_contact_history_(particleNum, True, compaction.particle_map, cplist, hist_cplist, object_object, hist_object_object)
+        kernel_restore_contact_history_(particleNum, cplist, hist_cplist, object_object)
+        ti.sync()
+        if i > 0: history_elapsed += time() - start
+
+    storage_error = check_storage(scene.particleNum[0], scene.sphereNum[0], scene.clumpNum[0], scene.particle, scene.sphere, scene.clump, reference.particle, reference.sphere, reference.clump)
+    count_error = int(remaining[0] != scene.particleNum[0] or remaining[1] != scene.sphereNum[0] or remaining[2] != scene.clumpNum[0])
+    contact_error = check_contact(scene.particleNum[0], scene.particle, cplist, object_object)
+    print(f"removal = {removal}, remaining particles = {scene.particleNum[0]}, serial: {serial_elapsed / repeat * 1000.:.3f} ms, prefix sum: {parallel_elapsed / repeat * 1000.:.3f} ms, "
+          f"history remap: {history_elapsed / repeat * 1000.:.3f} ms, mismatches = {storage_error + count_error + contact_error}")
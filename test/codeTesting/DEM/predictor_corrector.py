@@ -0,0 +1,148 @@
+import json, os, shutil, subprocess, sys
+
+import numpy as np
+
+# Convergence of the Gear predictor-corrector against the velocity Verlet and the symplectic Euler schemes. A sphere and a
+# dumbbell clump rest on an undamped linear spring floor and oscillate around the static overlap, the exact solution is
+# harmonic. A second dumbbell tumbles in free fall, its rotation is compared with a fine Runge-Kutta integration of the Euler
+# equations. The steps are fractions of sqrt(m / k), the errors are relative. The last runs restart from the files saved
+# halfway. The files carry the state after the step with the time before it, so a restarted run takes one step more and
+# has to end on the state of a continuous run one step longer.
+stiffness, density, radius = 1e3, 2650., 0.01
+gravity = 9.8
+sphere_mass = density * 4. / 3. * np.pi * radius ** 3
+period = 2. * np.pi * np.sqrt(sphere_mass / stiffness)
+simulation_time = 5. * period
+fractions = [0.05, 0.1, 0.2, 0.4]
+spin = np.array([3., 5., 40.])
+
+
+def build(engine, timestep, path, steps, restart=None):
+    from geotaichi import DEM, init, ti
+    init(arch="cpu", log=False)
+
+    dem = DEM(log=False)
+    dem.set_configuration(domain=ti.Vector([0.5, 0.5, 1.]), boundary=["Destroy", "Destroy", "Destroy"], gravity=ti.Vector([0., 0., -gravity]),
+                          engine=engine, search="LinkedCell", log=False)
+    dem.set_solver({"Timestep": timestep, "SimulationTime": steps * timestep, "SaveInterval": 0.5 * steps * timestep, "SavePath": path}, log=False)
+    dem.memory_allocate(memory={"max_material_number": 2, "max_particle_number": 5, "max_sphere_number": 1, "max_clump_number": 2,
+                                "max_plane_number": 1, "verlet_distance_multiplier": 0.2, "body_coordination_number": 4, "wall_coordination_number": 2}, log=False)
+    dem.add_attribute(materialID=0, attribute={"Density": density, "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    dem.add_attribute(materialID=1, attribute={"Density": density, "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    if restart is None:
+        dem.add_template(template={"Name": "dumbbell", "NSphere": 2, "Pebble": [{"Position": ti.Vector([-0.5, 0., 0.]), "Radius": 0.5},
+                                                                                  {"Position": ti.Vector([0.5, 0., 0.]), "Radius": 0.5}]})
+        # the bodies start at the static overlap, moving down at 80 % of the speed that would open the contact
+        overlap = sphere_mass * gravity / stiffness
+        velocity = -0.8 * overlap * np.sqrt(stiffness / sphere_mass)
+        dem.create_body(body={"BodyType": "Sphere", "Template": [{"GroupID": 0, "MaterialID": 0, "Radius": radius, "BodyPoint": ti.Vector([0.1, 0.25, radius - overlap]),
+                                                                   "InitialVelocity": ti.Vector([0., 0., velocity]), "InitialAngularVelocity": ti.Vector([0., 0., 0.]),
+                                                                   "FixVelocity": ["Free", "Free", "Free"], "FixAngularVelocity": ["Free", "Free", "Free"],
+                                                                   "BodyOrientation": "uniform"}]})
+        dem.create_body(body={"BodyType": "Clump", "Template": [{"Name": "dumbbell", "GroupID": 0, "MaterialID": 0, "ScaleFactor": 2. * radius, "BodyPoint": ti.Vector(center),
+                                                                  "BodyOrientation": "constant", "OrientationParameter": ti.Vector([0., 0., 1.]),
+                                                                  "InitialVelocity": ti.Vector([0., 0., init_v]), "InitialAngularVelocity": ti.Vector(init_w)}
+                                                                 for center, init_v, init_w in [([0.3, 0.25, radius - overlap], velocity, [0., 0., 0.]),
+                                                                                                ([0.25, 0.25, 0.8], 0., list(spin))]]})
+        dem.add_wall(body={"WallType": "Plane", "MaterialID": 1, "WallCenter": ti.Vector([0.25, 0.25, 0.]), "OuterNormal": ti.Vector([0., 0., 1.])})
+    else:
+        dem.read_restart(file_number=restart, file_path=path, sphere=True, clump=True, ppcontact=False, pwcontact=False)
+    dem.choose_contact_model(particle_particle_contact_model="Linear Model", particle_wall_contact_model="Linear Model")
+    dem.add_property(materialID1=0, materialID2=0, property={"NormalStiffness": stiffness, "TangentialStiffness": stiffness, "Friction": 0.5,
+                                                              "NormalViscousDamping": 0., "TangentialViscousDamping": 0.})
+    dem.add_property(materialID1=0, materialID2=1, property={"NormalStiffness": stiffness, "TangentialStiffness": stiffness, "Friction": 0.5,
+                                                              "NormalViscousDamping": 0., "TangentialViscousDamping": 0.}, dType="particle-wall")
+    dem.select_save_data(sphere=True, clump=True, wall=True)
+    return dem
+
+
+def run_case(engine, fraction, mode):
+    timestep = fraction * np.sqrt(sphere_mass / stiffness)
+    steps = 2 * int(round(0.5 * simulation_time / timestep))
+    path = f"/tmp/dem_predictor_corrector/{engine}_{fraction}"
+    if mode == "restart":
+        dem = build(engine, timestep, path, steps, restart=1)
+    else:
+        path += "_longer" if mode == "longer" else ""
+        shutil.rmtree(path, ignore_errors=True)
+        dem = build(engine, timestep, path, steps + int(mode == "longer"))
+    particle, clump = dem.scene.particle, dem.scene.clump
+    initial = [float(particle.x[0][2]), float(particle.v[0][2]), float(clump.mass_center[0][2]), float(clump.v[0][2]), clump.q[1].to_numpy().tolist(),
+               clump.w[1].to_numpy().tolist()]
+    dem.run()
+    return {"time": float(dem.sims.current_time), "initial": initial, "sphere_z": float(particle.x[0][2]), "sphere_vz": float(particle.v[0][2]),
+            "clump_mass": float(clump.m[0]), "pebble_radius": float(particle.rad[1]), "clump_z": float(clump.mass_center[0][2]), "clump_vz": float(clump.v[0][2]),
+            "inv_I": clump.inv_I[1].to_numpy().tolist(), "q": clump.q[1].to_numpy().tolist(), "w": clump.w[1].to_numpy().tolist()}
+
+
+def rotate(q):
+    x, y, z, w = q
+    return np.array([[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+                     [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+                     [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]])
+
+
+def tumbling_reference(inv_I, q0, w0, time, steps=200000):
+    # classical Runge-Kutta of the Euler equations and of dq/dt = q * w_body / 2 from the initial state
+    inertia = 1. / np.array(inv_I)
+
+    def derivative(state):
+        q, w = state[:4], state[4:]
+        x, y, z, s = q
+        dq = 0.5 * np.array([w[0] * s - w[1] * z + w[2] * y, w[1] * s - w[2] * x + w[0] * z, w[2] * s - w[0] * y + w[1] * x, -w[0] * x - w[1] * y - w[2] * z])
+        dw = np.array([w[1] * w[2] * (inertia[1] - inertia[2]), w[2] * w[0] * (inertia[2] - inertia[0]), w[0] * w[1] * (inertia[0] - inertia[1])]) / inertia
+        return np.concatenate([dq, dw])
+
+    state, h = np.concatenate([q0, rotate(q0).T @ np.array(w0)]), time / steps
+    for _ in range(steps):
+        k1 = derivative(state)
+        k2 = derivative(state + 0.5 * h * k1)
+        k3 = derivative(state + 0.5 * h * k2)
+        k4 = derivative(state + h * k3)
+        state = state + h / 6. * (k1 + 2. * k2 + 2. * k3 + k4)
+    return rotate(state[:4] / np.linalg.norm(state[:4])), state[4:]
+
+
+def oscillator_error(mass, contacts, rad, z0, vz0, time, z, vz):
+    # relative phase-space distance to the harmonic oscillation around the static overlap
+    omega = np.sqrt(contacts * stiffness / mass)
+    equilibrium = rad - mass * gravity / (contacts * stiffness)
+    displacement = (z0 - equilibrium) + 1j * vz0 / omega
+    exact = displacement * np.exp(-1j * omega * time)
+    return abs((z - equilibrium) + 1j * vz / omega - exact) / abs(displacement)
+
+
+def errors(result):
+    sphere_z0, sphere_vz0, clump_z0, clump_vz0, q0, w0 = result["initial"]
+    sphere = oscillator_error(sphere_mass, 1, radius, sphere_z0, sphere_vz0, result["time"], result["sphere_z"], result["sphere_vz"])
+    clump = oscillator_error(result["clump_mass"], 2, result["pebble_radius"], clump_z0, clump_vz0, result["time"], result["clump_z"], result["clump_vz"])
+    rotation, omega = tumbling_reference(result["inv_I"], np.array(q0), w0, result["time"])
+    angle = np.arccos(np.clip(0.5 * (np.trace(rotation.T @ rotate(np.array(result["q"]))) - 1.), -1., 1.))
+    return sphere, clump, angle, np.linalg.norm(np.array(result["w"]) - rotation @ omega) / np.linalg.norm(spin)
+
+
+def launch(engine, fraction, mode="continuous"):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), engine, str(fraction), mode], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The run of {engine} at dt = {fraction} sqrt(m / k) failed")
+    result = json.loads(lines[-1])
+    result["elapsed"] = next(float(line.split("=")[1]) for line in lines if line.startswith("Physical time"))
+    return result
+
+
+if len(sys.argv) == 4:
+    print(json.dumps(run_case(sys.argv[1], float(sys.argv[2]), sys.argv[3])))
+else:
+    print(f"{'engine':>17}{'dt/sqrt(m/k)':>14}{'run s':>8}{'sphere':>11}{'clump':>11}{'angle':>11}{'omega':>11}")
+    for engine in ["SymplecticEuler", "VelocityVerlet", "PredictCorrector"]:
+        for fraction in fractions:
+            result = launch(engine, fraction)
+            print(f"{engine:>17}{fraction:>14}{result['elapsed']:>8.2f}" + "".join(f"{value:>11.3e}" for value in errors(result)))
+    for engine in ["SymplecticEuler", "PredictCorrector"]:
+        longer = launch(engine, fractions[-1], "longer")
+        restarted = launch(engine, fractions[-1], "restart")
+        difference = max(abs(longer[key] - restarted[key]) for key in ["sphere_z", "sphere_vz", "clump_z", "clump_vz"])
+        difference = max(difference, np.abs(np.array(longer["q"]) - np.array(restarted["q"])).max(), np.abs(np.array(longer["w"]) - np.array(restarted["w"])).max())
+        print(f"{engine}: largest difference between the run restarted halfway and the continuous run one step longer: {difference:.3e}")
@@ -0,0 +1,85 @@
+import json, os, shutil, subprocess, sys
+
+import numpy as np
+
+# Sparse contact output against the full contact dumps. Spheres rain onto the floor of a box and the same run is saved
+# once with the full dumps and once with the delta-encoded frames, without restart-grade dumps, so that only the
+# keyframes written every KeyframeInterval saves bound the chains. At every frame, the pairs carrying a force decoded by
+# following the chain back have to equal the ones of the full dump, with the same forces.
+timestep = 1e-4
+save_interval = 0.02
+simulation_time = 0.6
+keyframe_interval = 4
+root = "/tmp/sparse_contact"
+
+
+def run_case(contact_output):
+    from geotaichi import DEM, init, ti
+    # a single thread keeps the atomic force sums, and so the two runs, identical
+    init(arch="cpu", cpu_max_num_threads=1, log=False)
+
+    path = f"{root}/{contact_output}"
+    shutil.rmtree(path, ignore_errors=True)
+    dem = DEM()
+    dem.set_configuration(domain=ti.Vector([0.2, 0.2, 0.4]), boundary=["Destroy", "Destroy", "Destroy"], gravity=ti.Vector([0., 0., -9.8]),
+                          engine="SymplecticEuler", search="LinkedCell")
+    dem.set_solver({"Timestep": timestep, "SimulationTime": simulation_time, "SaveInterval": save_interval, "SavePath": path,
+                    "ContactOutput": contact_output, "RestartInterval": 0, "KeyframeInterval": keyframe_interval})
+    dem.memory_allocate(memory={"max_material_number": 2, "max_particle_number": 500, "max_sphere_number": 500, "max_clump_number": 0,
+                                "max_plane_number": 1, "verlet_distance_multiplier": 0.2, "body_coordination_number": 16, "wall_coordination_number": 3,
+                                "compaction_ratio": [0.4, 0.4]})
+    dem.add_attribute(materialID=0, attribute={"Density": 2650., "ForceLocalDamping": 0.1, "TorqueLocalDamping": 0.1})
+    dem.add_attribute(materialID=1, attribute={"Density": 26500., "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    dem.add_region(region={"Name": "cloud", "Type": "Rectangle", "BoundingBoxPoint": ti.Vector([0.01, 0.01, 0.01]),
+                           "BoundingBoxSize": ti.Vector([0.18, 0.18, 0.38]), "zdirection": ti.Vector([0., 0., 1.])})
+    dem.add_body(body={"GenerateType": "Generate", "RegionName": "cloud", "BodyType": "Sphere", "TryNumber": 10000,
+                       "Template": {"GroupID": 0, "MaterialID": 0, "MinRadius": 0.004, "MaxRadius": 0.006, "BodyNumber": 500,
+                                    "InitialVelocity": ti.Vector([0., 0., 0.]), "InitialAngularVelocity": ti.Vector([0., 0., 0.])}})
+    dem.add_wall(body={"WallType": "Plane", "MaterialID": 1, "WallCenter": ti.Vector([0.1, 0.1, 0.]), "OuterNormal": ti.Vector([0., 0., 1.])})
+    dem.choose_contact_model(particle_particle_contact_model="Hertz Mindlin Model", particle_wall_contact_model="Hertz Mindlin Model")
+    dem.add_property(materialID1=0, materialID2=0, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    dem.add_property(materialID1=0, materialID2=1, property={"ShearModulus": 5e7, "Possion": 0.3, "Friction": 0.5, "Restitution": 0.6})
+    dem.select_save_data(particle=True, particle_particle_contact=True, particle_wall_contact=True)
+    dem.run()
+    return {"frames": int(dem.sims.current_print)}
+
+
+def launch(contact_output):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), contact_output], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The run with the {contact_output} contact output failed")
+    return json.loads(lines[-1])
+
+
+def active_pairs(contact_info):
+    # the encoder keeps the pairs carrying a force, sorted by (end1, end2)
+    active = np.any(contact_info["normal_force"] != 0., axis=1)
+    end1, end2 = contact_info["end1"][active].astype(np.int64), contact_info["end2"][active].astype(np.int64)
+    order = np.argsort((end1 << 32) | end2, kind="stable")
+    return {"end1": end1[order], "end2": end2[order], "normal_force": contact_info["normal_force"][active][order],
+            "tangential_force": contact_info["tangential_force"][active][order]}
+
+
+if len(sys.argv) == 2:
+    print(json.dumps(run_case(sys.argv[1])))
+else:
+    from src.utils.SparseContact import read_sparse_contact
+
+    frames = launch("Full")["frames"]
+    assert launch("Sparse")["frames"] == frames
+    print(f"{'contacts':<18}{'frame':>6}{'pairs':>7}{'chain':>7}{'mismatch':>10}")
+    for name in ["PP", "PW"]:
+        for frame in range(frames):
+            position = [np.load(f"{root}/{contact_output}/particles/DEMParticle{frame:06d}.npz")["position"] for contact_output in ["Full", "Sparse"]]
+            assert np.array_equal(position[0], position[1])
+
+            full = active_pairs(np.load(f"{root}/Full/contacts/DEMContact{name}{frame:06d}.npz"))
+            sparse = read_sparse_contact(f"{root}/Sparse/contacts/DEMContact{name}Sparse", frame)
+            mismatch = int(not all(np.array_equal(full[key], sparse[key]) for key in full))
+            chain, base = 1, frame
+            while int(np.load(f"{root}/Sparse/contacts/DEMContact{name}Sparse{base:06d}.npz")["base_frame"]) >= 0:
+                base, chain = int(np.load(f"{root}/Sparse/contacts/DEMContact{name}Sparse{base:06d}.npz")["base_frame"]), chain + 1
+            print(f"{name:<18}{frame:>6}{full['end1'].shape[0]:>7}{chain:>7}{mismatch:>10}")
+            assert mismatch == 0 and chain == frame % keyframe_interval + 1
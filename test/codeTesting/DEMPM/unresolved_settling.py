@@ -0,0 +1,115 @@
+import json, os, shutil, subprocess, sys
+
+import numpy as np
+
+# Nine grains settle in a tank of viscous MPM fluid through the unresolved CFD-DEM coupling. The grains relax within a few
+# milliseconds to the terminal velocity where the Di Felice drag balances the submerged weight, and every step the reaction
+# summed on the material points has to cancel the fluid force on the grains. The run is repeated with the DEM subcycled.
+simulation_time = 0.05
+grain_radius, grain_density = 0.002, 2650.
+fluid_density, fluid_viscosity = 1000., 1.
+gravity = 9.8
+
+
+def terminal_velocity(porosity=1.):
+    # bisection of the Di Felice drag against the submerged weight of a single grain
+    volume = 4. / 3. * np.pi * grain_radius ** 3
+    weight = (grain_density - fluid_density) * volume * gravity
+    lower, upper = 0., 10.
+    for _ in range(200):
+        speed = 0.5 * (lower + upper)
+        reynolds = 2. * grain_radius * fluid_density * porosity * speed / fluid_viscosity
+        drag_coefficient = (0.63 + 4.8 / np.sqrt(reynolds)) ** 2
+        exponent = 3.7 - 0.65 * np.exp(-0.5 * (1.5 - np.log10(reynolds)) ** 2)
+        drag = 0.5 * drag_coefficient * fluid_density * np.pi * grain_radius ** 2 * porosity ** (2. - exponent) * speed ** 2
+        lower, upper = (speed, upper) if drag < weight else (lower, speed)
+    return speed
+
+
+def run_case(subcycling):
+    from geotaichi import DEMPM, init, ti
+    init(arch="cpu", log=False)
+
+    path = f"/tmp/dempm_unresolved_settling/{int(subcycling)}"
+    shutil.rmtree(path, ignore_errors=True)
+    dempm = DEMPM(log=False)
+    dempm.set_configuration(domain=ti.Vector([0.1, 0.1, 0.2]), coupling_scheme="CFD-DEM", gravity=[0., 0., -gravity], log=False)
+    dempm.dem.set_configuration(boundary=["Destroy", "Destroy", "Destroy"], engine="SymplecticEuler", search="LinkedCell", log=False)
+    dempm.mpm.set_configuration(background_damping=0., alphaPIC=0.005, mapping="USL", shape_function="Linear", material_type="Fluid", log=False)
+    dempm.set_solver({"Timestep": 1e-4, "SimulationTime": simulation_time, "SaveInterval": 0.025, "SavePath": path, "CFL": 0.2,
+                      "Subcycling": subcycling}, log=False)
+
+    dempm.dem.memory_allocate(memory={"max_material_number": 1, "max_particle_number": 9, "max_sphere_number": 9, "max_clump_number": 0,
+                                      "verlet_distance_multiplier": 0.2}, log=False)
+    dempm.mpm.memory_allocate(memory={"max_material_number": 2, "max_particle_number": 20000,
+                                      "max_constraint_number": {"max_reflection_constraint": 20000}}, log=False)
+    dempm.memory_allocate(memory={"max_material_number": 2})
+
+    dempm.dem.add_attribute(materialID=0, attribute={"Density": grain_density, "ForceLocalDamping": 0., "TorqueLocalDamping": 0.})
+    dempm.dem.create_body(body={"BodyType": "Sphere", "Template": [{"GroupID": 0, "MaterialID": 0, "Radius": grain_radius,
+                                                                     "BodyPoint": ti.Vector([0.025 + 0.025 * i, 0.025 + 0.025 * j, 0.08]),
+                                                                     "InitialVelocity": ti.Vector([0., 0., 0.]), "InitialAngularVelocity": ti.Vector([0., 0., 0.]),
+                                                                     "FixVelocity": ["Free", "Free", "Free"], "FixAngularVelocity": ["Free", "Free", "Free"],
+                                                                     "BodyOrientation": "uniform"} for i in range(3) for j in range(3)]})
+    dempm.dem.choose_contact_model(particle_particle_contact_model="Linear Model", particle_wall_contact_model=None)
+    dempm.dem.add_property(materialID1=0, materialID2=0, property={"NormalStiffness": 1e5, "TangentialStiffness": 1e5, "Friction": 0.5,
+                                                                    "NormalViscousDamping": 0.2, "TangentialViscousDamping": 0.2})
+    dempm.dem.select_save_data()
+
+    dempm.mpm.add_material(model="Newtonian", material={"MaterialID": 1, "Density": fluid_density, "Modulus": 2e5, "Viscosity": fluid_viscosity})
+    dempm.mpm.add_element(element={"ElementType": "R8N3D", "ElementSize": ti.Vector([0.01, 0.01, 0.01])})
+    dempm.mpm.add_region(region={"Name": "tank", "Type": "Rectangle", "BoundingBoxPoint": ti.Vector([0., 0., 0.]),
+                                 "BoundingBoxSize": ti.Vector([0.1, 0.1, 0.15]), "zdirection": ti.Vector([0., 0., 1.])})
+    dempm.mpm.add_body(body={"Template": {"RegionName": "tank", "nParticlesPerCell": 2, "BodyID": 0, "MaterialID": 1,
+                                          "ParticleStress": {"GravityField": True, "InternalStress": ti.Vector([0., 0., 0., 0., 0., 0.])},
+                                          "InitialVelocity": ti.Vector([0., 0., 0.]), "FixVelocity": ["Free", "Free", "Free"]}})
+    dempm.mpm.add_boundary_condition(boundary=[
+        {"BoundaryType": "ReflectionConstraint", "Norm": [0., 0., -1.], "StartPoint": [0., 0., 0.], "EndPoint": [0.1, 0.1, 0.]},
+        {"BoundaryType": "ReflectionConstraint", "Norm": [-1., 0., 0.], "StartPoint": [0., 0., 0.], "EndPoint": [0., 0.1, 0.2]},
+        {"BoundaryType": "ReflectionConstraint", "Norm": [1., 0., 0.], "StartPoint": [0.1, 0., 0.], "EndPoint": [0.1, 0.1, 0.2]},
+        {"BoundaryType": "ReflectionConstraint", "Norm": [0., -1., 0.], "StartPoint": [0., 0., 0.], "EndPoint": [0.1, 0., 0.2]},
+        {"BoundaryType": "ReflectionConstraint", "Norm": [0., 1., 0.], "StartPoint": [0., 0.1, 0.], "EndPoint": [0.1, 0.1, 0.2]}])
+    dempm.mpm.select_save_data()
+    dempm.choose_contact_model(particle_particle_contact_model=None, particle_wall_contact_model=None)
+
+    imbalance = ti.field(float, shape=())
+
+    def check_reaction():
+        # the coupled step ends with the reaction of the last fluid force on the material points
+        grain = ti.static(dempm.dem.scene.particle)
+        point = ti.static(dempm.mpm.scene.particle)
+        fluid_force, reaction = ti.Vector([0., 0., 0.]), ti.Vector([0., 0., 0.])
+        for nparticle in range(dempm.dem.scene.particleNum[0]):
+            fluid_force += grain[nparticle].contact_force
+        for nparticle in range(dempm.mpm.scene.particleNum[0]):
+            reaction += point[nparticle].external_force
+        imbalance[None] = (fluid_force + reaction).norm() / fluid_force.norm()
+
+    dempm.run(function=check_reaction)
+    v = dempm.dem.scene.particle.v.to_numpy()[:9]
+    return {"steps": dempm.sims.current_step, "substep": dempm.sims.substep, "timestep": dempm.sims.delta, "vz": float(v[:, 2].mean()),
+            "vz_spread": float(v[:, 2].std()), "imbalance": imbalance[None]}
+
+
+def launch(subcycling):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), str(subcycling)], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The run with Subcycling = {bool(subcycling)} failed")
+    result = json.loads(lines[-1])
+    result["elapsed"] = next(float(line.split("=")[1]) for line in lines if line.startswith("Physical time"))
+    return result
+
+
+if len(sys.argv) == 2:
+    print(json.dumps(run_case(sys.argv[1] == "1")))
+else:
+    # the grain sees the porosity of the cells it overlaps, at most its own volume is missing from one cell
+    cell_porosity = 1. - 4. / 3. * np.pi * grain_radius ** 3 / 0.01 ** 3
+    print(f"Di Felice terminal velocity of a single grain: {terminal_velocity():.5f} m/s, {terminal_velocity(cell_porosity):.5f} m/s in its own cell")
+    print(f"{'subcycling':>11}{'steps':>8}{'substep':>9}{'dt':>12}{'run s':>8}{'vz':>10}{'spread':>10}{'imbalance':>11}")
+    for subcycling in [0, 1]:
+        result = launch(subcycling)
+        print(f"{subcycling:>11}{result['steps']:>8}{result['substep']:>9}{result['timestep']:>12.4e}{result['elapsed']:>8.2f}{result['vz']:>10.5f}"
+              f"{result['vz_spread']:>10.2e}{result['imbalance']:>11.2e}")
@@ -0,0 +1,63 @@
+import glob, json, os, shutil, subprocess, sys
+
+import numpy as np
+
+# Collapse of a soft 2D soil column: the stable step shrinks while the flow speeds up and recovers as it slows down.
+# The adaptive run follows the wave speed plus the particle velocity and must still save at the prescribed times.
+simulation_time = 0.6
+save_interval = 0.1
+
+
+def run_case(adaptive, timestep):
+    from geotaichi import MPM, init, ti
+    init(dim=2, arch="cpu", log=False)
+
+    path = f"/tmp/adaptive_timestep/{int(adaptive)}"
+    shutil.rmtree(path, ignore_errors=True)
+    mpm = MPM()
+    mpm.set_configuration(domain=ti.Vector([2., 1.]), gravity=[0., -9.8], mapping="USL", shape_function="GIMP")
+    mpm.set_solver(solver={"Timestep": timestep, "SimulationTime": simulation_time, "SaveInterval": save_interval, "SavePath": path, "CFL": 0.2, "AdaptiveTimestep": adaptive})
+    mpm.memory_allocate(memory={"max_material_number": 1, "max_particle_number": 20000,
+                                "max_constraint_number": {"max_velocity_constraint": 4000, "max_reflection_constraint": 4000}})
+    mpm.add_material(model="MohrCoulomb", material={"MaterialID": 1, "Density": 2000., "YoungModulus": 1e5, "PossionRatio": 0.3, "Cohesion": 0., "Friction": 20., "Dilation": 0., "Tensile": 0.})
+    mpm.add_element(element={"ElementType": "Q4N2D", "ElementSize": ti.Vector([0.02, 0.02])})
+    mpm.add_region(region={"Name": "column", "Type": "Rectangle2D", "BoundingBoxPoint": ti.Vector([0.1, 0.1]), "BoundingBoxSize": ti.Vector([0.3, 0.6]), "ydirection": ti.Vector([0., 1.])})
+    mpm.add_body(body={"Template": {"RegionName": "column", "nParticlesPerCell": 2, "BodyID": 0, "MaterialID": 1,
+                                    "ParticleStress": {"GravityField": False, "InternalStress": ti.Vector([0., 0., 0., 0., 0., 0.])},
+                                    "InitialVelocity": ti.Vector([0., 0.]), "FixVelocity": ["Free", "Free"]}})
+    mpm.add_boundary_condition(boundary=[{"BoundaryType": "VelocityConstraint", "Velocity": [0., 0.], "StartPoint": [0., 0.], "EndPoint": [2., 0.1]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [-1., 0.], "StartPoint": [0., 0.], "EndPoint": [0.1, 1.]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [1., 0.], "StartPoint": [1.9, 0.], "EndPoint": [2., 1.]}])
+    mpm.select_save_data()
+
+    mpm.run()
+    particleNum = int(mpm.scene.particleNum[0])
+    save_times = [float(np.load(name)["t_current"]) for name in sorted(glob.glob(path + "/particles/MPMParticle*.npz"))]
+    x = mpm.scene.particle.x.to_numpy()[:particleNum]
+    return {"steps": mpm.sims.current_step, "min_timestep": mpm.solver.timestepper.min_timestep if adaptive else mpm.sims.delta, "save_times": save_times,
+            "mean_x": x.mean(axis=0).tolist(), "runout": float(x[:, 0].max())}
+
+
+def launch(adaptive, timestep):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), str(adaptive), str(timestep)], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The run with AdaptiveTimestep = {bool(adaptive)} failed")
+    result = json.loads(lines[-1])
+    # the solver reports the time spent in its loop, without the compilation
+    result["elapsed"] = next(float(line.split("=")[1]) for line in lines if line.startswith("Physical time"))
+    return result
+
+
+if len(sys.argv) == 3:
+    print(json.dumps(run_case(sys.argv[1] == "1", float(sys.argv[2]))))
+else:
+    # the fixed step run uses the smallest step met by the adaptive run, the step it would need to be as safe
+    results = [launch(1, 1e-3)]
+    results.append(launch(0, results[0]["min_timestep"]))
+    print(f"{'adaptive':>10}{'steps':>8}{'min dt':>12}{'run s':>8}{'mean x':>20}{'runout':>9}   save times")
+    for adaptive, result in zip([1, 0], results):
+        mean_x = ", ".join(f"{value:.4f}" for value in result["mean_x"])
+        save_times = " ".join(f"{value:.6g}" for value in result["save_times"])
+        print(f"{adaptive:>10}{result['steps']:>8}{result['min_timestep']:>12.4e}{result['elapsed']:>8.2f}{mean_x:>20}{result['runout']:>9.4f}   {save_times}")
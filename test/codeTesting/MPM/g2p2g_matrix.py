@@ -0,0 +1,68 @@
+import json, os, subprocess, sys
+
+# G2P2G against USL on a 2D collapse of two columns with different Mohr-Coulomb parameters, for every shape function and
+# grid layout G2P2G supports. Each case runs in its own process. G2P2G keeps the particles in step with USL and both clear
+# every node of their grids, so the two runs have to end on the same positions and stresses up to round-off.
+SHAPE_FUNCTIONS = ["Linear", "GIMP", "QuadBSpline", "CubicBSpline"]
+LAYOUTS = {
+    "Dense": {},
+    "Sparse": {"sparse_grid": True},
+    "AOSOA": {"AOSOA": [64, 4]},
+    "SparseAOSOA": {"sparse_grid": True, "AOSOA": [64, 4]},
+}
+steps = 200
+position_tolerance, stress_tolerance = 1e-12, 1e-10
+
+
+def run_case(shape_function, layout, mapping):
+    from geotaichi import MPM, init, ti
+    init(dim=2, arch="cpu", log=False)
+
+    mpm = MPM()
+    mpm.set_configuration(domain=ti.Vector([2., 1.2]), gravity=[0., -9.8], mapping=mapping, shape_function=shape_function, **LAYOUTS[layout])
+    mpm.set_solver(solver={"Timestep": 1e-4, "SimulationTime": steps * 1e-4, "SaveInterval": 1., "SavePath": "/tmp/g2p2g_matrix"})
+    mpm.memory_allocate(memory={"max_material_number": 2, "max_particle_number": 60000,
+                                "max_constraint_number": {"max_velocity_constraint": 40000, "max_reflection_constraint": 40000}})
+    mpm.add_material(model="MohrCoulomb", material={"MaterialID": 1, "Density": 2000., "YoungModulus": 1e6, "PossionRatio": 0.3, "Cohesion": 0., "Friction": 30., "Dilation": 0., "Tensile": 0.})
+    mpm.add_material(model="MohrCoulomb", material={"MaterialID": 2, "Density": 1800., "YoungModulus": 2e6, "PossionRatio": 0.25, "Cohesion": 1e3, "Friction": 20., "Dilation": 0., "Tensile": 0.})
+    mpm.add_element(element={"ElementType": "Q4N2D", "ElementSize": ti.Vector([0.0125, 0.0125])})
+    mpm.add_region(region=[{"Name": "left", "Type": "Rectangle2D", "BoundingBoxPoint": ti.Vector([0.1, 0.1]), "BoundingBoxSize": ti.Vector([0.2, 0.8]), "ydirection": ti.Vector([0., 1.])},
+                           {"Name": "right", "Type": "Rectangle2D", "BoundingBoxPoint": ti.Vector([0.3, 0.1]), "BoundingBoxSize": ti.Vector([0.2, 0.6]), "ydirection": ti.Vector([0., 1.])}])
+    mpm.add_body(body={"Template": [{"RegionName": region, "nParticlesPerCell": 2, "BodyID": 0, "MaterialID": materialID,
+                                     "ParticleStress": {"GravityField": False, "InternalStress": ti.Vector([0., 0., 0., 0., 0., 0.])},
+                                     "InitialVelocity": ti.Vector([0., 0.]), "FixVelocity": ["Free", "Free"]} for region, materialID in [("left", 1), ("right", 2)]]})
+    mpm.add_boundary_condition(boundary=[{"BoundaryType": "VelocityConstraint", "Velocity": [0., 0.], "StartPoint": [0., 0.], "EndPoint": [2., 0.1]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [-1., 0.], "StartPoint": [0., 0.], "EndPoint": [0.1, 1.2]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [1., 0.], "StartPoint": [1.9, 0.], "EndPoint": [2., 1.2]}])
+    mpm.select_save_data(particle=False)
+    mpm.run()
+
+    particle_num = int(mpm.scene.particleNum[0])
+    return {"x": mpm.scene.particle.x.to_numpy()[:particle_num].tolist(), "stress": mpm.scene.particle.stress.to_numpy()[:particle_num].tolist()}
+
+
+if len(sys.argv) == 4:
+    print(json.dumps(run_case(sys.argv[1], sys.argv[2], sys.argv[3])))
+else:
+    import numpy as np
+    failed = []
+    print(f"{'shape function':<16}{'layout':<14}{'max |dx|':>12}{'max |dstress|':>15}{'relative':>12}")
+    for shape_function in SHAPE_FUNCTIONS:
+        for layout in LAYOUTS:
+            results = {}
+            for mapping in ["USL", "G2P2G"]:
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), shape_function, layout, mapping], capture_output=True, text=True, env=os.environ)
+                lines = output.stdout.strip().splitlines()
+                results[mapping] = json.loads(lines[-1]) if output.returncode == 0 and lines else None
+            if results["USL"] is None or results["G2P2G"] is None:
+                print(f"{shape_function:<16}{layout:<14}{'failed':>12}")
+                failed.append((shape_function, layout))
+                continue
+            deviation = np.abs(np.array(results["USL"]["x"]) - np.array(results["G2P2G"]["x"])).max()
+            stress = np.array(results["USL"]["stress"])
+            stress_deviation = np.abs(stress - np.array(results["G2P2G"]["stress"])).max()
+            relative = stress_deviation / np.abs(stress).max()
+            print(f"{shape_function:<16}{layout:<14}{deviation:>12.2e}{stress_deviation:>15.2e}{relative:>12.2e}")
+            if deviation > position_tolerance or relative > stress_tolerance:
+                failed.append((shape_function, layout))
+    assert not failed, f"G2P2G departs from USL for {failed}"
@@ -0,0 +1,63 @@
+import json, os, subprocess, sys
+
+# Quasi-static deflection of a cantilever clamped on the left and bent by its own weight, solved by the matrix-free implicit
+# engine with the Jacobi (PCG) and the multigrid (MGPCG) preconditioners. The tip deflection is compared with the
+# Euler-Bernoulli solution q L^4 / (8 E' I), E' being the plane strain modulus. The slender beam keeps the shear deflection
+# of the Timoshenko beam near 1 %.
+length, height, clamp = 1., 0.1, 0.1
+density, young, poisson = 1000., 1e8, 0.3
+gravity = 9.8
+element_size = 0.0125
+
+
+def run_case(linear_solver):
+    from geotaichi import MPM, init, ti
+    init(dim=2, arch="cpu", log=False)
+
+    mpm = MPM()
+    mpm.set_configuration(domain=ti.Vector([length + 2. * clamp, 0.6]), gravity=[0., -gravity], boundary=["None", "None", "None"], solver_type="Implicit",
+                          shape_function="Linear", velocity_projection="FLIP")
+    mpm.set_implicit_solver_parameters(quasi_static=True, linear_solver=linear_solver, max_iteration_number=20, multilevel=3, pre_and_post_smoothing=2, bottom_smoothing=20)
+    mpm.set_solver(solver={"Timestep": 1., "SimulationTime": 1., "SaveInterval": 1., "SavePath": f"/tmp/implicit_cantilever/{linear_solver}"})
+    mpm.memory_allocate(memory={"max_material_number": 1, "max_particle_number": 5000,
+                                "max_constraint_number": {"max_displacement_constraint": 500}})
+    mpm.add_material(model="LinearElastic", material={"MaterialID": 1, "Density": density, "YoungModulus": young, "PossionRatio": poisson})
+    mpm.add_element(element={"ElementType": "Q4N2D", "ElementSize": ti.Vector([element_size, element_size])})
+    mpm.add_region(region={"Name": "beam", "Type": "Rectangle2D", "BoundingBoxPoint": ti.Vector([clamp, 0.25]), "BoundingBoxSize": ti.Vector([length, height]),
+                           "ydirection": ti.Vector([0., 1.])})
+    mpm.add_body(body={"Template": {"RegionName": "beam", "nParticlesPerCell": 2, "BodyID": 0, "MaterialID": 1,
+                                    "ParticleStress": {"GravityField": False, "InternalStress": ti.Vector([0., 0., 0., 0., 0., 0.]), "Traction": {}},
+                                    "InitialVelocity": ti.Vector([0., 0.]), "FixVelocity": ["Free", "Free"]}})
+    mpm.add_boundary_condition(boundary=[{"BoundaryType": "DisplacementConstraint", "Displacement": [0., 0.], "StartPoint": [0., 0.25], "EndPoint": [clamp, 0.25 + height]}])
+    mpm.select_save_data(particle=False)
+
+    particle_num = int(mpm.scene.particleNum[0])
+    initial = mpm.scene.particle.x.to_numpy()[:particle_num]
+    mpm.run()
+    position = mpm.scene.particle.x.to_numpy()[:particle_num]
+    tip = initial[:, 0] > initial[:, 0].max() - 1e-6
+    return {"tip": float((initial[tip, 1] - position[tip, 1]).mean())}
+
+
+def launch(linear_solver):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), linear_solver], capture_output=True, text=True, env=os.environ)
+    lines = output.stdout.strip().splitlines()
+    if output.returncode != 0 or not lines:
+        print(output.stderr[-2000:])
+        raise RuntimeError(f"The run with {linear_solver} failed")
+    result = json.loads(lines[-1])
+    result["elapsed"] = next(float(line.split("=")[1]) for line in lines if line.startswith("Physical time"))
+    return result
+
+
+if len(sys.argv) == 2:
+    print(json.dumps(run_case(sys.argv[1])))
+else:
+    load = density * gravity * height
+    inertia = height ** 3 / 12.
+    analytical = load * length ** 4 / (8. * young / (1. - poisson ** 2) * inertia)
+    print(f"Euler-Bernoulli tip deflection: {analytical:.5e} m")
+    print(f"{'solver':>8}{'run s':>8}{'tip':>13}{'ratio':>8}")
+    for linear_solver in ["PCG", "MGPCG"]:
+        result = launch(linear_solver)
+        print(f"{linear_solver:>8}{result['elapsed']:>8.2f}{result['tip']:>13.5e}{result['tip'] / analytical:>8.3f}")
@@ -0,0 +1,80 @@
+import json, os, subprocess, sys, time
+
+# Memory and speed of every lightweight feature against the normal mode on a 2D column collapse.
+# Each case runs in its own process, the lightweight kernels are specialized on the global flags.
+FEATURES = {
+    "USL": {},
+    "USF": {"mapping": "USF"},
+    "MUSL": {"mapping": "MUSL"},
+    "Linear": {"shape_function": "Linear"},
+    "QuadBSpline": {"shape_function": "QuadBSpline"},
+    "CubicBSpline": {"shape_function": "CubicBSpline"},
+    "B-Bar": {"stabilize": "B-Bar Method"},
+    "F-Bar": {"stabilize": "F-Bar Method"},
+    "Affine": {"velocity_projection": "Affine"},
+    "SparseGrid": {"sparse_grid": True},
+    "AOSOA": {"AOSOA": [64, 4]},
+}
+steps = 200
+
+
+def run_case(feature, mode):
+    from geotaichi import MPM, init, ti
+    init(dim=2, arch="cpu", log=False)
+    from src.mpm.engines.ULExplicitEngine import ULExplicitEngine
+
+    configuration = dict(mode=mode, mapping="USL", shape_function="GIMP")
+    configuration.update(FEATURES[feature])
+    mpm = MPM()
+    mpm.set_configuration(domain=ti.Vector([2., 1.2]), gravity=[0., -9.8], **configuration)
+    mpm.set_solver(solver={"Timestep": 1e-4, "SimulationTime": steps * 1e-4, "SaveInterval": 1., "SavePath": "/tmp/lightweight_matrix"})
+    mpm.memory_allocate(memory={"max_material_number": 1, "max_particle_number": 60000,
+                                "max_constraint_number": {"max_velocity_constraint": 40000, "max_reflection_constraint": 40000}})
+    mpm.add_material(model="MohrCoulomb", material={"MaterialID": 1, "Density": 2000., "YoungModulus": 1e6, "PossionRatio": 0.3, "Cohesion": 0., "Friction": 30., "Dilation": 0., "Tensile": 0.})
+    mpm.add_element(element={"ElementType": "Q4N2D", "ElementSize": ti.Vector([0.0125, 0.0125])})
+    mpm.add_region(region={"Name": "column", "Type": "Rectangle2D", "BoundingBoxPoint": ti.Vector([0.1, 0.1]), "BoundingBoxSize": ti.Vector([0.4, 0.8]), "ydirection": ti.Vector([0., 1.])})
+    mpm.add_body(body={"Template": {"RegionName": "column", "nParticlesPerCell": 2, "BodyID": 0, "MaterialID": 1,
+                                    "ParticleStress": {"GravityField": False, "InternalStress": ti.Vector([0., 0., 0., 0., 0., 0.])},
+                                    "InitialVelocity": ti.Vector([0., 0.]), "FixVelocity": ["Free", "Free"]}})
+    mpm.add_boundary_condition(boundary=[{"BoundaryType": "VelocityConstraint", "Velocity": [0., 0.], "StartPoint": [0., 0.], "EndPoint": [2., 0.1]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [-1., 0.], "StartPoint": [0., 0.], "EndPoint": [0.1, 1.2]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [1., 0.], "StartPoint": [1.9, 0.], "EndPoint": [2., 1.2]}])
+    mpm.select_save_data(particle=False)
+
+    elapsed = []
+    def timed(function):
+        def wrapper(self, sims, scene):
+            ti.sync()
+            start = time.perf_counter()
+            function(self, sims, scene)
+            ti.sync()
+            elapsed.append(time.perf_counter() - start)
+        return wrapper
+    for name in ["usl_updating", "usf_updating", "musl_updating", "velocity_projection_updating", "lightweight", "lightweight_usf", "lightweight_musl"]:
+        setattr(ULExplicitEngine, name, timed(getattr(ULExplicitEngine, name)))
+    mpm.run()
+
+    # every field allocated by the run, the lightweight mode saves the particle-node connectivity of the normal mode
+    prog = ti.lang.impl.get_runtime().prog
+    memory = sum(prog.get_snode_root(tree).cell_size_bytes for tree in range(prog.get_snode_tree_size()))
+    particle = mpm.scene.particle.x.to_numpy()[:int(mpm.scene.particleNum[0])]
+    warm = elapsed[10:]
+    return {"memory": memory / 1024 ** 2, "time": 1e3 * sum(warm) / max(len(warm), 1), "x": particle.tolist()}
+
+
+if len(sys.argv) == 3:
+    print(json.dumps(run_case(sys.argv[1], sys.argv[2])))
+else:
+    import numpy as np
+    print(f"{'feature':<14}{'Normal MB':>12}{'Light MB':>12}{'Normal ms':>12}{'Light ms':>12}{'max |dx|':>12}")
+    for feature in FEATURES:
+        results = {}
+        for mode in ["Normal", "Lightweight"]:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), feature, mode], capture_output=True, text=True, env=os.environ)
+            lines = output.stdout.strip().splitlines()
+            results[mode] = json.loads(lines[-1]) if output.returncode == 0 and lines else None
+        if results["Normal"] is None or results["Lightweight"] is None:
+            print(f"{feature:<14}{'failed':>12}")
+            continue
+        deviation = np.abs(np.array(results["Normal"]["x"]) - np.array(results["Lightweight"]["x"])).max()
+        print(f"{feature:<14}{results['Normal']['memory']:>12.2f}{results['Lightweight']['memory']:>12.2f}{results['Normal']['time']:>12.3f}{results['Lightweight']['time']:>12.3f}{deviation:>12.2e}")
@@ -0,0 +1,64 @@
+import json, os, subprocess, sys, time
+
+# Step time of a 3D column collapse with and without the periodic Morton reordering of the material points.
+# The particles of the two columns are generated one body after another, the collapse then spreads them over the bed.
+INTERVALS = [0, 50]
+steps = 1500
+
+
+def run_case(reorder_interval):
+    from geotaichi import MPM, init, ti
+    init(dim=3, arch="cpu", log=False)
+    from src.mpm.engines.ULExplicitEngine import ULExplicitEngine
+
+    mpm = MPM()
+    mpm.set_configuration(domain=ti.Vector([2.4, 0.4, 0.5]), gravity=[0., 0., -9.8], mapping="USL", shape_function="GIMP")
+    mpm.set_solver(solver={"Timestep": 1e-4, "SimulationTime": steps * 1e-4, "SaveInterval": 1., "SavePath": "/tmp/morton_reorder", "ReorderInterval": reorder_interval})
+    mpm.memory_allocate(memory={"max_material_number": 2, "max_particle_number": 200000,
+                                "max_constraint_number": {"max_velocity_constraint": 120000, "max_reflection_constraint": 120000}})
+    mpm.add_material(model="MohrCoulomb", material=[{"MaterialID": 1, "Density": 2000., "YoungModulus": 1e6, "PossionRatio": 0.3, "Cohesion": 0., "Friction": 20., "Dilation": 0., "Tensile": 0.},
+                                                    {"MaterialID": 2, "Density": 1800., "YoungModulus": 1e6, "PossionRatio": 0.3, "Cohesion": 0., "Friction": 25., "Dilation": 0., "Tensile": 0.}])
+    mpm.add_element(element={"ElementType": "R8N3D", "ElementSize": ti.Vector([0.0125, 0.0125, 0.0125])})
+    mpm.add_region(region=[{"Name": "left", "Type": "Rectangle", "BoundingBoxPoint": ti.Vector([0.05, 0.05, 0.05]), "BoundingBoxSize": ti.Vector([0.15, 0.3, 0.3]), "zdirection": ti.Vector([0., 0., 1.])},
+                           {"Name": "right", "Type": "Rectangle", "BoundingBoxPoint": ti.Vector([2.2, 0.05, 0.05]), "BoundingBoxSize": ti.Vector([0.15, 0.3, 0.3]), "zdirection": ti.Vector([0., 0., 1.])}])
+    mpm.add_body(body={"Template": [{"RegionName": name, "nParticlesPerCell": 2, "BodyID": 0, "MaterialID": materialID,
+                                     "ParticleStress": {"GravityField": False, "InternalStress": ti.Vector([0., 0., 0., 0., 0., 0.])},
+                                     "InitialVelocity": ti.Vector([0., 0., 0.]), "FixVelocity": ["Free", "Free", "Free"]} for name, materialID in [("left", 1), ("right", 2)]]})
+    mpm.add_boundary_condition(boundary=[{"BoundaryType": "VelocityConstraint", "Velocity": [0., 0., 0.], "StartPoint": [0., 0., 0.], "EndPoint": [2.4, 0.4, 0.05]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [-1., 0., 0.], "StartPoint": [0., 0., 0.], "EndPoint": [0.05, 0.4, 0.5]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [1., 0., 0.], "StartPoint": [2.35, 0., 0.], "EndPoint": [2.4, 0.4, 0.5]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [0., -1., 0.], "StartPoint": [0., 0., 0.], "EndPoint": [2.4, 0.05, 0.5]},
+                                         {"BoundaryType": "ReflectionConstraint", "Norm": [0., 1., 0.], "StartPoint": [0., 0.35, 0.], "EndPoint": [2.4, 0.4, 0.5]}])
+    mpm.select_save_data(particle=False)
+
+    elapsed, reorder = [], []
+    def timed(function, record):
+        def wrapper(self, sims, scene, *args):
+            ti.sync()
+            start = time.perf_counter()
+            function(self, sims, scene, *args)
+            ti.sync()
+            record.append(time.perf_counter() - start)
+        return wrapper
+    ULExplicitEngine.usl_updating = timed(ULExplicitEngine.usl_updating, elapsed)
+    ULExplicitEngine.morton_reorder = timed(ULExplicitEngine.morton_reorder, reorder)
+    mpm.run()
+
+    # the last third of the run, when the columns have collapsed
+    late = elapsed[-len(elapsed) // 3:]
+    late_reorder = reorder[-len(reorder) // 3:] if reorder else [0.]
+    return {"particles": int(mpm.scene.particleNum[0]), "step": 1e3 * sum(late) / len(late), "reorder": 1e3 * sum(late_reorder) / len(late_reorder)}
+
+
+if len(sys.argv) == 2:
+    print(json.dumps(run_case(int(sys.argv[1]))))
+else:
+    print(f"{'interval':>10}{'particles':>12}{'step ms':>12}{'reorder ms/step':>18}")
+    for interval in INTERVALS:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), str(interval)], capture_output=True, text=True, env=os.environ)
+        lines = output.stdout.strip().splitlines()
+        if output.returncode != 0 or not lines:
+            print(f"{interval:>10}{'failed':>12}")
+            continue
+        result = json.loads(lines[-1])
+        print(f"{interval:>10}{result['particles']:>12}{result['step']:>12.3f}{result['reorder']:>18.3f}")